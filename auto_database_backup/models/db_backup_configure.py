@@ -23,17 +23,26 @@ import boto3
 import dropbox
 import errno
 import ftplib
+import io
 import json
 import logging
 import nextcloud_client
 import os
 import paramiko
+import queue
 import requests
 import shutil
 import subprocess
+import tarfile
 import tempfile
+import threading
+import time
+import uuid
+import zipfile
 import odoo
+from contextlib import contextmanager
 from datetime import timedelta
+from urllib.parse import quote
 from nextcloud import NextCloud
 from requests.auth import HTTPBasicAuth
 from werkzeug import urls
@@ -49,6 +58,342 @@ MICROSOFT_GRAPH_END_POINT = "https://graph.microsoft.com"
 GOOGLE_AUTH_ENDPOINT = 'https://accounts.google.com/o/oauth2/auth'
 GOOGLE_TOKEN_ENDPOINT = 'https://accounts.google.com/o/oauth2/token'
 GOOGLE_API_BASE_URL = 'https://www.googleapis.com'  
+# Size of the chunks streamed from pg_dump to the destinations. It must be a
+# multiple of 256 KiB (Google Drive) and 320 KiB (OneDrive), and at least
+# 5 MiB (Nextcloud chunked upload).
+BACKUP_CHUNK_SIZE = 10 * 1024 * 1024
+# Folder of the destination storing the filestore files of incremental
+# backups, by their filestore path ('ab/abcdef...', the SHA-1 of the content)
+FILESTORE_BLOB_DIR = 'filestore'
+# Destinations supporting incremental filestore backups
+INCREMENTAL_DESTINATIONS = ('local', 'ftp', 'sftp', 'amazon_s3')
+
+
+def read_chunk(stream, size=BACKUP_CHUNK_SIZE):
+    """Read `size` bytes from `stream`, or less only when it reaches EOF.
+    Pipes may return short reads, which the chunked upload APIs reject."""
+    chunks = []
+    remaining = size
+    while remaining:
+        data = stream.read(remaining)
+        if not data:
+            break
+        chunks.append(data)
+        remaining -= len(data)
+    return b''.join(chunks)
+
+
+def is_filestore_path(name):
+    """Whether `name` is a normalized relative filestore path, which cannot
+    point outside of the filestore folder it is joined to."""
+    return (bool(name) and isinstance(name, str)
+            and name == os.path.normpath(name).replace(os.sep, '/')
+            and not name.startswith(('/', '..')))
+
+
+# Signatures of file formats already compressed (JPEG, PNG, GIF, PDF, ZIP
+# and office documents, gzip, bzip2, xz, 7z), stored as is in zip backups
+COMPRESSED_FILE_SIGNATURES = (
+    b'\xff\xd8\xff', b'\x89PNG', b'GIF8', b'%PDF', b'PK\x03\x04', b'\x1f\x8b',
+    b'BZh', b'\xfd7zXZ', b'7z\xbc\xaf',
+)
+
+
+def is_compressed_file(path):
+    """Whether the file at `path` is in an already compressed format
+    (compressing it again costs CPU for no gain). Filestore files have no
+    extension, the format is recognized from the first bytes."""
+    with open(path, 'rb') as f:
+        header = f.read(12)
+    return (header.startswith(COMPRESSED_FILE_SIGNATURES)
+            # WEBP images and MP4/MOV videos
+            or (header[:4] == b'RIFF' and header[8:12] == b'WEBP')
+            or header[4:8] == b'ftyp')
+
+
+class FilestoreIndex:
+    """Filestore files referenced by the attachments of `db_name`, listed
+    once for all the destinations of an incremental backup.
+
+    The list is read in the snapshot the dump is taken from (see
+    snapshot()), so it matches the attachments of the dump exactly, even
+    if attachments are created or deleted while the backup runs."""
+
+    def __init__(self, db_name, dump_manifest):
+        self.db_name = db_name
+        self.dump_manifest = dump_manifest
+        self.filestore = odoo.tools.config.filestore(db_name)
+        self.ready = threading.Event()
+        self.blobs = None
+        self.manifest = None
+
+    @contextmanager
+    def snapshot(self):
+        """Export a snapshot of `db_name`, list the referenced filestore
+        files in it and yield its id for `pg_dump --snapshot`. The snapshot
+        is only valid while its transaction is open, so the context must
+        wrap the whole dump."""
+        db = odoo.sql_db.db_connect(self.db_name)
+        with db.cursor() as cr:
+            # First statement of the (repeatable read) transaction: the
+            # queries below and pg_dump all see this snapshot
+            cr.execute("SELECT pg_export_snapshot()")
+            snapshot_id = cr.fetchone()[0]
+            cr.execute("SELECT DISTINCT store_fname FROM ir_attachment"
+                       " WHERE store_fname IS NOT NULL")
+            names = [row[0] for row in cr.fetchall()]
+            self.manifest = self.dump_manifest(cr)
+            self.blobs = sorted(
+                name for name in names
+                if is_filestore_path(name)
+                and os.path.isfile(os.path.join(self.filestore, name)))
+            self.ready.set()
+            yield snapshot_id
+
+    def get(self):
+        """Return the sorted filestore paths of the referenced files"""
+        if not self.ready.is_set():
+            raise UserError("The filestore files of the backup were not "
+                            "listed, the dump did not start.")
+        return self.blobs
+
+
+class LocalBlobStore:
+    """Filestore files of incremental backups in a local directory"""
+
+    def __init__(self, root):
+        self.root = root
+
+    def list_blobs(self):
+        blob_dir = os.path.join(self.root, FILESTORE_BLOB_DIR)
+        blobs = set()
+        if os.path.isdir(blob_dir):
+            for prefix in os.listdir(blob_dir):
+                prefix_dir = os.path.join(blob_dir, prefix)
+                if os.path.isdir(prefix_dir):
+                    blobs.update(f'{prefix}/{name}'
+                                 for name in os.listdir(prefix_dir)
+                                 if not name.endswith('.part'))
+        return blobs
+
+    def upload_blob(self, name, path):
+        target = os.path.join(self.root, FILESTORE_BLOB_DIR, name)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        # Written under a temporary name, a partial file is never listed
+        shutil.copyfile(path, target + '.part')
+        os.replace(target + '.part', target)
+
+    def upload_bytes(self, filename, data):
+        with open(os.path.join(self.root, filename), 'wb') as f:
+            f.write(data)
+
+    def close(self):
+        pass
+
+
+class FtpBlobStore:
+    """Filestore files of incremental backups on an FTP server, the
+    connection being in the FTP path"""
+
+    def __init__(self, ftp_server):
+        self.ftp = ftp_server
+        self.dirs = set()
+
+    def list_blobs(self):
+        blobs = set()
+        try:
+            prefixes = self.ftp.nlst(FILESTORE_BLOB_DIR)
+        except ftplib.error_perm:
+            return blobs
+        for prefix in prefixes:
+            prefix = prefix.rstrip('/').rsplit('/', 1)[-1]
+            self.dirs.add(prefix)
+            for name in self.ftp.nlst(f'{FILESTORE_BLOB_DIR}/{prefix}'):
+                blobs.add(f"{prefix}/{name.rstrip('/').rsplit('/', 1)[-1]}")
+        return blobs
+
+    def _make_dir(self, path):
+        try:
+            self.ftp.mkd(path)
+        except ftplib.error_perm:
+            # Already exists
+            pass
+
+    def upload_blob(self, name, path):
+        prefix = name.split('/', 1)[0]
+        if prefix not in self.dirs:
+            if not self.dirs:
+                self._make_dir(FILESTORE_BLOB_DIR)
+            self._make_dir(f'{FILESTORE_BLOB_DIR}/{prefix}')
+            self.dirs.add(prefix)
+        remote = f'{FILESTORE_BLOB_DIR}/{name}'
+        with open(path, 'rb') as f:
+            self.ftp.storbinary('STOR %s.part' % remote, f,
+                                blocksize=BACKUP_CHUNK_SIZE)
+        self.ftp.rename(remote + '.part', remote)
+
+    def upload_bytes(self, filename, data):
+        self.ftp.storbinary('STOR %s' % filename, io.BytesIO(data))
+
+    def close(self):
+        self.ftp.quit()
+
+
+class SftpBlobStore:
+    """Filestore files of incremental backups on an SFTP server, the
+    session being in the SFTP path"""
+
+    def __init__(self, client, sftp):
+        self.client = client
+        self.sftp = sftp
+        self.dirs = set()
+
+    def list_blobs(self):
+        blobs = set()
+        try:
+            prefixes = self.sftp.listdir(FILESTORE_BLOB_DIR)
+        except IOError:
+            return blobs
+        for prefix in prefixes:
+            self.dirs.add(prefix)
+            blobs.update(f'{prefix}/{name}' for name in self.sftp.listdir(
+                f'{FILESTORE_BLOB_DIR}/{prefix}') if not name.endswith('.part'))
+        return blobs
+
+    def upload_blob(self, name, path):
+        prefix = name.split('/', 1)[0]
+        if prefix not in self.dirs:
+            for folder in (FILESTORE_BLOB_DIR, f'{FILESTORE_BLOB_DIR}/{prefix}'):
+                try:
+                    self.sftp.mkdir(folder)
+                except IOError:
+                    # Already exists
+                    pass
+            self.dirs.add(prefix)
+        remote = f'{FILESTORE_BLOB_DIR}/{name}'
+        self.sftp.put(path, remote + '.part')
+        self.sftp.posix_rename(remote + '.part', remote)
+
+    def upload_bytes(self, filename, data):
+        self.sftp.putfo(io.BytesIO(data), filename)
+
+    def close(self):
+        self.sftp.close()
+        self.client.close()
+
+
+class S3BlobStore:
+    """Filestore files of incremental backups in an Amazon S3 folder"""
+
+    def __init__(self, client, bucket, folder):
+        self.client = client
+        self.bucket = bucket
+        self.prefix = f'{folder}/{FILESTORE_BLOB_DIR}/'
+        self.folder = folder
+
+    def list_blobs(self):
+        blobs = set()
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix):
+            blobs.update(obj['Key'][len(self.prefix):]
+                         for obj in page.get('Contents', []))
+        return blobs
+
+    def upload_blob(self, name, path):
+        self.client.upload_file(path, self.bucket, self.prefix + name)
+
+    def upload_bytes(self, filename, data):
+        self.client.put_object(Bucket=self.bucket, Body=data,
+                               Key=f'{self.folder}/{filename}')
+
+    def close(self):
+        pass
+
+
+class BackupStreamReader:
+    """Readable file-like end of a BackupStreamTee, consumed by one upload
+    thread. Chunks are received through a bounded queue; the end of the
+    stream is an empty chunk, a failed dump is an exception raised by
+    read()."""
+
+    def __init__(self, max_chunks):
+        self.queue = queue.Queue(max_chunks)
+        self.chunk = b''
+        self.pos = 0
+        self.eof = False
+        self.closed = False
+
+    def feed(self, item):
+        """Producer side: queue a chunk, an empty chunk (end of stream) or
+        an exception. Dropped if the reader is closed."""
+        while not self.closed:
+            try:
+                self.queue.put(item, timeout=1)
+                return
+            except queue.Full:
+                continue
+
+    def _next_chunk(self):
+        item = self.queue.get()
+        if isinstance(item, Exception):
+            raise item
+        if not item:
+            self.eof = True
+        self.chunk = item
+        self.pos = 0
+
+    def read(self, size=-1):
+        if self.closed:
+            raise ValueError('I/O operation on closed file.')
+        if size is None or size < 0:
+            data = [self.chunk[self.pos:]]
+            while not self.eof:
+                self._next_chunk()
+                data.append(self.chunk)
+            self.chunk, self.pos = b'', 0
+            return b''.join(data)
+        while self.pos >= len(self.chunk) and not self.eof:
+            self._next_chunk()
+        data = self.chunk[self.pos:self.pos + size]
+        self.pos += len(data)
+        return data
+
+    def close(self):
+        """Stop receiving chunks, the producer skips closed readers"""
+        self.closed = True
+        while True:
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                break
+
+
+class BackupStreamTee:
+    """Fan out one stream, read once, to several BackupStreamReader. Each
+    reader buffers at most `max_chunks` chunks, so memory stays bounded and
+    the dump goes at the pace of the slowest upload. Readers closed by a
+    failed upload are skipped, the other uploads continue."""
+
+    def __init__(self, count, max_chunks=4):
+        self.readers = [BackupStreamReader(max_chunks) for _ in range(count)]
+
+    def pump(self, stream):
+        """Copy `stream` to the readers until its end. The end of stream is
+        only sent by finish(), once the dump is known to be complete."""
+        while True:
+            chunk = stream.read(BACKUP_CHUNK_SIZE)
+            if not chunk:
+                return
+            readers = [reader for reader in self.readers if not reader.closed]
+            if not readers:
+                raise UserError("All the backup uploads failed.")
+            for reader in readers:
+                reader.feed(chunk)
+
+    def finish(self, error=None):
+        """Send the end of stream, or `error` if the dump failed"""
+        for reader in self.readers:
+            reader.feed(error or b'')
 
 
 class DbBackupConfigure(models.Model):
@@ -65,9 +410,17 @@ class DbBackupConfigure(models.Model):
                              help='Master password')
     backup_format = fields.Selection([
         ('zip', 'Zip'),
-        ('dump', 'Dump')
+        ('dump', 'Dump'),
+        ('directory', 'Directory (Parallel)'),
+        ('incremental', 'Dump + Incremental Filestore')
     ], string='Backup Format', default='zip', required=True,
-        help='Format of the backup')
+        help='Format of the backup. Directory dumps the database with '
+             'several parallel jobs and uploads it as a tar archive. '
+             'Dump + Incremental Filestore uploads a dump, a manifest and '
+             'only the filestore files missing at the destination')
+    backup_jobs = fields.Integer(string='Parallel Jobs', default=4,
+                                 help='Number of parallel pg_dump jobs used '
+                                      'by the Directory backup format')
     backup_destination = fields.Selection([
         ('local', 'Local Storage'),
         ('google_drive', 'Google Drive'),
@@ -521,6 +874,34 @@ class DbBackupConfigure(models.Model):
         outh_result = dbx_auth.finish(auth_code)
         self.dropbox_refresh_token = outh_result.refresh_token
 
+    @api.constrains('backup_format', 'backup_jobs')
+    def _check_backup_jobs(self):
+        """Directory backups need at least one pg_dump job"""
+        for rec in self:
+            if rec.backup_format == 'directory' and rec.backup_jobs < 1:
+                raise ValidationError(
+                    _("Parallel Jobs must be at least 1."))
+
+    def _get_backup_extension(self):
+        """Return the file extension of the backups of this configuration"""
+        self.ensure_one()
+        if self.backup_format == 'directory':
+            return 'tar'
+        if self.backup_format == 'incremental':
+            return 'dump'
+        return self.backup_format
+
+    @api.constrains('backup_format', 'backup_destination')
+    def _check_incremental_destination(self):
+        """Incremental filestore backups need a destination where the
+        stored files can be listed by path"""
+        for rec in self:
+            if rec.backup_format == 'incremental' and \
+                    rec.backup_destination not in INCREMENTAL_DESTINATIONS:
+                raise ValidationError(_(
+                    "Incremental filestore backups are only available for "
+                    "Local Storage, FTP, SFTP and Amazon S3."))
+
     @api.constrains('db_name')
     def _check_db_credentials(self):
         """Validate entered database name and master password"""
@@ -581,496 +962,866 @@ class DbBackupConfigure(models.Model):
     def _schedule_auto_backup(self, frequency):
         """Function for generating and storing backup.
            Database backup for all the active records in backup configuration
-           model will be created."""
+           model will be created.
+
+           Records backing up the same database in the same format are
+           grouped: the database is dumped once and the dump is uploaded to
+           all their destinations concurrently, one thread per destination.
+           A failing destination does not affect the others."""
         records = self.search([('backup_frequency', '=', frequency)])
         mail_template_success = self.env.ref(
             'auto_database_backup.mail_template_data_db_backup_successful')
         mail_template_failed = self.env.ref(
             'auto_database_backup.mail_template_data_db_backup_failed')
+        groups = {}
         for rec in records:
+            jobs = rec.backup_jobs if rec.backup_format == 'directory' else 1
+            groups.setdefault((rec.db_name, rec.backup_format, jobs),
+                              self.browse())
+            groups[(rec.db_name, rec.backup_format, jobs)] |= rec
+        for (db_name, backup_format, jobs), group in groups.items():
             backup_time = fields.datetime.utcnow().strftime("%Y-%m-%d_%H-%M-%S")
-            backup_filename = f"{rec.db_name}_{backup_time}.{rec.backup_format}"
-            rec.backup_filename = backup_filename
-            # Local backup
-            if rec.backup_destination == 'local':
+            ready = self.browse()
+            for rec in group:
+                rec.backup_filename = f"{rec.db_name}_{backup_time}.{rec._get_backup_extension()}"
                 try:
-                    if not os.path.isdir(rec.backup_path):
-                        os.makedirs(rec.backup_path)
-                    backup_file = os.path.join(rec.backup_path,
-                                               backup_filename)
-                    f = open(backup_file, "wb")
-                    self.dump_data(rec.db_name, f, rec.backup_format, rec.backup_frequency)
-                    f.close()
-                    # Remove older backups
-                    if rec.auto_remove:
-                        for filename in os.listdir(rec.backup_path):
-                            file = os.path.join(rec.backup_path, filename)
-                            create_time = fields.datetime.fromtimestamp(
-                                os.path.getctime(file))
-                            backup_duration = fields.datetime.utcnow() - create_time
-                            if backup_duration.days >= rec.days_to_remove:
-                                os.remove(file)
-                    if rec.notify_user:
-                        mail_template_success.send_mail(rec.id, force_send=True)
+                    rec._prepare_backup_upload()
+                    ready |= rec
                 except Exception as e:
                     rec.generated_exception = e
-                    _logger.info('FTP Exception: %s', e)
+                    _logger.info('Backup Exception: %s', e)
                     if rec.notify_user:
                         mail_template_failed.send_mail(rec.id, force_send=True)
-            # FTP backup
-            elif rec.backup_destination == 'ftp':
-                try:
-                    ftp_server = ftplib.FTP()
-                    ftp_server.connect(rec.ftp_host, int(rec.ftp_port))
-                    ftp_server.login(rec.ftp_user, rec.ftp_password)
-                    ftp_server.encoding = "utf-8"
-                    temp = tempfile.NamedTemporaryFile(
-                        suffix='.%s' % rec.backup_format)
-                    try:
-                        ftp_server.cwd(rec.ftp_path)
-                    except ftplib.error_perm:
-                        ftp_server.mkd(rec.ftp_path)
-                        ftp_server.cwd(rec.ftp_path)
-                    with open(temp.name, "wb+") as tmp:
-                        self.dump_data(rec.db_name, tmp,
-                                                rec.backup_format, rec.backup_frequency)
-                    ftp_server.storbinary('STOR %s' % backup_filename,
-                                          open(temp.name, "rb"))
-                    if rec.auto_remove:
-                        files = ftp_server.nlst()
-                        for file in files:
-                            create_time = fields.datetime.strptime(
-                                ftp_server.sendcmd('MDTM ' + file)[4:],
-                                "%Y%m%d%H%M%S")
-                            diff_days = (
-                                    fields.datetime.now() - create_time).days
-                            if diff_days >= rec.days_to_remove:
-                                ftp_server.delete(file)
-                    ftp_server.quit()
-                    if rec.notify_user:
-                        mail_template_success.send_mail(rec.id,
-                                                        force_send=True)
-                except Exception as e:
-                    rec.generated_exception = e
-                    _logger.info('FTP Exception: %s', e)
-                    if rec.notify_user:
-                        mail_template_failed.send_mail(rec.id, force_send=True)
-            # SFTP backup
-            elif rec.backup_destination == 'sftp':
-                client = paramiko.SSHClient()
-                client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-                try:
-                    client.connect(hostname=rec.sftp_host,
-                                   username=rec.sftp_user,
-                                   password=rec.sftp_password,
-                                   port=rec.sftp_port)
-                    sftp = client.open_sftp()
-                    temp = tempfile.NamedTemporaryFile(
-                        suffix='.%s' % rec.backup_format)
-                    with open(temp.name, "wb+") as tmp:
-                        self.dump_data(rec.db_name, tmp, rec.backup_format, rec.backup_frequency)
-                    try:
-                        sftp.chdir(rec.sftp_path)
-                    except IOError as e:
-                        if e.errno == errno.ENOENT:
-                            sftp.mkdir(rec.sftp_path)
-                            sftp.chdir(rec.sftp_path)
-                    sftp.put(temp.name, backup_filename)
-                    if rec.auto_remove:
-                        files = sftp.listdir()
-                        expired = list(filter(
-                            lambda fl: (fields.datetime.now()
-                                        - fields.datetime.fromtimestamp(
-                                        sftp.stat(fl).st_mtime)).days >=
-                                       rec.days_to_remove, files))
-                        for file in expired:
-                            sftp.unlink(file)
-                    sftp.close()
-                    if rec.notify_user:
-                        mail_template_success.send_mail(rec.id,
-                                                        force_send=True)
-                except Exception as e:
-                    rec.generated_exception = e
-                    _logger.info('SFTP Exception: %s', e)
-                    if rec.notify_user:
-                        mail_template_failed.send_mail(rec.id, force_send=True)
-                finally:
-                    client.close()
-            # Google Drive backup
-            elif rec.backup_destination == 'google_drive':
-                try:
-                    if rec.gdrive_token_validity <= fields.Datetime.now():
-                        rec.generate_gdrive_refresh_token()
-                    temp = tempfile.NamedTemporaryFile(
-                        suffix='.%s' % rec.backup_format)
-                    with open(temp.name, "wb+") as tmp:
-                        self.dump_data(rec.db_name, tmp,
-                                                rec.backup_format, rec.backup_frequency)
-                    try:
-                        headers = {
-                            "Authorization": "Bearer %s" % rec.gdrive_access_token}
-                        para = {
-                            "name": backup_filename,
-                            "parents": [rec.google_drive_folder_key],
-                        }
-                        files = {
-                            'data': ('metadata', json.dumps(para),
-                                     'application/json; charset=UTF-8'),
-                            'file': open(temp.name, "rb")
-                        }
-                        requests.post(
-                            "https://www.googleapis.com/upload/drive/v3/files?uploadType=multipart",
-                            headers=headers,
-                            files=files
-                        )
-                        if rec.auto_remove:
-                            query = "parents = '%s'" % rec.google_drive_folder_key
-                            files_req = requests.get(
-                                "https://www.googleapis.com/drive/v3/files?q=%s" % query,
-                                headers=headers)
-                            for file in files_req.json()['files']:
-                                file_date_req = requests.get(
-                                    "https://www.googleapis.com/drive/v3/files/%s?fields=createdTime" %
-                                    file['id'], headers=headers)
-                                create_time = file_date_req.json()[
-                                                  'createdTime'][
-                                              :19].replace('T', ' ')
-                                diff_days = (
-                                        fields.datetime.now() - fields.datetime.strptime(
-                                    create_time, '%Y-%m-%d %H:%M:%S')).days
-                                if diff_days >= rec.days_to_remove:
-                                    requests.delete(
-                                        "https://www.googleapis.com/drive/v3/files/%s" %
-                                        file['id'], headers=headers)
-                        if rec.notify_user:
-                            mail_template_success.send_mail(rec.id,
-                                                            force_send=True)
-                    except Exception as e:
-
-                        rec.generated_exception = e
-                        _logger.info('Google Drive Exception: %s', e)
-                        if rec.notify_user:
-                            mail_template_failed.send_mail(rec.id,
-                                                           force_send=True)
-                except Exception:
-                    if rec.notify_user:
-                        mail_template_failed.send_mail(rec.id, force_send=True)
-                        raise ValidationError(
-                            'Please check the credentials before activation')
-                    else:
-                        raise ValidationError('Please check connection')
-            # Dropbox backup
-            elif rec.backup_destination == 'dropbox':
-                temp = tempfile.NamedTemporaryFile(
-                    suffix='.%s' % rec.backup_format)
-                with open(temp.name, "wb+") as tmp:
-                    self.dump_data(rec.db_name, tmp,
-                                            rec.backup_format, rec.backup_frequency)
-                try:
-                    dbx = dropbox.Dropbox(
-                        app_key=rec.dropbox_client_key,
-                        app_secret=rec.dropbox_client_secret,
-                        oauth2_refresh_token=rec.dropbox_refresh_token)
-                    dropbox_destination = (rec.dropbox_folder + '/' +
-                                           backup_filename)
-                    dbx.files_upload(temp.read(), dropbox_destination)
-                    if rec.auto_remove:
-                        files = dbx.files_list_folder(rec.dropbox_folder)
-                        file_entries = files.entries
-                        expired_files = list(filter(
-                            lambda fl: (fields.datetime.now() -
-                                        fl.client_modified).days >=
-                                       rec.days_to_remove,
-                            file_entries))
-                        for file in expired_files:
-                            dbx.files_delete_v2(file.path_display)
-                    if rec.notify_user:
-                        mail_template_success.send_mail(rec.id,
-                                                        force_send=True)
-                except Exception as error:
+            if not ready:
+                continue
+            # The upload threads use their own cursors, they must see the
+            # refreshed access tokens
+            self.env.cr.commit()
+            results = self._dump_and_upload(db_name, backup_format, frequency,
+                                            jobs, ready, backup_time)
+            for rec in ready:
+                error = results.get(rec.id)
+                if error:
                     rec.generated_exception = error
-                    _logger.info('Dropbox Exception: %s', error)
                     if rec.notify_user:
                         mail_template_failed.send_mail(rec.id, force_send=True)
-            # Onedrive Backup
-            elif rec.backup_destination == 'onedrive':
-                try:
-                    if rec.onedrive_token_validity <= fields.Datetime.now():
-                        rec.generate_onedrive_refresh_token()
+                elif rec.notify_user:
+                    mail_template_success.send_mail(rec.id, force_send=True)
 
-                    with tempfile.NamedTemporaryFile(suffix=f'.{rec.backup_format}') as temp:
-                        with open(temp.name, "wb+") as tmp:
-                            self.dump_data(rec.db_name, tmp, rec.backup_format, rec.backup_frequency)
+    def _prepare_backup_upload(self):
+        """Refresh the access tokens of the destination before the upload
+        threads start (they cannot write on the configuration)."""
+        self.ensure_one()
+        if self.backup_destination == 'google_drive':
+            if self.gdrive_token_validity <= fields.Datetime.now():
+                self.generate_gdrive_refresh_token()
+        elif self.backup_destination == 'onedrive':
+            if self.onedrive_token_validity <= fields.Datetime.now():
+                self.generate_onedrive_refresh_token()
 
-                        headers = {
-                            'Authorization': f'Bearer {rec.onedrive_access_token}',
-                            'Content-Type': 'application/json'
-                        }
+    def _dump_and_upload(self, db_name, backup_format, frequency, jobs,
+                         records, backup_time):
+        """Dump `db_name` once and upload the dump to the destination of
+        every record of `records` in parallel.
 
-                        upload_session_url = (
-                            f"{MICROSOFT_GRAPH_END_POINT}/v1.0/me/drive/items/"
-                            f"{rec.onedrive_folder_key}:/{backup_filename}:/createUploadSession"
-                        )
-
-                        upload_session = requests.post(upload_session_url, headers=headers)
-                        upload_session.raise_for_status()
-
-                        upload_url = upload_session.json().get('uploadUrl')
-                        if not upload_url:
-                            raise ValueError("Failed to get upload URL from OneDrive")
-
-                        file_size = os.path.getsize(temp.name)
-                        with open(temp.name, 'rb') as f:
-                            headers_upload = {
-                                'Content-Length': str(file_size),
-                                'Content-Range': f'bytes 0-{file_size - 1}/{file_size}'
-                            }
-                            upload_response = requests.put(upload_url, headers=headers_upload, data=f)
-                            upload_response.raise_for_status()
-
-
-                        if rec.auto_remove:
-                            verify_url = (
-                                f"{MICROSOFT_GRAPH_END_POINT}/v1.0/me/drive/items/"
-                                f"{rec.onedrive_folder_key}:/{backup_filename}"
-                            )
-                            verify_response = requests.get(verify_url, headers=headers)
-
-                            if verify_response.status_code == 200:
-                                list_url = (
-                                    f"{MICROSOFT_GRAPH_END_POINT}/v1.0/me/drive/items/"
-                                    f"{rec.onedrive_folder_key}/children"
-                                )
-                                response = requests.get(list_url, headers=headers)
-                                response.raise_for_status()
-
-                                files = response.json().get('value', [])
-                                current_time = fields.datetime.now()
-
-                                for file in files:
-                                    if file['name'] == backup_filename:
-                                        continue
-
-                                    create_time_str = file['createdDateTime'][:19].replace('T', ' ')
-                                    create_time = fields.datetime.strptime(create_time_str, '%Y-%m-%d %H:%M:%S')
-                                    diff_days = (current_time - create_time).days
-
-                                    if diff_days >= rec.days_to_remove:
-                                        delete_url = f"{MICROSOFT_GRAPH_END_POINT}/v1.0/me/drive/items/{file['id']}"
-                                        requests.delete(delete_url, headers=headers).raise_for_status()
-
-                        # Notify user on success
-                        if rec.notify_user:
-                            mail_template_success.send_mail(rec.id, force_send=True)
-
-                except requests.exceptions.RequestException as req_error:
-                    rec.generated_exception = str(req_error)
-                    _logger.error('OneDrive API Error: %s', req_error, exc_info=True)
-                    if rec.notify_user:
-                        mail_template_failed.send_mail(rec.id, force_send=True)
+        :return: dict {record id: exception or None}
+        """
+        results = {}
+        filestore_index = (FilestoreIndex(db_name, self._dump_db_manifest)
+                           if backup_format == 'incremental' else None)
+        tee = BackupStreamTee(len(records))
+        threads = []
+        for rec, reader in zip(records, tee.readers):
+            thread = threading.Thread(
+                target=self._run_backup_upload, daemon=True,
+                name='db-backup-upload-%s' % rec.id,
+                args=(rec.id, reader, rec.backup_filename, backup_time,
+                      results, filestore_index))
+            thread.start()
+            threads.append(thread)
+        error = None
+        try:
+            with self._backup_stream(db_name, backup_format, frequency,
+                                     jobs=jobs,
+                                     filestore_index=filestore_index) as stream:
+                tee.pump(stream)
+        except Exception as e:
+            _logger.info('Backup Exception: %s', e)
+            error = e
+        # The uploads are only completed once the dump is known to be
+        # complete, a failed dump makes every upload fail
+        tee.finish(error)
+        for thread in threads:
+            thread.join()
+        for rec in records:
+            results.setdefault(rec.id, error)
+        return results
 
-                except Exception as error:
-                    rec.generated_exception = str(error)
-                    _logger.error('OneDrive Backup Error: %s', error, exc_info=True)
-                    if rec.notify_user:
-                        mail_template_failed.send_mail(rec.id, force_send=True)
-            elif rec.backup_destination == 'next_cloud':
+    def _run_backup_upload(self, rec_id, stream, backup_filename, backup_time,
+                           results, filestore_index=None):
+        """Upload thread: upload `stream` to the destination of the record
+        `rec_id`, and store the outcome in `results`. For incremental
+        backups, the missing filestore blobs and the backup manifest are
+        uploaded once the dump is uploaded.
+
+        The upload can take hours: it runs on an in-memory copy of the
+        record (see _get_upload_record) and holds no database cursor, so no
+        transaction stays open on the database meanwhile."""
+        try:
+            rec = self._get_upload_record(rec_id)
+            rec._upload_backup(stream, backup_filename, backup_time)
+            if filestore_index:
+                rec._upload_filestore_blobs(filestore_index, backup_filename)
+            results[rec_id] = None
+        except Exception as e:
+            _logger.info('%s Backup Exception: %s', rec_id, e)
+            results[rec_id] = e
+        finally:
+            # Stop receiving the dump if the upload failed
+            stream.close()
+
+    def _get_upload_record(self, rec_id):
+        """Return an in-memory copy of the configuration `rec_id`, whose
+        field values are read with a short-lived cursor. The upload methods
+        only use field values; any database access on the copy fails, its
+        cursor being closed."""
+        with self.env.registry.cursor() as cr:
+            env = api.Environment(cr, self.env.uid, self.env.context)
+            rec = env[self._name].browse(rec_id)
+            field_names = [
+                name for name, field in rec._fields.items()
+                if field.store and name != 'id'
+                and field.type not in ('one2many', 'many2many', 'binary')]
+            values = rec.read(field_names, load=False)[0]
+            values.pop('id', None)
+            # Resolved while the cursor is open, the translated error
+            # messages of the upload need it
+            env.lang
+        return env[self._name].new(values)
+
+    def _upload_backup(self, stream, backup_filename, backup_time):
+        """Upload the backup read from `stream` to the destination of the
+        record and remove the old backups if required."""
+        self.ensure_one()
+        upload = getattr(self, '_upload_backup_%s' % self.backup_destination)
+        upload(stream, backup_filename, backup_time)
+
+    def _upload_backup_local(self, stream, backup_filename, backup_time):
+        """Local backup"""
+        if not os.path.isdir(self.backup_path):
+            os.makedirs(self.backup_path)
+        backup_file = os.path.join(self.backup_path, backup_filename)
+        # Written under a temporary name and renamed once the dump is
+        # complete, a failed dump never leaves a truncated backup
+        try:
+            with open(backup_file + '.part', "wb") as f:
+                shutil.copyfileobj(stream, f, BACKUP_CHUNK_SIZE)
+        except Exception:
+            if os.path.exists(backup_file + '.part'):
+                os.remove(backup_file + '.part')
+            raise
+        os.replace(backup_file + '.part', backup_file)
+        # Remove older backups
+        if self.auto_remove:
+            for filename in os.listdir(self.backup_path):
+                file = os.path.join(self.backup_path, filename)
+                # The filestore blobs of incremental backups are kept
+                if os.path.isdir(file):
+                    continue
+                create_time = fields.datetime.fromtimestamp(
+                    os.path.getctime(file))
+                backup_duration = fields.datetime.utcnow() - create_time
+                if backup_duration.days >= self.days_to_remove:
+                    os.remove(file)
+
+    def _connect_ftp(self):
+        """Return an FTP connection in the FTP path, created if needed"""
+        ftp_server = ftplib.FTP()
+        ftp_server.connect(self.ftp_host, int(self.ftp_port))
+        ftp_server.login(self.ftp_user, self.ftp_password)
+        ftp_server.encoding = "utf-8"
+        try:
+            ftp_server.cwd(self.ftp_path)
+        except ftplib.error_perm:
+            ftp_server.mkd(self.ftp_path)
+            ftp_server.cwd(self.ftp_path)
+        return ftp_server
+
+    def _upload_backup_ftp(self, stream, backup_filename, backup_time):
+        """FTP backup"""
+        ftp_server = self._connect_ftp()
+        # Uploaded under a temporary name and renamed once the dump is
+        # complete, a failed dump never leaves a truncated backup
+        try:
+            ftp_server.storbinary('STOR %s.part' % backup_filename, stream,
+                                  blocksize=BACKUP_CHUNK_SIZE)
+        except Exception:
+            try:
+                ftp_server.delete(backup_filename + '.part')
+            except ftplib.all_errors:
+                pass
+            ftp_server.close()
+            raise
+        ftp_server.rename(backup_filename + '.part', backup_filename)
+        if self.auto_remove:
+            files = ftp_server.nlst()
+            for file in files:
+                # The filestore blobs of incremental backups are kept
+                if file == FILESTORE_BLOB_DIR:
+                    continue
+                create_time = fields.datetime.strptime(
+                    ftp_server.sendcmd('MDTM ' + file)[4:],
+                    "%Y%m%d%H%M%S")
+                diff_days = (
+                        fields.datetime.now() - create_time).days
+                if diff_days >= self.days_to_remove:
+                    ftp_server.delete(file)
+        ftp_server.quit()
+
+    def _connect_sftp(self, client):
+        """Connect the SSH `client` and return an SFTP session in the SFTP
+        path, created if needed"""
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        client.connect(hostname=self.sftp_host,
+                       username=self.sftp_user,
+                       password=self.sftp_password,
+                       port=self.sftp_port)
+        sftp = client.open_sftp()
+        try:
+            sftp.chdir(self.sftp_path)
+        except IOError as e:
+            if e.errno == errno.ENOENT:
+                sftp.mkdir(self.sftp_path)
+                sftp.chdir(self.sftp_path)
+        return sftp
+
+    def _upload_backup_sftp(self, stream, backup_filename, backup_time):
+        """SFTP backup"""
+        client = paramiko.SSHClient()
+        try:
+            sftp = self._connect_sftp(client)
+            # Uploaded under a temporary name and renamed once the dump is
+            # complete, a failed dump never leaves a truncated backup
+            try:
+                sftp.putfo(stream, backup_filename + '.part')
+            except Exception:
                 try:
-                    if rec.domain and rec.next_cloud_password and \
-                            rec.next_cloud_user_name:
-                        try:
-                            # Connect to NextCloud using the provided username
-                            # and password
-                            ncx = NextCloud(rec.domain,
-                                            auth=HTTPBasicAuth(
-                                                rec.next_cloud_user_name,
-                                                rec.next_cloud_password))
-                            # Connect to NextCloud again to perform additional
-                            # operations
-                            nc = nextcloud_client.Client(rec.domain)
-                            nc.login(rec.next_cloud_user_name,
-                                     rec.next_cloud_password)
-                            # Get the folder name from the NextCloud folder ID
-                            folder_name = rec.nextcloud_folder_key
-                            # If auto_remove is enabled, remove backup files
-                            # older than specified days
-                            if rec.auto_remove:
-                                folder_path = "/" + folder_name
-                                for item in nc.list(folder_path):
-                                    backup_file_name = item.path.split("/")[-1]
-                                    backup_date_str = \
-                                        backup_file_name.split("_")[1]
-                                    backup_date = fields.datetime.strptime(
-                                        backup_date_str, '%Y-%m-%d').date()
-                                    if (fields.date.today() - backup_date).days \
-                                            >= rec.days_to_remove:
-                                        nc.delete(item.path)
-                            # If notify_user is enabled, send a success email
-                            # notification
-                            if rec.notify_user:
-                                mail_template_success.send_mail(rec.id,
-                                                                force_send=True)
-                        except Exception as error:
-                            rec.generated_exception = error
-                            _logger.info('NextCloud Exception: %s', error)
-                            if rec.notify_user:
-                                # If an exception occurs, send a failed email
-                                # notification
-                                mail_template_failed.send_mail(rec.id,
-                                                               force_send=True)
-                        # Get the list of folders in the root directory of NextCloud
-                        data = ncx.list_folders('/').__dict__
-                        folders = [
-                            [file_name['href'].split('/')[-2],
-                             file_name['file_id']]
-                            for file_name in data['data'] if
-                            file_name['href'].endswith('/')]
-                        # If the folder name is not found in the list of folders,
-                        # create the folder
-                        if folder_name not in [file[0] for file in folders]:
-                            nc.mkdir(folder_name)
-                            # Dump the database to a temporary file
-                            temp = tempfile.NamedTemporaryFile(
-                                suffix='.%s' % rec.backup_format)
-                            with open(temp.name, "wb+") as tmp:
-                                self.dump_data(rec.db_name, tmp,
-                                                        rec.backup_format, rec.backup_frequency)
-                            backup_file_name = temp.name
-                            remote_file_path = f"/{folder_name}/{rec.db_name}_" \
-                                               f"{backup_time}.{rec.backup_format}"
-                            nc.put_file(remote_file_path, backup_file_name)
-                        else:
-                            # Dump the database to a temporary file
-                            temp = tempfile.NamedTemporaryFile(
-                                suffix='.%s' % rec.backup_format)
-                            with open(temp.name, "wb+") as tmp:
-                                self.dump_data(rec.db_name, tmp,
-                                                        rec.backup_format, rec.backup_frequency)
-                            backup_file_name = temp.name
-                            remote_file_path = f"/{folder_name}/{rec.db_name}_" \
-                                               f"{backup_time}.{rec.backup_format}"
-                            nc.put_file(remote_file_path, backup_file_name)
-                except Exception:
-                    raise ValidationError('Please check connection')
-            # Amazon S3 Backup
-            elif rec.backup_destination == 'amazon_s3':
-                if rec.aws_access_key and rec.aws_secret_access_key:
-                    try:
-                        # Create a boto3 client for Amazon S3 with provided
-                        # access key id and secret access key
-                        bo3 = boto3.client(
-                            's3',
-                            aws_access_key_id=rec.aws_access_key,
-                            aws_secret_access_key=rec.aws_secret_access_key)
-                        # If auto_remove is enabled, remove the backups that
-                        # are older than specified days from the S3 bucket
-                        if rec.auto_remove:
-                            folder_path = rec.aws_folder_name
-                            response = bo3.list_objects(
-                                Bucket=rec.bucket_file_name,
-                                Prefix=folder_path)
-                            today = fields.date.today()
-                            for file in response['Contents']:
-                                file_path = file['Key']
-                                last_modified = file['LastModified']
-                                date = last_modified.date()
-                                age_in_days = (today - date).days
-                                if age_in_days >= rec.days_to_remove:
-                                    bo3.delete_object(
-                                        Bucket=rec.bucket_file_name,
-                                        Key=file_path)
-                        # Create a boto3 resource for Amazon S3 with provided
-                        # access key id and secret access key
-                        s3 = boto3.resource(
-                            's3',
-                            aws_access_key_id=rec.aws_access_key,
-                            aws_secret_access_key=rec.aws_secret_access_key)
-                        # Create a folder in the specified bucket, if it
-                        # doesn't already exist
-                        s3.Object(rec.bucket_file_name,
-                                  rec.aws_folder_name + '/').put()
-                        bucket = s3.Bucket(rec.bucket_file_name)
-                        # Get all the prefixes in the bucket
-                        prefixes = set()
-                        for obj in bucket.objects.all():
-                            key = obj.key
-                            if key.endswith('/'):
-                                prefix = key[:-1]  # Remove the trailing slash
-                                prefixes.add(prefix)
-                        # If the specified folder is present in the bucket,
-                        # take a backup of the database and upload it to the
-                        # S3 bucket
-                        if rec.aws_folder_name in prefixes:
-                            temp = tempfile.NamedTemporaryFile(
-                                suffix='.%s' % rec.backup_format)
-                            with open(temp.name, "wb+") as tmp:
-                                self.dump_data(rec.db_name, tmp,
-                                                        rec.backup_format, rec.backup_frequency)
-                            backup_file_name = temp.name
-                            remote_file_path = f"{rec.aws_folder_name}/{rec.db_name}_" \
-                                               f"{backup_time}.{rec.backup_format}"
-                            s3.Object(rec.bucket_file_name,
-                                      remote_file_path).upload_file(
-                                backup_file_name)
-                            # If notify_user is enabled, send an email to the
-                            # user notifying them about the successful backup
-                            if rec.notify_user:
-                                mail_template_success.send_mail(rec.id,
-                                                                force_send=True)
-                    except Exception as error:
-                        # If any error occurs, set the 'generated_exception'
-                        # field to the error message and log the error
-                        rec.generated_exception = error
-                        _logger.info('Amazon S3 Exception: %s', error)
-                        # If notify_user is enabled, email the user
-                        # notifying them about the failed backup
-                        if rec.notify_user:
-                            mail_template_failed.send_mail(rec.id, force_send=True)
-
-    def dump_data(self, db_name, stream, backup_format, backup_frequency):
+                    sftp.remove(backup_filename + '.part')
+                except IOError:
+                    pass
+                raise
+            sftp.posix_rename(backup_filename + '.part', backup_filename)
+            if self.auto_remove:
+                # The filestore blobs of incremental backups are kept
+                files = [fl for fl in sftp.listdir()
+                         if fl != FILESTORE_BLOB_DIR]
+                expired = list(filter(
+                    lambda fl: (fields.datetime.now()
+                                - fields.datetime.fromtimestamp(
+                                sftp.stat(fl).st_mtime)).days >=
+                               self.days_to_remove, files))
+                for file in expired:
+                    sftp.unlink(file)
+            sftp.close()
+        finally:
+            client.close()
+
+    def _upload_backup_google_drive(self, stream, backup_filename,
+                                    backup_time):
+        """Google Drive backup"""
+        headers = {
+            "Authorization": "Bearer %s" % self.gdrive_access_token}
+        self._gdrive_upload_stream(stream, backup_filename)
+        if self.auto_remove:
+            query = "parents = '%s'" % self.google_drive_folder_key
+            files_req = requests.get(
+                "https://www.googleapis.com/drive/v3/files?q=%s" % query,
+                headers=headers)
+            for file in files_req.json()['files']:
+                file_date_req = requests.get(
+                    "https://www.googleapis.com/drive/v3/files/%s?fields=createdTime" %
+                    file['id'], headers=headers)
+                create_time = file_date_req.json()[
+                                  'createdTime'][
+                              :19].replace('T', ' ')
+                diff_days = (
+                        fields.datetime.now() - fields.datetime.strptime(
+                    create_time, '%Y-%m-%d %H:%M:%S')).days
+                if diff_days >= self.days_to_remove:
+                    requests.delete(
+                        "https://www.googleapis.com/drive/v3/files/%s" %
+                        file['id'], headers=headers)
+
+    def _upload_backup_dropbox(self, stream, backup_filename, backup_time):
+        """Dropbox backup"""
+        dbx = dropbox.Dropbox(
+            app_key=self.dropbox_client_key,
+            app_secret=self.dropbox_client_secret,
+            oauth2_refresh_token=self.dropbox_refresh_token)
+        dropbox_destination = (self.dropbox_folder + '/' +
+                               backup_filename)
+        self._dropbox_upload_stream(dbx, stream, dropbox_destination)
+        if self.auto_remove:
+            files = dbx.files_list_folder(self.dropbox_folder)
+            file_entries = files.entries
+            expired_files = list(filter(
+                lambda fl: (fields.datetime.now() -
+                            fl.client_modified).days >=
+                           self.days_to_remove,
+                file_entries))
+            for file in expired_files:
+                dbx.files_delete_v2(file.path_display)
+
+    def _upload_backup_onedrive(self, stream, backup_filename, backup_time):
+        """Onedrive Backup"""
+        # OneDrive upload sessions need the total size in every
+        # fragment, so the dump is spooled to a temporary file
+        with tempfile.NamedTemporaryFile(suffix=f'.{self._get_backup_extension()}') as temp:
+            with open(temp.name, "wb+") as tmp:
+                shutil.copyfileobj(stream, tmp, BACKUP_CHUNK_SIZE)
+            self._onedrive_upload_file(temp.name, backup_filename)
+
+        headers = {
+            'Authorization': f'Bearer {self.onedrive_access_token}',
+            'Content-Type': 'application/json'
+        }
+        if self.auto_remove:
+            verify_url = (
+                f"{MICROSOFT_GRAPH_END_POINT}/v1.0/me/drive/items/"
+                f"{self.onedrive_folder_key}:/{backup_filename}"
+            )
+            verify_response = requests.get(verify_url, headers=headers)
+
+            if verify_response.status_code == 200:
+                list_url = (
+                    f"{MICROSOFT_GRAPH_END_POINT}/v1.0/me/drive/items/"
+                    f"{self.onedrive_folder_key}/children"
+                )
+                response = requests.get(list_url, headers=headers)
+                response.raise_for_status()
+
+                files = response.json().get('value', [])
+                current_time = fields.datetime.now()
+
+                for file in files:
+                    if file['name'] == backup_filename:
+                        continue
+
+                    create_time_str = file['createdDateTime'][:19].replace('T', ' ')
+                    create_time = fields.datetime.strptime(create_time_str, '%Y-%m-%d %H:%M:%S')
+                    diff_days = (current_time - create_time).days
+
+                    if diff_days >= self.days_to_remove:
+                        delete_url = f"{MICROSOFT_GRAPH_END_POINT}/v1.0/me/drive/items/{file['id']}"
+                        requests.delete(delete_url, headers=headers).raise_for_status()
+
+    def _upload_backup_next_cloud(self, stream, backup_filename, backup_time):
+        """NextCloud backup"""
+        if not (self.domain and self.next_cloud_password and
+                self.next_cloud_user_name):
+            raise UserError(_("Please check the NextCloud credentials."))
+        # Connect to NextCloud using the provided username
+        # and password
+        ncx = NextCloud(self.domain,
+                        auth=HTTPBasicAuth(
+                            self.next_cloud_user_name,
+                            self.next_cloud_password))
+        # Connect to NextCloud again to perform additional
+        # operations
+        nc = nextcloud_client.Client(self.domain)
+        nc.login(self.next_cloud_user_name,
+                 self.next_cloud_password)
+        # Get the folder name from the NextCloud folder ID
+        folder_name = self.nextcloud_folder_key
+        # If auto_remove is enabled, remove backup files
+        # older than specified days
+        if self.auto_remove:
+            folder_path = "/" + folder_name
+            for item in nc.list(folder_path):
+                backup_file_name = item.path.split("/")[-1]
+                backup_date_str = \
+                    backup_file_name.split("_")[1]
+                backup_date = fields.datetime.strptime(
+                    backup_date_str, '%Y-%m-%d').date()
+                if (fields.date.today() - backup_date).days \
+                        >= self.days_to_remove:
+                    nc.delete(item.path)
+        # Get the list of folders in the root directory of NextCloud
+        data = ncx.list_folders('/').__dict__
+        folders = [
+            [file_name['href'].split('/')[-2],
+             file_name['file_id']]
+            for file_name in data['data'] if
+            file_name['href'].endswith('/')]
+        # If the folder name is not found in the list of folders,
+        # create the folder
+        if folder_name not in [file[0] for file in folders]:
+            nc.mkdir(folder_name)
+        # Stream the dump to NextCloud in chunks
+        remote_file_path = f"/{folder_name}/{self.db_name}_" \
+                           f"{backup_time}.{self._get_backup_extension()}"
+        self._nextcloud_upload_stream(stream, remote_file_path)
+
+    def _upload_backup_amazon_s3(self, stream, backup_filename, backup_time):
+        """Amazon S3 Backup"""
+        if not (self.aws_access_key and self.aws_secret_access_key):
+            raise UserError(_("Please check the Amazon S3 credentials."))
+        # Create a boto3 client for Amazon S3 with provided
+        # access key id and secret access key
+        bo3 = boto3.client(
+            's3',
+            aws_access_key_id=self.aws_access_key,
+            aws_secret_access_key=self.aws_secret_access_key)
+        # If auto_remove is enabled, remove the backups that
+        # are older than specified days from the S3 bucket
+        if self.auto_remove:
+            folder_path = self.aws_folder_name
+            today = fields.date.today()
+            # Only the keys directly in the folder are listed: the filestore
+            # blobs of incremental backups, kept, are grouped under their
+            # folder prefix. Listed by pages, a listing returns at most 1000
+            # keys.
+            paginator = bo3.get_paginator('list_objects_v2')
+            pages = paginator.paginate(Bucket=self.bucket_file_name,
+                                       Prefix=folder_path + '/',
+                                       Delimiter='/')
+            for file in (obj for page in pages
+                         for obj in page.get('Contents', [])):
+                file_path = file['Key']
+                last_modified = file['LastModified']
+                date = last_modified.date()
+                age_in_days = (today - date).days
+                if age_in_days >= self.days_to_remove:
+                    bo3.delete_object(
+                        Bucket=self.bucket_file_name,
+                        Key=file_path)
+        # Create a boto3 resource for Amazon S3 with provided
+        # access key id and secret access key
+        s3 = boto3.resource(
+            's3',
+            aws_access_key_id=self.aws_access_key,
+            aws_secret_access_key=self.aws_secret_access_key)
+        # Create a folder in the specified bucket, if it
+        # doesn't already exist
+        s3.Object(self.bucket_file_name,
+                  self.aws_folder_name + '/').put()
+        remote_file_path = f"{self.aws_folder_name}/{self.db_name}_" \
+                           f"{backup_time}.{self._get_backup_extension()}"
+        # upload_fileobj reads the stream in multipart
+        # chunks, the dump is never stored locally
+        s3.Object(self.bucket_file_name,
+                  remote_file_path).upload_fileobj(stream)
+
+    def _open_blob_store(self):
+        """Return the store of the filestore files of incremental backups
+        at the destination of the record"""
+        self.ensure_one()
+        if self.backup_destination == 'local':
+            return LocalBlobStore(self.backup_path)
+        if self.backup_destination == 'ftp':
+            return FtpBlobStore(self._connect_ftp())
+        if self.backup_destination == 'sftp':
+            client = paramiko.SSHClient()
+            try:
+                return SftpBlobStore(client, self._connect_sftp(client))
+            except Exception:
+                client.close()
+                raise
+        if self.backup_destination == 'amazon_s3':
+            return S3BlobStore(
+                boto3.client(
+                    's3',
+                    aws_access_key_id=self.aws_access_key,
+                    aws_secret_access_key=self.aws_secret_access_key),
+                self.bucket_file_name, self.aws_folder_name)
+        raise UserError(_("Incremental filestore backups are not available "
+                          "for this destination."))
+
+    def _upload_filestore_blobs(self, filestore_index, backup_filename):
+        """Upload the filestore files referenced by the backup which are not
+        yet at the destination, then the manifest of the backup listing
+        them. Files are named by their SHA-1, a file present at the
+        destination never needs to be uploaded again."""
+        self.ensure_one()
+        blobs = filestore_index.get()
+        store = self._open_blob_store()
+        try:
+            existing = store.list_blobs()
+            missing = [name for name in blobs if name not in existing]
+            for name in missing:
+                path = os.path.join(filestore_index.filestore, name)
+                if not os.path.isfile(path):
+                    # Attachment deleted and its file garbage collected
+                    # after the dump snapshot: the backup would be missing
+                    # a file referenced by its dump
+                    raise UserError(_("The filestore file %s of the backup "
+                                      "was removed during the backup.", name))
+                store.upload_blob(name, path)
+            manifest = dict(filestore_index.manifest,
+                            dump=backup_filename, filestore=blobs)
+            store.upload_bytes(
+                backup_filename.rsplit('.', 1)[0] + '.manifest.json',
+                json.dumps(manifest, indent=4).encode())
+        finally:
+            store.close()
+        _logger.info('Incremental filestore backup %s: %s files, %s uploaded',
+                     backup_filename, len(blobs), len(missing))
+
+    @api.model
+    def restore_incremental_backup(self, master_pwd, db_name, dump_file,
+                                   manifest_file, blob_dir):
+        """Restore an incremental filestore backup into the new database
+        `db_name`.
+
+        :param master_pwd: master password of the server
+        :param db_name: name of the database to create
+        :param dump_file: path of the backup dump
+        :param manifest_file: path of the manifest of the backup
+        :param blob_dir: local copy of the filestore folder of the
+                         destination
+        """
+        odoo.service.db.check_super(master_pwd)
+        if db_name in db.list_dbs(force=True):
+            raise UserError(_("Database %s already exists.", db_name))
+        with open(manifest_file) as f:
+            manifest = json.load(f)
+        # The manifest is read from the destination, never join paths
+        # leaving the filestore (or the blob folder) to it
+        invalid = [name for name in manifest.get('filestore', [])
+                   if not is_filestore_path(name)]
+        if invalid:
+            raise UserError(_("The manifest of the backup contains invalid "
+                              "filestore paths, e.g. %s", invalid[0]))
+        missing = [name for name in manifest.get('filestore', [])
+                   if not os.path.isfile(os.path.join(blob_dir, name))]
+        if missing:
+            raise UserError(_("%s filestore files of the backup are missing, "
+                              "e.g. %s", len(missing), missing[0]))
+        _logger.info('RESTORE DB: %s from incremental backup', db_name)
+        db._create_empty_database(db_name)
+        try:
+            subprocess.run([find_pg_tool('pg_restore'), '--no-owner',
+                            '--dbname=' + db_name, dump_file],
+                           env=exec_pg_environ(), stdout=subprocess.DEVNULL,
+                           stderr=subprocess.STDOUT, check=True)
+            filestore = odoo.tools.config.filestore(db_name)
+            for name in manifest.get('filestore', []):
+                target = os.path.join(filestore, name)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                shutil.copyfile(os.path.join(blob_dir, name), target)
+        except Exception:
+            db.exp_drop(db_name)
+            raise
+        return True
+
+    def dump_data(self, db_name, stream, backup_format, backup_frequency,
+                  jobs=1):
         """Dump database `db` into file-like object `stream` if stream is None
         return a file object with the dump. """
+        self._check_backup_user(backup_frequency)
+        if stream:
+            self._write_dump(db_name, stream, backup_format, jobs=jobs)
+        else:
+            t = tempfile.TemporaryFile()
+            self._write_dump(db_name, t, backup_format, jobs=jobs)
+            t.seek(0)
+            return t
+
+    def _check_backup_user(self, backup_frequency):
+        """Backups may only be taken by the user of the backup cron job."""
         cron_user_id = self.env.ref(f'auto_database_backup.ir_cron_auto_db_backup_{backup_frequency}').user_id.id
         if cron_user_id != self.env.user.id:
             _logger.error(
                 'Unauthorized database operation. Backups should only be available from the cron job.')
             raise ValidationError("Unauthorized database operation. Backups should only be available from the cron job.")
+
+    def _write_dump(self, db_name, stream, backup_format, jobs=1,
+                    filestore_index=None):
+        """Write the backup of `db_name` into the writable file-like object
+        `stream`. pg_dump output is copied in bounded chunks, so the dump is
+        never held in memory. Does not use the environment, so it can run in
+        a separate thread (see _backup_stream).
+
+        The directory format runs pg_dump with `jobs` parallel workers into a
+        temporary directory, then writes it to `stream` as a tar archive
+        containing the `dump` directory and `manifest.json`.
+
+        The incremental format dumps the database in the snapshot in which
+        `filestore_index` lists the filestore files of the backup."""
         _logger.info('DUMP DB: %s format %s', db_name, backup_format)
         cmd = [find_pg_tool('pg_dump'), '--no-owner', db_name]
         env = exec_pg_environ()
         if backup_format == 'zip':
+            # The SQL dump, the manifest and the filestore files are written
+            # straight into the archive from their original location, the
+            # filestore is not copied to a temporary directory
+            filestore = odoo.tools.config.filestore(db_name)
+            with zipfile.ZipFile(stream, 'w', compression=zipfile.ZIP_DEFLATED,
+                                 allowZip64=True) as zf:
+                # The size of the dump is unknown when the entry starts
+                with zf.open('dump.sql', 'w', force_zip64=True) as entry:
+                    self._copy_pg_dump(cmd, env, entry)
+                zf.writestr('manifest.json',
+                            json.dumps(self._get_dump_manifest(db_name),
+                                       indent=4))
+                for root, dirs, files in os.walk(filestore):
+                    dirs.sort()
+                    for file_name in sorted(files):
+                        path = os.path.join(root, file_name)
+                        arcname = os.path.join(
+                            'filestore', os.path.relpath(path, filestore))
+                        zf.write(path, arcname, compress_type=(
+                            zipfile.ZIP_STORED if is_compressed_file(path)
+                            else zipfile.ZIP_DEFLATED))
+        elif backup_format == 'directory':
             with tempfile.TemporaryDirectory() as dump_dir:
-                filestore = odoo.tools.config.filestore(db_name)
-                cmd.insert(-1,'--file=' + os.path.join(dump_dir, 'dump.sql'))
+                cmd.insert(-1, '--format=directory')
+                cmd.insert(-1, '--jobs=%d' % max(jobs, 1))
+                cmd.insert(-1, '--file=' + os.path.join(dump_dir, 'dump'))
                 subprocess.run(cmd, env=env, stdout=subprocess.DEVNULL,
                                stderr=subprocess.STDOUT, check=True)
-                if os.path.exists(filestore):
-                    shutil.copytree(filestore,
-                                    os.path.join(dump_dir, 'filestore'))
-                with open(os.path.join(dump_dir, 'manifest.json'), 'w') as fh:
-                    db = odoo.sql_db.db_connect(db_name)
-                    with db.cursor() as cr:
-                        json.dump(self._dump_db_manifest(cr), fh, indent=4)
-                if stream:
-                    odoo.tools.osutil.zip_dir(dump_dir, stream,
-                                              include_dir=False,
-                                              fnct_sort=lambda
-                                                  file_name: file_name != 'dump.sql')
-                else:
-                    t = tempfile.TemporaryFile()
-                    odoo.tools.osutil.zip_dir(dump_dir, t, include_dir=False,
-                                              fnct_sort=lambda
-                                                  file_name: file_name != 'dump.sql')
-                    t.seek(0)
-                    return t
+                manifest = json.dumps(self._get_dump_manifest(db_name),
+                                      indent=4).encode()
+                # Stream mode: the archive is written sequentially, stream
+                # does not need to be seekable
+                with tarfile.open(fileobj=stream, mode='w|',
+                                  bufsize=BACKUP_CHUNK_SIZE) as tar:
+                    info = tarfile.TarInfo('manifest.json')
+                    info.size = len(manifest)
+                    info.mtime = int(time.time())
+                    tar.addfile(info, io.BytesIO(manifest))
+                    tar.add(os.path.join(dump_dir, 'dump'), arcname='dump')
+        elif backup_format == 'incremental' and filestore_index:
+            with filestore_index.snapshot() as snapshot_id:
+                cmd.insert(-1, '--format=c')
+                cmd.insert(-1, '--snapshot=' + snapshot_id)
+                self._copy_pg_dump(cmd, env, stream)
         else:
             cmd.insert(-1,'--format=c')
-            process = subprocess.Popen(cmd, env=env, stdout=subprocess.PIPE)
-            stdout, _ = process.communicate()
-            if stream:
-                stream.write(stdout)
+            self._copy_pg_dump(cmd, env, stream)
+
+    def _copy_pg_dump(self, cmd, env, stream):
+        """Run the pg_dump command `cmd` and copy its output into `stream`
+        in bounded chunks"""
+        process = subprocess.Popen(cmd, env=env, stdout=subprocess.PIPE)
+        try:
+            shutil.copyfileobj(process.stdout, stream, BACKUP_CHUNK_SIZE)
+            process.stdout.close()
+            if process.wait():
+                raise subprocess.CalledProcessError(process.returncode, cmd)
+        finally:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+
+    def _get_dump_manifest(self, db_name):
+        """Return the manifest of the dump of `db_name`"""
+        db = odoo.sql_db.db_connect(db_name)
+        with db.cursor() as cr:
+            return self._dump_db_manifest(cr)
+
+    @contextmanager
+    def _backup_stream(self, db_name, backup_format, backup_frequency,
+                       jobs=1, filestore_index=None):
+        """Yield a readable file-like object producing the backup of
+        `db_name`, so destinations can upload it while it is being dumped.
+
+        The dump is written by a separate thread into an OS pipe, so memory
+        use is bounded by the pipe buffer and the upload chunk size, and no
+        local copy of the backup is made. If the dump fails, the error is
+        raised when the context exits, after the upload consumed the stream.
+        """
+        self._check_backup_user(backup_frequency)
+        read_fd, write_fd = os.pipe()
+        reader = os.fdopen(read_fd, 'rb')
+        writer = os.fdopen(write_fd, 'wb')
+        errors = []
+
+        def produce():
+            try:
+                self._write_dump(db_name, writer, backup_format, jobs=jobs,
+                                 filestore_index=filestore_index)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                try:
+                    writer.close()
+                except OSError:
+                    # The reader was closed before the end of the dump
+                    pass
+
+        thread = threading.Thread(target=produce, daemon=True,
+                                  name='db-backup-dump-%s' % db_name)
+        thread.start()
+        try:
+            yield reader
+        finally:
+            # Closing the reader makes the dump fail with a broken pipe if the
+            # upload stopped early, so the thread always terminates.
+            reader.close()
+            thread.join()
+        if errors:
+            raise errors[0]
+
+    def _gdrive_upload_stream(self, stream, backup_filename):
+        """Upload `stream` to Google Drive with a resumable upload session,
+        sending it in chunks of BACKUP_CHUNK_SIZE. The total size is only
+        known, and sent, with the last chunk."""
+        headers = {"Authorization": "Bearer %s" % self.gdrive_access_token}
+        para = {
+            "name": backup_filename,
+            "parents": [self.google_drive_folder_key],
+        }
+        session = requests.post(
+            GOOGLE_API_BASE_URL + "/upload/drive/v3/files?uploadType=resumable",
+            headers=dict(headers, **{
+                'Content-Type': 'application/json; charset=UTF-8'}),
+            data=json.dumps(para))
+        session.raise_for_status()
+        upload_url = session.headers['Location']
+        offset = 0
+        chunk = read_chunk(stream)
+        while True:
+            next_chunk = read_chunk(stream) if len(chunk) == BACKUP_CHUNK_SIZE else b''
+            end = offset + len(chunk)
+            total = '*' if next_chunk else str(end)
+            content_range = (f'bytes {offset}-{end - 1}/{total}' if chunk
+                             else f'bytes */{total}')
+            response = requests.put(upload_url, data=chunk, headers=dict(
+                headers, **{'Content-Range': content_range}))
+            if not next_chunk:
+                response.raise_for_status()
+                return
+            if response.status_code != 308:
+                response.raise_for_status()
+                raise UserError(_("Unexpected Google Drive upload response: %s",
+                                  response.status_code))
+            offset = end
+            chunk = next_chunk
+
+    def _dropbox_upload_stream(self, dbx, stream, dropbox_destination):
+        """Upload `stream` to Dropbox with an upload session, one chunk of
+        BACKUP_CHUNK_SIZE at a time."""
+        chunk = read_chunk(stream)
+        session = dbx.files_upload_session_start(chunk)
+        cursor = dropbox.files.UploadSessionCursor(
+            session_id=session.session_id, offset=len(chunk))
+        last_chunk = b''
+        while len(chunk) == BACKUP_CHUNK_SIZE:
+            chunk = read_chunk(stream)
+            if len(chunk) < BACKUP_CHUNK_SIZE:
+                last_chunk = chunk
+                break
+            dbx.files_upload_session_append_v2(chunk, cursor)
+            cursor.offset += len(chunk)
+        dbx.files_upload_session_finish(
+            last_chunk, cursor,
+            dropbox.files.CommitInfo(path=dropbox_destination))
+
+    def _onedrive_upload_file(self, file_path, backup_filename):
+        """Upload the local file `file_path` to OneDrive with an upload
+        session, in fragments of BACKUP_CHUNK_SIZE (OneDrive rejects
+        fragments above 60 MiB)."""
+        headers = {
+            'Authorization': f'Bearer {self.onedrive_access_token}',
+            'Content-Type': 'application/json'
+        }
+        upload_session_url = (
+            f"{MICROSOFT_GRAPH_END_POINT}/v1.0/me/drive/items/"
+            f"{self.onedrive_folder_key}:/{backup_filename}:/createUploadSession"
+        )
+        upload_session = requests.post(upload_session_url, headers=headers)
+        upload_session.raise_for_status()
+        upload_url = upload_session.json().get('uploadUrl')
+        if not upload_url:
+            raise ValueError("Failed to get upload URL from OneDrive")
+        file_size = os.path.getsize(file_path)
+        with open(file_path, 'rb') as f:
+            offset = 0
+            while True:
+                chunk = read_chunk(f)
+                end = offset + len(chunk)
+                headers_upload = {
+                    'Content-Length': str(len(chunk)),
+                    'Content-Range': f'bytes {offset}-{end - 1}/{file_size}'
+                }
+                upload_response = requests.put(upload_url, headers=headers_upload, data=chunk)
+                upload_response.raise_for_status()
+                offset = end
+                if offset >= file_size:
+                    break
+
+    def _nextcloud_upload_stream(self, stream, remote_file_path):
+        """Upload `stream` to Nextcloud with the WebDAV chunked upload API:
+        chunks of BACKUP_CHUNK_SIZE are uploaded into a temporary upload
+        folder, then assembled at `remote_file_path` by Nextcloud."""
+        auth = HTTPBasicAuth(self.next_cloud_user_name,
+                             self.next_cloud_password)
+        dav_url = self.domain.rstrip('/') + '/remote.php/dav'
+        user = quote(self.next_cloud_user_name)
+        upload_url = f"{dav_url}/uploads/{user}/odoo-backup-{uuid.uuid4().hex}"
+        headers = {
+            'Destination': f"{dav_url}/files/{user}/{quote(remote_file_path.lstrip('/'))}"
+        }
+        requests.request('MKCOL', upload_url, auth=auth,
+                         headers=headers).raise_for_status()
+        try:
+            index = 1
+            while True:
+                chunk = read_chunk(stream)
+                if chunk or index == 1:
+                    requests.put(f"{upload_url}/{index:05d}", data=chunk,
+                                 auth=auth, headers=headers).raise_for_status()
+                    index += 1
+                if len(chunk) < BACKUP_CHUNK_SIZE:
+                    break
+            requests.request('MOVE', f"{upload_url}/.file", auth=auth,
+                             headers=headers).raise_for_status()
+        except Exception:
+            requests.request('DELETE', upload_url, auth=auth)
+            raise
+
+    @api.model
+    def restore_directory_backup(self, master_pwd, db_name, backup_file,
+                                 jobs=4):
+        """Restore a backup taken with the Directory format into the new
+        database `db_name`, with `jobs` parallel pg_restore workers.
+
+        :param master_pwd: master password of the server
+        :param db_name: name of the database to create
+        :param backup_file: path or readable file-like object of the tar
+                            archive
+        :param jobs: number of parallel pg_restore jobs
+        """
+        odoo.service.db.check_super(master_pwd)
+        if db_name in db.list_dbs(force=True):
+            raise UserError(_("Database %s already exists.", db_name))
+        with tempfile.TemporaryDirectory() as restore_dir:
+            if isinstance(backup_file, str):
+                tar = tarfile.open(backup_file, mode='r|*')
             else:
-                return stdout
+                tar = tarfile.open(fileobj=backup_file, mode='r|*')
+            with tar:
+                if hasattr(tarfile, 'data_filter'):
+                    tar.extractall(restore_dir, filter='data')
+                else:
+                    tar.extractall(restore_dir)
+            dump_dir = os.path.join(restore_dir, 'dump')
+            if not os.path.isdir(dump_dir):
+                raise UserError(_("The archive is not a Directory backup."))
+            _logger.info('RESTORE DB: %s with %s jobs', db_name, jobs)
+            db._create_empty_database(db_name)
+            cmd = [find_pg_tool('pg_restore'), '--no-owner',
+                   '--dbname=' + db_name, '--jobs=%d' % max(jobs, 1),
+                   dump_dir]
+            try:
+                subprocess.run(cmd, env=exec_pg_environ(),
+                               stdout=subprocess.DEVNULL,
+                               stderr=subprocess.STDOUT, check=True)
+            except Exception:
+                db.exp_drop(db_name)
+                raise
+        return True
 
     def _dump_db_manifest(self, cr):
         """ This function generates a manifest dictionary for database dump."""
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+###############################################################################
+#
+#    Cybrosys Technologies Pvt. Ltd.
+#
+#    Copyright (C) 2024-TODAY Cybrosys Technologies(<https://www.cybrosys.com>)
+#    Author: Cybrosys Techno Solutions (odoo@cybrosys.com)
+#
+#    You can modify it under the terms of the GNU LESSER
+#    GENERAL PUBLIC LICENSE (LGPL v3), Version 3.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU LESSER GENERAL PUBLIC LICENSE (LGPL v3) for more details.
+#
+#    You should have received a copy of the GNU LESSER GENERAL PUBLIC LICENSE
+#    (LGPL v3) along with this program.
+#    If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+import os
+import tempfile
+from unittest.mock import patch
+
+import odoo
+from odoo.tests.common import TransactionCase
+
+from odoo.addons.auto_database_backup.models import db_backup_configure
+
+
+class UnseekableStream:
+    """Write-only stream without tell() or seek(), like the pipe the dump
+    is written to"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def getvalue(self):
+        return b''.join(self.chunks)
+
+
+class DumpWriterCase(TransactionCase):
+    """Run _write_dump without PostgreSQL tools: pg_dump writes a fixed
+    content and the filestore is a temporary directory"""
+
+    def setUp(self):
+        super().setUp()
+        self.Backup = self.env['db.backup.configure']
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.tmp_dir = tmp_dir.name
+        self.filestore = os.path.join(self.tmp_dir, 'filestore')
+        os.makedirs(self.filestore)
+        self.startPatcher(patch.object(
+            db_backup_configure, 'find_pg_tool', return_value='pg_dump'))
+        self.startPatcher(patch.object(
+            db_backup_configure, 'exec_pg_environ', return_value={}))
+        self.startPatcher(patch.object(
+            odoo.tools.config, 'filestore', return_value=self.filestore))
+        self.startPatcher(patch.object(
+            type(self.Backup), '_get_dump_manifest',
+            return_value={'db_name': 'backup_test'}))
+        self.copy_pg_dump = self.startPatcher(patch.object(
+            type(self.Backup), '_copy_pg_dump', autospec=True,
+            side_effect=lambda rec, cmd, env, stream: stream.write(
+                b'PGDMP dump data')))
+
+    def _write_filestore_file(self, name, data):
+        """Write the filestore file `name` ('ab/abcdef...')"""
+        path = os.path.join(self.filestore, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+###############################################################################
+#
+#    Cybrosys Technologies Pvt. Ltd.
+#
+#    Copyright (C) 2024-TODAY Cybrosys Technologies(<https://www.cybrosys.com>)
+#    Author: Cybrosys Techno Solutions (odoo@cybrosys.com)
+#
+#    You can modify it under the terms of the GNU LESSER
+#    GENERAL PUBLIC LICENSE (LGPL v3), Version 3.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU LESSER GENERAL PUBLIC LICENSE (LGPL v3) for more details.
+#
+#    You should have received a copy of the GNU LESSER GENERAL PUBLIC LICENSE
+#    (LGPL v3) along with this program.
+#    If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+import io
+import json
+import os
+import subprocess
+import tarfile
+from unittest.mock import patch
+
+from odoo.addons.auto_database_backup.models import db_backup_configure
+from .common import DumpWriterCase, UnseekableStream
+
+
+def fake_directory_dump(cmd, **kwargs):
+    """pg_dump --format=directory writing a table of contents and a data
+    file into the --file directory"""
+    dump_dir = next(arg[len('--file='):] for arg in cmd
+                    if arg.startswith('--file='))
+    os.makedirs(dump_dir)
+    for name, data in (('toc.dat', b'TOC'), ('3001.dat.gz', b'DATA')):
+        with open(os.path.join(dump_dir, name), 'wb') as f:
+            f.write(data)
+    return subprocess.CompletedProcess(cmd, 0)
+
+
+class TestDirectoryBackup(DumpWriterCase):
+    """Directory-format backups are a tar archive of the pg_dump directory
+    and the manifest, written sequentially"""
+
+    def setUp(self):
+        super().setUp()
+        self.run = self.startPatcher(patch.object(
+            db_backup_configure.subprocess, 'run',
+            side_effect=fake_directory_dump))
+
+    def test_tar_archive_of_the_dump(self):
+        stream = UnseekableStream()
+        self.Backup._write_dump('backup_test', stream, 'directory', jobs=3)
+
+        cmd = self.run.call_args[0][0]
+        self.assertIn('--format=directory', cmd)
+        self.assertIn('--jobs=3', cmd)
+        self.assertEqual(cmd[-1], 'backup_test')
+        with tarfile.open(fileobj=io.BytesIO(stream.getvalue())) as tar:
+            self.assertEqual(
+                sorted(tar.getnames()),
+                ['dump', 'dump/3001.dat.gz', 'dump/toc.dat', 'manifest.json'])
+            self.assertEqual(tar.extractfile('dump/toc.dat').read(), b'TOC')
+            self.assertEqual(json.load(tar.extractfile('manifest.json')),
+                             {'db_name': 'backup_test'})
+
+    def test_at_least_one_job(self):
+        self.Backup._write_dump('backup_test', UnseekableStream(),
+                                'directory', jobs=0)
+        self.assertIn('--jobs=1', self.run.call_args[0][0])
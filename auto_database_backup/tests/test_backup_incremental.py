@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+###############################################################################
+#
+#    Cybrosys Technologies Pvt. Ltd.
+#
+#    Copyright (C) 2024-TODAY Cybrosys Technologies(<https://www.cybrosys.com>)
+#    Author: Cybrosys Techno Solutions (odoo@cybrosys.com)
+#
+#    You can modify it under the terms of the GNU LESSER
+#    GENERAL PUBLIC LICENSE (LGPL v3), Version 3.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU LESSER GENERAL PUBLIC LICENSE (LGPL v3) for more details.
+#
+#    You should have received a copy of the GNU LESSER GENERAL PUBLIC LICENSE
+#    (LGPL v3) along with this program.
+#    If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+import json
+import os
+from contextlib import contextmanager
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import odoo
+from odoo.exceptions import UserError
+
+from odoo.addons.auto_database_backup.models import db_backup_configure
+from odoo.addons.auto_database_backup.models.db_backup_configure import (
+    FilestoreIndex, LocalBlobStore, is_filestore_path)
+from .common import DumpWriterCase, UnseekableStream
+
+
+class TestIncrementalBackup(DumpWriterCase):
+    """Incremental backups dump the database in the snapshot listing its
+    filestore files, and upload only the files missing at the
+    destination"""
+
+    def setUp(self):
+        super().setUp()
+        self.backup_dir = os.path.join(self.tmp_dir, 'backups')
+        os.makedirs(self.backup_dir)
+        self.record = self.Backup.new({
+            'backup_destination': 'local',
+            'backup_path': self.backup_dir,
+        })
+
+    def _filestore_index(self, names):
+        return SimpleNamespace(get=lambda: names, filestore=self.filestore,
+                               manifest={'db_name': 'backup_test'})
+
+    def test_filestore_path(self):
+        self.assertTrue(is_filestore_path('ab/abcdef'))
+        for name in ('../secret', 'ab/../../secret', '/etc/passwd',
+                     'ab//abcdef', '', None):
+            self.assertFalse(is_filestore_path(name), name)
+
+    def test_snapshot_lists_filestore_files(self):
+        self._write_filestore_file('ab/ab01', b'content')
+        cr = MagicMock()
+        cr.fetchone.return_value = ('SNAPSHOT-1',)
+        cr.fetchall.return_value = [('ab/ab01',), ('../secret',),
+                                    ('cd/cd02',)]
+        connection = MagicMock()
+        connection.cursor.return_value.__enter__.return_value = cr
+        index = FilestoreIndex('backup_test', lambda cr: {'version': '18.0'})
+        with self.assertRaises(UserError):
+            index.get()
+
+        with patch.object(odoo.sql_db, 'db_connect', return_value=connection):
+            with index.snapshot() as snapshot_id:
+                self.assertEqual(snapshot_id, 'SNAPSHOT-1')
+                # Files outside the filestore or not on disk are skipped
+                self.assertEqual(index.get(), ['ab/ab01'])
+        self.assertEqual(index.manifest, {'version': '18.0'})
+
+    def test_dump_in_the_snapshot(self):
+        @contextmanager
+        def snapshot():
+            yield 'SNAPSHOT-2'
+
+        stream = UnseekableStream()
+        self.Backup._write_dump('backup_test', stream, 'incremental',
+                                filestore_index=SimpleNamespace(
+                                    snapshot=snapshot))
+
+        cmd = self.copy_pg_dump.call_args[0][1]
+        self.assertIn('--format=c', cmd)
+        self.assertIn('--snapshot=SNAPSHOT-2', cmd)
+        self.assertEqual(stream.getvalue(), b'PGDMP dump data')
+
+    def test_upload_missing_files_only(self):
+        self._write_filestore_file('ab/ab01', b'first')
+        self._write_filestore_file('cd/cd02', b'second')
+        self.record._upload_filestore_blobs(
+            self._filestore_index(['ab/ab01', 'cd/cd02']),
+            'backup_test_1.dump')
+
+        with open(os.path.join(self.backup_dir, 'filestore', 'cd/cd02'),
+                  'rb') as f:
+            self.assertEqual(f.read(), b'second')
+        with open(os.path.join(self.backup_dir,
+                               'backup_test_1.manifest.json')) as f:
+            manifest = json.load(f)
+        self.assertEqual(manifest['dump'], 'backup_test_1.dump')
+        self.assertEqual(manifest['filestore'], ['ab/ab01', 'cd/cd02'])
+
+        self._write_filestore_file('ef/ef03', b'third')
+        with patch.object(LocalBlobStore, 'upload_blob', autospec=True,
+                          side_effect=LocalBlobStore.upload_blob) as upload:
+            self.record._upload_filestore_blobs(
+                self._filestore_index(['ab/ab01', 'cd/cd02', 'ef/ef03']),
+                'backup_test_2.dump')
+        self.assertEqual([call[0][1] for call in upload.call_args_list],
+                         ['ef/ef03'])
+
+    def test_upload_removed_file(self):
+        with self.assertRaises(UserError):
+            self.record._upload_filestore_blobs(
+                self._filestore_index(['ab/ab01']), 'backup_test_1.dump')
+
+    def test_restore_rejects_paths_outside_filestore(self):
+        manifest_file = os.path.join(self.tmp_dir, 'manifest.json')
+        with open(manifest_file, 'w') as f:
+            json.dump({'filestore': ['ab/ab01', '../../etc/passwd']}, f)
+        self.startPatcher(patch.object(db_backup_configure.db, 'check_super'))
+        self.startPatcher(patch.object(db_backup_configure.db, 'list_dbs',
+                                       return_value=[]))
+        create_database = self.startPatcher(patch.object(
+            db_backup_configure.db, '_create_empty_database'))
+
+        with self.assertRaises(UserError):
+            self.Backup.restore_incremental_backup(
+                'admin', 'backup_restored', 'backup_test_1.dump',
+                manifest_file, self.backup_dir)
+        create_database.assert_not_called()
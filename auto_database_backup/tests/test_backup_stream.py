@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+###############################################################################
+#
+#    Cybrosys Technologies Pvt. Ltd.
+#
+#    Copyright (C) 2024-TODAY Cybrosys Technologies(<https://www.cybrosys.com>)
+#    Author: Cybrosys Techno Solutions (odoo@cybrosys.com)
+#
+#    You can modify it under the terms of the GNU LESSER
+#    GENERAL PUBLIC LICENSE (LGPL v3), Version 3.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU LESSER GENERAL PUBLIC LICENSE (LGPL v3) for more details.
+#
+#    You should have received a copy of the GNU LESSER GENERAL PUBLIC LICENSE
+#    (LGPL v3) along with this program.
+#    If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+import io
+
+from odoo.tests.common import BaseCase
+
+from odoo.addons.auto_database_backup.models.db_backup_configure import read_chunk
+
+
+class ShortReadStream(io.RawIOBase):
+    """Readable stream returning at most `step` bytes per read, like a
+    pipe"""
+
+    def __init__(self, data, step):
+        self.data = data
+        self.step = step
+        self.pos = 0
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = len(self.data)
+        size = min(size, self.step)
+        data = self.data[self.pos:self.pos + size]
+        self.pos += len(data)
+        return data
+
+
+class TestReadChunk(BaseCase):
+    """read_chunk returns full chunks from streams with short reads"""
+
+    def test_full_chunk_from_short_reads(self):
+        stream = ShortReadStream(b'0123456789', step=3)
+        self.assertEqual(read_chunk(stream, 8), b'01234567')
+        self.assertEqual(read_chunk(stream, 8), b'89')
+        self.assertEqual(read_chunk(stream, 8), b'')
+
+    def test_chunk_at_exact_end(self):
+        stream = ShortReadStream(b'abcdef', step=4)
+        self.assertEqual(read_chunk(stream, 6), b'abcdef')
+        self.assertEqual(read_chunk(stream, 6), b'')
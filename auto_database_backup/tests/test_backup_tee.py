@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+###############################################################################
+#
+#    Cybrosys Technologies Pvt. Ltd.
+#
+#    Copyright (C) 2024-TODAY Cybrosys Technologies(<https://www.cybrosys.com>)
+#    Author: Cybrosys Techno Solutions (odoo@cybrosys.com)
+#
+#    You can modify it under the terms of the GNU LESSER
+#    GENERAL PUBLIC LICENSE (LGPL v3), Version 3.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU LESSER GENERAL PUBLIC LICENSE (LGPL v3) for more details.
+#
+#    You should have received a copy of the GNU LESSER GENERAL PUBLIC LICENSE
+#    (LGPL v3) along with this program.
+#    If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+import io
+import threading
+from unittest.mock import patch
+
+from odoo.exceptions import UserError
+from odoo.tests.common import BaseCase
+
+from odoo.addons.auto_database_backup.models import db_backup_configure
+from odoo.addons.auto_database_backup.models.db_backup_configure import (
+    BackupStreamTee, read_chunk)
+
+
+@patch.object(db_backup_configure, 'BACKUP_CHUNK_SIZE', 4)
+class TestBackupStreamTee(BaseCase):
+    """BackupStreamTee sends the stream to every open reader, and the end
+    of stream or the dump error through finish()"""
+
+    def test_every_reader_gets_the_stream(self):
+        data = b'0123456789'
+        tee = BackupStreamTee(2, max_chunks=10)
+        tee.pump(io.BytesIO(data))
+        tee.finish()
+        first, second = tee.readers
+        self.assertEqual(first.read(3), b'012')
+        self.assertEqual(first.read(), b'3456789')
+        self.assertEqual(first.read(3), b'')
+        self.assertEqual(read_chunk(second, 6), b'012345')
+        self.assertEqual(read_chunk(second, 6), b'6789')
+
+    def test_closed_reader_is_skipped(self):
+        tee = BackupStreamTee(2, max_chunks=1)
+        failed, uploading = tee.readers
+        failed.close()
+        result = []
+        thread = threading.Thread(target=lambda: result.append(uploading.read()))
+        thread.start()
+        tee.pump(io.BytesIO(b'x' * 100))
+        tee.finish()
+        thread.join(10)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(result, [b'x' * 100])
+
+    def test_all_readers_closed(self):
+        tee = BackupStreamTee(2)
+        for reader in tee.readers:
+            reader.close()
+        with self.assertRaises(UserError):
+            tee.pump(io.BytesIO(b'data'))
+
+    def test_bounded_buffer_with_concurrent_readers(self):
+        data = bytes(range(256)) * 8
+        tee = BackupStreamTee(3, max_chunks=1)
+        results = {}
+
+        def consume(index, reader):
+            chunks = []
+            while True:
+                chunk = reader.read(7)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+            results[index] = b''.join(chunks)
+
+        threads = [threading.Thread(target=consume, args=(index, reader))
+                   for index, reader in enumerate(tee.readers)]
+        for thread in threads:
+            thread.start()
+        tee.pump(io.BytesIO(data))
+        tee.finish()
+        for thread in threads:
+            thread.join(10)
+        self.assertEqual(results, {0: data, 1: data, 2: data})
+
+    def test_dump_error_reaches_readers(self):
+        tee = BackupStreamTee(1, max_chunks=10)
+        tee.pump(io.BytesIO(b'partial'))
+        tee.finish(UserError("pg_dump failed"))
+        reader = tee.readers[0]
+        self.assertEqual(read_chunk(reader, 7), b'partial')
+        with self.assertRaises(UserError):
+            reader.read(1)
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+###############################################################################
+#
+#    Cybrosys Technologies Pvt. Ltd.
+#
+#    Copyright (C) 2024-TODAY Cybrosys Technologies(<https://www.cybrosys.com>)
+#    Author: Cybrosys Techno Solutions (odoo@cybrosys.com)
+#
+#    You can modify it under the terms of the GNU LESSER
+#    GENERAL PUBLIC LICENSE (LGPL v3), Version 3.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU LESSER GENERAL PUBLIC LICENSE (LGPL v3) for more details.
+#
+#    You should have received a copy of the GNU LESSER GENERAL PUBLIC LICENSE
+#    (LGPL v3) along with this program.
+#    If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+import io
+import json
+import zipfile
+
+from odoo.addons.auto_database_backup.models.db_backup_configure import (
+    is_compressed_file)
+from .common import DumpWriterCase, UnseekableStream
+
+PNG_DATA = b'\x89PNG\r\n\x1a\n' + b'\x00' * 1024
+TEXT_DATA = b'plain text attachment ' * 100
+
+
+class TestZipBackup(DumpWriterCase):
+    """Zip backups write the dump, the manifest and the filestore files
+    straight into the archive, storing already compressed files as is"""
+
+    def test_compressed_file(self):
+        for name, data, compressed in (
+                ('ab/ab01', PNG_DATA, True),
+                ('ab/ab02', b'%PDF-1.7 ...', True),
+                ('ab/ab03', b'RIFF\x00\x00\x00\x00WEBPVP8 ', True),
+                ('ab/ab04', b'\x00\x00\x00\x18ftypmp42', True),
+                ('ab/ab05', TEXT_DATA, False),
+                ('ab/ab06', b'', False)):
+            path = self._write_filestore_file(name, data)
+            self.assertEqual(is_compressed_file(path), compressed, name)
+
+    def test_zip_archive(self):
+        self._write_filestore_file('ab/ab01', PNG_DATA)
+        self._write_filestore_file('cd/cd02', TEXT_DATA)
+        stream = UnseekableStream()
+        self.Backup._write_dump('backup_test', stream, 'zip')
+
+        with zipfile.ZipFile(io.BytesIO(stream.getvalue())) as zf:
+            self.assertEqual(zf.namelist(), [
+                'dump.sql', 'manifest.json', 'filestore/ab/ab01',
+                'filestore/cd/cd02'])
+            self.assertEqual(zf.read('dump.sql'), b'PGDMP dump data')
+            self.assertEqual(json.loads(zf.read('manifest.json')),
+                             {'db_name': 'backup_test'})
+            png = zf.getinfo('filestore/ab/ab01')
+            text = zf.getinfo('filestore/cd/cd02')
+            self.assertEqual(png.compress_type, zipfile.ZIP_STORED)
+            self.assertEqual(text.compress_type, zipfile.ZIP_DEFLATED)
+            self.assertEqual(zf.read(png), PNG_DATA)
+            self.assertEqual(zf.read(text), TEXT_DATA)
+            self.assertIsNone(zf.testzip())
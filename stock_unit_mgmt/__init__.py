@@ -3,3 +3,19 @@
 from . import models
 from . import wizard
 from . import controllers
+
+
+def post_init_hook(env):
+    """安装时根据历史已完成移动行生成批次单位台账和余额
+
+    不放在模型 init() 中：init() 在各模型建表过程中依次执行，此时余额表可能尚未创建，
+    且每次升级都会执行。升级已部署的数据库时由 migrations/1.1.0/post-migrate.py 生成。
+    """
+    env['stock.lot.unit.ledger'].sudo()._rebuild_from_history()
+
+
+def uninstall_hook(env):
+    """卸载时删除 stock_quant 上的库存汇总触发器（汇总表随模块删除）"""
+    env.cr.execute("DROP TRIGGER IF EXISTS stock_unit_mgmt_quant_summary ON stock_quant")
+    env.cr.execute("DROP FUNCTION IF EXISTS stock_unit_mgmt_quant_summary_trigger()")
+    env.cr.execute("DROP FUNCTION IF EXISTS stock_unit_mgmt_quant_summary_rows(stock_quant, integer)")
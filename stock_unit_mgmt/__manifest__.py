@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 {
     'name': '库存单位管理器',
-    'version': '1.0.0',
+    'version': '1.1.0',
     'summary': '统一的产品多单位管理和库存单位扩展',
     'description': """
         库存单位管理器
@@ -27,15 +27,22 @@
     ],
     'data': [
         'security/ir.model.access.csv',
+        'security/security.xml',
         'data/uom_data.xml',
+        'data/stock_lot_unit_ledger_data.xml',
+        'data/product_stock_summary_data.xml',
         'views/product_template_views.xml',
         'views/stock_move_views.xml',
         'views/stock_quant_views.xml',
         'views/stock_picking_type_views.xml',
         'views/mrp_production_views.xml',
         'wizard/product_unit_setup_wizard_views.xml',
+        'wizard/stock_move_lot_import_wizard_views.xml',
         'views/menu_views.xml',
+        'views/stock_lot_unit_report_views.xml',
     ],
+    'post_init_hook': 'post_init_hook',
+    'uninstall_hook': 'uninstall_hook',
     'installable': True,
     'auto_install': False,
     'application': False,
@@ -1,4 +1,4 @@
 # -*- coding: utf-8 -*-
 
 from . import stock_barcode_controller
-
+from . import stock_unit_trace_controller
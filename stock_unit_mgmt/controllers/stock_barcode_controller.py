@@ -1,12 +1,15 @@
 # -*- coding: utf-8 -*-
 
 import logging
+import re
 from collections import defaultdict
 from odoo import http, fields, _
 from odoo.http import request
 from odoo.osv import expression
 from odoo.exceptions import UserError, ValidationError
 
+from ..models import utils
+
 # 导入原始的控制器类（如果可能）
 try:
     from odoo.addons.stock_barcode.controllers.stock_barcode import StockBarcodeController as OriginalStockBarcodeController
@@ -19,6 +22,22 @@ except ImportError:
 
 _logger = logging.getLogger(__name__)
 
+# 批量扫码验证结果
+SCAN_ACCEPTED = 'accepted'
+SCAN_NOT_IN_PREFILLED = 'not_in_prefilled'
+SCAN_DUPLICATE = 'duplicate'
+SCAN_STATUSES = (SCAN_ACCEPTED, SCAN_NOT_IN_PREFILLED, SCAN_DUPLICATE)
+
+# 扫码界面地址中的调拨单ID（/barcode-operations/<id>/）
+BARCODE_OPERATION_PICKING_RE = re.compile(r'/barcode-operations/(\d+)/')
+# fetch_quants 时每次扫码最多返回的库存数量记录数（更多记录通过 quant_offset 分页获取）
+QUANT_FETCH_LIMIT = 200
+# fetch_quants 时读取的库存数量字段（与 stock.quant._get_fields_stock_barcode 取交集）
+QUANT_FETCH_FIELDS = [
+    'product_id', 'location_id', 'lot_id', 'package_id', 'owner_id',
+    'quantity', 'inventory_quantity', 'inventory_quantity_set',
+]
+
 
 class StockBarcodeController(OriginalStockBarcodeController):
 
@@ -28,14 +47,8 @@ class StockBarcodeController(OriginalStockBarcodeController):
         
         这是扫码时实际调用的方法，用于查询批次号信息
         注意：由于 Odoo 的路由系统，这个路由可能不会覆盖原始路由
-        所以我们也在 stock.lot 模型的 _search 方法中添加了日志
+        需要跟踪批次号查询时，可开启追踪（见 models/tracing.py），stock.lot._search 会被记录
         """
-        # **关键修复**：使用 print 和 sys.stderr 确保日志输出
-        import sys
-        print("=" * 80, file=sys.stderr)
-        print(f"[扫码查询数据] get_specific_barcode_data 被调用: 条码={kwargs.get('barcode')}", file=sys.stderr)
-        print("=" * 80, file=sys.stderr)
-        
         _logger.error(
             f"[扫码查询数据] ========== get_specific_barcode_data 被调用 ========== "
             f"条码={kwargs.get('barcode')}, kwargs={kwargs}"
@@ -67,6 +80,7 @@ class StockBarcodeController(OriginalStockBarcodeController):
         nomenclature = request.env.company.nomenclature_id
         result = defaultdict(list)
         product_ids = set()
+        scanned_lot_ids = []
         
         # **关键修复**：保存原始条码信息，用于后续验证（即使批次号查询结果为空）
         original_barcodes = kwargs.get('barcodes') or [kwargs.get('barcode')] if kwargs.get('barcode') else []
@@ -98,7 +112,14 @@ class StockBarcodeController(OriginalStockBarcodeController):
             barcode_field = request.env[model_name]._barcode_field
             domain = [(barcode_field, 'in', barcodes)]
 
-            if nomenclature.is_gs1_nomenclature:
+            if model_name == 'stock.lot':
+                # **性能优化**：批次号通过按公司缓存的精确匹配解析为ID（包括 GS1 去掉填充后的形式），
+                # 不再为每个 GS1 条码拼接无法使用索引的 ilike 条件；未知条码也会被缓存
+                lot_ids = request.env['stock.lot']._resolve_barcode_lot_ids(
+                    barcodes, is_gs1_nomenclature=nomenclature.is_gs1_nomenclature
+                )
+                domain = [('id', 'in', lot_ids)]
+            elif nomenclature.is_gs1_nomenclature:
                 # If we use GS1 nomenclature, the domain might need some adjustments.
                 converted_barcodes_domain = []
                 unconverted_barcodes = []
@@ -154,75 +175,26 @@ class StockBarcodeController(OriginalStockBarcodeController):
                 # **关键修复**：检查是否真的是扫码操作
                 # 只在扫码界面（/barcode-operations/）下才进行验证
                 # 如果是从表单编辑界面触发的查询，应该跳过验证
-                is_barcode_operation = False
-                picking_id = None
+                is_barcode_operation, picking_id = self._get_request_picking_id(kwargs)
                 context = kwargs.get('context', {})
                 
-                # 方法1：检查 referer 是否包含扫码界面路径
-                if hasattr(request, 'httprequest'):
-                    try:
-                        referer = request.httprequest.headers.get('Referer', '')
-                        if referer and '/barcode-operations/' in referer:
-                            is_barcode_operation = True
-                            import re
-                            # 尝试从 referer 中提取 picking_id（例如：/barcode-operations/492/）
-                            match = re.search(r'/barcode-operations/(\d+)/', referer)
-                            if match:
-                                picking_id = int(match.group(1))
-                                _logger.error(f"[扫码验证] 从 Referer 中提取 picking_id: {picking_id}, referer={referer}")
-                    except Exception as e:
-                        _logger.debug(f"[扫码验证] 从 Referer 检查时出错: {str(e)}")
-                
-                # 方法2：检查 path 是否包含扫码界面路径
-                if not is_barcode_operation and hasattr(request, 'httprequest'):
+                # 确定是扫码操作但无法从请求中获取 picking_id 时，通过批次号查询关联的 picking（作为后备方案）
+                if is_barcode_operation and not picking_id and records:
                     try:
-                        path = request.httprequest.path
-                        if '/barcode-operations/' in path:
-                            is_barcode_operation = True
-                            import re
-                            match = re.search(r'/barcode-operations/(\d+)/', path)
-                            if match:
-                                picking_id = int(match.group(1))
-                                _logger.error(f"[扫码验证] 从 Path 中提取 picking_id: {picking_id}, path={path}")
+                        lot_ids = [r.id for r in records]
+                        move_lines = request.env['stock.move.line'].search([
+                            ('lot_id', 'in', lot_ids),
+                            ('picking_id', '!=', False),
+                            ('picking_id.state', 'in', ('draft', 'waiting', 'confirmed', 'assigned', 'partially_available')),
+                        ], limit=10, order='write_date desc')
+                        
+                        if move_lines:
+                            picking_ids = list(set([line.picking_id.id for line in move_lines if line.picking_id]))
+                            if len(picking_ids) == 1:
+                                picking_id = picking_ids[0]
+                                _logger.error(f"[扫码验证] 通过批次号查询推断 picking_id: {picking_id}")
                     except Exception as e:
-                        _logger.debug(f"[扫码验证] 从 Path 检查时出错: {str(e)}")
-                
-                # 方法3：如果确定是扫码操作，尝试从其他方式获取 picking_id
-                if is_barcode_operation:
-                    # 从 context 中获取
-                    if not picking_id:
-                        picking_id = (
-                            context.get('active_picking_id') or 
-                            context.get('default_picking_id') or
-                            context.get('picking_id') or
-                            context.get('active_id')
-                        )
-                    
-                    # 从 kwargs 中直接获取
-                    if not picking_id:
-                        picking_id = kwargs.get('picking_id') or kwargs.get('res_id') or kwargs.get('active_id')
-                    
-                    # 从 request.params 中获取
-                    if not picking_id and hasattr(request, 'params'):
-                        picking_id = request.params.get('picking_id') or request.params.get('res_id') or request.params.get('active_id')
-                    
-                    # 通过批次号查询关联的 picking（作为后备方案）
-                    if not picking_id and records:
-                        try:
-                            lot_ids = [r.id for r in records]
-                            move_lines = request.env['stock.move.line'].search([
-                                ('lot_id', 'in', lot_ids),
-                                ('picking_id', '!=', False),
-                                ('picking_id.state', 'in', ('draft', 'waiting', 'confirmed', 'assigned', 'partially_available')),
-                            ], limit=10, order='write_date desc')
-                            
-                            if move_lines:
-                                picking_ids = list(set([line.picking_id.id for line in move_lines if line.picking_id]))
-                                if len(picking_ids) == 1:
-                                    picking_id = picking_ids[0]
-                                    _logger.error(f"[扫码验证] 通过批次号查询推断 picking_id: {picking_id}")
-                        except Exception as e:
-                            _logger.debug(f"[扫码验证] 通过批次号查询 picking_id 时出错: {str(e)}")
+                        _logger.debug(f"[扫码验证] 通过批次号查询 picking_id 时出错: {str(e)}")
                 
                 _logger.error(
                     f"[扫码验证] 是否扫码操作: {is_barcode_operation}, "
@@ -253,78 +225,35 @@ class StockBarcodeController(OriginalStockBarcodeController):
                     try:
                         # 重新获取 picking（因为上面已经获取过了）
                         picking = request.env['stock.picking'].browse(picking_id)
+                        # 与扫码保存和其他扫码枪的登记互斥，在读取预填索引和扫码记录台账之前加锁
+                        picking._acquire_barcode_lock()
                         if picking.exists():
-                            # 查询当前 picking 中所有移动（stock.move）
-                            moves = picking.move_ids
-                            
-                            # 收集所有预填的批次号
-                            prefilled_lot_names = []
-                            saved_lot_names = []
-                            # **关键修复**：记录每个批次号对应的记录数量，用于检测重复扫描
-                            lot_name_to_lines = {}  # {lot_name: [line1, line2, ...]}
-                            
-                            for move in moves:
-                                # 查询当前移动中所有已保存记录的批次号（预填列表）
-                                existing_lines = request.env['stock.move.line'].search([
-                                    ('move_id', '=', move.id),
-                                    ('lot_name', '!=', False),
-                                    ('lot_name', '!=', ''),
-                                ])
-                                
-                                for line in existing_lines:
-                                    if line.lot_name:
-                                        lot_name_normalized = line.lot_name.strip().lower()
-                                        if lot_name_normalized not in prefilled_lot_names:
-                                            prefilled_lot_names.append(lot_name_normalized)
-                                            saved_lot_names.append(line.lot_name)
-                                        # 记录每个批次号对应的记录
-                                        if lot_name_normalized not in lot_name_to_lines:
-                                            lot_name_to_lines[lot_name_normalized] = []
-                                        lot_name_to_lines[lot_name_normalized].append(line)
+                            # **性能优化**：使用调拨单级别的预填批次号索引（标准化批次号 -> 移动行）
+                            # 索引只在移动行变化后重建，每次扫码只需一次修订号校验查询
+                            lot_index = picking._get_prefilled_lot_index()
+                            prefilled_lot_names = set(lot_index)
+                            saved_lot_names = [entry['name'] for entry in lot_index.values()]
+                            # **关键修复**：记录每个批次号对应的记录，用于检测重复扫描
+                            lot_name_to_lines = {
+                                lot_key: entry['line_ids'] for lot_key, entry in lot_index.items()
+                            }
                             
-                            # **关键修复**：从会话变量中获取已扫描但可能还未保存的批次号
+                            # **关键修复**：从扫码记录台账中获取已扫描但可能还未保存的批次号
                             # 这样可以确保预填列表包含所有已扫描的批次号，无论它们是否已保存到数据库
-                            session = request.session
-                            scanned_lots_key = f'scanned_lots_{picking_id}'
-                            scanned_lots = list(session.get(scanned_lots_key, []) or [])
+                            LotScan = request.env['stock.lot.scan'].sudo()
+                            scanned_lots = LotScan._get_scanned_lot_names(picking_id)
                             
-                            if scanned_lots:
-                                _logger.info(
-                                    f"[扫码验证] 从会话变量获取已扫描批次号: picking_id={picking_id}, "
-                                    f"会话中的批次号={scanned_lots}, 数据库预填列表={saved_lot_names}"
-                                )
-                                
-                                # 将会话变量中的批次号添加到预填列表中
-                                # 注意：会话变量中存储的是标准化后的批次号（小写）
-                                for scanned_lot_normalized in scanned_lots:
-                                    if scanned_lot_normalized and scanned_lot_normalized not in prefilled_lot_names:
-                                        # 会话变量中的批次号不在数据库预填列表中，添加到预填列表
-                                        prefilled_lot_names.append(scanned_lot_normalized)
-                                        # 尝试从数据库中找到原始批次号（保持原始大小写）
-                                        # 如果找不到，使用标准化后的批次号
-                                        original_lot_name = scanned_lot_normalized
-                                        # 查找数据库中是否有此批次号（忽略大小写）
-                                        matching_lines = request.env['stock.move.line'].search([
-                                            ('move_id', 'in', moves.ids),
-                                            ('lot_name', '!=', False),
-                                            ('lot_name', '!=', ''),
-                                        ])
-                                        for line in matching_lines:
-                                            if line.lot_name and line.lot_name.strip().lower() == scanned_lot_normalized:
-                                                original_lot_name = line.lot_name
-                                                break
-                                        saved_lot_names.append(original_lot_name)
-                                        _logger.info(
-                                            f"[扫码验证] 将会话中的批次号添加到预填列表: "
-                                            f"标准化批次号={scanned_lot_normalized}, "
-                                            f"原始批次号={original_lot_name}"
-                                        )
+                            # 不在索引中的批次号在数据库中没有对应记录，直接使用标准化后的批次号
+                            for scanned_lot_normalized in scanned_lots:
+                                if scanned_lot_normalized not in prefilled_lot_names:
+                                    prefilled_lot_names.add(scanned_lot_normalized)
+                                    saved_lot_names.append(scanned_lot_normalized)
                             
                             _logger.error(
                                 f"[扫码验证] 预填批次号列表: {saved_lot_names}, "
                                 f"扫描的批次号: {scanned_barcodes}, "
                                 f"批次号记录映射: {[(lot, len(lines)) for lot, lines in lot_name_to_lines.items()]}, "
-                                f"会话中的批次号={scanned_lots}"
+                                f"已扫描的批次号={scanned_lots}"
                             )
                             
                             # **关键修复**：验证扫描的批次号
@@ -334,7 +263,7 @@ class StockBarcodeController(OriginalStockBarcodeController):
                                 if not scanned_barcode:
                                     continue
                                 
-                                scanned_lot_name = str(scanned_barcode).strip().lower()
+                                scanned_lot_name = utils.normalize_lot_name(scanned_barcode)
                                 
                                 # 检查是否在预填列表中
                                 if prefilled_lot_names:
@@ -356,253 +285,49 @@ class StockBarcodeController(OriginalStockBarcodeController):
                                     
                                     # **关键修复**：检查是否重复扫描
                                     # 重复扫描的定义：
-                                    # 1. 如果批次号在预填列表中，且已经有记录存在，说明是重复扫描
-                                    # 2. **重要**：扫码只是验证，不应该创建新记录或更新数量
-                                    # 3. 用户预填了两卷，说明预填了两个批次号记录，扫码时应该匹配到对应的记录，而不是创建新记录或更新数量
-                                    
-                                    # 获取该批次号对应的所有记录
+                                    # 1. 批次号对应的记录已经保存了完成数量（qty_done > 0）
+                                    # 2. 或者批次号已经在扫码记录台账中（由唯一索引保证，多个扫码枪同时扫描也能识别）
+                                    # **重要**：扫码只是验证，不应该创建新记录或更新数量
                                     lines_for_lot = lot_name_to_lines.get(scanned_lot_name, [])
+                                    all_lines_with_lot = request.env['stock.move.line'].sudo().browse(lines_for_lot)
                                     
-                                    # **关键修复**：检查是否重复扫描
-                                    # 重复扫描的定义：
-                                    # 1. 如果批次号在预填列表中，且已经有记录存在，说明是重复扫描
-                                    # 2. **重要**：扫码只是验证，不应该创建新记录或更新数量
-                                    # 3. 用户预填了两卷，说明预填了两个批次号记录，扫码时应该匹配到对应的记录，而不是创建新记录或更新数量
-                                    
-                                    # 查询当前 picking 中所有包含此批次号的移动行（包括所有记录，不管 qty_done 是否 > 0）
-                                    # **关键修复**：使用 sudo() 确保获取最新的 qty_done 值
-                                    all_lines_with_lot = request.env['stock.move.line'].sudo().search([
-                                        ('move_id', 'in', moves.ids),
-                                        ('lot_name', '=', scanned_barcode),
-                                    ])
-                                    
-                                    # **关键修复**：清除缓存，确保获取最新的 qty_done 值
+                                    qty_done_map = {}
                                     if all_lines_with_lot:
-                                        # 清除缓存，从数据库重新读取最新值
                                         all_lines_with_lot.invalidate_recordset(['qty_done'])
+                                        qty_done_map = {
+                                            r['id']: float(r.get('qty_done') or 0.0)
+                                            for r in all_lines_with_lot.read(['qty_done'])
+                                        }
                                     
-                                    # **关键修复**：检查是否重复扫描
-                                    # 重复扫描的定义：批次号在预填列表中，且已经有记录存在
-                                    # **重要**：如果记录已存在，说明用户已经预填了，扫码只是验证
-                                    # 如果用户扫描同一个批次号两次，就应该提示重复扫描
-                                    # 
-                                    # **关键问题**：由于扫码只是验证，不会修改 qty_done，所以无法通过 qty_done 判断是否已扫描
-                                    # 我们需要使用其他方法来检测重复扫描
-                                    # 
-                                    # **解决方案**：使用会话（session）变量来跟踪已扫描的批次号
-                                    # 在同一个会话中，如果批次号已经被扫描过，就提示重复扫描
-                                    if all_lines_with_lot:
-                                        # **关键修复**：检查是否重复扫描
-                                        # 使用 ORM 方式读取 qty_done，避免 SQL 查询导致事务失败
-                                        scanned_lot_normalized = scanned_barcode.strip().lower()
-                                        
-                                        # 使用 ORM 方式读取 qty_done 值
-                                        is_duplicate = False
-                                        qty_done_map = {}
-                                        
-                                        # **关键修复**：使用会话变量来跟踪已扫描的批次号
-                                        # 因为 qty_done 字段在数据库中可能不存在或不可靠
-                                        # 使用会话变量可以在同一会话中立即检测重复扫描
-                                        session = request.session
-                                        scanned_lots_key = f'scanned_lots_{picking_id}'
-                                        scanned_lots = list(session.get(scanned_lots_key, []) or [])
-                                        
-                                        # **关键修复**：在检查重复之前，先清理会话变量中的重复项
-                                        # 确保会话变量中没有重复的批次号
-                                        if scanned_lots:
-                                            unique_scanned_lots = []
-                                            seen = set()
-                                            for lot in scanned_lots:
-                                                if lot not in seen:
-                                                    unique_scanned_lots.append(lot)
-                                                    seen.add(lot)
-                                            if len(unique_scanned_lots) != len(scanned_lots):
-                                                # 有重复项，更新会话变量
-                                                session[scanned_lots_key] = unique_scanned_lots
-                                                session.modified = True
-                                                _logger.error(
-                                                    f"[扫码验证] 清理会话变量中的重复项（检查前）: picking_id={picking_id}, "
-                                                    f"原始列表={scanned_lots}, 清理后列表={unique_scanned_lots}"
-                                                )
-                                                scanned_lots = unique_scanned_lots
-                                        
-                                        scanned_lot_normalized = scanned_barcode.strip().lower()
-                                        
+                                    if any(qty_done > 0.0 for qty_done in qty_done_map.values()):
+                                        is_duplicate = True
+                                        duplicate_reason = f"记录已保存完成数量（qty_done映射={qty_done_map}）"
+                                    else:
+                                        # 登记扫码：批次号已处于已扫描状态时登记失败，即重复扫描
+                                        is_duplicate = not LotScan._register_scan(picking_id, scanned_barcode)
+                                        duplicate_reason = "批次号已在扫码记录中"
+                                        if is_duplicate and not all_lines_with_lot:
+                                            # 数据库中不存在记录，说明记录已被删除，允许重新扫描
+                                            LotScan._release_scans(picking_id, [scanned_barcode])
+                                            is_duplicate = not LotScan._register_scan(picking_id, scanned_barcode)
+                                    
+                                    if is_duplicate:
                                         _logger.error(
-                                            f"[扫码验证] 检查重复扫描: 批次号={scanned_barcode}, "
-                                            f"标准化批次号={scanned_lot_normalized}, "
-                                            f"picking_id={picking_id}, "
-                                            f"会话键={scanned_lots_key}, "
-                                            f"会话中已扫描列表={scanned_lots}, "
-                                            f"是否在会话中={scanned_lot_normalized in scanned_lots}"
+                                            f"[扫码验证] 重复扫描: 批次号={scanned_barcode}, "
+                                            f"picking_id={picking_id}, 原因={duplicate_reason}"
                                         )
-                                        
-                                        # **关键修复**：优先检查数据库中的实际记录状态
-                                        # 如果数据库中不存在记录或记录已被删除（qty_done = 0），即使会话中有，也不应该视为重复
-                                        is_duplicate = False
-                                        qty_done_map = {}
-                                        
-                                        # 方法1：检查数据库中的 qty_done（最可靠）
-                                        try:
-                                            # 尝试使用 ORM 读取 qty_done
-                                            all_lines_with_lot.invalidate_recordset(['qty_done'])
-                                            read_values = all_lines_with_lot.read(['qty_done'])
-                                            qty_done_map = {r['id']: float(r.get('qty_done') or 0.0) for r in read_values}
-                                            
-                                            # 检查是否有任何记录的 qty_done > 0（包括标记值 0.0001）
-                                            duplicate_line_ids = [
-                                                lid for lid in all_lines_with_lot.ids
-                                                if qty_done_map.get(lid, 0.0) > 0.0
-                                            ]
-                                            
-                                            if duplicate_line_ids:
-                                                is_duplicate = True
-                                                scanned_qty_dones = [qty_done_map.get(lid, 0.0) for lid in duplicate_line_ids]
-                                                _logger.error(
-                                                    f"[扫码验证] 重复扫描（数据库qty_done>0）: 批次号={scanned_barcode}, "
-                                                    f"已扫描的记录数={len(duplicate_line_ids)}, "
-                                                    f"已扫描的记录ID={duplicate_line_ids}, "
-                                                    f"qty_done列表={scanned_qty_dones}"
-                                                )
-                                            else:
-                                                _logger.error(
-                                                    f"[扫码验证] 检查 qty_done: 批次号={scanned_barcode}, "
-                                                    f"记录ID={all_lines_with_lot.ids}, "
-                                                    f"qty_done映射={qty_done_map}, 数据库中未检测到重复扫描"
-                                                )
-                                        except Exception as e:
-                                            _logger.warning(f"[扫码验证] 读取 qty_done 失败: {str(e)}, 使用会话跟踪作为备用")
-                                            # 如果读取失败，使用会话跟踪作为备用
-                                            qty_done_map = {}
-                                        
-                                        # 方法2：如果数据库中未检测到重复，检查会话变量并同步
-                                        # **关键修复**：优先检查数据库状态，如果数据库中没有记录或记录已被删除，从会话中移除
-                                        # 这样可以确保会话变量与数据库状态一致
-                                        if not is_duplicate:
-                                            # **关键修复**：首先同步会话变量与数据库状态
-                                            # 如果数据库中不存在记录，说明记录已被删除，从会话中移除
-                                            if not all_lines_with_lot:
-                                                # 数据库中不存在记录，说明记录已被删除
-                                                # 从会话中移除所有该批次号的记录（可能有多条重复的）
-                                                if scanned_lot_normalized in scanned_lots:
-                                                    # 移除所有重复的批次号（使用列表推导式，移除所有匹配的）
-                                                    scanned_lots = [lot for lot in scanned_lots if lot != scanned_lot_normalized]
-                                                    session[scanned_lots_key] = scanned_lots
-                                                    session.modified = True
-                                                    _logger.error(
-                                                        f"[扫码验证] 数据库中不存在记录，从会话中移除: 批次号={scanned_barcode}, "
-                                                        f"picking_id={picking_id}, 更新后的会话列表={scanned_lots}"
-                                                    )
-                                                # 允许扫描
-                                                is_duplicate = False
-                                            elif all_lines_with_lot:
-                                                # 数据库中存在记录，检查 qty_done 状态
-                                                # 如果所有记录的 qty_done 都是 0，说明记录存在但未被扫描，或者被删除了但记录还在
-                                                # 在这种情况下，检查会话变量
-                                                all_qty_done_zero = all(
-                                                    qty_done_map.get(lid, 0.0) == 0.0 
-                                                    for lid in all_lines_with_lot.ids
-                                                )
-                                                
-                                                if all_qty_done_zero:
-                                                    # 所有记录的 qty_done 都是 0，说明记录存在但未被扫描
-                                                    # 或者记录被删除后重新创建了（qty_done=0）
-                                                    # 在这种情况下，如果会话中有该批次号，需要检查是否真的是重复扫描
-                                                    # **关键修复**：如果数据库中有记录但 qty_done=0，且会话中有该批次号，
-                                                    # 说明可能是删除后重新扫描，应该从会话中移除，允许重新扫描
-                                                    if scanned_lot_normalized in scanned_lots:
-                                                        # 从会话中移除，允许重新扫描
-                                                        scanned_lots = [lot for lot in scanned_lots if lot != scanned_lot_normalized]
-                                                        session[scanned_lots_key] = scanned_lots
-                                                        session.modified = True
-                                                        _logger.error(
-                                                            f"[扫码验证] 数据库中记录存在但 qty_done=0，从会话中移除: 批次号={scanned_barcode}, "
-                                                            f"记录ID={all_lines_with_lot.ids}, qty_done映射={qty_done_map}, "
-                                                            f"picking_id={picking_id}, 更新后的会话列表={scanned_lots}, "
-                                                            f"允许重新扫描"
-                                                        )
-                                                    # 允许扫描
-                                                    is_duplicate = False
-                                                else:
-                                                    # 有记录的 qty_done > 0，说明已经被扫描过
-                                                    # 但是在方法1中已经检测到了，所以这里不应该到达
-                                                    # 如果到达这里，说明逻辑有问题，记录日志但不视为重复
-                                                    _logger.warning(
-                                                        f"[扫码验证] 数据库中有记录的 qty_done > 0，但未在方法1中检测到: "
-                                                        f"批次号={scanned_barcode}, 记录ID={all_lines_with_lot.ids}, "
-                                                        f"qty_done映射={qty_done_map}"
-                                                    )
-                                                    is_duplicate = False
-                                            else:
-                                                # 数据库中也没有，会话中也没有，说明是第一次扫描
-                                                is_duplicate = False
-                                            
-                                            # **关键修复**：清理会话变量中的重复项
-                                            # 确保会话变量中没有重复的批次号
-                                            if scanned_lots:
-                                                unique_scanned_lots = []
-                                                seen = set()
-                                                for lot in scanned_lots:
-                                                    if lot not in seen:
-                                                        unique_scanned_lots.append(lot)
-                                                        seen.add(lot)
-                                                if len(unique_scanned_lots) != len(scanned_lots):
-                                                    # 有重复项，更新会话变量
-                                                    session[scanned_lots_key] = unique_scanned_lots
-                                                    session.modified = True
-                                                    _logger.error(
-                                                        f"[扫码验证] 清理会话变量中的重复项: picking_id={picking_id}, "
-                                                        f"原始列表={scanned_lots}, 清理后列表={unique_scanned_lots}"
-                                                    )
-                                                    scanned_lots = unique_scanned_lots
-                                        
-                                        if is_duplicate:
-                                            # 批次号已经扫描过，提示重复扫描
-                                            raise UserError(
-                                                _('重复扫描！\n\n'
-                                                  '批次号 "%s" 已经扫描过，请勿重复扫描！\n\n'
-                                                  '如需继续扫描，请联系系统管理员。')
-                                                % scanned_barcode
-                                            )
-                                        else:
-                                            # 批次号还没有扫描过，允许继续
-                                            # **关键修复**：立即将会话变量标记为已扫描
-                                            # 这样在同一个会话中，后续扫描可以立即检测到重复
-                                            if scanned_lot_normalized not in scanned_lots:
-                                                scanned_lots.append(scanned_lot_normalized)
-                                                session[scanned_lots_key] = scanned_lots.copy()
-                                                session.modified = True
-                                                _logger.error(
-                                                    f"[扫码验证] 添加到会话跟踪: 批次号={scanned_barcode}, "
-                                                    f"picking_id={picking_id}, 已扫描列表={scanned_lots}"
-                                                )
-                                            
-                                            # 同时尝试在数据库中标记（如果可能）
-                                            line_ids = all_lines_with_lot.ids
-                                            if line_ids:
-                                                try:
-                                                    # 尝试使用 ORM 方式更新 qty_done（如果字段存在）
-                                                    # 注意：如果 qty_done 不存在，这个操作可能会失败，但不影响会话跟踪
-                                                    all_lines_with_lot.sudo().with_context(
-                                                        skip_duplicate_check=True
-                                                    ).write({'qty_done': 0.0001})
-                                                    all_lines_with_lot.invalidate_recordset(['qty_done'])
-                                                    _logger.error(
-                                                        f"[扫码验证] 在数据库中标记为正在扫描: 批次号={scanned_barcode}, "
-                                                        f"记录ID={line_ids}, 已设置 qty_done=0.0001（标记值）"
-                                                    )
-                                                except Exception as write_error:
-                                                    # 如果更新失败，不影响流程，因为我们已经使用会话跟踪
-                                                    _logger.warning(
-                                                        f"[扫码验证] 数据库标记失败（不影响流程）: {str(write_error)}"
-                                                    )
-                                            
-                                            _logger.error(
-                                                f"[扫码验证] 批次号在预填列表中，且已有记录存在: {scanned_barcode}, "
-                                                f"已存在的记录数={len(all_lines_with_lot)}, "
-                                                f"已存在的记录ID={[l.id for l in all_lines_with_lot]}, "
-                                                f"已添加到会话跟踪，允许继续"
-                                            )
+                                        # 批次号已经扫描过，提示重复扫描
+                                        raise UserError(
+                                            _('重复扫描！\n\n'
+                                              '批次号 "%s" 已经扫描过，请勿重复扫描！\n\n'
+                                              '如需继续扫描，请联系系统管理员。')
+                                            % scanned_barcode
+                                        )
+                                    
+                                    _logger.error(
+                                        f"[扫码验证] 批次号在预填列表中，已登记扫码记录: {scanned_barcode}, "
+                                        f"已存在的记录ID={all_lines_with_lot.ids}, 允许继续"
+                                    )
                                 else:
                                     # 没有预填列表，说明是第一次预填，允许扫描
                                     _logger.error(
@@ -639,12 +364,16 @@ class StockBarcodeController(OriginalStockBarcodeController):
             fetched_data = self._get_records_fields_stock_barcode(records)
             if fetch_quant and model_name == 'product.product':
                 product_ids = records.ids
+            if fetch_quant and model_name == 'stock.lot':
+                scanned_lot_ids = records.ids
             for f_model_name in fetched_data:
                 result[f_model_name] = result[f_model_name] + fetched_data[f_model_name]
 
         if fetch_quant and product_ids:
-            quants = request.env['stock.quant'].search([('product_id', 'in', product_ids)])
-            fetched_data = self._get_records_fields_stock_barcode(quants)
+            # **性能优化**：只获取调拨单源/目标库位（含子库位）中的库存数量，扫描了批次号时只获取该批次号，
+            # 并限制返回条数、只读取扫码界面需要的字段，响应大小不再随总库存量增长
+            quants = self._search_scoped_quants(product_ids, scanned_lot_ids, kwargs)
+            fetched_data = self._get_records_fields_stock_barcode(quants, field_names=QUANT_FETCH_FIELDS)
 
             for f_model_name in fetched_data:
                 result[f_model_name] = result[f_model_name] + fetched_data[f_model_name]
@@ -656,10 +385,258 @@ class StockBarcodeController(OriginalStockBarcodeController):
         
         return result
 
-    def _get_records_fields_stock_barcode(self, records):
-        """获取记录字段（复制自原始实现）"""
+    @http.route('/stock_barcode/get_move_lines_delta', type='json', auth='user')
+    def get_move_lines_delta(self, picking_id, since_revision=0, offset=0, limit=200, **kwargs):
+        """分页/增量加载调拨单的移动行
+        
+        大调拨单（上千行）首次打开时按页加载（since_revision=0），之后只加载修订号大于
+        since_revision 的移动行；之后删除或移到其他调拨单的移动行在 removed_ids 中返回。
+        
+        Args:
+            picking_id (int): 调拨单ID
+            since_revision (int): 客户端已知的扫码修订号
+            offset (int): 分页偏移
+            limit (int): 每页行数
+        
+        Returns:
+            dict: 见 stock.picking._get_barcode_move_lines_delta
+        """
+        picking = request.env['stock.picking'].browse(picking_id)
+        if not picking.exists():
+            return {'warning': _('调拨单不存在')}
+        return picking._get_barcode_move_lines_delta(
+            since_revision=since_revision or 0, offset=offset or 0, limit=limit or None
+        )
+
+    def _get_saved_barcode_data(self, record, base_revision=None):
+        """获取保存后返回给扫码界面的数据（增量模式下只返回变更的移动行）"""
+        if base_revision is not None and record._name == 'stock.picking':
+            return record._get_barcode_move_lines_delta(since_revision=base_revision)
+        return record._get_stock_barcode_data()
+
+    @http.route('/stock_barcode/validate_lot_barcodes', type='json', auth='user')
+    def validate_lot_barcodes(self, picking_id, barcodes, **kwargs):
+        """批量验证扫描的批次号（手持终端连续扫描整托盘时一次提交）
+        
+        所有条码基于同一份调拨单移动行快照进行验证，逐个返回结果，
+        不会因为某个条码不合法而中断整批验证。
+        
+        Args:
+            picking_id (int): 调拨单ID
+            barcodes (list): 扫描的批次号条码列表（按扫描顺序）
+        
+        Returns:
+            dict: {
+                'picking_id': 调拨单ID,
+                'enhanced_validation': 是否启用增强条码验证,
+                'results': [{'barcode': 条码, 'lot_name': 匹配的批次号, 'status': 结果}, ...]
+            }
+            status 取值：accepted（通过）、not_in_prefilled（不在预填列表中）、duplicate（重复扫描）
+        """
+        if not isinstance(barcodes, list):
+            barcodes = [barcodes] if barcodes else []
+        
+        picking = request.env['stock.picking'].browse(int(picking_id))
+        # 与扫码保存和单个扫码登记互斥，在读取调拨单之前加锁
+        picking._acquire_barcode_lock()
+        picking = picking.exists()
+        if not picking:
+            raise UserError(_('调拨单不存在或已被删除！'))
+        
+        enhanced_validation = bool(picking.picking_type_id.enable_enhanced_barcode_validation)
+        if not enhanced_validation:
+            # 未启用增强条码验证，所有条码均视为通过
+            results = [
+                {'barcode': barcode, 'lot_name': barcode, 'status': SCAN_ACCEPTED}
+                for barcode in barcodes if barcode
+            ]
+        else:
+            results = self._validate_lot_barcodes_snapshot(picking, barcodes)
+        
+        _logger.info(
+            f"[批量扫码验证] picking_id={picking.id}, 条码数={len(barcodes)}, "
+            f"增强验证={enhanced_validation}, "
+            f"结果统计={dict((status, sum(1 for r in results if r['status'] == status)) for status in SCAN_STATUSES)}"
+        )
+        return {
+            'picking_id': picking.id,
+            'enhanced_validation': enhanced_validation,
+            'results': results,
+        }
+
+    def _validate_lot_barcodes_snapshot(self, picking, barcodes):
+        """基于同一份快照批量验证批次号条码
+        
+        与单个扫码验证规则一致：
+        1. 没有预填列表时（第一次预填），允许扫描
+        2. 批次号必须在预填列表中（数据库预填记录 + 扫码记录台账中的批次号）
+        3. 批次号对应的记录 qty_done > 0，或在本批次中已出现过，视为重复扫描
+        4. 其余批次号登记到扫码记录台账，登记失败（已被其他扫码枪扫描）视为重复扫描
+        
+        Args:
+            picking (stock.picking): 调拨单
+            barcodes (list): 扫描的批次号条码列表
+        
+        Returns:
+            list: [{'barcode': 条码, 'lot_name': 匹配的批次号, 'status': 结果}, ...]
+        """
+        lot_index = picking._get_prefilled_lot_index()
+        LotScan = request.env['stock.lot.scan'].sudo()
+        prefilled_lot_names = set(lot_index) | set(LotScan._get_scanned_lot_names(picking.id))
+        is_gs1_nomenclature = request.env.company.nomenclature_id.is_gs1_nomenclature
+        
+        # 第一遍：把条码解析为标准化批次号
+        resolved = []
+        for barcode in barcodes:
+            if not barcode:
+                continue
+            lot_key = utils.normalize_lot_name(barcode)
+            if lot_key not in prefilled_lot_names and is_gs1_nomenclature and lot_key.isdigit():
+                # GS1 条码可能带有前导 0 填充，去掉填充后再匹配
+                lot_key = str(int(lot_key))
+            resolved.append((barcode, lot_key))
+        
+        # 一次读取本批次涉及的所有移动行的 qty_done，作为验证快照
+        line_ids = [
+            line_id
+            for lot_key in {lot_key for _barcode, lot_key in resolved}
+            for line_id in lot_index.get(lot_key, {}).get('line_ids', [])
+        ]
+        MoveLine = request.env['stock.move.line'].sudo()
+        qty_done_map = {
+            r['id']: float(r.get('qty_done') or 0.0)
+            for r in MoveLine.browse(line_ids).read(['qty_done'])
+        } if line_ids else {}
+        
+        # 第二遍：逐个条码给出验证结果
+        results = []
+        seen_keys = set()
+        for barcode, lot_key in resolved:
+            entry = lot_index.get(lot_key, {})
+            lot_name = entry.get('name') or barcode
+            if not prefilled_lot_names:
+                status = SCAN_ACCEPTED
+            elif lot_key not in prefilled_lot_names:
+                status = SCAN_NOT_IN_PREFILLED
+            elif lot_key in seen_keys or any(
+                qty_done_map.get(line_id, 0.0) > 0.0 for line_id in entry.get('line_ids', [])
+            ):
+                status = SCAN_DUPLICATE
+            elif LotScan._register_scan(picking.id, lot_name):
+                status = SCAN_ACCEPTED
+            else:
+                status = SCAN_DUPLICATE
+            seen_keys.add(lot_key)
+            results.append({'barcode': barcode, 'lot_name': lot_name, 'status': status})
+        
+        return results
+
+    def _search_scoped_quants(self, product_ids, lot_ids, kwargs):
+        """搜索扫码界面需要的库存数量记录
+        
+        • 能确定当前调拨单时，只搜索调拨单源库位和目标库位（含子库位）
+        • 扫描了批次号时，只搜索这些批次号
+        • 每次最多返回 QUANT_FETCH_LIMIT 条（可通过 quant_limit 参数调整），按ID排序；
+          返回条数等于 limit 时可能还有更多记录，传入 quant_offset 获取下一页
+        
+        Args:
+            product_ids (list): 扫描的产品ID
+            lot_ids (list): 扫描的批次号ID
+            kwargs (dict): get_specific_barcode_data 的请求参数
+        
+        Returns:
+            stock.quant: 库存数量记录
+        """
+        domain = [('product_id', 'in', list(product_ids))]
+        if lot_ids:
+            domain.append(('lot_id', 'in', list(lot_ids)))
+        
+        picking = self._get_request_picking(kwargs)
+        if picking:
+            location_ids = (picking.location_id | picking.location_dest_id).ids
+            if location_ids:
+                domain.append(('location_id', 'child_of', location_ids))
+        
+        limit = int(kwargs.get('quant_limit') or QUANT_FETCH_LIMIT)
+        offset = int(kwargs.get('quant_offset') or 0)
+        quants = request.env['stock.quant'].search(domain, offset=offset, limit=limit, order='id')
+        _logger.info(
+            f"[扫码查询数据] 获取库存数量: 产品数={len(product_ids)}, 批次号数={len(lot_ids)}, "
+            f"picking_id={picking.id if picking else None}, 返回记录数={len(quants)}, "
+            f"offset={offset}, limit={limit}"
+        )
+        return quants
+
+    def _get_request_picking_id(self, kwargs):
+        """从 Referer/请求路径（/barcode-operations/<id>/）、请求参数或上下文中获取当前调拨单ID
+        
+        只有请求来自扫码界面（Referer 或请求路径包含 /barcode-operations/）时，
+        才会使用 res_id、active_id 等含义不明确的参数。
+        
+        Args:
+            kwargs (dict): get_specific_barcode_data 的请求参数
+        
+        Returns:
+            tuple: (是否扫码界面的请求, 调拨单ID，无法确定时为 None)
+        """
+        is_barcode_operation = False
+        picking_id = None
+        if hasattr(request, 'httprequest'):
+            for source in (request.httprequest.headers.get('Referer') or '', request.httprequest.path or ''):
+                if '/barcode-operations/' in source:
+                    is_barcode_operation = True
+                    match = BARCODE_OPERATION_PICKING_RE.search(source)
+                    if match:
+                        picking_id = match.group(1)
+                    break
+        
+        context = kwargs.get('context') or {}
+        if not picking_id:
+            picking_id = (
+                kwargs.get('picking_id') or
+                context.get('active_picking_id') or
+                context.get('default_picking_id') or
+                context.get('picking_id')
+            )
+        if not picking_id and (is_barcode_operation or context.get('active_model') == 'stock.picking'):
+            picking_id = context.get('active_id')
+        if not picking_id and is_barcode_operation:
+            params = getattr(request, 'params', None) or {}
+            picking_id = (
+                kwargs.get('res_id') or kwargs.get('active_id') or
+                params.get('picking_id') or params.get('res_id') or params.get('active_id')
+            )
+        
+        try:
+            picking_id = int(picking_id) if picking_id else None
+        except (TypeError, ValueError):
+            picking_id = None
+        return is_barcode_operation, picking_id
+
+    def _get_request_picking(self, kwargs):
+        """获取当前调拨单（见 _get_request_picking_id）
+        
+        Returns:
+            stock.picking: 调拨单，无法确定时返回空记录集
+        """
+        _is_barcode_operation, picking_id = self._get_request_picking_id(kwargs)
+        Picking = request.env['stock.picking']
+        if not picking_id:
+            return Picking
+        return Picking.browse(picking_id).exists()
+
+    def _get_records_fields_stock_barcode(self, records, field_names=None):
+        """获取记录字段（复制自原始实现）
+        
+        Args:
+            records: 记录集
+            field_names (list): 只读取这些字段（与模型的扫码字段取交集），None 时读取全部扫码字段
+        """
         result = defaultdict(list)
-        result[records._name] = records.read(records._get_fields_stock_barcode(), load=False)
+        barcode_fields = records._get_fields_stock_barcode()
+        if field_names:
+            barcode_fields = [name for name in barcode_fields if name in field_names or name == 'id']
+        result[records._name] = records.read(barcode_fields, load=False)
         if hasattr(records, '_get_stock_barcode_specific_data'):
             records_data_by_model = records._get_stock_barcode_specific_data()
             for res_model in records_data_by_model:
@@ -688,7 +665,22 @@ class StockBarcodeController(OriginalStockBarcodeController):
         - res_id = picking 的 ID
         - write_field = 'move_line_ids'
         - write_vals = 命令列表，格式如 [[1, line_id, {lot_name: 'xxx', ...}], [0, 0, {lot_name: 'yyy', ...}], ...]
+        - base_revision（可选）= 客户端已知的扫码修订号，传入时启用增量模式：
+          客户端只提交变更的移动行，服务端跳过空的更新命令，只返回修订号大于 base_revision 的移动行
+          （格式见 stock.picking._get_barcode_move_lines_delta），而不是整张调拨单的扫码数据；
+          无论作业类型是否启用增强条码验证，stock.picking 都按增量格式返回。
+          base_revision 只对 stock.picking 生效，其他模型始终返回完整的扫码数据
         """
+        # **性能优化**：增量模式下跳过不产生变更的空更新命令 [1, id, {}]，大调拨单不再逐行处理未变更的移动行
+        # 其他命令（包括把移动行关联到调拨单、即设置 picking_id 的 4 命令）都会产生变更，必须保留
+        base_revision = kwargs.pop('base_revision', None)
+        if base_revision is not None and isinstance(write_vals, list):
+            write_vals = [
+                command for command in write_vals
+                if not (isinstance(command, (list, tuple)) and len(command) > 2
+                        and command[0] == 1 and not command[2])
+            ]
+        
         # **关键修复**：使用 ERROR 级别确保日志输出
         _logger.error(
             f"[扫码保存数据] ========== save_barcode_data 被调用 ========== "
@@ -701,8 +693,12 @@ class StockBarcodeController(OriginalStockBarcodeController):
             try:
                 # 解析命令列表，提取批次号信息
                 # 命令格式：[[1, line_id, {lot_name: 'xxx', ...}], [0, 0, {lot_name: 'yyy', ...}], ...]
-                # 1 = 更新现有记录, 0 = 创建新记录, 2 = 删除记录, 3 = 取消链接, 4 = 取消删除, 5 = 删除所有
+                # 1 = 更新现有记录, 0 = 创建新记录, 2 = 删除记录, 3 = 取消关联, 4 = 关联已有记录, 5 = 取消所有关联
                 picking = request.env[model].browse(res_id)
+                # **性能优化**：按调拨单加咨询锁，多个操作员同时保存同一调拨单时排队执行，
+                # 避免并发更新同一批移动行导致序列化失败和整个请求回滚重试；
+                # 在读取调拨单之前加锁，保存逻辑读到的是前一个操作员提交后的数据
+                picking._acquire_barcode_lock()
                 if not picking.exists():
                     _logger.error(f"[扫码保存数据] picking 不存在: res_id={res_id}")
                 else:
@@ -722,6 +718,11 @@ class StockBarcodeController(OriginalStockBarcodeController):
                         _logger.info(
                             f"[扫码保存数据] 作业类型未启用增强条码验证，跳过增强验证: picking_id={res_id}"
                         )
+                        if base_revision is not None:
+                            # 增量模式：与原始保存逻辑一样写入，但按增量格式返回，
+                            # 客户端收到的数据格式不随作业类型配置变化
+                            picking.write({write_field: write_vals})
+                            return self._get_saved_barcode_data(picking, base_revision)
                         # 调用父类方法，使用原始的保存逻辑
                         return super(StockBarcodeController, self).save_barcode_data(
                             model, res_id, write_field, write_vals, allow_duplicate_scan, **kwargs
@@ -733,9 +734,9 @@ class StockBarcodeController(OriginalStockBarcodeController):
                     # 收集所有要创建/更新的批次号
                     scanned_lot_names = {}
                     
-                    # **关键修复**：记录 write_vals 的详细内容，用于调试
-                    _logger.error(
-                        f"[扫码保存数据] write_vals 详细内容: {write_vals}"
+                    # 只记录命令数，大调拨单的完整命令列表会让日志量随行数线性增长
+                    _logger.info(
+                        f"[扫码保存数据] 待处理命令数: {len(write_vals)}, base_revision={base_revision}"
                     )
                     
                     for idx, command in enumerate(write_vals):
@@ -746,10 +747,9 @@ class StockBarcodeController(OriginalStockBarcodeController):
                         line_vals = command[2] if len(command) > 2 else {}
                         line_id = command[1] if command_type == 1 else None
                         
-                        _logger.error(
+                        _logger.debug(
                             f"[扫码保存数据] 处理命令: 索引={idx}, 类型={command_type}, "
-                            f"记录ID={line_id}, line_vals keys={list(line_vals.keys())}, "
-                            f"line_vals={line_vals}"
+                            f"记录ID={line_id}, line_vals keys={list(line_vals.keys())}"
                         )
                         
                         # **关键修复**：不再阻止更新数量
@@ -763,7 +763,7 @@ class StockBarcodeController(OriginalStockBarcodeController):
                         # 方法1：从 line_vals 中获取 lot_name（如果有）
                         if 'lot_name' in line_vals and line_vals.get('lot_name'):
                             lot_name = line_vals.get('lot_name')
-                            scanned_lot_name = str(lot_name).strip().lower()
+                            scanned_lot_name = utils.normalize_lot_name(lot_name)
                         
                         # 方法2：如果是更新命令，从数据库记录中获取 lot_name
                         elif command_type == 1 and line_id:
@@ -771,7 +771,7 @@ class StockBarcodeController(OriginalStockBarcodeController):
                                 existing_line = request.env['stock.move.line'].browse(line_id)
                                 if existing_line.exists() and existing_line.lot_name:
                                     lot_name = existing_line.lot_name
-                                    scanned_lot_name = str(lot_name).strip().lower()
+                                    scanned_lot_name = utils.normalize_lot_name(lot_name)
                                     _logger.info(
                                         f"[扫码保存数据] 从数据库记录获取批次号: 记录ID={line_id}, "
                                         f"批次号={lot_name}, qty_done={existing_line.qty_done}, "
@@ -1046,20 +1046,13 @@ class StockBarcodeController(OriginalStockBarcodeController):
                                 continue
                             
                             # 查询当前移动中所有已保存记录的批次号（预填列表）
-                            existing_lines = request.env['stock.move.line'].search([
-                                ('move_id', '=', move_id),
-                                ('lot_name', '!=', False),
-                                ('lot_name', '!=', ''),
-                            ])
-                            existing_lot_names = [
-                                line.lot_name.strip().lower() 
-                                for line in existing_lines 
-                                if line.lot_name
-                            ]
+                            # **性能优化**：按标准化批次号分组一次查询，不再加载整个移动的移动行
+                            MoveLine = request.env['stock.move.line']
+                            existing_lots = MoveLine._get_move_prefilled_lots(move_id)
                             
                             _logger.error(
                                 f"[扫码保存数据] 验证批次号: 移动ID={move_id}, "
-                                f"预填列表={existing_lot_names}, "
+                                f"预填列表={sorted(existing_lots.values())}, "
                                 f"扫描的批次号={[lot['lot_name'] for lot in lot_info_list]}"
                             )
                             
@@ -1089,12 +1082,6 @@ class StockBarcodeController(OriginalStockBarcodeController):
                                 command_idx = lot_info.get('command_idx')
                                 line_vals = lot_info.get('line_vals', {})
                                 
-                                # 查询当前移动中所有包含此批次号的移动行（包括当前记录本身）
-                                all_lines_with_lot = request.env['stock.move.line'].search([
-                                    ('move_id', '=', move_id),
-                                    ('lot_name', '=', lot_name),
-                                ])
-                                
                                 # **关键修复**：检查是否重复扫描
                                 # 重复扫描的定义：批次号在预填列表中，且已经有记录存在
                                 # **重要**：即使 qty_done=0，只要记录已存在，也应该检测为重复扫描
@@ -1104,12 +1091,12 @@ class StockBarcodeController(OriginalStockBarcodeController):
                                 # 2. 检查是否在同一个请求中有多个命令试图处理同一个批次号
                                 # 3. 检查是否当前命令是更新命令，且批次号已经在预填列表中
                                 
-                                # 排除当前记录本身（如果是更新命令）
-                                existing_lot_names_for_check = [
-                                    line.lot_name.strip().lower() 
-                                    for line in existing_lines 
-                                    if line.lot_name and line.id != line_id
-                                ]
+                                # 查询当前移动中具有相同批次号的其他移动行（排除当前记录本身）
+                                # **性能优化**：使用标准化批次号索引等值查询
+                                duplicate_lines = MoveLine._search_lot_name_lines(
+                                    scanned_lot_name, move_id=move_id,
+                                    exclude_ids=[line_id] if line_id else None
+                                )
                                 
                                 # **关键修复**：如果批次号在预填列表中，检查是否有其他记录
                                 # 或者，如果当前命令是更新命令，且批次号已经在预填列表中，检查是否是重复扫描
@@ -1117,16 +1104,9 @@ class StockBarcodeController(OriginalStockBarcodeController):
                                 duplicate_reason = ""
                                 
                                 # 方法1：检查是否有其他记录（排除当前记录本身）具有相同的批次号
-                                if scanned_lot_name in existing_lot_names_for_check:
-                                    duplicate_lines = [
-                                        line for line in existing_lines 
-                                        if line.lot_name and 
-                                           line.lot_name.strip().lower() == scanned_lot_name and
-                                           line.id != line_id
-                                    ]
-                                    if duplicate_lines:
-                                        is_duplicate = True
-                                        duplicate_reason = f"批次号已存在于其他记录中（记录数={len(duplicate_lines)}）"
+                                if duplicate_lines:
+                                    is_duplicate = True
+                                    duplicate_reason = f"批次号已存在于其他记录中（记录数={len(duplicate_lines)}）"
                                 
                                 # 方法2：检查是否在同一个请求中有多个命令试图处理同一个批次号
                                 # 这在上面已经检查过了（scanned_in_command 重复检查）
@@ -1134,13 +1114,10 @@ class StockBarcodeController(OriginalStockBarcodeController):
                                 # 方法3：如果当前命令是更新命令，且批次号已经在预填列表中，且记录已存在
                                 # **关键修复**：检查当前记录是否已经扫描过（qty_done > 0）
                                 if not is_duplicate and command_type == 1 and line_id:
-                                    if scanned_lot_name in existing_lot_names:
+                                    if scanned_lot_name in existing_lots:
                                         # 批次号在预填列表中，且当前命令是更新命令
                                         # 检查是否有其他记录具有相同的批次号
-                                        other_lines_with_same_lot = [
-                                            line for line in all_lines_with_lot 
-                                            if line.id != line_id
-                                        ]
+                                        other_lines_with_same_lot = duplicate_lines
                                         if other_lines_with_same_lot:
                                             is_duplicate = True
                                             duplicate_reason = f"批次号已存在于其他记录中（记录数={len(other_lines_with_same_lot)}）"
@@ -1248,34 +1225,20 @@ class StockBarcodeController(OriginalStockBarcodeController):
                                                         f"[扫码保存数据] 包裹操作，允许继续: 记录ID={line_id}, "
                                                         f"批次号={lot_name}, qty_done={old_qty_done} -> {new_qty_done}"
                                                     )
-                                                    # **关键修复**：包裹操作时，从会话变量中移除该批次号
+                                                    # **关键修复**：包裹操作时，释放该批次号的扫码记录
                                                     # 因为 qty_done 被设为 0，说明该批次号不再处于"已扫描"状态
                                                     # **关键修复**：同时设置扫描顺序，用于保持包裹中记录的顺序
                                                     try:
-                                                        session = request.session
-                                                        scanned_lots_key = f'scanned_lots_{res_id}'
-                                                        scanned_lots = list(session.get(scanned_lots_key, []) or [])
-                                                        scanned_lot_normalized = str(lot_name).strip().lower()
-                                                        
-                                                        # **关键修复**：设置扫描顺序
-                                                        # 查找该批次号在扫描顺序中的位置
-                                                        if scanned_lot_normalized in scanned_lots:
-                                                            scan_index = scanned_lots.index(scanned_lot_normalized)
-                                                            # 设置扫描顺序（从1开始，不是从0开始）
-                                                            line_vals['scan_sequence'] = scan_index + 1
+                                                        LotScan = request.env['stock.lot.scan'].sudo()
+                                                        scanned_lot_normalized = utils.normalize_lot_name(lot_name)
+                                                        scan_sequence = LotScan._get_scan_sequence_map(res_id).get(scanned_lot_normalized)
+                                                        if scan_sequence:
+                                                            line_vals['scan_sequence'] = scan_sequence
                                                             _logger.info(
                                                                 f"[扫码保存数据] 包裹操作，设置扫描顺序: 记录ID={line_id}, "
-                                                                f"批次号={lot_name}, 扫描顺序={scan_index + 1}"
-                                                            )
-                                                        
-                                                        if scanned_lot_normalized in scanned_lots:
-                                                            scanned_lots.remove(scanned_lot_normalized)
-                                                            session[scanned_lots_key] = scanned_lots
-                                                            session.modified = True
-                                                            _logger.info(
-                                                                f"[扫码保存数据] 包裹操作，从会话中移除批次号: 批次号={lot_name}, "
-                                                                f"picking_id={res_id}, 更新后的会话列表={scanned_lots}"
+                                                                f"批次号={lot_name}, 扫描顺序={scan_sequence}"
                                                             )
+                                                        LotScan._release_scans(res_id, [lot_name])
                                                     except Exception as e:
                                                         _logger.warning(
                                                             f"[扫码保存数据] 包裹操作时处理扫描顺序失败: {str(e)}"
@@ -1336,15 +1299,11 @@ class StockBarcodeController(OriginalStockBarcodeController):
                                         )
                                 
                                 # 检查是否在预填列表中
-                                if existing_lines:
+                                if existing_lots:
                                     # 有预填列表，检查批次号是否在列表中
-                                    if scanned_lot_name not in existing_lot_names:
+                                    if scanned_lot_name not in existing_lots:
                                         # 批次号不在预填列表中
-                                        unique_lot_names = list(set([
-                                            line.lot_name 
-                                            for line in existing_lines 
-                                            if line.lot_name and line.lot_name.strip()
-                                        ]))
+                                        unique_lot_names = sorted(existing_lots.values())
                                         _logger.error(
                                             f"[扫码保存数据] 阻止保存: 批次号 {lot_name} 不在预填列表中, "
                                             f"移动ID={move_id}, 预填列表={unique_lot_names}"
@@ -1392,7 +1351,7 @@ class StockBarcodeController(OriginalStockBarcodeController):
                 )
                 # 解析出错时不阻止，让原始逻辑处理
         
-        # **关键修复**：在保存之前处理删除命令，从会话中移除批次号
+        # **关键修复**：在保存之前处理删除命令，释放批次号的扫码记录
         # 这样可以在记录被删除之前读取批次号
         deleted_lots_before_save = []
         if res_id and model == 'stock.picking' and isinstance(write_vals, list):
@@ -1416,7 +1375,7 @@ class StockBarcodeController(OriginalStockBarcodeController):
                                 read_result = deleted_line.read(['lot_name'])
                                 if read_result and read_result[0].get('lot_name'):
                                     deleted_lot_name = read_result[0].get('lot_name')
-                                    deleted_lot_normalized = str(deleted_lot_name).strip().lower()
+                                    deleted_lot_normalized = utils.normalize_lot_name(deleted_lot_name)
                                     if deleted_lot_normalized not in deleted_lots_before_save:
                                         deleted_lots_before_save.append(deleted_lot_normalized)
                                         _logger.error(
@@ -1428,50 +1387,12 @@ class StockBarcodeController(OriginalStockBarcodeController):
                                 f"[扫码保存数据] 读取删除记录的批次号失败: 记录ID={line_id}, 错误={str(e)}"
                             )
                 
-                # 在保存之前，从会话中移除被删除的批次号
+                # 在保存之前，释放被删除批次号的扫码记录，允许重新扫描
                 if deleted_lots_before_save:
-                    session = request.session
-                    scanned_lots_key = f'scanned_lots_{res_id}'
-                    scanned_lots = list(session.get(scanned_lots_key, []) or [])
-                    
-                    # **关键修复**：移除所有被删除的批次号（包括重复的）
-                    # 使用列表推导式，移除所有匹配的批次号，而不是只移除第一个
-                    original_scanned_lots = scanned_lots.copy()
-                    for deleted_lot_normalized in deleted_lots_before_save:
-                        # 移除所有匹配的批次号（可能有多条重复的）
-                        scanned_lots = [lot for lot in scanned_lots if lot != deleted_lot_normalized]
-                    
-                    # 如果列表发生了变化，更新会话变量
-                    if scanned_lots != original_scanned_lots:
-                        session[scanned_lots_key] = scanned_lots
-                        session.modified = True
-                        removed_lots = set(original_scanned_lots) - set(scanned_lots)
-                        _logger.error(
-                            f"[扫码保存数据] 保存前从会话中移除被删除的批次号: 移除的批次号={list(removed_lots)}, "
-                            f"picking_id={res_id}, 原始列表={original_scanned_lots}, 更新后的会话列表={scanned_lots}"
-                        )
-                    
-                    # **关键修复**：清理会话变量中的重复项
-                    # 确保会话变量中没有重复的批次号
-                    if scanned_lots:
-                        unique_scanned_lots = []
-                        seen = set()
-                        for lot in scanned_lots:
-                            if lot not in seen:
-                                unique_scanned_lots.append(lot)
-                                seen.add(lot)
-                        if len(unique_scanned_lots) != len(scanned_lots):
-                            # 有重复项，更新会话变量
-                            session[scanned_lots_key] = unique_scanned_lots
-                            session.modified = True
-                            _logger.error(
-                                f"[扫码保存数据] 保存前清理会话变量中的重复项: picking_id={res_id}, "
-                                f"原始列表={scanned_lots}, 清理后列表={unique_scanned_lots}"
-                            )
-                    
+                    request.env['stock.lot.scan'].sudo()._release_scans(res_id, deleted_lots_before_save)
                     _logger.error(
-                        f"[扫码保存数据] 保存前会话变量已更新: picking_id={res_id}, "
-                        f"最终会话中的批次号={session.get(scanned_lots_key, [])}"
+                        f"[扫码保存数据] 保存前释放被删除批次号的扫码记录: picking_id={res_id}, "
+                        f"批次号={deleted_lots_before_save}"
                     )
             except Exception as e:
                 _logger.warning(
@@ -1511,17 +1432,17 @@ class StockBarcodeController(OriginalStockBarcodeController):
                     _logger.error(
                         f"[扫码保存数据] write_vals 为空，不执行保存操作，返回原始数据"
                     )
-                    result = target_record._get_stock_barcode_data()
+                    result = self._get_saved_barcode_data(target_record, base_revision)
                 else:
                     target_record.write({write_field: write_vals})
-                    result = target_record._get_stock_barcode_data()
+                    result = self._get_saved_barcode_data(target_record, base_revision)
                     _logger.error(
                         f"[扫码保存数据] write 调用完成: 模型={model}, 记录ID={res_id}, "
                         f"字段={write_field}, 结果记录数={len(result) if isinstance(result, list) else 1}"
                     )
             
-            # **关键修复**：保存成功后，更新会话变量，标记批次号已扫描
-            # 只有在保存成功后才添加到会话列表
+            # **关键修复**：保存成功后，登记扫码记录，标记批次号已扫描
+            # 只有在保存成功后才登记
             if res_id and model == 'stock.picking':
                 try:
                     _logger.error(
@@ -1531,6 +1452,8 @@ class StockBarcodeController(OriginalStockBarcodeController):
                     
                     # **关键修复**：提取新增/更新的批次号，添加到会话中
                     scanned_lots_in_request = []
+                    # 标准化批次号 -> 扫描时的原始批次号（登记扫码记录时保存原始批次号，由 _register_scan 自行标准化）
+                    scanned_lot_names_in_request = {}
                     
                     if isinstance(write_vals, list):
                         _logger.error(
@@ -1637,9 +1560,10 @@ class StockBarcodeController(OriginalStockBarcodeController):
                                     continue  # 跳过，不添加到会话变量
                             
                             if lot_name:
-                                scanned_lot_normalized = str(lot_name).strip().lower()
+                                scanned_lot_normalized = utils.normalize_lot_name(lot_name)
                                 if scanned_lot_normalized not in scanned_lots_in_request:
                                     scanned_lots_in_request.append(scanned_lot_normalized)
+                                    scanned_lot_names_in_request[scanned_lot_normalized] = str(lot_name).strip()
                                     _logger.error(
                                         f"[扫码保存数据] 添加到批次号列表: 批次号={scanned_lot_normalized}, "
                                         f"原始批次号={lot_name}, 当前列表={scanned_lots_in_request}"
@@ -1650,149 +1574,19 @@ class StockBarcodeController(OriginalStockBarcodeController):
                         f"res_id={res_id}, model={model}"
                     )
                     
-                    # **关键修复**：更新会话变量，添加新增/更新的批次号
-                    # **关键修复**：同时处理包裹操作，确保所有被放入包裹的记录都按照扫描顺序设置 scan_sequence
+                    # **关键修复**：登记新增/更新的批次号到扫码记录台账
+                    # 已登记的批次号不会重复登记（ON CONFLICT），保留首次扫描顺序
                     if scanned_lots_in_request:
-                        session = request.session
-                        scanned_lots_key = f'scanned_lots_{res_id}'
-                        scanned_lots = list(session.get(scanned_lots_key, []) or [])
-                        
-                        _logger.error(
-                            f"[扫码保存数据] 更新会话变量: picking_id={res_id}, "
-                            f"新增/更新的批次号={scanned_lots_in_request}, 当前会话中的批次号={scanned_lots}"
-                        )
-                        
-                        # **关键修复**：先同步会话变量与数据库状态，移除数据库中不存在的批次号
-                        # **关键修复**：同时移除 qty_done=0 的批次号（这些是包裹操作，不应该在会话中）
-                        # 这样可以确保会话变量与数据库状态一致
-                        # **关键修复**：但是，放入包裹时，qty_done 会被设为 0，所以我们需要在放入包裹时保存扫描顺序
-                        try:
-                            # 查询所有有批次号的移动行
-                            picking = request.env['stock.picking'].browse(res_id)
-                            if picking.exists():
-                                all_lines_with_lot = request.env['stock.move.line'].search([
-                                    ('picking_id', '=', res_id),
-                                    ('lot_name', '!=', False),
-                                    ('lot_name', '!=', ''),
-                                ])
-                                
-                                # **关键修复**：处理包裹操作，确保所有被放入包裹的记录都按照扫描顺序设置 scan_sequence
-                                # 放入包裹时，可能多个记录同时被放入，我们需要按照扫描顺序设置 scan_sequence
-                                # 首先，找出所有被放入包裹的记录（result_package_id 不为 False 的记录）
-                                package_lines = all_lines_with_lot.filtered(lambda l: l.result_package_id)
-                                
-                                if package_lines:
-                                    # 有记录被放入包裹，按照扫描顺序设置 scan_sequence
-                                    for line in package_lines:
-                                        if line.lot_name:
-                                            lot_name_normalized = line.lot_name.strip().lower()
-                                            # 查找该批次号在扫描顺序中的位置
-                                            # **关键修复**：使用完整的 scanned_lots 列表（包括新添加的批次号）
-                                            full_scanned_lots = scanned_lots + scanned_lots_in_request
-                                            # 去重，保持顺序
-                                            seen_lots = set()
-                                            unique_full_scanned_lots = []
-                                            for lot in full_scanned_lots:
-                                                if lot not in seen_lots:
-                                                    unique_full_scanned_lots.append(lot)
-                                                    seen_lots.add(lot)
-                                            
-                                            try:
-                                                scan_index = unique_full_scanned_lots.index(lot_name_normalized)
-                                                # 设置扫描顺序（从1开始，不是从0开始）
-                                                try:
-                                                    line.with_context(skip_quantity_fix=True).write({'scan_sequence': scan_index + 1})
-                                                    _logger.info(
-                                                        f"[扫码保存数据] 包裹操作，设置扫描顺序: 记录ID={line.id}, "
-                                                        f"批次号={line.lot_name}, 扫描顺序={scan_index + 1}"
-                                                    )
-                                                except Exception as e:
-                                                    _logger.warning(
-                                                        f"[扫码保存数据] 包裹操作，设置扫描顺序失败: 记录ID={line.id}, "
-                                                        f"批次号={line.lot_name}, 错误={str(e)}"
-                                                    )
-                                            except ValueError:
-                                                # 批次号不在扫描列表中，保持原有顺序
-                                                _logger.debug(
-                                                    f"[扫码保存数据] 包裹操作，批次号不在扫描列表中: 记录ID={line.id}, "
-                                                    f"批次号={line.lot_name}"
-                                                )
-                                
-                                # 获取数据库中所有存在的批次号（标准化后），且 qty_done > 0
-                                # **关键修复**：只有 qty_done > 0 的批次号才应该保留在会话变量中
-                                # qty_done = 0 的批次号是包裹操作，不应该在会话中
-                                db_lot_names_with_qty_done = set()
-                                for line in all_lines_with_lot:
-                                    if line.lot_name:
-                                        try:
-                                            # 清除缓存，读取最新的 qty_done
-                                            line.invalidate_recordset(['qty_done'])
-                                            read_result = line.read(['qty_done'])
-                                            qty_done = read_result[0].get('qty_done', 0.0) or 0.0 if read_result else 0.0
-                                            
-                                            # 只有 qty_done > 0 的批次号才应该保留在会话变量中
-                                            if qty_done > 0:
-                                                db_lot_names_with_qty_done.add(line.lot_name.strip().lower())
-                                        except Exception as e:
-                                            # 如果读取失败，使用属性访问
-                                            try:
-                                                qty_done = line.qty_done or 0.0
-                                                if qty_done > 0:
-                                                    db_lot_names_with_qty_done.add(line.lot_name.strip().lower())
-                                            except:
-                                                # 如果还是失败，保守处理：不添加到集合中
-                                                pass
-                                
-                                # 从会话变量中移除数据库中不存在的批次号，或 qty_done = 0 的批次号
-                                original_scanned_lots = scanned_lots.copy()
-                                scanned_lots = [lot for lot in scanned_lots if lot in db_lot_names_with_qty_done]
-                                
-                                if len(scanned_lots) != len(original_scanned_lots):
-                                    removed_lots = set(original_scanned_lots) - set(scanned_lots)
-                                    _logger.error(
-                                        f"[扫码保存数据] 同步会话变量: picking_id={res_id}, "
-                                        f"从会话中移除的批次号={list(removed_lots)} "
-                                        f"（数据库中不存在或 qty_done=0）, "
-                                        f"原始列表={original_scanned_lots}, 同步后列表={scanned_lots}"
-                                    )
-                        except Exception as e:
-                            _logger.warning(f"[扫码保存数据] 同步会话变量时出错: {str(e)}")
-                        
-                        # 添加新增/更新的批次号
+                        LotScan = request.env['stock.lot.scan'].sudo()
                         for scanned_lot_normalized in scanned_lots_in_request:
-                            if scanned_lot_normalized not in scanned_lots:
-                                scanned_lots.append(scanned_lot_normalized)
-                                _logger.error(
-                                    f"[扫码保存数据] 保存成功后，添加到会话跟踪: 批次号={scanned_lot_normalized}, "
-                                    f"picking_id={res_id}, 已扫描列表={scanned_lots}"
-                                )
-                        
-                        # **关键修复**：清理会话变量中的重复项
-                        # 确保会话变量中没有重复的批次号
-                        if scanned_lots:
-                            unique_scanned_lots = []
-                            seen = set()
-                            for lot in scanned_lots:
-                                if lot not in seen:
-                                    unique_scanned_lots.append(lot)
-                                    seen.add(lot)
-                            if len(unique_scanned_lots) != len(scanned_lots):
-                                # 有重复项，更新会话变量
-                                _logger.error(
-                                    f"[扫码保存数据] 清理会话变量中的重复项: picking_id={res_id}, "
-                                    f"原始列表={scanned_lots}, 清理后列表={unique_scanned_lots}"
-                                )
-                                scanned_lots = unique_scanned_lots
-                        
-                        session[scanned_lots_key] = scanned_lots
-                        session.modified = True
+                            LotScan._register_scan(res_id, scanned_lot_names_in_request[scanned_lot_normalized])
                         _logger.error(
-                            f"[扫码保存数据] 会话变量已更新: picking_id={res_id}, "
-                            f"最终会话中的批次号={session.get(scanned_lots_key, [])}"
+                            f"[扫码保存数据] 保存成功后，登记扫码记录: picking_id={res_id}, "
+                            f"批次号={scanned_lots_in_request}"
                         )
                 except Exception as e:
                     _logger.error(
-                        f"[扫码保存数据] 更新会话变量失败: {str(e)}", 
+                        f"[扫码保存数据] 登记扫码记录失败: {str(e)}", 
                         exc_info=True
                     )
             
@@ -1809,116 +1603,51 @@ class StockBarcodeController(OriginalStockBarcodeController):
                         # **关键修复**：查询所有有批次号且已放入包裹的记录
                         # 按照 scan_sequence 排序，确保顺序正确
                         # **关键**：由于模型的 _order 已设置为 'scan_sequence, id'，所以查询结果会自动按照扫描顺序排序
-                        package_lines = request.env['stock.move.line'].search([
+                        package_domain = [
                             ('picking_id', '=', res_id),
                             ('lot_name', '!=', False),
                             ('lot_name', '!=', ''),
                             ('result_package_id', '!=', False),
-                        ], order='scan_sequence, id')  # 显式指定排序，确保按照扫描顺序排序
+                        ]
+                        # **性能优化**：增量模式下只处理本次保存变更过的移动行
+                        if base_revision is not None:
+                            package_domain.append(('barcode_revision', '>', base_revision))
+                        package_lines = request.env['stock.move.line'].search(
+                            package_domain, order='scan_sequence, id'
+                        )  # 显式指定排序，确保按照扫描顺序排序
                         
                         _logger.info(
                             f"[扫码保存数据] 保存后查询包裹记录: picking_id={res_id}, "
-                            f"包裹记录数={len(package_lines)}, 记录ID={[l.id for l in package_lines]}, "
-                            f"包裹ID={[l.result_package_id.id if l.result_package_id else False for l in package_lines]}"
+                            f"包裹记录数={len(package_lines)}"
                         )
                         
                         if package_lines:
-                            session = request.session
-                            scanned_lots_key = f'scanned_lots_{res_id}'
-                            scanned_lots = list(session.get(scanned_lots_key, []) or [])
-                            
-                            # **关键修复**：按包裹分组，统计每个包裹中的记录数
-                            # 这样可以更好地支持多个包裹的情况
-                            package_groups = {}
-                            for line in package_lines:
-                                package_id = line.result_package_id.id if line.result_package_id else False
-                                if package_id not in package_groups:
-                                    package_groups[package_id] = []
-                                package_groups[package_id].append(line)
-                            
+                            # **关键修复**：按照扫码记录台账中的扫描顺序，为所有被放入包裹的记录设置 scan_sequence
+                            # 无论有多少个包裹，都会正确处理每个包裹中的记录
+                            sequence_map = request.env['stock.lot.scan'].sudo()._get_scan_sequence_map(res_id)
                             _logger.info(
                                 f"[扫码保存数据] 保存后处理包裹操作: picking_id={res_id}, "
-                                f"会话中的批次号={scanned_lots}, 包裹记录数={len(package_lines)}, "
-                                f"包裹数量={len(package_groups)}, 包裹ID={list(package_groups.keys())}"
+                                f"包裹记录数={len(package_lines)}, 已登记扫描顺序数={len(sequence_map)}"
                             )
-                            
-                            # **关键修复**：如果会话变量中没有扫描顺序，从数据库记录中恢复
-                            # 这样可以确保即使会话变量丢失，也能保持扫描顺序
-                            # **关键**：按照记录的创建时间或 ID 顺序，重建扫描顺序
-                            if not scanned_lots:
-                                # 从数据库记录中恢复扫描顺序
-                                # 按照记录的创建时间或 ID 顺序，重建扫描顺序
-                                scanned_lots = []
-                                # 按照记录的创建时间排序，获取扫描顺序
-                                sorted_lines = package_lines.sorted(lambda l: (l.create_date or fields.Datetime.now(), l.id))
-                                for line in sorted_lines:
-                                    if line.lot_name:
-                                        lot_name_normalized = line.lot_name.strip().lower()
-                                        if lot_name_normalized not in scanned_lots:
-                                            scanned_lots.append(lot_name_normalized)
-                                
-                                # 更新会话变量
-                                session[scanned_lots_key] = scanned_lots
-                                session.modified = True
-                                _logger.info(
-                                    f"[扫码保存数据] 从数据库记录恢复扫描顺序: picking_id={res_id}, "
-                                    f"扫描顺序={scanned_lots}"
-                                )
-                            
-                            # **关键修复**：按照扫描顺序，为所有被放入包裹的记录设置 scan_sequence
-                            # 这样可以确保所有包裹（无论有多少个）中的记录都按照扫描顺序排列
-                            # **关键修复**：支持多个包裹（三个、四个、五个...），每个包裹中的记录都按照扫描顺序设置
-                            if scanned_lots:
-                                _logger.info(
-                                    f"[扫码保存数据] 开始为包裹记录设置扫描顺序: picking_id={res_id}, "
-                                    f"会话中的批次号={scanned_lots}, 包裹记录数={len(package_lines)}, "
-                                    f"包裹数量={len(package_groups)}"
-                                )
-                                # **关键修复**：为每个包裹中的每个记录设置扫描顺序
-                                # 无论有多少个包裹，都会正确处理每个包裹中的记录
-                                for package_id, lines in package_groups.items():
-                                    _logger.info(
-                                        f"[扫码保存数据] 处理包裹 {package_id}: 记录数={len(lines)}, "
-                                        f"记录ID={[l.id for l in lines]}"
-                                    )
-                                    for line in lines:
-                                        if line.lot_name:
-                                            lot_name_normalized = line.lot_name.strip().lower()
-                                            try:
-                                                scan_index = scanned_lots.index(lot_name_normalized)
-                                                # 设置扫描顺序（从1开始，不是从0开始）
-                                                try:
-                                                    current_scan_sequence = line.scan_sequence or 0
-                                                    if current_scan_sequence != scan_index + 1:
-                                                        line.with_context(skip_quantity_fix=True).write({'scan_sequence': scan_index + 1})
-                                                        _logger.info(
-                                                            f"[扫码保存数据] 包裹操作后，设置扫描顺序: 记录ID={line.id}, "
-                                                            f"批次号={line.lot_name}, 扫描顺序={scan_index + 1}, "
-                                                            f"包裹ID={package_id}"
-                                                        )
-                                                    else:
-                                                        _logger.debug(
-                                                            f"[扫码保存数据] 包裹操作后，扫描顺序已正确: 记录ID={line.id}, "
-                                                            f"批次号={line.lot_name}, 扫描顺序={current_scan_sequence}, "
-                                                            f"包裹ID={package_id}"
-                                                        )
-                                                except Exception as e:
-                                                    _logger.warning(
-                                                        f"[扫码保存数据] 包裹操作后，设置扫描顺序失败: 记录ID={line.id}, "
-                                                        f"批次号={line.lot_name}, 包裹ID={package_id}, 错误={str(e)}", 
-                                                        exc_info=True
-                                                    )
-                                            except ValueError:
-                                                # 批次号不在扫描列表中，保持原有顺序
-                                                _logger.warning(
-                                                    f"[扫码保存数据] 包裹操作后，批次号不在扫描列表中: 记录ID={line.id}, "
-                                                    f"批次号={line.lot_name}, 包裹ID={package_id}, 会话中的批次号={scanned_lots}"
-                                                )
-                            else:
-                                _logger.warning(
-                                    f"[扫码保存数据] 保存后处理包裹操作，但会话中没有批次号: picking_id={res_id}, "
-                                    f"包裹数量={len(package_groups)}"
-                                )
+                            for line in package_lines:
+                                scan_sequence = sequence_map.get(utils.normalize_lot_name(line.lot_name))
+                                if not scan_sequence:
+                                    # 批次号不在扫码记录中，保持原有顺序
+                                    continue
+                                if (line.scan_sequence or 0) != scan_sequence:
+                                    try:
+                                        line.with_context(skip_quantity_fix=True).write({'scan_sequence': scan_sequence})
+                                        _logger.info(
+                                            f"[扫码保存数据] 包裹操作后，设置扫描顺序: 记录ID={line.id}, "
+                                            f"批次号={line.lot_name}, 扫描顺序={scan_sequence}, "
+                                            f"包裹ID={line.result_package_id.id}"
+                                        )
+                                    except Exception as e:
+                                        _logger.warning(
+                                            f"[扫码保存数据] 包裹操作后，设置扫描顺序失败: 记录ID={line.id}, "
+                                            f"批次号={line.lot_name}, 错误={str(e)}",
+                                            exc_info=True
+                                        )
                         else:
                             _logger.debug(
                                 f"[扫码保存数据] 保存后处理包裹操作，但没有找到包裹记录: picking_id={res_id}"
@@ -1947,6 +1676,11 @@ class StockBarcodeController(OriginalStockBarcodeController):
             raise
         
         # 如果不是 stock.picking 的 move_line_ids 写入，或者没有启用增强验证，调用父类方法
+        # （base_revision 只对 stock.picking 生效，其他模型返回完整的扫码数据）
+        if base_revision is not None and model == 'stock.picking' and res_id:
+            picking = request.env[model].browse(res_id)
+            picking.write({write_field: write_vals})
+            return self._get_saved_barcode_data(picking, base_revision)
         return super(StockBarcodeController, self).save_barcode_data(
             model, res_id, write_field, write_vals, allow_duplicate_scan, **kwargs
         )
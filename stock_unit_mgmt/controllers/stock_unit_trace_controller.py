@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+
+import logging
+
+from odoo import http, _
+from odoo.exceptions import AccessError
+from odoo.http import request
+
+from ..models import tracing
+
+_logger = logging.getLogger(__name__)
+
+
+class StockUnitTraceController(http.Controller):
+    """热路径追踪记录查看（仅系统管理员）"""
+
+    def _check_trace_access(self):
+        if not request.env.user.has_group('base.group_system'):
+            raise AccessError(_('只有系统管理员可以查看追踪记录！'))
+
+    @http.route('/stock_unit_mgmt/trace', type='json', auth='user')
+    def get_trace_records(self, limit=100, **kwargs):
+        """获取当前数据库的追踪记录（最新的在前）
+
+        Args:
+            limit (int): 返回的最大记录数
+
+        Returns:
+            dict: {'enabled': 数据库级是否开启, 'records': 追踪记录列表}
+        """
+        self._check_trace_access()
+        return {
+            'enabled': tracing.is_enabled(request.env(context={})),
+            'records': tracing.get_records(request.env.cr.dbname, limit=limit),
+        }
+
+    @http.route('/stock_unit_mgmt/trace/clear', type='json', auth='user')
+    def clear_trace_records(self, **kwargs):
+        """清空当前数据库的追踪记录"""
+        self._check_trace_access()
+        tracing.clear_records(request.env.cr.dbname)
+        _logger.info(f"[热路径追踪] 追踪记录已清空: 数据库={request.env.cr.dbname}, 用户={request.env.uid}")
+        return True
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+
+import logging
+
+from odoo import api, SUPERUSER_ID
+
+_logger = logging.getLogger(__name__)
+
+
+def migrate(cr, version):
+    """升级到 1.1.0：根据历史已完成移动行生成批次单位台账和余额
+
+    批次单位台账在 1.1.0 引入，全新安装时由 post_init_hook 生成；
+    已部署的数据库升级时不会执行 post_init_hook，余额表为空，
+    库存数量重新计算时会找不到余额而把单位数量置为 0，这里补建一次。
+    """
+    if not version:
+        return
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    _logger.info("[批次单位台账] 升级到 1.1.0，根据历史移动行生成批次单位台账")
+    env['stock.lot.unit.ledger']._rebuild_from_history()
@@ -1,11 +1,18 @@
 # -*- coding: utf-8 -*-
 
 from . import utils
+from . import ir_config_parameter
 from . import product_template
+from . import uom_uom
+from . import product_stock_summary
 from . import stock_move
 from . import stock_move_line
+from . import stock_move_line_barcode_removal
 from . import stock_quant
 from . import stock_lot
+from . import stock_lot_scan
+from . import stock_lot_unit_ledger
+from . import stock_lot_unit_report
 from . import stock_picking
 from . import stock_picking_type
 from . import mrp_production
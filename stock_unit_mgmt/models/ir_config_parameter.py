@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, api
+from odoo.tools import ormcache, str2bool
+
+from . import tracing
+
+
+class IrConfigParameter(models.Model):
+    _inherit = 'ir.config_parameter'
+
+    @api.model
+    @ormcache()
+    def _get_stock_unit_trace_enabled(self):
+        """数据库级是否开启热路径追踪（系统参数 stock_unit_mgmt.trace_enabled）
+
+        被追踪的方法每次调用都要检查开关，结果缓存在注册表的 ormcache 中；
+        系统参数的创建/修改/删除会清除 ormcache 并通知其他 worker，不需要单独失效。
+
+        Returns:
+            bool: 是否开启追踪
+        """
+        return str2bool(self.sudo().get_param(tracing.TRACE_PARAM) or 'False', False)
@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+
+import logging
+
+from odoo import models, fields, api
+
+_logger = logging.getLogger(__name__)
+
+# 影响汇总的库存数量列，只有这些列变化时触发器才记录差额
+SUMMARY_QUANT_COLUMNS = ['quantity', 'location_id', 'product_id', 'lot_id', 'lot_quantity', 'o_note1', 'o_note2']
+
+
+class ProductTemplateStockSummary(models.Model):
+    """产品库存汇总（差额记录）
+
+    stock_quant 上的触发器在库存数量变化时按差额追加记录（只插入，不更新已有行），
+    多个事务同时修改同一产品的库存时不会争用同一行；
+    产品模板的汇总字段读取时按模板求和，定时任务把差额合并为每个模板/备注一行。
+
+    只统计内部库位的库存数量：
+    • quantity / quantity_no_note1 / quantity_no_note2 / quantity_no_notes：在手数量（安全库存规则使用）
+    • lot_quantity：在手数量大于 0 的附加单位数量
+    • roll_count：在手数量大于 0 且有批次号的记录数（实际卷数）
+    • note / note_count：在手数量大于 0 的记录中每个备注内容出现的次数（备注卷数）
+    """
+    _name = 'product.template.stock.summary'
+    _description = '产品库存汇总'
+    _log_access = False
+
+    product_tmpl_id = fields.Many2one(
+        'product.template', string='产品模板', required=True, index=True, ondelete='cascade'
+    )
+    note = fields.Char(string='备注')
+    quantity = fields.Float(string='在手数量', default=0.0)
+    quantity_no_note1 = fields.Float(string='在手数量（不含备注1）', default=0.0)
+    quantity_no_note2 = fields.Float(string='在手数量（不含备注2）', default=0.0)
+    quantity_no_notes = fields.Float(string='在手数量（不含备注）', default=0.0)
+    lot_quantity = fields.Float(string='附加单位数量', digits=(16, 2), default=0.0)
+    roll_count = fields.Integer(string='实际卷数', default=0)
+    note_count = fields.Integer(string='备注数', default=0)
+
+    @api.model
+    def _setup_quant_trigger(self):
+        """创建 stock_quant 触发器，首次安装时按现有库存生成汇总
+
+        由 stock.quant.init() 调用，不放在本模型的 init() 中：本模型先于 stock.quant 初始化，
+        此时 stock_quant 上本模块的列（lot_quantity、o_note1、o_note2）可能尚未创建。
+        安装和升级时都会执行，可重复执行。
+        """
+        self.env.cr.execute("""
+            CREATE OR REPLACE FUNCTION stock_unit_mgmt_quant_summary_rows(q stock_quant, sign integer)
+            RETURNS void AS $$
+            DECLARE
+                tmpl_id integer;
+                qty double precision;
+            BEGIN
+                IF q.location_id IS NULL OR NOT EXISTS (
+                    SELECT 1 FROM stock_location WHERE id = q.location_id AND usage = 'internal'
+                ) THEN
+                    RETURN;
+                END IF;
+                SELECT product_tmpl_id INTO tmpl_id FROM product_product WHERE id = q.product_id;
+                IF tmpl_id IS NULL THEN
+                    RETURN;
+                END IF;
+                qty := COALESCE(q.quantity, 0);
+                INSERT INTO product_template_stock_summary (
+                    product_tmpl_id, quantity, quantity_no_note1, quantity_no_note2, quantity_no_notes,
+                    lot_quantity, roll_count, note_count
+                ) VALUES (
+                    tmpl_id,
+                    sign * qty,
+                    CASE WHEN COALESCE(q.o_note1, '') = '' THEN sign * qty ELSE 0 END,
+                    CASE WHEN COALESCE(q.o_note2, '') = '' THEN sign * qty ELSE 0 END,
+                    CASE WHEN COALESCE(q.o_note1, '') = '' AND COALESCE(q.o_note2, '') = '' THEN sign * qty ELSE 0 END,
+                    CASE WHEN qty > 0 THEN sign * COALESCE(q.lot_quantity, 0) ELSE 0 END,
+                    CASE WHEN qty > 0 AND q.lot_id IS NOT NULL THEN sign ELSE 0 END,
+                    0
+                );
+                IF qty > 0 AND COALESCE(q.o_note1, '') != '' THEN
+                    INSERT INTO product_template_stock_summary (product_tmpl_id, note, note_count)
+                    VALUES (tmpl_id, q.o_note1, sign);
+                END IF;
+                IF qty > 0 AND COALESCE(q.o_note2, '') != '' THEN
+                    INSERT INTO product_template_stock_summary (product_tmpl_id, note, note_count)
+                    VALUES (tmpl_id, q.o_note2, sign);
+                END IF;
+            END;
+            $$ LANGUAGE plpgsql;
+
+            CREATE OR REPLACE FUNCTION stock_unit_mgmt_quant_summary_trigger()
+            RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                    PERFORM stock_unit_mgmt_quant_summary_rows(OLD, -1);
+                END IF;
+                IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                    PERFORM stock_unit_mgmt_quant_summary_rows(NEW, 1);
+                END IF;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql;
+
+            DROP TRIGGER IF EXISTS stock_unit_mgmt_quant_summary ON stock_quant;
+            CREATE TRIGGER stock_unit_mgmt_quant_summary
+                AFTER INSERT OR DELETE OR UPDATE OF %s ON stock_quant
+                FOR EACH ROW EXECUTE FUNCTION stock_unit_mgmt_quant_summary_trigger();
+        """ % ', '.join(SUMMARY_QUANT_COLUMNS))
+
+        self.env.cr.execute("SELECT 1 FROM product_template_stock_summary LIMIT 1")
+        if not self.env.cr.fetchone():
+            self._rebuild()
+
+    @api.model
+    def _rebuild(self):
+        """清空汇总，按现有库存数量重新生成"""
+        self.env['stock.quant'].flush_model(SUMMARY_QUANT_COLUMNS)
+        self.env.cr.execute("DELETE FROM product_template_stock_summary")
+        self.env.cr.execute("""
+            INSERT INTO product_template_stock_summary (
+                product_tmpl_id, quantity, quantity_no_note1, quantity_no_note2, quantity_no_notes,
+                lot_quantity, roll_count, note_count
+            )
+            SELECT pp.product_tmpl_id,
+                   SUM(q.quantity),
+                   SUM(q.quantity) FILTER (WHERE COALESCE(q.o_note1, '') = ''),
+                   SUM(q.quantity) FILTER (WHERE COALESCE(q.o_note2, '') = ''),
+                   SUM(q.quantity) FILTER (WHERE COALESCE(q.o_note1, '') = '' AND COALESCE(q.o_note2, '') = ''),
+                   SUM(COALESCE(q.lot_quantity, 0)) FILTER (WHERE q.quantity > 0),
+                   COUNT(*) FILTER (WHERE q.quantity > 0 AND q.lot_id IS NOT NULL),
+                   0
+              FROM stock_quant q
+              JOIN stock_location sl ON sl.id = q.location_id AND sl.usage = 'internal'
+              JOIN product_product pp ON pp.id = q.product_id
+             GROUP BY pp.product_tmpl_id
+        """)
+        self.env.cr.execute("""
+            INSERT INTO product_template_stock_summary (product_tmpl_id, note, note_count)
+            SELECT pp.product_tmpl_id, n.note, COUNT(*)
+              FROM stock_quant q
+              JOIN stock_location sl ON sl.id = q.location_id AND sl.usage = 'internal'
+              JOIN product_product pp ON pp.id = q.product_id
+             CROSS JOIN LATERAL (VALUES (q.o_note1), (q.o_note2)) AS n(note)
+             WHERE q.quantity > 0
+               AND COALESCE(n.note, '') != ''
+             GROUP BY pp.product_tmpl_id, n.note
+        """)
+        self.invalidate_model()
+        _logger.info("[库存汇总] 按现有库存数量重新生成产品库存汇总")
+        return True
+
+    @api.model
+    def _cron_compact(self):
+        """把差额记录合并为每个模板/备注一行（定时任务调用）"""
+        self.env.cr.execute("""
+            WITH moved AS (
+                DELETE FROM product_template_stock_summary
+                RETURNING product_tmpl_id, note, quantity, quantity_no_note1, quantity_no_note2,
+                          quantity_no_notes, lot_quantity, roll_count, note_count
+            )
+            INSERT INTO product_template_stock_summary (
+                product_tmpl_id, note, quantity, quantity_no_note1, quantity_no_note2,
+                quantity_no_notes, lot_quantity, roll_count, note_count
+            )
+            SELECT product_tmpl_id, note,
+                   COALESCE(SUM(quantity), 0), COALESCE(SUM(quantity_no_note1), 0),
+                   COALESCE(SUM(quantity_no_note2), 0), COALESCE(SUM(quantity_no_notes), 0),
+                   COALESCE(SUM(lot_quantity), 0), COALESCE(SUM(roll_count), 0), COALESCE(SUM(note_count), 0)
+              FROM moved
+             GROUP BY product_tmpl_id, note
+            HAVING (note IS NULL AND (
+                        SUM(quantity) != 0 OR SUM(quantity_no_note1) != 0 OR SUM(quantity_no_note2) != 0
+                        OR SUM(quantity_no_notes) != 0 OR SUM(lot_quantity) != 0 OR SUM(roll_count) != 0))
+                OR (note IS NOT NULL AND SUM(note_count) != 0)
+        """)
+        self.invalidate_model()
+        return True
+
+    @api.model
+    def _get_summaries(self, template_ids):
+        """一次查询获取多个产品模板的库存汇总
+
+        Args:
+            template_ids (list): 产品模板ID
+
+        Returns:
+            dict: {模板ID: {'quantity': ..., 'quantity_no_note1': ..., 'quantity_no_note2': ...,
+                            'quantity_no_notes': ..., 'lot_quantity': ..., 'roll_count': ...,
+                            'note_counts': [(备注, 数量), ...]}}
+        """
+        template_ids = list(template_ids or [])
+        if not template_ids:
+            return {}
+        self.env['stock.quant'].flush_model(SUMMARY_QUANT_COLUMNS)
+        self.env.cr.execute("""
+            SELECT product_tmpl_id,
+                   COALESCE(SUM(quantity), 0), COALESCE(SUM(quantity_no_note1), 0),
+                   COALESCE(SUM(quantity_no_note2), 0), COALESCE(SUM(quantity_no_notes), 0),
+                   COALESCE(SUM(lot_quantity), 0), COALESCE(SUM(roll_count), 0)
+              FROM product_template_stock_summary
+             WHERE product_tmpl_id = ANY(%s)
+               AND note IS NULL
+             GROUP BY product_tmpl_id
+        """, [template_ids])
+        summaries = {
+            row[0]: {
+                'quantity': row[1],
+                'quantity_no_note1': row[2],
+                'quantity_no_note2': row[3],
+                'quantity_no_notes': row[4],
+                'lot_quantity': row[5],
+                'roll_count': row[6],
+                'note_counts': [],
+            }
+            for row in self.env.cr.fetchall()
+        }
+        self.env.cr.execute("""
+            SELECT product_tmpl_id, note, SUM(note_count)
+              FROM product_template_stock_summary
+             WHERE product_tmpl_id = ANY(%s)
+               AND note IS NOT NULL
+             GROUP BY product_tmpl_id, note
+            HAVING SUM(note_count) > 0
+             ORDER BY product_tmpl_id, note
+        """, [template_ids])
+        for template_id, note, note_count in self.env.cr.fetchall():
+            summary = summaries.setdefault(template_id, {
+                'quantity': 0.0, 'quantity_no_note1': 0.0, 'quantity_no_note2': 0.0,
+                'quantity_no_notes': 0.0, 'lot_quantity': 0.0, 'roll_count': 0,
+                'note_counts': [],
+            })
+            summary['note_counts'].append((note, note_count))
+        return summaries
@@ -2,10 +2,23 @@
 
 from odoo import models, fields, api, _
 from odoo.exceptions import UserError
+from odoo.tools import LRU
 
 from . import utils
 
 
+# 影响单位配置缓存的产品模板字段（custom_unit_* 由其他模块定义，可能不存在）
+UNIT_CONFIG_FIELDS = {
+    'enable_custom_units', 'default_unit_config', 'quick_unit_name',
+    'custom_unit_name', 'custom_unit_name_text', 'custom_unit_value',
+}
+# 单位配置缓存：{(数据库名, 产品模板ID, 产品模板修改时间): 单位配置}
+# 键中包含修改时间，其他 worker 提交的修改使旧缓存自然失效，不需要清除注册表的 ormcache
+_UNIT_CONFIG_CACHE = LRU(4096)
+# 移动行单位选择列表只显示配置单位本身的单位（件 piece 不在其中，仍显示全部单位选项）
+SINGLE_SELECTION_UNITS = ('kg', 'roll', 'barrel', 'box', 'bag', 'sqm')
+
+
 class ProductTemplate(models.Model):
     _inherit = 'product.template'
 
@@ -151,106 +164,164 @@ class ProductTemplate(models.Model):
             else:
                 record.product_volume = 0.0
 
-    @api.depends('product_variant_ids.stock_quant_ids', 'product_variant_ids.stock_quant_ids.o_note1', 
-                 'product_variant_ids.stock_quant_ids.o_note2')
+    def _get_stock_summaries(self):
+        """获取产品模板的库存汇总（见 product.template.stock.summary）
+        
+        **性能优化**：库存汇总由 stock_quant 触发器按差额维护，汇总字段不再依赖
+        product_variant_ids.stock_quant_ids，库存数量变化时不会使模板字段失效并重新加载所有库存数量
+        """
+        return self.env['product.template.stock.summary'].sudo()._get_summaries(
+            [template_id for template_id in self.ids if template_id]
+        )
+
     def _compute_o_note(self):
-        """计算备注卷数"""
+        """计算备注卷数（统计相同备注内容的数量，格式：数量1, 数量2, ...）"""
+        summaries = self._get_stock_summaries()
         for product in self:
-            # 优化：直接使用已加载的 stock_quant_ids，避免重复查询
-            all_quants = product.product_variant_ids.mapped('stock_quant_ids')
-            quants = all_quants.filtered(
-                lambda q: q.location_id.usage == 'internal' and q.quantity > 0
-            )
-            # 收集所有备注1和备注2的内容
-            all_notes = []
-            for quant in quants:
-                if quant.o_note1:
-                    all_notes.append(quant.o_note1)
-                if quant.o_note2:
-                    all_notes.append(quant.o_note2)
-            
-            # 统计相同备注内容的数量
-            note_counts = {}
-            for note in all_notes:
-                if note:  # 确保备注不为空
-                    note_counts[note] = note_counts.get(note, 0) + 1
-            
-            # 生成统计结果字符串，格式：数量1, 数量2, ...
-            if note_counts:
-                product.o_note = ', '.join([str(count) for count in note_counts.values()])
+            summary = summaries.get(product.id)
+            if summary and summary['note_counts']:
+                product.o_note = ', '.join([str(count) for _note, count in summary['note_counts']])
             else:
                 product.o_note = ''
 
-    @api.depends('safty_qty', 'safty_rule', 'product_variant_ids.stock_quant_ids', 
-                 'product_variant_ids.stock_quant_ids.inventory_quantity_auto_apply',
-                 'product_variant_ids.stock_quant_ids.o_note1', 'product_variant_ids.stock_quant_ids.o_note2')
+    @api.depends('safty_qty', 'safty_rule')
     def _compute_is_safty(self):
         """计算是否安全库存"""
+        summaries = self._get_stock_summaries()
+        rule_fields = {
+            'all': 'quantity',
+            'not_note1': 'quantity_no_note1',
+            'not_note2': 'quantity_no_note2',
+            'not_all': 'quantity_no_notes',
+        }
         for product in self:
             if product.safty_qty <= 0:
                 product.is_safty = True
                 continue
-                
-            # 优化：直接使用已加载的 stock_quant_ids，避免重复查询
-            all_quants = product.product_variant_ids.mapped('stock_quant_ids')
-            quants = all_quants.filtered(lambda q: q.location_id.usage == 'internal')
             
-            qty = 0
-            if product.safty_rule == 'all':
-                qty = sum(quants.mapped('inventory_quantity_auto_apply'))
-            elif product.safty_rule == 'not_note1':
-                qty = sum(quants.filtered(lambda x: not x.o_note1).mapped('inventory_quantity_auto_apply'))
-            elif product.safty_rule == 'not_note2':
-                qty = sum(quants.filtered(lambda x: not x.o_note2).mapped('inventory_quantity_auto_apply'))
-            elif product.safty_rule == 'not_all':
-                qty = sum(quants.filtered(lambda x: not x.o_note1 and not x.o_note2).mapped('inventory_quantity_auto_apply'))
-
+            summary = summaries.get(product.id)
+            rule_field = rule_fields.get(product.safty_rule)
+            qty = summary[rule_field] if summary and rule_field else 0
             product.is_safty = qty >= product.safty_qty
 
-    @api.depends('product_variant_ids.stock_quant_ids', 
-                 'product_variant_ids.stock_quant_ids.lot_id', 
-                 'product_variant_ids.stock_quant_ids.inventory_quantity_auto_apply',
-                 'product_variant_ids.stock_quant_ids.quantity',
-                 'product_variant_ids.stock_quant_ids.location_id.usage')
     def _compute_lot_weight(self):
         """计算库存重量和数量统计"""
+        summaries = self._get_stock_summaries()
+        # lot_weight 字段保留但可能在其他模块中定义，只有库存数量上有该字段时才汇总
+        weight_by_template = {}
+        Quant = self.env['stock.quant']
+        if 'lot_weight' in Quant._fields and Quant._fields['lot_weight'].store and self.ids:
+            for product, lot_weight in Quant._read_group(
+                [('product_id.product_tmpl_id', 'in', self.ids), ('location_id.usage', '=', 'internal')],
+                ['product_id'], ['lot_weight:sum'],
+            ):
+                template_id = product.product_tmpl_id.id
+                weight_by_template[template_id] = weight_by_template.get(template_id, 0.0) + (lot_weight or 0.0)
         for product in self:
-            # 优化：直接使用已加载的 stock_quant_ids，避免重复查询
-            all_quants = product.product_variant_ids.mapped('stock_quant_ids')
-            quants = all_quants.filtered(lambda q: q.location_id.usage == 'internal')
-            if quants:
-                # lot_weight 字段保留但可能在其他模块中定义，使用 hasattr 检查
-                product.lot_weight = sum(q.lot_weight for q in quants if hasattr(q, 'lot_weight') and q.lot_weight) or 0.0
-                # lot_qty 字段保留但不再使用（第二单位系统已删除）
-                product.lot_qty = 0.0
-            else:
-                product.lot_weight = 0.0
-                product.lot_qty = 0.0
+            summary = summaries.get(product.id)
+            product.lot_weight = weight_by_template.get(product.id, 0.0)
+            # lot_qty 字段保留但不再使用（第二单位系统已删除）
+            product.lot_qty = 0.0
             # 实际卷数：按照批号/序列号计算，每个批号/序列号都算作一卷，但需要判断在手数量大于0
-            product.act_juan = len(quants.filtered(lambda x: x.lot_id and x.inventory_quantity_auto_apply > 0))
+            product.act_juan = summary['roll_count'] if summary else 0
 
     # ==================== 单位配置方法 ====================
     def get_unit_config_for_stock_move(self):
         """获取库存移动时的单位配置"""
         self.ensure_one()
-        if not self.enable_custom_units:
-            return []
+        return [
+            {'name': name, 'label': label}
+            for name, label in self._get_unit_config()['configs']
+        ]
+
+    def _get_unit_config(self):
+        """获取产品模板解析后的单位配置（已保存的模板读缓存，表单中未保存的模板按当前值解析）
+        
+        **性能优化**：移动行的单位选择列表、onchange 和库存数量计算每行都需要单位配置，
+        缓存后只是一次字典查找。缓存按 (模板ID, 修改时间) 保存在 worker 内：
+        其他事务提交的修改会更新修改时间，本事务内的修改在 write 中移除对应缓存。
+        
+        Returns:
+            dict: 共享缓存，调用方不得修改
+                {
+                    'enabled': 是否启用自定义单位,
+                    'default_unit': 附加单位模板（default_unit_config）,
+                    'quick_unit_name': 自定义单位名称,
+                    'configs': ((单位代码, 显示名称), ...)，即 get_unit_config_for_stock_move 的结果,
+                    'selection': ((单位代码, 显示名称), ...)，移动行单位选择列表,
+                    'legacy_unit_name': custom_unit_name（其他模块定义的旧单位配置）,
+                    'legacy_unit_name_text': custom_unit_name_text,
+                    'legacy_unit_value': custom_unit_value,
+                }
+        """
+        self.ensure_one()
+        if not isinstance(self.id, int):
+            return self._build_unit_config()
+        cache_key = (self.env.cr.dbname, self.id, self.write_date)
+        config = _UNIT_CONFIG_CACHE.get(cache_key)
+        if config is None:
+            config = _UNIT_CONFIG_CACHE[cache_key] = self._build_unit_config()
+        return config
+
+    def _build_unit_config(self):
+        """解析单位配置（_get_unit_config 的实际计算，空记录集返回未启用的配置）"""
+        template = self[:1]
+        all_options = tuple(utils.UNIT_DISPLAY_MAP.items())
+        if not template:
+            return {
+                'enabled': False, 'default_unit': False, 'quick_unit_name': False,
+                'configs': (), 'selection': all_options,
+                'legacy_unit_name': False, 'legacy_unit_name_text': False, 'legacy_unit_value': False,
+            }
         
-        configs = []
+        enabled = bool(template.enable_custom_units)
+        default_unit = template.default_unit_config or False
+        quick_unit_name = template.quick_unit_name or False
         
         # 快速配置：返回可用的附加单位（收货时手动输入数量）
-        if self.default_unit_config and self.default_unit_config != 'custom':
-            configs.append({
-                'name': self.default_unit_config,
-                'label': self._get_unit_display_name(self.default_unit_config)
-            })
-        elif self.default_unit_config == 'custom' and self.quick_unit_name:
-            configs.append({
-                'name': 'custom',
-                'label': self.quick_unit_name
-            })
+        configs = ()
+        if enabled:
+            if default_unit and default_unit != 'custom':
+                configs = ((default_unit, self._get_unit_display_name(default_unit)),)
+            elif default_unit == 'custom' and quick_unit_name:
+                configs = (('custom', quick_unit_name),)
         
-        return configs
+        # 根据产品配置返回对应的单位选项
+        if not default_unit:
+            selection = all_options
+        elif default_unit == 'custom':
+            selection = (('custom', '自定义'),)
+        elif default_unit in SINGLE_SELECTION_UNITS:
+            selection = ((default_unit, utils.UNIT_DISPLAY_MAP[default_unit]),)
+        else:
+            selection = all_options
+        
+        return {
+            'enabled': enabled,
+            'default_unit': default_unit,
+            'quick_unit_name': quick_unit_name,
+            'configs': configs,
+            'selection': selection,
+            'legacy_unit_name': getattr(template, 'custom_unit_name', False) or False,
+            'legacy_unit_name_text': getattr(template, 'custom_unit_name_text', False) or False,
+            'legacy_unit_value': getattr(template, 'custom_unit_value', False) or False,
+        }
+
+    def write(self, vals):
+        res = super(ProductTemplate, self).write(vals)
+        if 'product_width' in vals or 'uom_id' in vals:
+            # 库存数量的计算长度依赖宽度和主单位，批量 SQL 更新（不逐条重新计算）
+            self.env['stock.quant'].sudo()._update_calculated_length(self.with_context(active_test=False).product_variant_ids)
+        if UNIT_CONFIG_FIELDS & set(vals):
+            # 同一事务内修改时间不变，移除本 worker 中这些模板的单位配置缓存；
+            # 其他 worker 在提交后读到新的修改时间，不会命中旧缓存
+            dbname = self.env.cr.dbname
+            for template in self:
+                try:
+                    del _UNIT_CONFIG_CACHE[(dbname, template.id, template.write_date)]
+                except KeyError:
+                    pass
+        return res
 
     def _get_unit_display_name(self, unit_code):
         """获取单位显示名称"""
@@ -297,23 +368,15 @@ class ProductTemplate(models.Model):
             if record.solution_solid_content and (record.solution_solid_content < 0 or record.solution_solid_content > 100):
                 raise UserError(_("固含量必须在0-100之间"))
 
-    @api.depends('enable_custom_units', 'product_variant_ids.stock_quant_ids', 
-                 'product_variant_ids.stock_quant_ids.lot_quantity',
-                 'product_variant_ids.stock_quant_ids.quantity',
-                 'product_variant_ids.stock_quant_ids.location_id.usage')
+    @api.depends('enable_custom_units')
     def _compute_total_lot_quantity(self):
         """计算所有批次的附加单位总数量"""
+        summaries = self._get_stock_summaries()
         for template in self:
             if not template.enable_custom_units:
                 template.total_lot_quantity = 0.0
                 continue
             
-            # 优化：直接使用已加载的 stock_quant_ids，避免重复查询
-            all_quants = template.product_variant_ids.mapped('stock_quant_ids')
-            quants = all_quants.filtered(
-                lambda q: q.location_id.usage == 'internal' and q.quantity > 0
-            )
-            
-            total = sum(quants.mapped('lot_quantity') or [0.0])
-            template.total_lot_quantity = total if total else 0.0
+            summary = summaries.get(template.id)
+            template.total_lot_quantity = summary['lot_quantity'] if summary else 0.0
 
@@ -1,72 +1,181 @@
 # -*- coding: utf-8 -*-
 
 import logging
-from odoo import models, api
+from odoo import models, fields, api
+from odoo.tools import LRU
+from odoo.tools.sql import column_exists, create_column, create_index
+
+from . import tracing, utils
 
 _logger = logging.getLogger(__name__)
 
+# 扫码条码 -> 批次号ID 缓存：{(数据库名, 批次号修订号, 公司ID, 条码, GS1键): 批次号ID元组}
+# 键中包含批次号修订号（数据库序列），批次号创建/改名/删除时修订号递增，旧缓存自然失效，
+# 不需要清除整个注册表的 ormcache
+_BARCODE_LOT_CACHE = LRU(8192)
+# 影响扫码查找结果的批次号字段
+LOT_BARCODE_FIELDS = {'name', 'company_id'}
+
 
 class StockLot(models.Model):
     _inherit = 'stock.lot'
 
-    @api.model
-    def _search(self, domain, offset=0, limit=None, order=None):
-        """重写搜索方法，添加日志以跟踪批次号查询"""
-        # **关键修复**：无论 domain 是什么，都记录日志（用于调试）
-        import sys
-        import traceback
-        
-        # 检查是否是批次号名称搜索
-        lot_name_domain = [d for d in domain if isinstance(d, (list, tuple)) and len(d) >= 2 and d[0] == 'name']
-        lot_names = []
-        if lot_name_domain:
-            # 获取搜索的批次号名称
-            lot_names = [d[2] for d in lot_name_domain if d[1] in ('=', 'in', 'ilike')]
-        
-        # **关键日志**：无论是否有 name 字段，都记录日志
-        print("=" * 80, file=sys.stderr)
-        print(f"[批次号搜索] stock.lot._search 被调用: domain={domain}", file=sys.stderr)
-        print(f"[批次号搜索] lot_names={lot_names}, offset={offset}, limit={limit}", file=sys.stderr)
-        print("=" * 80, file=sys.stderr)
-        
-        _logger.error(
-            f"[批次号搜索] ========== stock.lot._search 被调用 ========== "
-            f"domain={domain}, lot_names={lot_names}, "
-            f"offset={offset}, limit={limit}, order={order}"
+    # 标准化批次号字段（去除首尾空格并转为小写）
+    # **性能优化**：存储并建立索引，忽略大小写的批次号查找直接走索引等值查询
+    name_normalized = fields.Char(
+        string='标准化批次号',
+        compute='_compute_name_normalized',
+        store=True,
+        index=True,
+        help='去除首尾空格并转为小写的批次号，用于忽略大小写的批次号匹配'
+    )
+
+    def _auto_init(self):
+        """安装/升级时分批回填标准化批次号，避免 ORM 逐条重新计算"""
+        if not column_exists(self.env.cr, self._table, 'name_normalized'):
+            create_column(self.env.cr, self._table, 'name_normalized', 'varchar')
+            utils.backfill_normalized_lot_names(self.env.cr, self._table, 'name', 'name_normalized')
+        return super(StockLot, self)._auto_init()
+
+    def init(self):
+        """创建 (产品, 标准化批次号) 复合索引和扫码查找批次号使用的索引"""
+        super(StockLot, self).init()
+        create_index(
+            self.env.cr, 'stock_lot_product_name_normalized_idx',
+            self._table, ['product_id', 'name_normalized'],
+            where='name_normalized IS NOT NULL'
+        )
+        # 扫码精确匹配批次号名称（批次号名称默认只有 trigram 索引，不能用于等值查询）
+        create_index(
+            self.env.cr, 'stock_lot_name_btree_idx',
+            self._table, ['name']
         )
-        
-        # 获取调用栈信息（只取前3层，避免日志过长）
-        try:
-            caller_info = traceback.extract_stack()[-4:-1] if len(traceback.extract_stack()) > 4 else []
-            caller_str = ' -> '.join([f"{c.filename.split('/')[-1]}:{c.lineno}" for c in caller_info[-2:]])
-            _logger.error(f"[批次号搜索] 调用栈: {caller_str}")
-            print(f"[批次号搜索] 调用栈: {caller_str}", file=sys.stderr)
-        except:
-            pass
-        
-        # 调用父类的搜索方法（这会调用 stock_barcode 模块的 _search 方法）
-        result = super(StockLot, self)._search(domain, offset=offset, limit=limit, order=order)
-        
-        # 记录搜索结果（只记录输入参数，不访问结果，避免 SQL 错误）
-        # 注意：_search 返回的是查询对象或记录 ID 列表，不应在此处访问记录内容
-        _logger.error(
-            f"[批次号搜索] 搜索完成: domain={domain}, "
-            f"lot_names={lot_names}, offset={offset}, limit={limit}"
+        # GS1 纯数字批次号去掉前导 0 后的形式，用于扫码时精确匹配带填充的 GS1 条码
+        create_index(
+            self.env.cr, 'stock_lot_company_gs1_name_idx',
+            self._table, ['company_id', "ltrim(name, '0')"],
+            where="name ~ '^[0-9]+$'"
         )
-        print(f"[批次号搜索] 搜索完成: domain={domain}, lot_names={lot_names}", file=sys.stderr)
-        
-        return result
-
-    def read(self, fields=None, load='_classic_read'):
-        """重写 read 方法，添加日志以跟踪批次号读取"""
-        # 如果读取 name 字段，记录日志
-        if fields is None or 'name' in fields:
-            lot_names = [lot.name for lot in self if hasattr(lot, 'name') and lot.name]
-            if lot_names:
-                _logger.error(
-                    f"[批次号读取] ========== stock.lot.read 被调用 ========== "
-                    f"批次号列表={lot_names}, 记录数={len(self)}"
-                )
-        
-        return super(StockLot, self).read(fields=fields, load=load)
+        self.env.cr.execute("""
+            CREATE SEQUENCE IF NOT EXISTS stock_lot_barcode_revision_seq
+        """)
+
+    @api.depends('name')
+    def _compute_name_normalized(self):
+        """计算标准化批次号"""
+        for lot in self:
+            lot.name_normalized = utils.normalize_lot_name(lot.name) or False
+
+    @api.model
+    @tracing.traced('stock.lot._search')
+    def _search(self, domain, offset=0, limit=None, order=None):
+        """批次号搜索（开启追踪时记录调用者、耗时和 SQL 查询数，见 tracing.py）"""
+        return super(StockLot, self)._search(domain, offset=offset, limit=limit, order=order)
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        lots = super(StockLot, self).create(vals_list)
+        # 新批次号可能命中扫码查找的负缓存，递增批次号修订号使缓存失效
+        self._bump_barcode_lot_revision()
+        return lots
+
+    def write(self, vals):
+        res = super(StockLot, self).write(vals)
+        if LOT_BARCODE_FIELDS & set(vals):
+            self._bump_barcode_lot_revision()
+        return res
+
+    def unlink(self):
+        res = super(StockLot, self).unlink()
+        self._bump_barcode_lot_revision()
+        return res
+
+    @api.model
+    def _bump_barcode_lot_revision(self):
+        """递增批次号修订号，使所有 worker 中的扫码查找缓存失效
+
+        立即递增一次：本事务之后的查找不会命中旧缓存；
+        提交后再递增一次：其他事务在本事务提交前查到的结果（看不到未提交的批次号）也会失效。
+        每个事务只注册一次提交后递增。
+        """
+        self.env.cr.execute("SELECT nextval('stock_lot_barcode_revision_seq')")
+        postcommit = self.env.cr.postcommit
+        if not postcommit.data.get('stock_lot_barcode_revision'):
+            postcommit.data['stock_lot_barcode_revision'] = True
+            registry = self.env.registry
+
+            def bump_after_commit():
+                with registry.cursor() as cr:
+                    cr.execute("SELECT nextval('stock_lot_barcode_revision_seq')")
+
+            postcommit.add(bump_after_commit)
+
+    @api.model
+    def _resolve_barcode_lot_ids(self, barcodes, is_gs1_nomenclature=False):
+        """把扫描的条码解析为批次号ID（精确匹配，按公司缓存）
+
+        • 条码与批次号名称完全一致时匹配
+        • GS1 命名规则下，纯数字条码去掉前导 0 后与纯数字批次号去掉前导 0 后的形式一致时匹配
+
+        结果（包括未找到的条码）按 (批次号修订号, 公司, 条码) 缓存在 worker 内，
+        批次号创建/改名/删除时修订号递增，所有 worker 的旧缓存随之失效。
+
+        Args:
+            barcodes (iterable): 扫描的条码列表
+            is_gs1_nomenclature (bool): 是否使用 GS1 命名规则
+
+        Returns:
+            list: 匹配的批次号ID（未做权限过滤，调用方应再按 ID 搜索以应用记录规则）
+        """
+        lot_ids = set()
+        self.env.cr.execute("SELECT last_value FROM stock_lot_barcode_revision_seq")
+        revision = self.env.cr.fetchone()[0]
+        for barcode in set(barcodes or []):
+            if not barcode:
+                continue
+            barcode = str(barcode)
+            gs1_key = False
+            if is_gs1_nomenclature and barcode.isdigit():
+                gs1_key = barcode.lstrip('0')
+            for company_id in self.env.companies.ids:
+                cache_key = (self.env.cr.dbname, revision, company_id, barcode, gs1_key)
+                cached = _BARCODE_LOT_CACHE.get(cache_key)
+                if cached is None:
+                    cached = _BARCODE_LOT_CACHE[cache_key] = self._lookup_barcode_lot_ids(
+                        company_id, barcode, gs1_key
+                    )
+                lot_ids.update(cached)
+        return list(lot_ids)
+
+    @api.model
+    def _lookup_barcode_lot_ids(self, company_id, barcode, gs1_key):
+        """按公司查找条码对应的批次号ID（由 _resolve_barcode_lot_ids 缓存，未找到时缓存空结果）
+
+        Args:
+            company_id (int): 公司ID
+            barcode (str): 扫描的条码
+            gs1_key (str): GS1 纯数字条码去掉前导 0 后的形式，非 GS1 时为 False
 
+        Returns:
+            tuple: 批次号ID
+        """
+        self.flush_model(['name', 'company_id'])
+        query = f"""
+            SELECT id
+              FROM {self._table}
+             WHERE (company_id = %s OR company_id IS NULL)
+               AND name = %s
+        """
+        params = [company_id, barcode]
+        if gs1_key is not False:
+            query += f"""
+             UNION
+            SELECT id
+              FROM {self._table}
+             WHERE (company_id = %s OR company_id IS NULL)
+               AND name ~ '^[0-9]+$'
+               AND ltrim(name, '0') = %s
+            """
+            params += [company_id, gs1_key]
+        self.env.cr.execute(query, params)
+        return tuple(sorted(row[0] for row in self.env.cr.fetchall()))
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+
+import logging
+
+from odoo import models, fields, api
+
+from . import utils
+
+_logger = logging.getLogger(__name__)
+
+
+class StockLotScan(models.Model):
+    """扫码记录台账
+
+    每个调拨单中每个批次号（标准化后）只有一条记录，由唯一索引保证。
+    扫码时通过 INSERT ... ON CONFLICT 一次完成"登记 + 重复检测"，
+    多个扫码枪同时处理同一个调拨单时也能正确识别重复扫描。
+    """
+    _name = 'stock.lot.scan'
+    _description = '批次号扫码记录'
+    _order = 'picking_id, scan_sequence, id'
+
+    picking_id = fields.Many2one(
+        'stock.picking',
+        string='调拨单',
+        required=True,
+        index=True,
+        ondelete='cascade'
+    )
+    lot_name = fields.Char(
+        string='批次号',
+        required=True
+    )
+    lot_name_normalized = fields.Char(
+        string='标准化批次号',
+        required=True
+    )
+    scan_sequence = fields.Integer(
+        string='扫描顺序',
+        default=0
+    )
+    state = fields.Selection([
+        ('scanned', '已扫描'),
+        ('released', '已释放'),
+    ], string='状态', default='scanned', required=True,
+        help='已释放：对应的移动行被删除或放入包裹后，允许重新扫描该批次号')
+    user_id = fields.Many2one(
+        'res.users',
+        string='扫码人',
+        default=lambda self: self.env.user
+    )
+
+    _sql_constraints = [
+        ('picking_lot_uniq', 'unique(picking_id, lot_name_normalized)',
+         '同一调拨单中批次号只能有一条扫码记录！'),
+    ]
+
+    @api.model
+    def _register_scan(self, picking_id, lot_name):
+        """登记一次扫码
+
+        批次号未登记或已释放时登记成功（已释放的记录恢复为已扫描，保留原扫描顺序）；
+        批次号已处于已扫描状态时登记失败，即重复扫描。
+
+        Args:
+            picking_id (int): 调拨单ID
+            lot_name (str): 扫描的批次号
+
+        Returns:
+            bool: True 表示登记成功，False 表示重复扫描
+        """
+        lot_key = utils.normalize_lot_name(lot_name)
+        if not picking_id or not lot_key:
+            return True
+        self.env.cr.execute("""
+            INSERT INTO stock_lot_scan (
+                picking_id, lot_name, lot_name_normalized, scan_sequence, state,
+                user_id, create_uid, create_date, write_uid, write_date
+            )
+            VALUES (
+                %(picking_id)s, %(lot_name)s, %(lot_key)s,
+                (SELECT COALESCE(MAX(scan_sequence), 0) + 1
+                   FROM stock_lot_scan WHERE picking_id = %(picking_id)s),
+                'scanned', %(uid)s, %(uid)s, NOW() AT TIME ZONE 'UTC',
+                %(uid)s, NOW() AT TIME ZONE 'UTC'
+            )
+            ON CONFLICT (picking_id, lot_name_normalized) DO UPDATE
+               SET state = 'scanned',
+                   user_id = EXCLUDED.user_id,
+                   write_uid = EXCLUDED.write_uid,
+                   write_date = EXCLUDED.write_date
+             WHERE stock_lot_scan.state = 'released'
+            RETURNING id
+        """, {
+            'picking_id': picking_id,
+            'lot_name': str(lot_name).strip(),
+            'lot_key': lot_key,
+            'uid': self.env.uid,
+        })
+        registered = bool(self.env.cr.fetchone())
+        self.invalidate_model()
+        return registered
+
+    @api.model
+    def _release_scans(self, picking_id, lot_names):
+        """释放扫码记录（移动行被删除或放入包裹后，允许重新扫描）
+
+        Args:
+            picking_id (int): 调拨单ID
+            lot_names (iterable): 批次号列表（原始或标准化均可）
+        """
+        lot_keys = list({utils.normalize_lot_name(name) for name in lot_names or []} - {''})
+        if not picking_id or not lot_keys:
+            return
+        self.env.cr.execute("""
+            UPDATE stock_lot_scan
+               SET state = 'released', write_uid = %s, write_date = NOW() AT TIME ZONE 'UTC'
+             WHERE picking_id = %s
+               AND lot_name_normalized IN %s
+               AND state = 'scanned'
+        """, [self.env.uid, picking_id, tuple(lot_keys)])
+        self.invalidate_model()
+
+    @api.model
+    def _get_scanned_lot_names(self, picking_id):
+        """获取调拨单中已扫描的批次号（标准化后，按扫描顺序）
+
+        Args:
+            picking_id (int): 调拨单ID
+
+        Returns:
+            list: 标准化批次号列表
+        """
+        if not picking_id:
+            return []
+        self.env.cr.execute("""
+            SELECT lot_name_normalized
+              FROM stock_lot_scan
+             WHERE picking_id = %s AND state = 'scanned'
+             ORDER BY scan_sequence, id
+        """, [picking_id])
+        return [row[0] for row in self.env.cr.fetchall()]
+
+    @api.model
+    def _get_scan_sequence_map(self, picking_id):
+        """获取调拨单中批次号的扫描顺序（包括已释放的记录，用于包裹内排序）
+
+        Args:
+            picking_id (int): 调拨单ID
+
+        Returns:
+            dict: {标准化批次号: 扫描顺序}
+        """
+        if not picking_id:
+            return {}
+        self.env.cr.execute("""
+            SELECT lot_name_normalized, scan_sequence
+              FROM stock_lot_scan
+             WHERE picking_id = %s
+        """, [picking_id])
+        return dict(self.env.cr.fetchall())
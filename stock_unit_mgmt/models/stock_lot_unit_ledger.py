@@ -0,0 +1,291 @@
+# -*- coding: utf-8 -*-
+
+import logging
+
+from odoo import models, fields, api
+
+_logger = logging.getLogger(__name__)
+
+# 台账重建时每批处理的移动行数
+LEDGER_REBUILD_BATCH_SIZE = 10000
+
+# 影响台账的移动行字段，已完成的移动行修改这些字段时需要向台账追加差额
+LEDGER_MOVE_LINE_FIELDS = {
+    'product_id', 'lot_id', 'location_id', 'location_dest_id', 'owner_id',
+    'lot_quantity', 'lot_unit_name', 'lot_unit_name_custom', 'contract_no',
+    'quantity',
+}
+
+
+class StockLotUnitLedger(models.Model):
+    """批次单位台账（只追加）
+
+    每条已完成且有批次号的移动行在台账中有两类分录：
+    • 入库（in）：记在目标库位，单位数量为正
+    • 出库（out）：记在源库位，单位数量为正，汇总时从余额中扣减
+
+    已完成的移动行再次修改时，只追加与已记分录的差额，不修改或删除已有分录；
+    每条分录同时累加到 stock.lot.unit.balance 的余额中，
+    stock.quant 的单位数量和单位名称直接读取余额，不再遍历批次号的全部历史移动行。
+    """
+    _name = 'stock.lot.unit.ledger'
+    _description = '批次单位台账'
+    _order = 'id'
+    _log_access = False
+
+    move_line_id = fields.Many2one('stock.move.line', string='移动行', index=True, ondelete='set null')
+    direction = fields.Selection([
+        ('in', '入库'),
+        ('out', '出库'),
+    ], string='方向', required=True)
+    product_id = fields.Many2one('product.product', string='产品', required=True, ondelete='cascade')
+    lot_id = fields.Many2one('stock.lot', string='批次号', required=True, ondelete='cascade')
+    location_id = fields.Many2one('stock.location', string='库位', required=True, ondelete='cascade')
+    owner_id = fields.Many2one('res.partner', string='所有者', ondelete='cascade')
+    lot_quantity = fields.Float(string='单位数量', digits=(16, 2))
+    qty = fields.Float(string='数量')
+    lot_unit_name = fields.Char(string='单位名称')
+    lot_unit_name_custom = fields.Char(string='自定义单位名称')
+    contract_no = fields.Char(string='合同号')
+    date = fields.Datetime(string='记账时间', default=fields.Datetime.now)
+
+    @api.model
+    def _post_move_lines(self, move_line_ids):
+        """把已完成移动行的单位数量记入台账（只追加与已记分录的差额）并累加到余额
+
+        同一移动行重复记账是安全的：内容未变化时不会产生新分录。
+
+        Args:
+            move_line_ids (list): 移动行ID
+
+        Returns:
+            set: 余额发生变化的 (产品ID, 批次号ID, 库位ID, 所有者ID) 集合
+        """
+        move_line_ids = list(move_line_ids or [])
+        if not move_line_ids:
+            return set()
+        self.env['stock.move.line'].flush_model(list(LEDGER_MOVE_LINE_FIELDS) + ['state'])
+        self.env.cr.execute("""
+            WITH cur AS (
+                SELECT sml.id AS move_line_id,
+                       d.direction,
+                       sml.product_id,
+                       sml.lot_id,
+                       CASE d.direction WHEN 'in' THEN sml.location_dest_id ELSE sml.location_id END AS location_id,
+                       sml.owner_id,
+                       CASE WHEN COALESCE(sml.lot_quantity, 0) > 0 THEN sml.lot_quantity ELSE 0 END AS lot_quantity,
+                       COALESCE(sml.quantity, 0) AS qty,
+                       sml.lot_unit_name,
+                       sml.lot_unit_name_custom,
+                       sml.contract_no
+                  FROM stock_move_line sml
+                 CROSS JOIN (VALUES ('in'), ('out')) AS d(direction)
+                 WHERE sml.id = ANY(%(ids)s)
+                   AND sml.state = 'done'
+                   AND sml.lot_id IS NOT NULL
+            ),
+            posted AS (
+                SELECT move_line_id, direction, product_id, lot_id, location_id, owner_id,
+                       SUM(lot_quantity) AS lot_quantity,
+                       SUM(qty) AS qty,
+                       (array_agg(lot_unit_name ORDER BY id DESC))[1] AS lot_unit_name,
+                       (array_agg(lot_unit_name_custom ORDER BY id DESC))[1] AS lot_unit_name_custom,
+                       (array_agg(contract_no ORDER BY id DESC))[1] AS contract_no
+                  FROM stock_lot_unit_ledger
+                 WHERE move_line_id = ANY(%(ids)s)
+                 GROUP BY move_line_id, direction, product_id, lot_id, location_id, owner_id
+            ),
+            delta AS (
+                SELECT COALESCE(cur.move_line_id, posted.move_line_id) AS move_line_id,
+                       COALESCE(cur.direction, posted.direction) AS direction,
+                       COALESCE(cur.product_id, posted.product_id) AS product_id,
+                       COALESCE(cur.lot_id, posted.lot_id) AS lot_id,
+                       COALESCE(cur.location_id, posted.location_id) AS location_id,
+                       CASE WHEN cur.move_line_id IS NOT NULL THEN cur.owner_id ELSE posted.owner_id END AS owner_id,
+                       COALESCE(cur.lot_quantity, 0) - COALESCE(posted.lot_quantity, 0) AS lot_quantity,
+                       COALESCE(cur.qty, 0) - COALESCE(posted.qty, 0) AS qty,
+                       CASE WHEN cur.move_line_id IS NOT NULL THEN cur.lot_unit_name ELSE posted.lot_unit_name END AS lot_unit_name,
+                       CASE WHEN cur.move_line_id IS NOT NULL THEN cur.lot_unit_name_custom ELSE posted.lot_unit_name_custom END AS lot_unit_name_custom,
+                       CASE WHEN cur.move_line_id IS NOT NULL THEN cur.contract_no ELSE posted.contract_no END AS contract_no,
+                       posted.move_line_id IS NULL
+                           OR cur.lot_unit_name IS DISTINCT FROM posted.lot_unit_name
+                           OR cur.lot_unit_name_custom IS DISTINCT FROM posted.lot_unit_name_custom
+                           OR cur.contract_no IS DISTINCT FROM posted.contract_no AS info_changed,
+                       cur.move_line_id IS NOT NULL AS is_current
+                  FROM cur
+                  FULL OUTER JOIN posted
+                    ON posted.move_line_id = cur.move_line_id
+                   AND posted.direction = cur.direction
+                   AND posted.product_id = cur.product_id
+                   AND posted.lot_id = cur.lot_id
+                   AND posted.location_id = cur.location_id
+                   AND COALESCE(posted.owner_id, 0) = COALESCE(cur.owner_id, 0)
+            ),
+            new_entries AS (
+                INSERT INTO stock_lot_unit_ledger (
+                    move_line_id, direction, product_id, lot_id, location_id, owner_id,
+                    lot_quantity, qty, lot_unit_name, lot_unit_name_custom, contract_no, date
+                )
+                SELECT move_line_id, direction, product_id, lot_id, location_id, owner_id,
+                       lot_quantity, qty, lot_unit_name, lot_unit_name_custom, contract_no,
+                       now() AT TIME ZONE 'UTC'
+                  FROM delta
+                 WHERE lot_quantity != 0 OR qty != 0 OR (is_current AND info_changed)
+             RETURNING move_line_id, direction, product_id, lot_id, location_id, owner_id,
+                       lot_quantity, qty, lot_unit_name, lot_unit_name_custom, contract_no
+            )
+            INSERT INTO stock_lot_unit_balance (
+                product_id, lot_id, location_id, owner_id,
+                in_lot_quantity, out_lot_quantity, in_qty,
+                unit_move_line_id, lot_unit_name, lot_unit_name_custom,
+                in_move_line_id, in_contract_no, last_move_line_id, last_contract_no
+            )
+            SELECT product_id, lot_id, location_id, owner_id,
+                   SUM(CASE WHEN direction = 'in' THEN lot_quantity ELSE 0 END),
+                   SUM(CASE WHEN direction = 'out' THEN lot_quantity ELSE 0 END),
+                   SUM(CASE WHEN direction = 'in' THEN qty ELSE 0 END),
+                   MAX(move_line_id) FILTER (WHERE lot_unit_name IS NOT NULL),
+                   (array_agg(lot_unit_name ORDER BY move_line_id DESC) FILTER (WHERE lot_unit_name IS NOT NULL))[1],
+                   (array_agg(lot_unit_name_custom ORDER BY move_line_id DESC) FILTER (WHERE lot_unit_name IS NOT NULL))[1],
+                   MAX(move_line_id) FILTER (WHERE direction = 'in'),
+                   (array_agg(contract_no ORDER BY move_line_id DESC) FILTER (WHERE direction = 'in'))[1],
+                   MAX(move_line_id),
+                   (array_agg(contract_no ORDER BY move_line_id DESC))[1]
+              FROM new_entries
+             GROUP BY product_id, lot_id, location_id, owner_id
+            ON CONFLICT (product_id, lot_id, location_id, COALESCE(owner_id, 0)) DO UPDATE SET
+                in_lot_quantity = stock_lot_unit_balance.in_lot_quantity + EXCLUDED.in_lot_quantity,
+                out_lot_quantity = stock_lot_unit_balance.out_lot_quantity + EXCLUDED.out_lot_quantity,
+                in_qty = stock_lot_unit_balance.in_qty + EXCLUDED.in_qty,
+                unit_move_line_id = GREATEST(stock_lot_unit_balance.unit_move_line_id, EXCLUDED.unit_move_line_id),
+                lot_unit_name = CASE
+                    WHEN EXCLUDED.unit_move_line_id >= COALESCE(stock_lot_unit_balance.unit_move_line_id, 0)
+                    THEN EXCLUDED.lot_unit_name ELSE stock_lot_unit_balance.lot_unit_name END,
+                lot_unit_name_custom = CASE
+                    WHEN EXCLUDED.unit_move_line_id >= COALESCE(stock_lot_unit_balance.unit_move_line_id, 0)
+                    THEN EXCLUDED.lot_unit_name_custom ELSE stock_lot_unit_balance.lot_unit_name_custom END,
+                in_move_line_id = GREATEST(stock_lot_unit_balance.in_move_line_id, EXCLUDED.in_move_line_id),
+                in_contract_no = CASE
+                    WHEN EXCLUDED.in_move_line_id >= COALESCE(stock_lot_unit_balance.in_move_line_id, 0)
+                    THEN EXCLUDED.in_contract_no ELSE stock_lot_unit_balance.in_contract_no END,
+                last_move_line_id = GREATEST(stock_lot_unit_balance.last_move_line_id, EXCLUDED.last_move_line_id),
+                last_contract_no = CASE
+                    WHEN EXCLUDED.last_move_line_id >= COALESCE(stock_lot_unit_balance.last_move_line_id, 0)
+                    THEN EXCLUDED.last_contract_no ELSE stock_lot_unit_balance.last_contract_no END
+            RETURNING product_id, lot_id, location_id, owner_id
+        """, {'ids': move_line_ids})
+        keys = {tuple(row) for row in self.env.cr.fetchall()}
+        if keys:
+            self.env['stock.lot.unit.balance'].invalidate_model()
+        _logger.info(
+            f"[批次单位台账] 记账: 移动行数={len(move_line_ids)}, 余额变化数={len(keys)}"
+        )
+        return keys
+
+    @api.model
+    def _rebuild_from_history(self):
+        """清空台账和余额，按历史已完成移动行重新生成，并重新计算所有有批次号的库存数量
+
+        安装模块时由 post_init_hook 执行一次（见 __init__.py），从旧版本升级时由 1.1.0 的升级脚本执行一次；
+        可在 Odoo shell 中执行：env['stock.lot.unit.ledger']._rebuild_from_history()
+        也可通过库存数量列表的"重建批次单位台账"动作执行。
+        """
+        self.env.cr.execute("DELETE FROM stock_lot_unit_ledger")
+        self.env.cr.execute("DELETE FROM stock_lot_unit_balance")
+        self.invalidate_model()
+        self.env['stock.lot.unit.balance'].invalidate_model()
+
+        self.env['stock.move.line'].flush_model(['state', 'lot_id'])
+        self.env.cr.execute("""
+            SELECT id
+              FROM stock_move_line
+             WHERE state = 'done'
+               AND lot_id IS NOT NULL
+             ORDER BY id
+        """)
+        move_line_ids = [row[0] for row in self.env.cr.fetchall()]
+        for start in range(0, len(move_line_ids), LEDGER_REBUILD_BATCH_SIZE):
+            self._post_move_lines(move_line_ids[start:start + LEDGER_REBUILD_BATCH_SIZE])
+
+        quants = self.env['stock.quant'].search([('lot_id', '!=', False)])
+        if quants:
+            quants.invalidate_recordset(['lot_quantity', 'lot_unit_name', 'lot_unit_name_custom', 'contract_no'])
+            quants._compute_lot_unit_info()
+        _logger.info(
+            f"[批次单位台账] 重建完成: 移动行数={len(move_line_ids)}, 重新计算库存数量记录数={len(quants)}"
+        )
+        return True
+
+
+class StockLotUnitBalance(models.Model):
+    """批次单位余额
+
+    每个 (产品, 批次号, 库位, 所有者) 一条记录，由批次单位台账按差额累加维护。
+    """
+    _name = 'stock.lot.unit.balance'
+    _description = '批次单位余额'
+    _log_access = False
+
+    product_id = fields.Many2one('product.product', string='产品', required=True, ondelete='cascade')
+    lot_id = fields.Many2one('stock.lot', string='批次号', required=True, ondelete='cascade')
+    location_id = fields.Many2one('stock.location', string='库位', required=True, ondelete='cascade')
+    owner_id = fields.Many2one('res.partner', string='所有者', ondelete='cascade')
+    in_lot_quantity = fields.Float(string='入库单位数量', digits=(16, 2), default=0.0)
+    out_lot_quantity = fields.Float(string='出库单位数量', digits=(16, 2), default=0.0)
+    in_qty = fields.Float(string='入库数量', default=0.0)
+    unit_move_line_id = fields.Integer(string='单位名称来源移动行')
+    lot_unit_name = fields.Char(string='单位名称')
+    lot_unit_name_custom = fields.Char(string='自定义单位名称')
+    in_move_line_id = fields.Integer(string='最新入库移动行')
+    in_contract_no = fields.Char(string='最新入库合同号')
+    last_move_line_id = fields.Integer(string='最新移动行')
+    last_contract_no = fields.Char(string='最新合同号')
+
+    def init(self):
+        """创建 (产品, 批次号, 库位, 所有者) 唯一索引，用于按差额累加余额"""
+        super(StockLotUnitBalance, self).init()
+        self.env.cr.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS stock_lot_unit_balance_key_uniq
+                ON stock_lot_unit_balance (product_id, lot_id, location_id, COALESCE(owner_id, 0))
+        """)
+
+    @api.model
+    def _get_balances(self, keys):
+        """一次查询获取多个 (产品, 批次号, 库位, 所有者) 的余额
+
+        Args:
+            keys (iterable): (产品ID, 批次号ID, 库位ID, 所有者ID) 元组，所有者为空时传 False/None
+
+        Returns:
+            dict: {(产品ID, 批次号ID, 库位ID, 所有者ID或0): 余额字典}
+        """
+        keys = {(p, l, loc, owner or 0) for p, l, loc, owner in keys}
+        if not keys:
+            return {}
+        product_ids, lot_ids, location_ids, owner_ids = (list(column) for column in zip(*keys))
+        self.env.cr.execute("""
+            SELECT b.product_id, b.lot_id, b.location_id, COALESCE(b.owner_id, 0),
+                   b.in_lot_quantity, b.out_lot_quantity, b.in_qty,
+                   b.lot_unit_name, b.lot_unit_name_custom,
+                   b.in_move_line_id, b.in_contract_no, b.last_move_line_id, b.last_contract_no
+              FROM unnest(%s::int[], %s::int[], %s::int[], %s::int[]) AS k(product_id, lot_id, location_id, owner_id)
+              JOIN stock_lot_unit_balance b
+                ON b.product_id = k.product_id
+               AND b.lot_id = k.lot_id
+               AND b.location_id = k.location_id
+               AND COALESCE(b.owner_id, 0) = k.owner_id
+        """, [product_ids, lot_ids, location_ids, owner_ids])
+        balances = {}
+        for row in self.env.cr.fetchall():
+            balances[tuple(row[:4])] = {
+                'in_lot_quantity': row[4] or 0.0,
+                'out_lot_quantity': row[5] or 0.0,
+                'in_qty': row[6] or 0.0,
+                'lot_unit_name': row[7],
+                'lot_unit_name_custom': row[8],
+                'in_move_line_id': row[9],
+                'in_contract_no': row[10],
+                'last_move_line_id': row[11],
+                'last_contract_no': row[12],
+            }
+        return balances
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+
+import logging
+
+from odoo import models, fields, api
+
+from . import utils
+
+_logger = logging.getLogger(__name__)
+
+
+class StockLotUnitReport(models.Model):
+    """附加单位库存报表（物化视图）
+
+    按产品、批次号、库位、附加单位透视/图表分析内部库位的库存。
+    数据来自 stock_quant 已存储的列，报表查询不会触发任何计算字段；
+    物化视图由定时任务定期刷新（CONCURRENTLY，刷新期间不阻塞查询），也可手动刷新。
+    """
+    _name = 'stock.lot.unit.report'
+    _description = '附加单位库存报表'
+    _auto = False
+    _order = 'product_id, lot_id, location_id'
+
+    quant_id = fields.Many2one('stock.quant', string='库存数量', readonly=True)
+    product_id = fields.Many2one('product.product', string='产品', readonly=True)
+    product_tmpl_id = fields.Many2one('product.template', string='产品模板', readonly=True)
+    categ_id = fields.Many2one('product.category', string='产品类别', readonly=True)
+    lot_id = fields.Many2one('stock.lot', string='批次号', readonly=True)
+    location_id = fields.Many2one('stock.location', string='库位', readonly=True)
+    warehouse_id = fields.Many2one('stock.warehouse', string='仓库', readonly=True)
+    company_id = fields.Many2one('res.company', string='公司', readonly=True)
+    lot_unit_name = fields.Selection(
+        list(utils.UNIT_DISPLAY_MAP.items()), string='附加单位类型', readonly=True
+    )
+    lot_unit_name_custom = fields.Char(string='自定义单位名称', readonly=True)
+    in_date = fields.Datetime(string='到货日期', readonly=True)
+    quantity = fields.Float(string='库存数量（面积）', readonly=True)
+    lot_quantity = fields.Float(string='附加单位数量', digits=(16, 2), readonly=True)
+    calculated_length_m = fields.Float(string='计算长度 (m)', digits=(16, 2), readonly=True)
+    roll_count = fields.Integer(string='卷数', readonly=True)
+
+    def init(self):
+        """创建物化视图及其索引（升级时重建）"""
+        self.env.cr.execute(f"DROP MATERIALIZED VIEW IF EXISTS {self._table}")
+        self.env.cr.execute(f"""
+            CREATE MATERIALIZED VIEW {self._table} AS (
+                SELECT q.id AS id,
+                       q.id AS quant_id,
+                       q.product_id,
+                       pp.product_tmpl_id,
+                       pt.categ_id,
+                       q.lot_id,
+                       q.location_id,
+                       sl.warehouse_id,
+                       q.company_id,
+                       q.lot_unit_name,
+                       q.lot_unit_name_custom,
+                       q.in_date,
+                       q.quantity,
+                       COALESCE(q.lot_quantity, 0) AS lot_quantity,
+                       COALESCE(q.calculated_length_m, 0) AS calculated_length_m,
+                       CASE WHEN q.lot_id IS NOT NULL AND q.quantity > 0 THEN 1 ELSE 0 END AS roll_count
+                  FROM stock_quant q
+                  JOIN stock_location sl ON sl.id = q.location_id
+                  JOIN product_product pp ON pp.id = q.product_id
+                  JOIN product_template pt ON pt.id = pp.product_tmpl_id
+                 WHERE sl.usage = 'internal'
+            )
+        """)
+        # 唯一索引是 REFRESH ... CONCURRENTLY 的前提
+        self.env.cr.execute(f"CREATE UNIQUE INDEX {self._table}_id_uniq ON {self._table} (id)")
+        self.env.cr.execute(f"CREATE INDEX {self._table}_product_idx ON {self._table} (product_id)")
+        self.env.cr.execute(f"CREATE INDEX {self._table}_location_idx ON {self._table} (location_id)")
+        self.env.cr.execute(f"CREATE INDEX {self._table}_lot_unit_name_idx ON {self._table} (lot_unit_name)")
+
+    @api.model
+    def _refresh(self):
+        """刷新物化视图（定时任务和"刷新附加单位库存报表"动作调用）"""
+        self.env['stock.quant'].flush_model()
+        self.env.cr.execute(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {self._table}")
+        self.invalidate_model()
+        _logger.info("[附加单位报表] 物化视图已刷新")
+        return True
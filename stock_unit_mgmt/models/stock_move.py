@@ -1,7 +1,23 @@
 # -*- coding: utf-8 -*-
 
+import logging
+import re
+
 from odoo import models, fields, api
+from odoo.exceptions import UserError
+
+from . import utils
+
+_logger = logging.getLogger(__name__)
 
+# 批次号文本的字段分隔符（制表符或分号）
+LOT_FIELD_SEPARATOR_RE = re.compile(r'[\t;]')
+# 批量导入的一行：批次号[分隔符 单位数量[分隔符 单位]]
+LOT_IMPORT_LINE_RE = re.compile(
+    r'(?P<lot_name>[^\t;]+?) *(?:[\t;] *(?P<lot_quantity>\d+(?:\.\d+)?)? *(?:[\t;] *(?P<unit>[^\t;]*?))?)?'
+)
+# 批量导入时每次 create 的移动行数
+LOT_IMPORT_CHUNK_SIZE = 1000
 
 class StockMove(models.Model):
     _inherit = 'stock.move'
@@ -43,51 +59,15 @@ class StockMove(models.Model):
         """完成库存移动时，将单位信息传递到库存数量记录"""
         result = super()._action_done(cancel_backorder)
         
-        # 收集需要更新计算的 stock_quant 记录
-        quants_to_recompute = self.env['stock.quant']
+        # **性能优化**：把已完成移动行的单位数量记入批次单位台账，库存数量直接读取累计余额
+        done_line_ids = self.move_line_ids.filtered(lambda ml: ml.state == 'done' and ml.lot_id).ids
+        if done_line_ids:
+            self.env['stock.lot.unit.ledger'].sudo()._post_move_lines(done_line_ids)
         
-        for move in self:
-            for move_line in move.move_line_ids:
-                # 只要有批次号就触发重新计算，即使 lot_quantity 为空
-                # 因为 lot_quantity 可能在扫码时填写，需要重新计算
-                if move_line.lot_id:
-                    # 查找相关的 stock_quant 记录
-                    # 优先匹配目标位置（入库），如果没有找到再尝试源位置（出库）
-                    domain = [
-                        ('product_id', '=', move_line.product_id.id),
-                        ('lot_id', '=', move_line.lot_id.id),
-                    ]
-                    
-                    # owner_id 处理：如果移动行有 owner_id，则匹配；否则匹配 owner_id 为空的记录
-                    if move_line.owner_id:
-                        domain.append(('owner_id', '=', move_line.owner_id.id))
-                    else:
-                        domain.append(('owner_id', '=', False))
-                    
-                    # 优先查找目标位置的 quant（入库）
-                    quants_found = False
-                    if move_line.location_dest_id:
-                        quants = self.env['stock.quant'].search(domain + [
-                            ('location_id', '=', move_line.location_dest_id.id)
-                        ])
-                        if quants:
-                            quants_to_recompute |= quants
-                            quants_found = True
-                    
-                    # 如果没有找到，尝试源位置的 quant（出库或内部移动）
-                    if not quants_found and move_line.location_id:
-                        quants = self.env['stock.quant'].search(domain + [
-                            ('location_id', '=', move_line.location_id.id)
-                        ])
-                        if quants:
-                            quants_to_recompute |= quants
-                            quants_found = True
-                    
-                    # 如果还是没找到，尝试不限制位置（可能位置不匹配）
-                    if not quants_found:
-                        quants = self.env['stock.quant'].search(domain)
-                        if quants:
-                            quants_to_recompute |= quants
+        # **性能优化**：一次查询找出所有需要重新计算的 stock_quant 记录，查询次数不再随移动行数增长
+        quants_to_recompute = self._get_lot_unit_quants_to_recompute(
+            self.move_line_ids.filtered('lot_id')
+        )
         
         # 触发所有相关的 stock_quant 重新计算
         if quants_to_recompute:
@@ -99,27 +79,82 @@ class StockMove(models.Model):
         return result
 
     @api.model
-    def split_lots(self, lots):
-        """分割批次号，支持单位数量"""
-        breaking_char = '\n'
-        separation_char = '\t'
-        options = False
+    def _get_lot_unit_quants_to_recompute(self, move_lines):
+        """获取移动行涉及的 stock_quant 记录（按产品、批次号、所有者匹配）
+        
+        每条移动行优先匹配目标位置（入库）的 quant，没有时匹配源位置（出库或内部移动）的 quant，
+        还是没有时匹配该产品、批次号、所有者在任意位置的 quant。
+        只对涉及的 (产品, 批次号) 执行一次查询，再在内存中按上述顺序匹配。
+        
+        Args:
+            move_lines (stock.move.line): 有批次号的移动行
+        
+        Returns:
+            stock.quant: 需要重新计算单位信息的库存数量记录
+        """
+        Quant = self.env['stock.quant']
+        if not move_lines:
+            return Quant
+        
+        line_keys = {
+            (ml.product_id.id, ml.lot_id.id, ml.owner_id.id or 0, ml.location_dest_id.id, ml.location_id.id)
+            for ml in move_lines
+        }
+        product_ids, lot_ids = zip(*{(key[0], key[1]) for key in line_keys})
+        
+        Quant.flush_model(['product_id', 'lot_id', 'owner_id', 'location_id'])
+        self.env.cr.execute("""
+            SELECT q.id, q.product_id, q.lot_id, COALESCE(q.owner_id, 0), q.location_id
+              FROM stock_quant q
+              JOIN unnest(%s::int[], %s::int[]) AS k(product_id, lot_id)
+                ON q.product_id = k.product_id
+               AND q.lot_id = k.lot_id
+        """, [list(product_ids), list(lot_ids)])
+        
+        # {(产品ID, 批次号ID, 所有者ID): {库位ID: [quant ID, ...]}}
+        quant_index = {}
+        for quant_id, product_id, lot_id, owner_id, location_id in self.env.cr.fetchall():
+            quant_index.setdefault((product_id, lot_id, owner_id), {}).setdefault(location_id, []).append(quant_id)
+        
+        quant_ids = set()
+        for product_id, lot_id, owner_id, location_dest_id, location_id in line_keys:
+            quants_by_location = quant_index.get((product_id, lot_id, owner_id))
+            if not quants_by_location:
+                continue
+            matched = quants_by_location.get(location_dest_id) or quants_by_location.get(location_id)
+            if not matched:
+                # 如果还是没找到，不限制位置（可能位置不匹配）
+                matched = [quant_id for ids in quants_by_location.values() for quant_id in ids]
+            quant_ids.update(matched)
+        return Quant.browse(quant_ids)
 
+    @api.model
+    def split_lots(self, lots):
+        """分割批次号，支持单位数量
+        
+        **性能优化**：字段分隔用预编译的正则一次完成；格式选项确定后，
+        相同字符串的字段解析结果只计算一次（大批量粘贴时大部分是重复的格式字符）。
+        """
         if not lots:
             return []
 
-        split_lines = lots.split(breaking_char)
-        split_lines = list(filter(None, split_lines))
+        options = False
+        field_data_cache = {}
         move_lines_vals = []
-        for lot_text in split_lines:
+        for lot_text in filter(None, lots.split('\n')):
             move_line_vals = {
                 'lot_name': lot_text,
                 'quantity': 1,
             }
-            lot_text_parts = lot_text.replace(';', separation_char).split(separation_char)
+            lot_text_parts = LOT_FIELD_SEPARATOR_RE.split(lot_text)
             options = options or self._get_formating_options(lot_text_parts[1:] if len(lot_text_parts) > 1 else [])
             for extra_string in (lot_text_parts[1] if len(lot_text_parts) > 1 else []):
-                field_data = self._convert_string_into_field_data(extra_string, options)
+                if not options:
+                    field_data = self._convert_string_into_field_data(extra_string, options)
+                elif extra_string in field_data_cache:
+                    field_data = field_data_cache[extra_string]
+                else:
+                    field_data = field_data_cache[extra_string] = self._convert_string_into_field_data(extra_string, options)
                 if field_data:
                     lot_text = lot_text_parts[0]
                     lot_quantity = int(lot_text_parts[-1]) if lot_text_parts[-1].isdigit() else 1
@@ -132,3 +167,128 @@ class StockMove(models.Model):
                     break
             move_lines_vals.append(move_line_vals)
         return move_lines_vals
+
+    def import_lots(self, lots):
+        """大批量导入批次号（收货时一次粘贴上万行）
+        
+        每行格式：批次号[制表符/分号 单位数量[制表符/分号 单位]]，单位可以是单位代码或显示名称，
+        其他名称按自定义单位处理；没有单位时使用产品配置的附加单位。
+        
+        **性能优化**：
+        - 用预编译的正则解析，不经过 _get_formating_options / _convert_string_into_field_data
+        - 与移动中已有的批次号一次查询去重，导入内容中的重复行只保留第一行
+        - 按 LOT_IMPORT_CHUNK_SIZE 分批创建，create 走快速路径（跳过扫码验证分支）
+        
+        由移动明细操作中的"批量导入批次号"向导调用（见 stock.move.lot.import.wizard）。
+        
+        Args:
+            lots (str): 粘贴的批次号文本
+        
+        Returns:
+            dict: {'created': 创建的移动行数, 'skipped': 重复跳过的行数}
+        """
+        self.ensure_one()
+        self._check_import_lots()
+        if not lots:
+            return {'created': 0, 'skipped': 0}
+        
+        MoveLine = self.env['stock.move.line']
+        existing = MoveLine._get_move_prefilled_lots(self.id)
+        unit_codes = self._get_import_unit_codes()
+        default_unit = self._get_import_default_unit()
+        
+        base_vals = self._prepare_move_line_vals()
+        base_vals.pop('quantity', None)
+        contract_no = self.production_id.contract_no or self.raw_material_production_id.contract_no
+        if contract_no:
+            base_vals['contract_no'] = contract_no
+        
+        vals_list = []
+        seen = set()
+        skipped = 0
+        invalid_lines = []
+        for line_no, line in enumerate(lots.splitlines(), 1):
+            line = line.strip()
+            if not line:
+                continue
+            match = LOT_IMPORT_LINE_RE.fullmatch(line)
+            if not match:
+                invalid_lines.append(f"第 {line_no} 行：{line}")
+                continue
+            lot_name = match.group('lot_name')
+            lot_key = utils.normalize_lot_name(lot_name)
+            if lot_key in existing or lot_key in seen:
+                skipped += 1
+                continue
+            seen.add(lot_key)
+            
+            unit = (match.group('unit') or '').strip()
+            unit_name, unit_name_custom = unit_codes.get(unit.lower(), ('custom', unit)) if unit else default_unit
+            vals = dict(
+                base_vals,
+                lot_name=lot_name,
+                quantity=1,
+                lot_quantity=float(match.group('lot_quantity') or 1),
+            )
+            if unit_name:
+                vals['lot_unit_name'] = unit_name
+            if unit_name_custom:
+                vals['lot_unit_name_custom'] = unit_name_custom
+            vals_list.append(vals)
+        
+        if invalid_lines:
+            raise UserError(
+                '以下行格式不正确（格式：批次号[制表符/分号 单位数量[制表符/分号 单位]]）：\n%s' % '\n'.join(invalid_lines[:20])
+            )
+        
+        MoveLine = MoveLine.with_context(bulk_lot_import=True)
+        for start in range(0, len(vals_list), LOT_IMPORT_CHUNK_SIZE):
+            MoveLine.create(vals_list[start:start + LOT_IMPORT_CHUNK_SIZE])
+        _logger.info(
+            f"[批量导入批次号] 移动ID={self.id}, 创建={len(vals_list)}, 重复跳过={skipped}"
+        )
+        return {'created': len(vals_list), 'skipped': skipped}
+
+    def _check_import_lots(self):
+        """批量导入前检查移动状态、产品追踪方式和权限（快速路径跳过了逐行的扫码验证，这里统一检查）"""
+        self.ensure_one()
+        if self.state in ('done', 'cancel'):
+            raise UserError('移动 %s 已完成或已取消，不能导入批次号。' % self.display_name)
+        if self.product_id.tracking == 'none':
+            raise UserError('产品 %s 未启用批次号/序列号追踪，不能导入批次号。' % self.product_id.display_name)
+        if self.picking_type_id and not self.picking_type_id.use_create_lots:
+            raise UserError('作业类型 %s 不允许创建新的批次号，不能导入批次号。' % self.picking_type_id.display_name)
+        self.check_access('write')
+        self.env['stock.move.line'].check_access('create')
+
+    @api.model
+    def _get_import_unit_codes(self):
+        """单位文本（小写的代码或显示名称）到 (单位代码, 自定义单位名称) 的映射"""
+        unit_codes = {}
+        for code, label in utils.UNIT_DISPLAY_MAP.items():
+            if code == 'custom':
+                continue
+            for text in (code, label, utils.get_unit_display_name_cn(code)):
+                unit_codes[text.lower()] = (code, False)
+        return unit_codes
+
+    def _get_import_default_unit(self):
+        """没有填写单位时使用产品配置的附加单位：(单位代码, 自定义单位名称)"""
+        configs = self.product_id.product_tmpl_id._get_unit_config()['configs']
+        if not configs:
+            return False, False
+        name, label = configs[0]
+        return (name, label) if name == 'custom' else (name, False)
+
+    def action_open_lot_import_wizard(self):
+        """打开批量导入批次号向导"""
+        self.ensure_one()
+        self._check_import_lots()
+        return {
+            'name': '批量导入批次号',
+            'type': 'ir.actions.act_window',
+            'res_model': 'stock.move.lot.import.wizard',
+            'view_mode': 'form',
+            'target': 'new',
+            'context': {'default_move_id': self.id},
+        }
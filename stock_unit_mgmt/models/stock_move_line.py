@@ -2,9 +2,19 @@
 
 from odoo import models, fields, api, _
 from odoo.exceptions import UserError, ValidationError
+from odoo.tools.sql import column_exists, create_column, create_index
 from re import findall as regex_findall
 
-from . import utils
+from . import tracing, utils
+from .stock_lot_unit_ledger import LEDGER_MOVE_LINE_FIELDS
+
+# 没有 stock_barcode 的字段列表时，扫码界面读取的移动行字段
+BARCODE_DEFAULT_FIELDS = [
+    'id', 'move_id', 'product_id', 'lot_id', 'lot_name', 'qty_done', 'location_id',
+    'location_dest_id', 'result_package_id',
+]
+# 本模块在扫码界面额外显示的移动行字段
+BARCODE_EXTRA_FIELDS = ['barcode_revision', 'lot_quantity', 'lot_unit_name']
 
 
 class StockMoveLine(models.Model):
@@ -60,7 +70,29 @@ class StockMoveLine(models.Model):
         string='合同号',
         help='合同号，从制造订单自动获取'
     )
-    
+
+    # 扫码修订号（用于扫码界面的增量加载/保存）
+    # 创建移动行或修改扫码界面显示的字段时推进所属调拨单的修订号，并记为移动行的修订号
+    # （见 stock.picking._bump_barcode_revision）
+    barcode_revision = fields.Integer(
+        string='扫码修订号',
+        default=0,
+        copy=False,
+        readonly=True,
+        help='移动行最后一次变更时的修订号，扫码界面只需加载和保存大于已知修订号的移动行'
+    )
+
+    # 标准化批次号字段（去除首尾空格并转为小写）
+    # **性能优化**：存储并建立索引，忽略大小写的批次号比对直接走索引等值查询，
+    # 不再在 Python 中遍历整个移动/调拨单的移动行
+    lot_name_normalized = fields.Char(
+        string='标准化批次号',
+        compute='_compute_lot_name_normalized',
+        store=True,
+        index=True,
+        help='去除首尾空格并转为小写的批次号，用于忽略大小写的批次号匹配'
+    )
+
     # 发货重量字段（根据产品发货重量系数自动计算）
     delivery_weight = fields.Float(
         string='发货重量 (kg)',
@@ -70,21 +102,132 @@ class StockMoveLine(models.Model):
         help='根据产品发货重量系数和面积自动计算的发货重量，单位：千克'
     )
 
+    def _auto_init(self):
+        """安装/升级时分批回填标准化批次号，避免 ORM 逐条重新计算"""
+        if not column_exists(self.env.cr, self._table, 'lot_name_normalized'):
+            create_column(self.env.cr, self._table, 'lot_name_normalized', 'varchar')
+            utils.backfill_normalized_lot_names(self.env.cr, self._table, 'lot_name', 'lot_name_normalized')
+        return super(StockMoveLine, self)._auto_init()
+
+    def init(self):
+        """创建 (移动, 标准化批次号)、(调拨单, 标准化批次号)、(调拨单, 扫码修订号) 复合索引"""
+        super(StockMoveLine, self).init()
+        create_index(
+            self.env.cr, 'stock_move_line_move_lot_name_normalized_idx',
+            self._table, ['move_id', 'lot_name_normalized'],
+            where='lot_name_normalized IS NOT NULL'
+        )
+        create_index(
+            self.env.cr, 'stock_move_line_picking_lot_name_normalized_idx',
+            self._table, ['picking_id', 'lot_name_normalized'],
+            where='lot_name_normalized IS NOT NULL'
+        )
+        create_index(
+            self.env.cr, 'stock_move_line_picking_barcode_revision_idx',
+            self._table, ['picking_id', 'barcode_revision']
+        )
+        # 修订号改为按调拨单计数后不再使用的全局序列
+        self.env.cr.execute("DROP SEQUENCE IF EXISTS stock_move_line_barcode_revision_seq")
+
+    def _touch_barcode_revision(self, picking_id=None):
+        """推进移动行所属调拨单的扫码修订号，并把新修订号记为这些移动行的修订号
+
+        Args:
+            picking_id (int): 移动行即将移入的调拨单ID（write 修改 picking_id 时传入），
+                None 表示按移动行当前所属的调拨单
+        """
+        if picking_id is None:
+            line_pickings = {line.id: line.picking_id.id for line in self}
+        else:
+            line_pickings = dict.fromkeys(self.ids, picking_id)
+        line_pickings = {line_id: picking_id for line_id, picking_id in line_pickings.items() if picking_id}
+        if not line_pickings:
+            return
+        revisions = self.env['stock.picking']._bump_barcode_revision(line_pickings.values())
+        line_ids = list(line_pickings)
+        self.env.cr.execute("""
+            UPDATE stock_move_line AS sml
+               SET barcode_revision = r.revision
+              FROM unnest(%s::int[], %s::int[]) AS r(id, revision)
+             WHERE sml.id = r.id
+        """, [line_ids, [revisions[line_pickings[line_id]] for line_id in line_ids]])
+        self.browse(line_ids).invalidate_recordset(['barcode_revision'])
+
+    @api.model
+    def _get_barcode_fields(self):
+        """扫码界面读取的移动行字段（增量加载时读取这些字段，修改这些字段时推进扫码修订号）"""
+        if hasattr(self, '_get_fields_stock_barcode'):
+            field_names = list(self._get_fields_stock_barcode())
+        else:
+            field_names = list(BARCODE_DEFAULT_FIELDS)
+        for extra_field in BARCODE_EXTRA_FIELDS:
+            if extra_field in self._fields and extra_field not in field_names:
+                field_names.append(extra_field)
+        return field_names
+
+    @api.depends('lot_name')
+    def _compute_lot_name_normalized(self):
+        """计算标准化批次号"""
+        for record in self:
+            record.lot_name_normalized = utils.normalize_lot_name(record.lot_name) or False
+
+    @api.model
+    def _search_lot_name_lines(self, lot_name, move_id=None, picking_id=None, exclude_ids=None):
+        """按标准化批次号查找移动行（索引等值查询）
+
+        Args:
+            lot_name (str): 批次号（原始或标准化均可）
+            move_id (int): 限定的移动ID
+            picking_id (int): 限定的调拨单ID
+            exclude_ids (iterable): 需要排除的移动行ID
+
+        Returns:
+            stock.move.line: 匹配的移动行
+        """
+        lot_key = utils.normalize_lot_name(lot_name)
+        if not lot_key:
+            return self.browse()
+        domain = [('lot_name_normalized', '=', lot_key)]
+        if move_id:
+            domain.append(('move_id', '=', move_id))
+        if picking_id:
+            domain.append(('picking_id', '=', picking_id))
+        exclude_ids = [line_id for line_id in (exclude_ids or []) if isinstance(line_id, int)]
+        if exclude_ids:
+            domain.append(('id', 'not in', exclude_ids))
+        return self.search(domain)
+
+    @api.model
+    def _get_move_prefilled_lots(self, move_id, exclude_ids=None):
+        """获取移动中已保存的预填批次号（一次分组查询）
+
+        Args:
+            move_id (int): 移动ID
+            exclude_ids (iterable): 需要排除的移动行ID（如当前正在验证的记录）
+
+        Returns:
+            dict: {标准化批次号: 原始批次号}
+        """
+        if not move_id:
+            return {}
+        self.flush_model(['lot_name', 'lot_name_normalized', 'move_id'])
+        exclude_ids = tuple(line_id for line_id in (exclude_ids or []) if isinstance(line_id, int))
+        query = """
+            SELECT lot_name_normalized, MIN(lot_name)
+              FROM stock_move_line
+             WHERE move_id = %s
+               AND lot_name_normalized IS NOT NULL
+        """
+        params = [move_id]
+        if exclude_ids:
+            query += " AND id NOT IN %s"
+            params.append(exclude_ids)
+        self.env.cr.execute(query + " GROUP BY lot_name_normalized", params)
+        return dict(self.env.cr.fetchall())
+
     @api.model
     def _get_lot_unit_name_selection(self):
         """根据产品配置动态获取单位选择列表"""
-        # 所有可用的单位选项
-        all_options = [
-            ('kg', '公斤(kg)'),
-            ('roll', '卷'),
-            ('barrel', '桶'),
-            ('box', '箱'),
-            ('bag', '袋'),
-            ('sqm', '平方米(㎡)'),
-            ('piece', '件'),
-            ('custom', '自定义')
-        ]
-        
         # 尝试从当前记录获取产品
         product_id = None
         if hasattr(self, 'product_id') and self.product_id:
@@ -96,32 +239,15 @@ class StockMoveLine(models.Model):
             product_id = self.env.context.get('default_product_id')
         
         if not product_id:
-            return all_options
+            return list(utils.UNIT_DISPLAY_MAP.items())
         
         # 获取产品
-        product = self.env['product.product'].browse(product_id)
-        if not product.exists():
-            return all_options
+        product = self.env['product.product'].browse(product_id).exists()
+        if not product:
+            return list(utils.UNIT_DISPLAY_MAP.items())
         
-        # 获取产品配置的单位
-        product_tmpl = product.product_tmpl_id
-        if not hasattr(product_tmpl, 'default_unit_config') or not product_tmpl.default_unit_config:
-            return all_options
-        
-        if product_tmpl.default_unit_config == 'custom':
-            return [('custom', '自定义')]
-        
-        # 根据产品配置返回对应的单位选项
-        config_map = {
-            'kg': [('kg', '公斤(kg)')],
-            'roll': [('roll', '卷')],
-            'barrel': [('barrel', '桶')],
-            'box': [('box', '箱')],
-            'bag': [('bag', '袋')],
-            'sqm': [('sqm', '平方米(㎡)')],
-        }
-        
-        return config_map.get(product_tmpl.default_unit_config, all_options)
+        # **性能优化**：单位选项来自按产品模板缓存的单位配置
+        return list(product.product_tmpl_id._get_unit_config()['selection'])
 
     @api.depends('lot_unit_name', 'lot_unit_name_custom')
     def _compute_lot_weight_label(self):
@@ -147,66 +273,52 @@ class StockMoveLine(models.Model):
            - 如果产品单位不是平方米，根据 quantity 和产品宽度计算面积
         3. 计算重量：面积 × 重量系数
         """
+        # **性能优化**：产品重量系数或宽度变化时可能有大量明细行重新计算，
+        # 按 (产品, 单位) 计算一次每单位数量的重量系数，每行只做一次乘法
+        factors = {}
         for record in self:
-            if not record.product_id:
-                record.delivery_weight = 0.0
-                continue
-            
             product = record.product_id
-            product_tmpl = product.product_tmpl_id
-            
-            # 检查产品是否有发货重量系数
-            if not hasattr(product_tmpl, 'weight_per_sqm') or not product_tmpl.weight_per_sqm:
-                record.delivery_weight = 0.0
-                continue
-            
-            weight_per_sqm = product_tmpl.weight_per_sqm
-            
             # 获取数量（优先使用 qty_done，如果没有则使用 quantity）
             qty = record.qty_done if record.qty_done > 0 else (record.quantity or 0.0)
-            if qty <= 0:
+            if not product or qty <= 0:
                 record.delivery_weight = 0.0
                 continue
             
             # 获取产品单位
             uom_id = record.product_uom_id or product.uom_id
-            if not uom_id:
-                record.delivery_weight = 0.0
-                continue
-            
-            # 判断单位是否为平方米
-            uom_name = str(uom_id.name or '').lower()
-            is_sqm_unit = (
-                '平米' in uom_name or 
-                '平方米' in uom_name or 
-                'sqm' in uom_name or
-                'm²' in uom_name or
-                'm2' in uom_name or
-                (hasattr(uom_id, 'category_id') and uom_id.category_id and 
-                 ('面积' in (uom_id.category_id.name or '') or 
-                  'area' in (uom_id.category_id.name or '').lower()))
-            )
-            
-            # 计算面积
-            if is_sqm_unit:
-                # 如果单位是平方米，直接用数量作为面积
-                area_sqm = qty
-            else:
-                # 如果单位不是平方米，需要根据数量和产品宽度计算面积
-                # 面积 = 数量 × 宽度(mm) / 1000 (转换为平方米)
-                if not product_tmpl.product_width or product_tmpl.product_width <= 0:
-                    record.delivery_weight = 0.0
-                    continue
-                
-                # 假设数量单位是"米"或"卷"等，需要转换为面积
-                # 如果数量单位是"米"，面积 = 数量 × 宽度(mm) / 1000
-                # 如果数量单位是"卷"，需要知道每卷的面积，这里暂时按"米"处理
-                # 注意：这里假设数量单位是"米"，如果是其他单位可能需要调整
-                width_m = product_tmpl.product_width / 1000.0  # mm转m
-                area_sqm = qty * width_m
-            
-            # 计算重量：面积 × 重量系数
-            record.delivery_weight = round(area_sqm * weight_per_sqm, 2)
+            key = (product.id, uom_id.id)
+            if key not in factors:
+                factors[key] = self._get_delivery_weight_factor(product, uom_id)
+            record.delivery_weight = round(qty * factors[key], 2) if factors[key] else 0.0
+
+    @api.model
+    def _get_delivery_weight_factor(self, product, uom_id):
+        """获取每单位数量的发货重量（千克），不适用时返回 0
+        
+        - 产品没有配置发货重量系数或没有单位：0
+        - 单位是平方米：数量即面积，系数 = 重量系数
+        - 单位不是平方米：面积 = 数量 × 宽度(mm) / 1000，系数 = 宽度(m) × 重量系数
+        """
+        product_tmpl = product.product_tmpl_id
+        # 检查产品是否有发货重量系数
+        if not hasattr(product_tmpl, 'weight_per_sqm') or not product_tmpl.weight_per_sqm:
+            return 0.0
+        if not uom_id:
+            return 0.0
+        
+        # 判断单位是否为平方米（按单位ID缓存，不再逐行匹配单位名称）
+        if self.env['uom.uom']._is_area_uom(uom_id.id):
+            return product_tmpl.weight_per_sqm
+        
+        # 如果单位不是平方米，需要根据数量和产品宽度计算面积
+        if not product_tmpl.product_width or product_tmpl.product_width <= 0:
+            return 0.0
+        # 假设数量单位是"米"或"卷"等，需要转换为面积
+        # 如果数量单位是"米"，面积 = 数量 × 宽度(mm) / 1000
+        # 如果数量单位是"卷"，需要知道每卷的面积，这里暂时按"米"处理
+        # 注意：这里假设数量单位是"米"，如果是其他单位可能需要调整
+        width_m = product_tmpl.product_width / 1000.0  # mm转m
+        return width_m * product_tmpl.weight_per_sqm
 
     @api.onchange('product_id')
     def _onchange_product_id_custom_units(self):
@@ -216,33 +328,34 @@ class StockMoveLine(models.Model):
         result = super()._onchange_product_id() if hasattr(super(), '_onchange_product_id') else {}
         
         if self.product_id:
-            product_tmpl = self.product_id.product_tmpl_id
+            # **性能优化**：单位配置来自按产品模板缓存的单位配置
+            unit_config = self.product_id.product_tmpl_id._get_unit_config()
             # 只在单位信息为空时才自动填充
             if not self.lot_unit_name:
-                if hasattr(product_tmpl, 'enable_custom_units') and product_tmpl.enable_custom_units:
-                    if hasattr(product_tmpl, 'default_unit_config') and product_tmpl.default_unit_config:
-                        if product_tmpl.default_unit_config == 'custom':
+                if unit_config['enabled']:
+                    if unit_config['default_unit']:
+                        if unit_config['default_unit'] == 'custom':
                             self.lot_unit_name = 'custom'
                             # 自定义单位名称从产品配置中获取
-                            if hasattr(product_tmpl, 'quick_unit_name') and product_tmpl.quick_unit_name:
-                                self.lot_unit_name_custom = product_tmpl.quick_unit_name
+                            if unit_config['quick_unit_name']:
+                                self.lot_unit_name_custom = unit_config['quick_unit_name']
                         else:
-                            self.lot_unit_name = product_tmpl.default_unit_config
+                            self.lot_unit_name = unit_config['default_unit']
                     
-                    elif hasattr(product_tmpl, 'custom_unit_name') and product_tmpl.custom_unit_name:
-                        if product_tmpl.custom_unit_name == 'custom':
+                    elif unit_config['legacy_unit_name']:
+                        if unit_config['legacy_unit_name'] == 'custom':
                             self.lot_unit_name = 'custom'
-                            self.lot_unit_name_custom = product_tmpl.custom_unit_name_text or ''
+                            self.lot_unit_name_custom = unit_config['legacy_unit_name_text'] or ''
                         else:
-                            self.lot_unit_name = product_tmpl.custom_unit_name
+                            self.lot_unit_name = unit_config['legacy_unit_name']
             
             # 只在单位数量为空时才自动填充
             if not self.lot_quantity:
-                if hasattr(product_tmpl, 'enable_custom_units') and product_tmpl.enable_custom_units:
-                    if hasattr(product_tmpl, 'default_unit_config') and product_tmpl.default_unit_config:
+                if unit_config['enabled']:
+                    if unit_config['default_unit']:
                         self.lot_quantity = 1
-                    elif hasattr(product_tmpl, 'custom_unit_value') and product_tmpl.custom_unit_value:
-                        self.lot_quantity = int(product_tmpl.custom_unit_value)
+                    elif unit_config['legacy_unit_value']:
+                        self.lot_quantity = int(unit_config['legacy_unit_value'])
                     else:
                         self.lot_quantity = 1
         
@@ -254,24 +367,25 @@ class StockMoveLine(models.Model):
         if not self.product_id or not self.lot_unit_name:
             return {}
         
-        product_tmpl = self.product_id.product_tmpl_id
-        if not hasattr(product_tmpl, 'enable_custom_units') or not product_tmpl.enable_custom_units:
+        unit_config = self.product_id.product_tmpl_id._get_unit_config()
+        if not unit_config['enabled']:
             return {}
         
-        if not hasattr(product_tmpl, 'default_unit_config') or not product_tmpl.default_unit_config:
+        default_unit = unit_config['default_unit']
+        if not default_unit:
             return {}
         
-        if product_tmpl.default_unit_config != 'custom':
-            if self.lot_unit_name != product_tmpl.default_unit_config:
-                self.lot_unit_name = product_tmpl.default_unit_config
+        if default_unit != 'custom':
+            if self.lot_unit_name != default_unit:
+                self.lot_unit_name = default_unit
                 return {
                     'warning': {
                         'title': '单位已自动调整',
-                        'message': f'该产品已配置单位"{self._get_unit_display_name(product_tmpl.default_unit_config)}"，已自动调整为配置的单位。'
+                        'message': f'该产品已配置单位"{self._get_unit_display_name(default_unit)}"，已自动调整为配置的单位。'
                     }
                 }
-        elif product_tmpl.default_unit_config == 'custom':
-            custom_unit_name = product_tmpl.quick_unit_name if hasattr(product_tmpl, 'quick_unit_name') else None
+        elif default_unit == 'custom':
+            custom_unit_name = unit_config['quick_unit_name'] or None
             if self.lot_unit_name == 'custom' and not self.lot_unit_name_custom and custom_unit_name:
                 self.lot_unit_name_custom = custom_unit_name
             elif self.lot_unit_name != 'custom':
@@ -788,7 +902,50 @@ class StockMoveLine(models.Model):
             # 其他错误，重新抛出
             raise
     
+    @api.model
+    def _prefetch_create_move_info(self, vals_list):
+        """一次性预取 create 所需的移动相关信息
+
+        整批 vals_list 只读取一次移动、调拨单、作业类型、产品和制造订单，
+        ORM 预取会把同一批记录的字段合并为少量查询。
+
+        Args:
+            vals_list (list): create 的 vals 列表
+
+        Returns:
+            tuple: (move_info_map, product_tracking_map)
+                move_info_map: {移动ID: {'picking_id', 'picking_type_id', 'enhanced_validation',
+                                'product_tracking', 'contract_no'}}
+                product_tracking_map: {产品ID: 追踪类型}（vals 中显式指定的产品）
+        """
+        move_ids = {vals['move_id'] for vals in vals_list if isinstance(vals.get('move_id'), int)}
+        product_ids = {vals['product_id'] for vals in vals_list if isinstance(vals.get('product_id'), int)}
+
+        move_info_map = {}
+        for move in self.env['stock.move'].browse(move_ids).exists():
+            picking_type = move.picking_id.picking_type_id
+            # 优先从成品制造订单获取合同号，如果没有，则从原材料制造订单获取
+            contract_no = (
+                move.production_id.contract_no or
+                move.raw_material_production_id.contract_no or
+                False
+            )
+            move_info_map[move.id] = {
+                'picking_id': move.picking_id.id,
+                'picking_type_id': picking_type.id,
+                'enhanced_validation': bool(picking_type.enable_enhanced_barcode_validation),
+                'product_tracking': move.product_id.tracking if move.product_id else None,
+                'contract_no': contract_no,
+            }
+
+        product_tracking_map = {
+            product.id: product.tracking
+            for product in self.env['product.product'].browse(product_ids).exists()
+        }
+        return move_info_map, product_tracking_map
+
     @api.model_create_multi
+    @tracing.traced('stock.move.line.create')
     def create(self, vals_list):
         """在创建记录之前，验证批次号是否在预填列表中，并检查重复
        这样可以防止扫码时创建不在预填列表中的新记录，以及防止重复扫码
@@ -802,10 +959,13 @@ class StockMoveLine(models.Model):
         6. **关键修改**：如果记录有批次号，强制设置 quantity = 1.0（按照序列号方式）
         """
         import logging
-        import traceback
         from odoo.tools import float_compare
         _logger = logging.getLogger(__name__)
         
+        # **性能优化**：一次性预取整批 vals_list 涉及的移动、调拨单、作业类型、产品和制造订单
+        # 后续的数量强制、扫描顺序和合同号规则都基于内存中的映射处理，不再逐条 browse/exists
+        move_info_map, product_tracking_map = self._prefetch_create_move_info(vals_list)
+        
         # **关键修改**：在创建之前，检查是否启用了增强条码验证
         # 如果启用，且有批次号，强制设置 quantity = 1.0（按照序列号方式）
         for vals in vals_list:
@@ -813,75 +973,29 @@ class StockMoveLine(models.Model):
             if lot_name and lot_name.strip():
                 lot_name = lot_name.strip()
                 move_id = vals.get('move_id')
-                
-                # 检查是否启用了增强条码验证
-                enable_enhanced_validation = False
-                if move_id:
-                    try:
-                        move = self.env['stock.move'].browse(move_id)
-                        if move.exists() and move.picking_id and move.picking_id.picking_type_id:
-                            enable_enhanced_validation = move.picking_id.picking_type_id.enable_enhanced_barcode_validation
-                            _logger.info(
-                                f"[批次号创建] 作业类型配置检查: move_id={move_id}, "
-                                f"picking_type_id={move.picking_id.picking_type_id.id}, "
-                                f"enable_enhanced_barcode_validation={enable_enhanced_validation}, "
-                                f"批次号={lot_name}"
-                            )
-                    except Exception as e:
-                        _logger.warning(f"[批次号创建] 检查作业类型配置时出错: {str(e)}")
+                move_info = move_info_map.get(move_id, {})
                 
                 # **关键修改**：只有当启用增强条码验证时，才强制设置 quantity = 1.0
                 # **重要**：只对非序列号产品应用此逻辑，序列号产品保持原有逻辑
                 # 完全按照序列号的方式：每个批次号对应 1.0 单位
-                if enable_enhanced_validation:
+                if move_info.get('enhanced_validation'):
                     # 检查产品不是序列号追踪（tracking != 'serial'）
-                    # 序列号产品应该保持原有的 Odoo 标准逻辑
-                    product_tracking = None
-                    product_id = vals.get('product_id')
-                    if product_id:
-                        try:
-                            product = self.env['product.product'].browse(product_id)
-                            if product.exists():
-                                product_tracking = product.tracking
-                        except Exception as e:
-                            _logger.warning(f"[批次号创建] 检查产品追踪类型时出错: {str(e)}")
-                    
-                    # 如果无法从 vals 获取，尝试从 move 获取
-                    if product_tracking is None and move_id:
-                        try:
-                            move = self.env['stock.move'].browse(move_id)
-                            if move.exists() and move.product_id:
-                                product_tracking = move.product_id.tracking
-                        except Exception as e:
-                            _logger.warning(f"[批次号创建] 从移动获取产品追踪类型时出错: {str(e)}")
+                    # 优先使用 vals 中的产品，否则使用移动的产品
+                    product_tracking = product_tracking_map.get(
+                        vals.get('product_id'), move_info.get('product_tracking')
+                    )
                     
                     # **关键修复**：只对非序列号产品应用增强验证逻辑
                     # 序列号产品（tracking == 'serial'）保持原有逻辑
                     if product_tracking != 'serial':
                         # 如果 quantity 存在且不是 1.0，强制设置为 1.0
-                        if 'quantity' in vals:
-                            original_quantity = vals.get('quantity', 0.0)
-                            if original_quantity and float_compare(original_quantity, 1.0, precision_rounding=0.01) != 0:
-                                _logger.info(
-                                    f"[批次号创建] 强制设置 quantity = 1.0（启用增强验证，按照序列号方式）: 批次号={lot_name}, "
-                                    f"原数量={original_quantity}, 移动ID={move_id}, 追踪类型={product_tracking}"
-                                )
-                                vals['quantity'] = 1.0
-                        elif 'quantity' not in vals:
-                            # 如果 quantity 不存在，设置默认值为 1.0（按照序列号方式）
+                        original_quantity = vals.get('quantity')
+                        if not original_quantity or float_compare(original_quantity, 1.0, precision_rounding=0.01) != 0:
                             _logger.info(
-                                f"[批次号创建] 设置默认 quantity = 1.0（启用增强验证，按照序列号方式）: 批次号={lot_name}, "
-                                f"移动ID={move_id}, 追踪类型={product_tracking}"
+                                f"[批次号创建] 强制设置 quantity = 1.0（启用增强验证，按照序列号方式）: 批次号={lot_name}, "
+                                f"原数量={original_quantity}, 移动ID={move_id}, 追踪类型={product_tracking}"
                             )
                             vals['quantity'] = 1.0
-                        # **关键修改**：如果没有 quantity，但需要 quantity，按照序列号的方式自动设置
-                        # 序列号产品在创建时，如果没有 quantity，会自动设置为 1
-                        if not vals.get('quantity'):
-                            vals['quantity'] = 1.0
-                            _logger.info(
-                                f"[批次号创建] 自动设置 quantity = 1.0（启用增强验证，按照序列号方式）: 批次号={lot_name}, "
-                                f"移动ID={move_id}, 追踪类型={product_tracking}"
-                            )
                     else:
                         _logger.info(
                             f"[批次号创建] 跳过增强验证（序列号产品保持原有逻辑）: 批次号={lot_name}, "
@@ -889,77 +1003,34 @@ class StockMoveLine(models.Model):
                         )
         
         # **关键修复**：记录扫描顺序
-        # 从会话变量中获取扫描顺序，并设置到新创建的记录中
-        try:
-            from odoo.http import request
-            if request and hasattr(request, 'session'):
-                session = request.session
-                # 获取当前 picking_id
-                picking_id = None
-                for vals in vals_list:
-                    move_id = vals.get('move_id')
-                    if move_id:
-                        try:
-                            move = self.env['stock.move'].browse(move_id)
-                            if move.exists() and move.picking_id:
-                                picking_id = move.picking_id.id
-                                break
-                        except Exception:
-                            pass
-                
-                if picking_id:
-                    scanned_lots_key = f'scanned_lots_{picking_id}'
-                    scanned_lots = list(session.get(scanned_lots_key, []) or [])
-                    
-                    if scanned_lots:
-                        # 按照扫描顺序，为新创建的记录设置 scan_sequence
-                        for vals in vals_list:
-                            lot_name = vals.get('lot_name')
-                            if lot_name and lot_name.strip():
-                                lot_name_normalized = lot_name.strip().lower()
-                                # 查找该批次号在扫描顺序中的位置
-                                try:
-                                    scan_index = scanned_lots.index(lot_name_normalized)
-                                    # 设置扫描顺序（从1开始，不是从0开始）
-                                    vals['scan_sequence'] = scan_index + 1
-                                    _logger.info(
-                                        f"[批次号创建] 设置扫描顺序: 批次号={lot_name}, "
-                                        f"扫描顺序={scan_index + 1}"
-                                    )
-                                except ValueError:
-                                    # 批次号不在扫描列表中，使用默认值 0
-                                    _logger.debug(
-                                        f"[批次号创建] 批次号不在扫描列表中: 批次号={lot_name}"
-                                    )
-        except (ImportError, AttributeError, RuntimeError) as e:
-            # 无法访问 request 或没有请求上下文，跳过扫描顺序设置
-            _logger.debug(f"[批次号创建] 无法访问 request，跳过扫描顺序设置: {str(e)}")
+        # 从扫码记录台账中获取扫描顺序（每个调拨单只查询一次），并设置到新创建的记录中
+        sequence_maps = {}
+        for vals in vals_list:
+            picking_id = move_info_map.get(vals.get('move_id'), {}).get('picking_id')
+            lot_key = utils.normalize_lot_name(vals.get('lot_name'))
+            if not picking_id or not lot_key:
+                continue
+            if picking_id not in sequence_maps:
+                sequence_maps[picking_id] = self.env['stock.lot.scan'].sudo()._get_scan_sequence_map(picking_id)
+            scan_sequence = sequence_maps[picking_id].get(lot_key)
+            if scan_sequence:
+                vals['scan_sequence'] = scan_sequence
+                _logger.info(
+                    f"[批次号创建] 设置扫描顺序: 批次号={vals.get('lot_name')}, "
+                    f"扫描顺序={scan_sequence}"
+                )
         
         # **关键修复**：从制造订单获取合同号
-        # 为每个要创建的记录从制造订单获取合同号
+        # 优先从成品制造订单获取（production_id），如果没有，则从原材料制造订单获取（raw_material_production_id）
         for vals in vals_list:
             move_id = vals.get('move_id')
             if move_id and not vals.get('contract_no'):
-                try:
-                    move = self.env['stock.move'].browse(move_id)
-                    if move.exists():
-                        # 优先从成品制造订单获取（production_id）
-                        # 如果没有，则从原材料制造订单获取（raw_material_production_id）
-                        contract_no = None
-                        if move.production_id and move.production_id.contract_no:
-                            contract_no = move.production_id.contract_no
-                        elif move.raw_material_production_id and move.raw_material_production_id.contract_no:
-                            contract_no = move.raw_material_production_id.contract_no
-                        
-                        if contract_no:
-                            vals['contract_no'] = contract_no
-                            _logger.info(
-                                f"[合同号创建] 从制造订单获取合同号: move_id={move_id}, "
-                                f"合同号={contract_no}, production_id={move.production_id.id if move.production_id else None}, "
-                                f"raw_material_production_id={move.raw_material_production_id.id if move.raw_material_production_id else None}"
-                            )
-                except Exception as e:
-                    _logger.warning(f"[合同号创建] 从制造订单获取合同号时出错: {str(e)}")
+                contract_no = move_info_map.get(move_id, {}).get('contract_no')
+                if contract_no:
+                    vals['contract_no'] = contract_no
+                    _logger.info(
+                        f"[合同号创建] 从制造订单获取合同号: move_id={move_id}, 合同号={contract_no}"
+                    )
         
         # **关键修复**：检查是否是扫码操作
         is_barcode_scan = (
@@ -972,24 +1043,19 @@ class StockMoveLine(models.Model):
         
         # **关键修复**：检查作业类型是否启用了增强条码验证
         # 只有当作业类型启用了增强条码验证时，才执行增强验证
+        # 取 vals_list 中第一个有移动的记录所属作业类型的配置
         enable_enhanced_validation = False
         if is_barcode_scan:
-            # 尝试从 vals_list 中获取 move_id，然后获取 picking_type_id
             for vals in vals_list:
-                move_id = vals.get('move_id')
-                if move_id:
-                    try:
-                        move = self.env['stock.move'].browse(move_id)
-                        if move.exists() and move.picking_id and move.picking_id.picking_type_id:
-                            enable_enhanced_validation = move.picking_id.picking_type_id.enable_enhanced_barcode_validation
-                            _logger.info(
-                                f"[扫码创建验证] 作业类型配置检查: move_id={move_id}, "
-                                f"picking_type_id={move.picking_id.picking_type_id.id}, "
-                                f"enable_enhanced_barcode_validation={enable_enhanced_validation}"
-                            )
-                            break
-                    except Exception as e:
-                        _logger.warning(f"[扫码创建验证] 检查作业类型配置时出错: {str(e)}")
+                move_info = move_info_map.get(vals.get('move_id'))
+                if move_info and move_info.get('picking_type_id'):
+                    enable_enhanced_validation = move_info['enhanced_validation']
+                    _logger.info(
+                        f"[扫码创建验证] 作业类型配置检查: move_id={vals.get('move_id')}, "
+                        f"picking_type_id={move_info['picking_type_id']}, "
+                        f"enable_enhanced_barcode_validation={enable_enhanced_validation}"
+                    )
+                    break
         
         # 如果没有启用增强验证，跳过增强验证逻辑
         if is_barcode_scan and not enable_enhanced_validation:
@@ -998,15 +1064,21 @@ class StockMoveLine(models.Model):
             )
             is_barcode_scan = False  # 将 is_barcode_scan 设为 False，跳过增强验证
         
-        # 获取调用栈信息（用于调试）
-        caller_info = traceback.extract_stack()[-3:-1] if len(traceback.extract_stack()) > 3 else []
-        caller_str = f"{caller_info[0].filename}:{caller_info[0].lineno}" if caller_info else "unknown"
+        # **性能优化**：批量导入批次号（见 stock.move.import_lots）已在导入时与移动及导入内容去重，
+        # 不是扫码操作，跳过逐条的重复检查、预填列表检查和明细日志
+        if self.env.context.get('bulk_lot_import'):
+            tracing.note_branch('bulk_import')
+            _logger.info(f"[批量导入批次号] 快速创建移动行: 记录数={len(vals_list)}")
+            result = super(StockMoveLine, self).create(vals_list)
+            result._touch_barcode_revision()
+            self.env['stock.picking']._invalidate_prefilled_lot_index(result.move_id.picking_id.ids)
+            return result
         
+        # 调用者、耗时和 SQL 查询数由追踪模块记录（见 tracing.py），这里不再获取调用栈
         _logger.info(
             f"[扫码创建验证] create 方法被调用: 要创建的记录数={len(vals_list)}, "
             f"是否来自扫码={is_barcode_scan}, "
             f"启用增强验证={enable_enhanced_validation}, "
-            f"调用者={caller_str}, "
             f"context keys={list(self.env.context.keys())[:10]}, "
             f"vals_list={[(vals.get('move_id'), vals.get('lot_name'), vals.get('product_id')) for vals in vals_list]}"
         )
@@ -1021,7 +1093,7 @@ class StockMoveLine(models.Model):
             
             move_id = vals.get('move_id')
             lot_name = vals.get('lot_name')
-            scanned_lot_name = lot_name.strip().lower() if lot_name else ''
+            scanned_lot_name = utils.normalize_lot_name(lot_name)
             
             if not scanned_lot_name:
                 continue
@@ -1041,7 +1113,7 @@ class StockMoveLine(models.Model):
             
             move_id = vals.get('move_id')
             lot_name = vals.get('lot_name')
-            scanned_lot_name = lot_name.strip().lower() if lot_name else ''
+            scanned_lot_name = utils.normalize_lot_name(lot_name)
             product_id = vals.get('product_id')
             
             if not scanned_lot_name:
@@ -1066,6 +1138,7 @@ class StockMoveLine(models.Model):
                         f"重复次数={len(duplicate_in_create)}, 移动ID={move_id}, "
                         f"重复的索引={[idx for idx, _, _ in duplicate_in_create]}"
                     )
+                    tracing.note_branch('duplicate_in_batch')
                     raise ValidationError(
                         _('重复扫描！\n\n'
                           '批次号 "%s" 在当前操作中重复扫描。\n\n'
@@ -1075,105 +1148,70 @@ class StockMoveLine(models.Model):
                     )
             
             # 检查当前移动中是否已经有已保存的记录（预填列表）
+            # **性能优化**：只在扫码操作时查询，按标准化批次号分组一次查询，不再加载整个移动的移动行
+            # 手动编辑时，允许用户添加新批次号，不需要检查批次号是否在预填列表中
+            if not is_barcode_scan:
+                tracing.note_branch('manual_edit')
+                _logger.info(
+                    f"[扫码创建验证] 手动编辑，允许创建批次号: {lot_name}, "
+                    f"移动ID={move_id}, 产品ID={product_id}, "
+                    f"是否来自扫码={is_barcode_scan}"
+                )
+                continue
             try:
-                move = self.env['stock.move'].browse(move_id)
-                if move.exists():
-                    # 查询当前移动中所有已保存记录的批次号（预填列表）
-                    existing_lines = self.env['stock.move.line'].search([
-                        ('move_id', '=', move_id),
-                        ('lot_name', '!=', False),
-                        ('lot_name', '!=', ''),
-                    ])
+                existing_lots = self._get_move_prefilled_lots(move_id)
+                
+                _logger.info(
+                    f"[扫码创建验证] 查询已保存记录: 移动ID={move_id}, "
+                    f"预填批次号数={len(existing_lots)}, "
+                    f"当前批次号 (标准化): {scanned_lot_name}, "
+                    f"是否在预填列表中: {scanned_lot_name in existing_lots}"
+                )
+                
+                if existing_lots:
+                    # 有已保存的记录，说明已经有预填的批次号
+                    # 新创建的记录的批次号必须在预填列表中
+                    if scanned_lot_name in existing_lots:
+                        # **关键修复**：批次号在已保存记录中，说明是重复扫描，应该阻止
+                        duplicate_line_ids = self._search_lot_name_lines(scanned_lot_name, move_id=move_id).ids
+                        _logger.warning(
+                            f"[扫码创建验证] 阻止创建新记录: 批次号 {lot_name} 已在已保存记录中, "
+                            f"这是重复扫描, 移动ID={move_id}, "
+                            f"重复的记录ID={duplicate_line_ids}"
+                        )
+                        tracing.note_branch('duplicate')
+                        raise ValidationError(
+                            _('重复扫描！\n\n'
+                              '批次号 "%s" 已经在已保存的记录中，请勿重复扫描！\n\n'
+                              '如需修改，请直接在列表中编辑已保存的记录。')
+                            % lot_name
+                        )
                     
-                    _logger.info(
-                        f"[扫码创建验证] 查询已保存记录: 移动ID={move_id}, "
-                        f"已保存记录数={len(existing_lines)}, "
-                        f"已保存批次号列表={[line.lot_name for line in existing_lines if line.lot_name]}"
+                    # 批次号不在预填列表中，应该阻止创建
+                    unique_lot_names = sorted(existing_lots.values())
+                    _logger.warning(
+                        f"[扫码创建验证] 阻止创建新记录: 批次号 {lot_name} 不在预填列表中, "
+                        f"移动ID={move_id}, 产品ID={product_id}, "
+                        f"预填批次号列表={unique_lot_names}, "
+                        f"当前批次号 (标准化)={scanned_lot_name}"
                     )
-                    
-                    # **关键修复**：只有在扫码操作时，才需要检查批次号是否在预填列表中
-                    # 如果是手动编辑，应该允许用户添加新批次号
-                    if is_barcode_scan:
-                        if existing_lines:
-                            # 有已保存的记录，说明已经有预填的批次号
-                            # 新创建的记录的批次号必须在预填列表中
-                            existing_lot_names = [
-                                line.lot_name.strip().lower() 
-                                for line in existing_lines 
-                                if line.lot_name
-                            ]
-                            
-                            _logger.info(
-                                f"[扫码创建验证] 预填批次号列表 (标准化): {existing_lot_names}, "
-                                f"当前批次号 (标准化): {scanned_lot_name}, "
-                                f"是否在预填列表中: {scanned_lot_name in existing_lot_names}"
-                            )
-                            
-                            # **关键修复**：检查是否与已保存记录重复
-                            if scanned_lot_name in existing_lot_names:
-                                # 批次号在已保存记录中，说明是重复扫描，应该阻止
-                                duplicate_line_ids = [
-                                    line.id for line in existing_lines 
-                                    if line.lot_name and line.lot_name.strip().lower() == scanned_lot_name
-                                ]
-                                _logger.warning(
-                                    f"[扫码创建验证] 阻止创建新记录: 批次号 {lot_name} 已在已保存记录中, "
-                                    f"这是重复扫描, 移动ID={move_id}, "
-                                    f"重复的记录ID={duplicate_line_ids}, "
-                                    f"预填批次号列表={existing_lot_names}"
-                                )
-                                raise ValidationError(
-                                    _('重复扫描！\n\n'
-                                      '批次号 "%s" 已经在已保存的记录中，请勿重复扫描！\n\n'
-                                      '如需修改，请直接在列表中编辑已保存的记录。')
-                                    % lot_name
-                                )
-                            
-                            if scanned_lot_name not in existing_lot_names:
-                                # 批次号不在预填列表中，应该阻止创建
-                                _logger.warning(
-                                    f"[扫码创建验证] 阻止创建新记录: 批次号 {lot_name} 不在预填列表中, "
-                                    f"移动ID={move_id}, 产品ID={product_id}, "
-                                    f"预填批次号列表={existing_lot_names}, "
-                                    f"当前批次号 (标准化)={scanned_lot_name}"
-                                )
-                                
-                                # 获取所有预填的批次号（用于显示错误消息）
-                                unique_lot_names = list(set([
-                                    line.lot_name 
-                                    for line in existing_lines 
-                                    if line.lot_name and line.lot_name.strip()
-                                ]))
-                                
-                                raise ValidationError(
-                                    _('批次号不在列表中！\n\n'
-                                      '扫描的批次号："%s"\n\n'
-                                      '已预填的批次号列表：\n%s\n\n'
-                                      '扫码只是验证，批次号必须在预填列表中。\n'
-                                      '请先手动预填批次号，然后再扫码验证。\n\n'
-                                      '如需添加新批次号，请手动填写，不要使用扫码。')
-                                    % (lot_name, '\n'.join(unique_lot_names))
-                                )
-                            else:
-                                # 批次号在预填列表中，允许创建
-                                _logger.info(
-                                    f"[扫码创建验证] 允许创建新记录: 批次号 {lot_name} 在预填列表中, "
-                                    f"移动ID={move_id}, 产品ID={product_id}"
-                                )
-                        else:
-                            # 没有已保存的记录，说明是第一次预填，允许创建任意批次号
-                            _logger.info(
-                                f"[扫码创建验证] 第一次预填，允许创建批次号: {lot_name}, "
-                                f"移动ID={move_id}, 产品ID={product_id}"
-                            )
-                    else:
-                        # **关键修复**：手动编辑时，允许用户添加新批次号
-                        # 不需要检查批次号是否在预填列表中
-                        _logger.info(
-                            f"[扫码创建验证] 手动编辑，允许创建批次号: {lot_name}, "
-                            f"移动ID={move_id}, 产品ID={product_id}, "
-                            f"是否来自扫码={is_barcode_scan}"
-                        )
+                    tracing.note_branch('not_in_prefilled')
+                    raise ValidationError(
+                        _('批次号不在列表中！\n\n'
+                          '扫描的批次号："%s"\n\n'
+                          '已预填的批次号列表：\n%s\n\n'
+                          '扫码只是验证，批次号必须在预填列表中。\n'
+                          '请先手动预填批次号，然后再扫码验证。\n\n'
+                          '如需添加新批次号，请手动填写，不要使用扫码。')
+                        % (lot_name, '\n'.join(unique_lot_names))
+                    )
+                
+                # 没有已保存的记录，说明是第一次预填，允许创建任意批次号
+                tracing.note_branch('first_prefill')
+                _logger.info(
+                    f"[扫码创建验证] 第一次预填，允许创建批次号: {lot_name}, "
+                    f"移动ID={move_id}, 产品ID={product_id}"
+                )
             except ValidationError:
                 raise
             except Exception as e:
@@ -1189,6 +1227,13 @@ class StockMoveLine(models.Model):
         
         # 调用父类的 create 方法
         result = super(StockMoveLine, self).create(vals_list)
+        # 新建的移动行推进所属调拨单的扫码修订号，扫码界面增量加载时可以取到
+        result._touch_barcode_revision()
+        
+        # 新记录带有批次号时，使所属调拨单的预填批次号索引失效
+        self.env['stock.picking']._invalidate_prefilled_lot_index(
+            result.filtered('lot_name').move_id.picking_id.ids
+        )
         
         _logger.info(
             f"[扫码创建验证] 记录创建完成: 创建的记录数={len(result)}, "
@@ -1197,6 +1242,7 @@ class StockMoveLine(models.Model):
         
         return result
     
+    @tracing.traced('stock.move.line.write')
     def write(self, vals):
         """重写 write 方法，在更新记录时验证批次号
         扫码模块可能会先创建空记录，然后通过 write 方法更新批次号
@@ -1204,10 +1250,27 @@ class StockMoveLine(models.Model):
         6. **关键修改**：如果记录有批次号，强制设置 quantity = 1.0（按照序列号方式）
         """
         import logging
-        import traceback
         from odoo.tools import float_compare
         _logger = logging.getLogger(__name__)
         
+        # 移到其他调拨单的移动行从原调拨单中移除，记录下来供增量加载返回
+        if 'picking_id' in vals:
+            self.env['stock.move.line.barcode.removal']._record_removal(
+                self.filtered(lambda ml: ml.picking_id.id != (vals['picking_id'] or False))
+            )
+        
+        # 修改扫码界面显示的字段时推进（新）调拨单的扫码修订号，扫码界面增量加载时可以取到本次变更的移动行
+        # 与扫码界面无关的修改（如其他模块的内部字段）不锁定调拨单，也不额外写修订号列
+        if 'barcode_revision' not in vals and set(vals) & {'picking_id', *self._get_barcode_fields()}:
+            self._touch_barcode_revision((vals['picking_id'] or False) if 'picking_id' in vals else None)
+        
+        # 批次号或所属移动变化时，使新旧调拨单的预填批次号索引失效
+        if {'lot_name', 'move_id', 'picking_id'} & set(vals):
+            picking_ids = self.move_id.picking_id.ids
+            if vals.get('move_id'):
+                picking_ids += self.env['stock.move'].browse(vals['move_id']).picking_id.ids
+            self.env['stock.picking']._invalidate_prefilled_lot_index(picking_ids)
+        
         # **关键修改**：在更新之前，检查是否启用了增强条码验证
         # 如果启用，且有批次号，强制设置 quantity = 1.0（按照序列号方式）
         enable_enhanced_validation = False
@@ -1283,16 +1346,13 @@ class StockMoveLine(models.Model):
                             vals['quantity'] = 1.0
                             break
         
-        # **关键修复**：获取调用栈信息，以便区分扫码和手动编辑
-        caller_info = traceback.extract_stack()[-4:-1] if len(traceback.extract_stack()) > 4 else []
-        caller_str = ' -> '.join([f"{c.filename.split('/')[-1]}:{c.lineno}" for c in caller_info[-3:]])
-        
         # **关键修复**：无论是否更新批次号，都记录日志（用于调试）
+        # 调用者、耗时和 SQL 查询数由追踪模块记录（见 tracing.py），这里不再获取调用栈
         if 'lot_name' in vals or any('lot_name' in str(v) for v in vals.values() if isinstance(v, dict)):
             _logger.info(
                 f"[扫码/编辑更新验证] write 方法被调用（批次号相关）: "
                 f"记录数={len(self)}, 记录ID={[r.id for r in self]}, "
-                f"vals={vals}, 调用者={caller_str}, "
+                f"vals={vals}, "
                 f"context keys={list(self.env.context.keys())[:10]}"
             )
         
@@ -1397,6 +1457,7 @@ class StockMoveLine(models.Model):
             # 放入包裹时，系统可能会先更新批次号，然后再设置包裹
             # 但如果在批次号验证时，vals 中已经有包裹字段，或者记录已经有包裹，都应该跳过验证
             # **关键修复**：在包裹操作时，立即设置扫描顺序
+            tracing.note_branch('package_operation')
             _logger.info(
                 f"[扫码/编辑更新验证] 包裹操作，跳过批次号验证（在验证循环前）: 记录ID={[r.id for r in self]}, "
                 f"vals keys={list(vals.keys())}, 记录数={len(self)}"
@@ -1555,66 +1616,26 @@ class StockMoveLine(models.Model):
             # 这样可以处理多个记录、多个包裹的情况，以及 vals 中没有批次号的情况
             # **关键修复**：无论有多少个包裹，都会正确处理每个包裹中的记录
             try:
-                from odoo.http import request
-                if request and hasattr(request, 'session'):
-                    session = request.session
-                    # 获取当前 picking_id
-                    picking_id = None
-                    for record in self:
-                        if record.exists() and record.move_id and record.move_id.picking_id:
-                            picking_id = record.move_id.picking_id.id
-                            break
-                    
-                    if picking_id:
-                        scanned_lots_key = f'scanned_lots_{picking_id}'
-                        scanned_lots = list(session.get(scanned_lots_key, []) or [])
-                        
+                LotScan = self.env['stock.lot.scan'].sudo()
+                sequence_maps = {}
+                for record in self.exists():
+                    picking = record.move_id.picking_id
+                    if not picking or not record.lot_name:
+                        continue
+                    if picking.id not in sequence_maps:
+                        sequence_maps[picking.id] = LotScan._get_scan_sequence_map(picking.id)
+                    scan_sequence = sequence_maps[picking.id].get(utils.normalize_lot_name(record.lot_name))
+                    if not scan_sequence:
+                        # 批次号不在扫码记录中，保持默认值
+                        continue
+                    if (record.scan_sequence or 0) != scan_sequence:
+                        # **关键修复**：使用 skip_quantity_fix 上下文，避免递归
+                        record.with_context(skip_quantity_fix=True).write({'scan_sequence': scan_sequence})
                         _logger.info(
-                            f"[包裹操作] write 后处理扫描顺序: picking_id={picking_id}, "
-                            f"记录数={len(self)}, 会话中的批次号={scanned_lots}"
+                            f"[包裹操作] write 后设置扫描顺序: 记录ID={record.id}, "
+                            f"批次号={record.lot_name}, 扫描顺序={scan_sequence}, "
+                            f"包裹ID={record.result_package_id.id if record.result_package_id else False}"
                         )
-                        
-                        if scanned_lots:
-                            # **关键修复**：为每个记录设置扫描顺序
-                            # 无论有多少个记录，都会为每个记录单独设置扫描顺序
-                            # 这样可以支持多个包裹的情况
-                            for record in self:
-                                if record.exists():
-                                    # 使用记录中已有的批次号（write 之后，批次号已经保存）
-                                    lot_name = record.lot_name
-                                    if lot_name and lot_name.strip():
-                                        lot_name_normalized = lot_name.strip().lower()
-                                        try:
-                                            scan_index = scanned_lots.index(lot_name_normalized)
-                                            # 设置扫描顺序（从1开始，不是从0开始）
-                                            current_scan_sequence = record.scan_sequence or 0
-                                            if current_scan_sequence != scan_index + 1:
-                                                # **关键修复**：使用 skip_quantity_fix 上下文，避免递归
-                                                record.with_context(skip_quantity_fix=True).write({'scan_sequence': scan_index + 1})
-                                                _logger.info(
-                                                    f"[包裹操作] write 后设置扫描顺序: 记录ID={record.id}, "
-                                                    f"批次号={lot_name}, 扫描顺序={scan_index + 1}, "
-                                                    f"包裹ID={record.result_package_id.id if record.result_package_id else False}, "
-                                                    f"会话中的批次号={scanned_lots}"
-                                                )
-                                            else:
-                                                _logger.debug(
-                                                    f"[包裹操作] write 后，扫描顺序已正确: 记录ID={record.id}, "
-                                                    f"批次号={lot_name}, 扫描顺序={current_scan_sequence}"
-                                                )
-                                        except ValueError:
-                                            # 批次号不在扫描列表中，保持默认值
-                                            _logger.warning(
-                                                f"[包裹操作] write 后，批次号不在扫描列表中: 记录ID={record.id}, "
-                                                f"批次号={lot_name}, 会话中的批次号={scanned_lots}"
-                                            )
-                        else:
-                            _logger.warning(
-                                f"[包裹操作] write 后，会话中没有批次号: picking_id={picking_id}, 记录数={len(self)}"
-                            )
-            except (ImportError, AttributeError, RuntimeError) as e:
-                # 无法访问 request 或没有请求上下文，跳过扫描顺序设置
-                _logger.debug(f"[包裹操作] write 后，无法访问 request，跳过扫描顺序设置: {str(e)}")
             except Exception as e:
                 # 其他异常，记录日志但不阻止操作
                 _logger.warning(
@@ -1622,12 +1643,13 @@ class StockMoveLine(models.Model):
                     exc_info=True
                 )
             
+            self._sync_lot_unit_ledger(vals)
             return result
         
         # 如果更新了批次号，需要验证
         if 'lot_name' in vals and vals.get('lot_name'):
             lot_name = vals.get('lot_name')
-            scanned_lot_name = lot_name.strip().lower() if lot_name else ''
+            scanned_lot_name = utils.normalize_lot_name(lot_name)
             
             if scanned_lot_name:
                 # 对于每个要更新的记录，检查批次号
@@ -1670,7 +1692,7 @@ class StockMoveLine(models.Model):
                         
                         # **关键修复**：检查批次号是否真正变化
                         # 如果原始批次号和新批次号相同（标准化后），说明批次号没有变化
-                        original_lot_name_normalized = (original_lot_name or '').strip().lower() if original_lot_name else ''
+                        original_lot_name_normalized = record.lot_name_normalized or ''
                         lot_name_really_changed = original_lot_name_normalized != scanned_lot_name
                     except Exception as e:
                         # 记录可能已被删除，跳过
@@ -1740,14 +1762,6 @@ class StockMoveLine(models.Model):
                         f"vals={vals}"
                     )
                     
-                    # 获取调用栈信息（仅在需要时）
-                    try:
-                        caller_info = traceback.extract_stack()[-4:-1] if len(traceback.extract_stack()) > 4 else []
-                        caller_str = ' -> '.join([f"{c.filename.split('/')[-1]}:{c.lineno}" for c in caller_info[-2:]])
-                        _logger.debug(f"[扫码/编辑更新验证] 调用栈: {caller_str}")
-                    except:
-                        pass
-                    
                     # **关键修复**：如果是扫码操作，需要执行严格的验证
                     # 如果是手动编辑，也需要验证，但逻辑可能稍有不同
                     if is_barcode_scan:
@@ -1755,7 +1769,7 @@ class StockMoveLine(models.Model):
                     
                     # **关键修复**：检查批次号是否真正变化
                     # 如果原始批次号和新批次号相同（标准化后），说明批次号没有变化
-                    original_lot_name_normalized = (original_lot_name or '').strip().lower() if original_lot_name else ''
+                    original_lot_name_normalized = record.lot_name_normalized or ''
                     lot_name_changed = original_lot_name_normalized != scanned_lot_name
                     
                     _logger.info(
@@ -1776,167 +1790,126 @@ class StockMoveLine(models.Model):
                     # 3. 或者更新不同的记录，批次号相同（lot_name_changed=False），这也是重复扫描
                     # 所以需要检查：如果批次号在已保存记录中，且不是当前记录，说明是重复扫描
                     try:
-                        move = self.env['stock.move'].browse(move_id)
-                        if move.exists():
-                            # 查询当前移动中所有已保存记录的批次号（预填列表）
-                            # 排除当前记录
-                            existing_lines = self.env['stock.move.line'].search([
-                                ('move_id', '=', move_id),
-                                ('lot_name', '!=', False),
-                                ('lot_name', '!=', ''),
-                                ('id', '!=', record.id),
-                            ])
-                            
-                            _logger.info(
-                                f"[扫码更新验证] 查询已保存记录: 移动ID={move_id}, "
-                                f"已保存记录数={len(existing_lines)}, "
-                                f"已保存批次号列表={[line.lot_name for line in existing_lines if line.lot_name]}"
-                            )
-                            
-                            if existing_lines:
-                                # 有已保存的记录，说明已经有预填的批次号
-                                existing_lot_names = [
-                                    line.lot_name.strip().lower() 
-                                    for line in existing_lines 
-                                    if line.lot_name
-                                ]
-                                
+                        # **性能优化**：按标准化批次号分组一次查询预填列表（排除当前记录），
+                        # 不再加载整个移动的移动行并在 Python 中逐条比对
+                        existing_lots = self._get_move_prefilled_lots(move_id, exclude_ids=[record.id])
+                        
+                        _logger.info(
+                            f"[扫码更新验证] 查询已保存记录: 移动ID={move_id}, "
+                            f"预填批次号数={len(existing_lots)}, "
+                            f"当前批次号 (标准化): {scanned_lot_name}, "
+                            f"是否在预填列表中: {scanned_lot_name in existing_lots}"
+                        )
+                        
+                        if existing_lots:
+                            # **关键修复**：只在扫码操作时，才检查是否与已保存记录重复
+                            # 手动编辑时，允许修改批次号，即使批次号已经在其他记录中
+                            # 这样用户可以手动修改批次号，而不会被误判为重复扫描
+                            if is_barcode_scan and scanned_lot_name in existing_lots:
+                                # 扫码操作：批次号在已保存记录中，说明是重复扫描，应该阻止
+                                duplicate_line_ids = self._search_lot_name_lines(
+                                    scanned_lot_name, move_id=move_id, exclude_ids=[record.id]
+                                ).ids
+                                _logger.warning(
+                                    f"[扫码更新验证] 阻止更新记录: 批次号 {new_lot_name} 已在已保存记录中, "
+                                    f"这是重复扫描, 记录ID={record.id}, 移动ID={move_id}, "
+                                    f"重复的记录ID={duplicate_line_ids}, "
+                                    f"批次号是否变化={lot_name_changed}"
+                                )
+                                tracing.note_branch('duplicate')
+                                raise ValidationError(
+                                    _('重复扫描！\n\n'
+                                      '批次号 "%s" 已经在已保存的记录中，请勿重复扫描！\n\n'
+                                      '如需修改，请直接在列表中编辑已保存的记录。')
+                                    % new_lot_name
+                                )
+                            elif not is_barcode_scan and scanned_lot_name in existing_lots:
+                                # 手动编辑：批次号在已保存记录中，但这是手动编辑，允许继续
+                                # 用户可能想要修改批次号，即使批次号已经在其他记录中
                                 _logger.info(
-                                    f"[扫码更新验证] 预填批次号列表 (标准化): {existing_lot_names}, "
-                                    f"当前批次号 (标准化): {scanned_lot_name}, "
-                                    f"是否在预填列表中: {scanned_lot_name in existing_lot_names}"
+                                    f"[手动编辑验证] 允许修改批次号: 批次号 {new_lot_name} 已在已保存记录中, "
+                                    f"但这是手动编辑，允许继续, 记录ID={record.id}, 移动ID={move_id}"
                                 )
-                                
-                                # **关键修复**：只在扫码操作时，才检查是否与已保存记录重复
-                                # 手动编辑时，允许修改批次号，即使批次号已经在其他记录中
-                                # 这样用户可以手动修改批次号，而不会被误判为重复扫描
-                                if is_barcode_scan and scanned_lot_name in existing_lot_names:
-                                    # 扫码操作：批次号在已保存记录中，说明是重复扫描，应该阻止
-                                    duplicate_line_ids = [
-                                        line.id for line in existing_lines 
-                                        if line.lot_name and line.lot_name.strip().lower() == scanned_lot_name
-                                    ]
+                            
+                            # **关键修复**：只在扫码操作时，才检查批次号是否在预填列表中
+                            # **重要**：包裹操作时，跳过"批次号不在预填列表中"的验证
+                            # 手动编辑时，允许修改批次号，不检查预填列表
+                            # 只在批次号发生变化时，才进行检查
+                            if lot_name_changed and is_barcode_scan and not is_package_operation:
+                                # 扫码操作：检查批次号是否在预填列表中
+                                # **关键修复**：包裹操作时，跳过此验证
+                                if scanned_lot_name not in existing_lots:
+                                    # 批次号不在预填列表中，应该阻止
+                                    unique_lot_names = sorted(existing_lots.values())
                                     _logger.warning(
-                                        f"[扫码更新验证] 阻止更新记录: 批次号 {new_lot_name} 已在已保存记录中, "
-                                        f"这是重复扫描, 记录ID={record.id}, 移动ID={move_id}, "
-                                        f"重复的记录ID={duplicate_line_ids}, "
-                                        f"预填批次号列表={existing_lot_names}, "
-                                        f"批次号是否变化={lot_name_changed}"
+                                        f"[扫码更新验证] 阻止更新记录: 批次号 {new_lot_name} 不在预填列表中, "
+                                        f"记录ID={record.id}, 移动ID={move_id}, 产品ID={record.product_id.id if record.product_id else None}, "
+                                        f"预填批次号列表={unique_lot_names}, "
+                                        f"当前批次号 (标准化)={scanned_lot_name}, "
+                                        f"是否是包裹操作={is_package_operation}"
                                     )
+                                    tracing.note_branch('not_in_prefilled')
                                     raise ValidationError(
-                                        _('重复扫描！\n\n'
-                                          '批次号 "%s" 已经在已保存的记录中，请勿重复扫描！\n\n'
-                                          '如需修改，请直接在列表中编辑已保存的记录。')
-                                        % new_lot_name
+                                        _('批次号不在列表中！\n\n'
+                                          '扫描的批次号："%s"\n\n'
+                                          '已预填的批次号列表：\n%s\n\n'
+                                          '扫码只是验证，批次号必须在预填列表中。\n'
+                                          '请先手动预填批次号，然后再扫码验证。\n\n'
+                                          '如需添加新批次号，请手动填写，不要使用扫码。')
+                                        % (new_lot_name, '\n'.join(unique_lot_names))
                                     )
-                                elif not is_barcode_scan and scanned_lot_name in existing_lot_names:
-                                    # 手动编辑：批次号在已保存记录中，但这是手动编辑，允许继续
-                                    # 用户可能想要修改批次号，即使批次号已经在其他记录中
+                                else:
+                                    # 批次号在预填列表中，允许更新
+                                    tracing.note_branch('prefilled_match')
                                     _logger.info(
-                                        f"[手动编辑验证] 允许修改批次号: 批次号 {new_lot_name} 已在已保存记录中, "
-                                        f"但这是手动编辑，允许继续, 记录ID={record.id}, 移动ID={move_id}"
+                                        f"[扫码更新验证] 允许更新记录: 批次号 {new_lot_name} 在预填列表中, "
+                                        f"记录ID={record.id}, 移动ID={move_id}, 产品ID={record.product_id.id if record.product_id else None}"
                                     )
+                            elif lot_name_changed and is_barcode_scan and is_package_operation:
+                                # **关键修复**：包裹操作时，即使批次号变化，也跳过"批次号不在预填列表中"的验证
+                                # 放入包裹时，可能只是更新了包裹相关字段，批次号可能是从其他地方获取的
+                                tracing.note_branch('package_operation')
+                                _logger.info(
+                                    f"[扫码/编辑更新验证] 包裹操作，跳过批次号预填列表验证: 记录ID={record.id}, "
+                                    f"原始批次号={original_lot_name}, 新批次号={new_lot_name}, "
+                                    f"是否是包裹操作={is_package_operation}"
+                                )
                                 
-                                # **关键修复**：只在扫码操作时，才检查批次号是否在预填列表中
-                                # **重要**：包裹操作时，跳过"批次号不在预填列表中"的验证
-                                # 手动编辑时，允许修改批次号，不检查预填列表
-                                # 只在批次号发生变化时，才进行检查
-                                if lot_name_changed and is_barcode_scan and not is_package_operation:
-                                    # 扫码操作：检查批次号是否在预填列表中
-                                    # **关键修复**：包裹操作时，跳过此验证
-                                    if scanned_lot_name not in existing_lot_names:
-                                        # 批次号不在预填列表中，应该阻止
-                                        _logger.warning(
-                                            f"[扫码更新验证] 阻止更新记录: 批次号 {new_lot_name} 不在预填列表中, "
-                                            f"记录ID={record.id}, 移动ID={move_id}, 产品ID={record.product_id.id if record.product_id else None}, "
-                                            f"预填批次号列表={existing_lot_names}, "
-                                            f"当前批次号 (标准化)={scanned_lot_name}, "
-                                            f"是否是包裹操作={is_package_operation}"
-                                        )
-                                        
-                                        # 获取所有预填的批次号（用于显示错误消息）
-                                        unique_lot_names = list(set([
-                                            line.lot_name 
-                                            for line in existing_lines 
-                                            if line.lot_name and line.lot_name.strip()
-                                        ]))
-                                        
-                                        raise ValidationError(
-                                            _('批次号不在列表中！\n\n'
-                                              '扫描的批次号："%s"\n\n'
-                                              '已预填的批次号列表：\n%s\n\n'
-                                              '扫码只是验证，批次号必须在预填列表中。\n'
-                                              '请先手动预填批次号，然后再扫码验证。\n\n'
-                                              '如需添加新批次号，请手动填写，不要使用扫码。')
-                                            % (new_lot_name, '\n'.join(unique_lot_names))
-                                        )
-                                    else:
-                                        # 批次号在预填列表中，允许更新
+                                # **关键修复**：在包裹操作时，设置扫描顺序
+                                # 从扫码记录台账中获取扫描顺序，并设置到记录中
+                                if record.move_id.picking_id and new_lot_name:
+                                    scan_sequence = self.env['stock.lot.scan'].sudo()._get_scan_sequence_map(
+                                        record.move_id.picking_id.id
+                                    ).get(utils.normalize_lot_name(new_lot_name))
+                                    if scan_sequence:
+                                        vals['scan_sequence'] = scan_sequence
                                         _logger.info(
-                                            f"[扫码更新验证] 允许更新记录: 批次号 {new_lot_name} 在预填列表中, "
-                                            f"记录ID={record.id}, 移动ID={move_id}, 产品ID={record.product_id.id if record.product_id else None}"
+                                            f"[包裹操作] 设置扫描顺序: 记录ID={record.id}, "
+                                            f"批次号={new_lot_name}, 扫描顺序={scan_sequence}"
                                         )
-                                elif lot_name_changed and is_barcode_scan and is_package_operation:
-                                    # **关键修复**：包裹操作时，即使批次号变化，也跳过"批次号不在预填列表中"的验证
-                                    # 放入包裹时，可能只是更新了包裹相关字段，批次号可能是从其他地方获取的
-                                    _logger.info(
-                                        f"[扫码/编辑更新验证] 包裹操作，跳过批次号预填列表验证: 记录ID={record.id}, "
-                                        f"原始批次号={original_lot_name}, 新批次号={new_lot_name}, "
-                                        f"是否是包裹操作={is_package_operation}"
-                                    )
-                                    
-                                    # **关键修复**：在包裹操作时，设置扫描顺序
-                                    # 从会话变量中获取扫描顺序，并设置到记录中
-                                    try:
-                                        from odoo.http import request
-                                        if request and hasattr(request, 'session'):
-                                            session = request.session
-                                            # 获取当前 picking_id
-                                            if record.move_id and record.move_id.picking_id:
-                                                picking_id = record.move_id.picking_id.id
-                                                scanned_lots_key = f'scanned_lots_{picking_id}'
-                                                scanned_lots = list(session.get(scanned_lots_key, []) or [])
-                                                
-                                                if scanned_lots and new_lot_name:
-                                                    lot_name_normalized = new_lot_name.strip().lower()
-                                                    try:
-                                                        scan_index = scanned_lots.index(lot_name_normalized)
-                                                        # 设置扫描顺序（从1开始，不是从0开始）
-                                                        vals['scan_sequence'] = scan_index + 1
-                                                        _logger.info(
-                                                            f"[包裹操作] 设置扫描顺序: 记录ID={record.id}, "
-                                                            f"批次号={new_lot_name}, 扫描顺序={scan_index + 1}, "
-                                                            f"会话中的批次号={scanned_lots}"
-                                                        )
-                                                    except ValueError:
-                                                        # 批次号不在扫描列表中，保持默认值
-                                                        _logger.debug(
-                                                            f"[包裹操作] 批次号不在扫描列表中: 记录ID={record.id}, "
-                                                            f"批次号={new_lot_name}, 会话中的批次号={scanned_lots}"
-                                                        )
-                                    except (ImportError, AttributeError, RuntimeError) as e:
-                                        # 无法访问 request 或没有请求上下文，跳过扫描顺序设置
-                                        _logger.debug(f"[包裹操作] 无法访问 request，跳过扫描顺序设置: {str(e)}")
-                                elif lot_name_changed and not is_barcode_scan:
-                                    # 手动编辑：允许修改批次号，不检查预填列表
-                                    # 只检查重复（已经在上面检查过了）
-                                    _logger.info(
-                                        f"[手动编辑验证] 允许修改批次号: 记录ID={record.id}, "
-                                        f"原始批次号={original_lot_name}, 新批次号={new_lot_name}, "
-                                        f"手动编辑时允许修改批次号，不检查预填列表"
-                                    )
-                                else:
-                                    # 批次号没有变化，说明是更新其他字段，不需要检查预填列表
-                                    _logger.info(
-                                        f"[扫码更新验证] 批次号未变化，允许更新其他字段: 记录ID={record.id}, "
-                                        f"移动ID={move_id}, 批次号={new_lot_name}"
-                                    )
+                            elif lot_name_changed and not is_barcode_scan:
+                                # 手动编辑：允许修改批次号，不检查预填列表
+                                # 只检查重复（已经在上面检查过了）
+                                tracing.note_branch('manual_edit')
+                                _logger.info(
+                                    f"[手动编辑验证] 允许修改批次号: 记录ID={record.id}, "
+                                    f"原始批次号={original_lot_name}, 新批次号={new_lot_name}, "
+                                    f"手动编辑时允许修改批次号，不检查预填列表"
+                                )
                             else:
-                                # 没有已保存的记录，说明是第一次预填，允许更新任意批次号
+                                # 批次号没有变化，说明是更新其他字段，不需要检查预填列表
+                                tracing.note_branch('unchanged')
                                 _logger.info(
-                                    f"[扫码更新验证] 第一次预填，允许更新批次号: {new_lot_name}, "
-                                    f"记录ID={record.id}, 移动ID={move_id}, 产品ID={record.product_id.id if record.product_id else None}"
+                                    f"[扫码更新验证] 批次号未变化，允许更新其他字段: 记录ID={record.id}, "
+                                    f"移动ID={move_id}, 批次号={new_lot_name}"
                                 )
+                        else:
+                            # 没有已保存的记录，说明是第一次预填，允许更新任意批次号
+                            tracing.note_branch('first_prefill')
+                            _logger.info(
+                                f"[扫码更新验证] 第一次预填，允许更新批次号: {new_lot_name}, "
+                                f"记录ID={record.id}, 移动ID={move_id}, 产品ID={record.product_id.id if record.product_id else None}"
+                            )
                     except ValidationError:
                         raise
                     except Exception as e:
@@ -2007,8 +1980,40 @@ class StockMoveLine(models.Model):
                 f"更新的记录ID={[r.id for r in self]}"
             )
         
+        self._sync_lot_unit_ledger(vals)
         return result
     
+    def _sync_lot_unit_ledger(self, vals):
+        """已完成的移动行修改单位相关字段后，向批次单位台账追加差额并重新计算相关库存数量
+        
+        例如入库验证后恢复 lot_unit_name，或在已完成的调拨单上修改单位数量
+        """
+        if not LEDGER_MOVE_LINE_FIELDS & set(vals):
+            return
+        done_lines = self.exists().filtered(lambda ml: ml.state == 'done' and ml.lot_id)
+        if not done_lines:
+            return
+        keys = self.env['stock.lot.unit.ledger'].sudo()._post_move_lines(done_lines.ids)
+        if not keys:
+            return
+        product_ids, lot_ids, location_ids, _owner_ids = zip(*keys)
+        quants = self.env['stock.quant'].sudo().search([
+            ('product_id', 'in', list(set(product_ids))),
+            ('lot_id', 'in', list(set(lot_ids))),
+            ('location_id', 'in', list(set(location_ids))),
+        ])
+        if quants:
+            quants.invalidate_recordset(['lot_quantity', 'lot_unit_name', 'lot_unit_name_custom', 'contract_no'])
+            quants._compute_lot_unit_info()
+    
+    def unlink(self):
+        """删除移动行时，使所属调拨单的预填批次号索引失效，并记录移除的移动行供扫码界面增量加载"""
+        self.env['stock.picking']._invalidate_prefilled_lot_index(
+            self.filtered('lot_name').move_id.picking_id.ids
+        )
+        self.env['stock.move.line.barcode.removal']._record_removal(self)
+        return super(StockMoveLine, self).unlink()
+    
     @api.constrains('lot_quantity')
     def _check_lot_quantity(self):
         """验证单位数量不能为负数"""
@@ -2024,563 +2029,80 @@ class StockMoveLine(models.Model):
                 raise ValidationError(_('批次号长度不能超过255个字符！'))
     
     @api.constrains('lot_name', 'move_id')
+    @tracing.traced('stock.move.line._check_lot_name_match')
     def _check_lot_name_match(self):
-        """验证扫码的批次号必须与已填写的批次号匹配，且不能重复扫描
+        """验证同一移动中批次号不能重复（忽略大小写和首尾空格）
         扫码入库流程：
         1. 提前在库存移动中填好产品的批次/序列号
-        2. 扫码时验证批次号是否在已填写的列表中
+        2. 扫码时验证批次号是否在已填写的列表中（在 create/write 中根据扫码上下文验证）
         3. 一个条码只能扫一次，重复扫会阻止保存
+        
+        **性能优化**：整个记录集只执行一次按 (移动, 标准化批次号) 分组的查询，
+        同时得到每个批次号的重复行和是否属于预填列表（本次验证记录集之外的已保存行），
+        所有重复批次号合并为一条错误提示
         """
         import logging
         _logger = logging.getLogger(__name__)
         
-        # **关键修复**：先过滤掉不存在的记录，避免访问已删除记录导致 MissingError
-        existing_records = self.exists()
-        if not existing_records:
-            # 所有记录都不存在，直接跳过验证
+        records = self.exists().filtered(lambda line: line.move_id and line.lot_name)
+        if not records:
             return
         
-        for record in existing_records:
-            # **关键修复**：使用 try-except 捕获 MissingError，防止访问已删除记录
-            try:
-                # 检查记录是否存在以及是否有 lot_name 和 move_id
-                if not record.exists():
-                    continue
-                
-                # 安全地访问字段
-                lot_name = record.lot_name
-                move_id_record = record.move_id
-                
-                if not lot_name or not move_id_record:
-                    continue
-                
-                move_id = move_id_record.id
-            except Exception as e:
-                # 记录可能已被删除，跳过
-                _logger.warning(
-                    f"[批次号约束验证] 记录访问失败，跳过验证: 记录ID={record.id}, 错误={str(e)}"
-                )
-                continue
-            
-            _logger.info(
-                f"[批次号约束验证] 记录ID={record.id}, "
-                f"批次号={lot_name}, "
-                f"移动ID={move_id}"
-            )
-            
-            # 关键逻辑：
-            # 1. 如果当前记录是已保存的记录，且批次号没有变化，只需要检查重复，不需要检查"批次号不在列表中"
-            # 2. 如果当前记录是已保存的记录，但批次号发生了变化，需要检查新批次号是否在已保存的记录列表中
-            # 3. 如果当前记录是新的记录（未保存），需要检查批次号是否在已保存的记录列表中（扫码验证）
-            # 4. 永远检查重复，确保每个批次号在当前移动中只出现一次
-            
-            # 检查当前记录是否是已保存的记录，以及批次号是否发生变化
-            is_saved_record = record.id and isinstance(record.id, int) and record.id > 0
-            lot_name_changed = False
-            original_lot_name = None
-            
-            if is_saved_record:
-                # **关键修复**：从数据库读取原始批次号，而不是从 _origin 获取
-                # 因为 _origin 在约束验证阶段可能不可用或不准确
-                # 从数据库读取是最可靠的方式
-                try:
-                    # 从数据库读取原始批次号
-                    db_record = self.env['stock.move.line'].browse(record.id)
-                    if db_record.exists():
-                        original_lot_name = db_record.lot_name
-                        current_lot_name = record.lot_name
-                        # 标准化比较，确保比较的准确性
-                        original_lot_normalized = original_lot_name.strip().lower() if original_lot_name else ''
-                        current_lot_normalized = current_lot_name.strip().lower() if current_lot_name else ''
-                        lot_name_changed = original_lot_normalized != current_lot_normalized
-                        _logger.info(
-                            f"[批次号约束验证] 已保存记录，从数据库读取原始批次号={original_lot_name}, "
-                            f"当前批次号={current_lot_name}, 批次号是否变化={lot_name_changed}"
-                        )
-                    else:
-                        # 记录不存在于数据库中，可能是新记录
-                        _logger.warning(f"[批次号约束验证] 记录ID={record.id} 不存在于数据库中，可能是新记录")
-                        lot_name_changed = False
-                except Exception as e:
-                    _logger.warning(f"[批次号约束验证] 从数据库读取原始批次号时出错: {str(e)}")
-                    # 出错时，尝试使用 _origin
-                    try:
-                        if hasattr(record, '_origin') and record._origin:
-                            original_lot_name = record._origin.lot_name
-                            current_lot_name = record.lot_name
-                            lot_name_changed = original_lot_name != current_lot_name
-                            _logger.info(
-                                f"[批次号约束验证] 已保存记录，从 _origin 获取原始批次号={original_lot_name}, "
-                                f"当前批次号={current_lot_name}, 批次号是否变化={lot_name_changed}"
-                            )
-                    except Exception as e2:
-                        _logger.warning(f"[批次号约束验证] 从 _origin 获取原始批次号时也出错: {str(e2)}")
-                        # 出错时，假设批次号可能发生变化，继续验证
-                        lot_name_changed = True  # 为了安全起见，假设批次号可能发生了变化
-            
-            # 获取当前移动中所有记录（排除当前行）
-            # 关键：需要同时检查已保存和未保存的记录，因为在批量保存时，其他记录可能还未保存
-            saved_lot_names = []  # 已保存的批次号（标准化后）
-            saved_lot_lines = []  # 已保存的行记录
-            unsaved_lot_names = []  # 未保存的批次号（标准化后，用于重复检测和预填验证）
-            unsaved_lot_lines = []  # 未保存的行记录（用于获取原始批次号）
-            duplicate_lines = []  # 重复的批次号行（包括已保存和未保存的）
-            
-            scanned_lot_name = record.lot_name.strip().lower() if record.lot_name else ''
-            
-            # **关键修复**：在批量保存时，需要获取所有记录（包括未保存的NewId记录）
-            # 不能使用 exists()，因为 exists() 会过滤掉 NewId 记录
-            # 我们需要检查所有记录（已保存和未保存）来检测重复
-            # **关键修复**：安全地访问 move_id.move_line_ids，防止访问已删除记录导致 MissingError
-            try:
-                move_line_ids = record.move_id.move_line_ids
-            except Exception as e:
-                # move_id 或 move_line_ids 访问失败，可能是记录已被删除
-                _logger.warning(
-                    f"[批次号约束验证] 访问 move_line_ids 失败，跳过验证: 记录ID={record.id}, "
-                    f"move_id={move_id}, 错误={str(e)}"
-                )
-                continue
-            
-            # 注意：在约束验证阶段，move_line_ids 可能包含 NewId 记录
-            # 我们需要手动遍历所有记录，不能使用 exists() 过滤
-            # 但是，我们需要确保只处理有效的记录（有批次号的记录）
-            # **关键修复**：使用 exists() 过滤掉已删除的记录，避免访问已删除记录导致 MissingError
-            try:
-                existing_move_line_ids = move_line_ids.exists()
-            except Exception as e:
-                _logger.warning(
-                    f"[批次号约束验证] 过滤已删除记录失败，跳过验证: 记录ID={record.id}, "
-                    f"move_id={move_id}, 错误={str(e)}"
-                )
+        self.flush_model(['lot_name', 'lot_name_normalized', 'move_id'])
+        checked_keys = {(line.move_id.id, line.lot_name_normalized) for line in records if line.lot_name_normalized}
+        if not checked_keys:
+            return
+        
+        self.env.cr.execute("""
+            SELECT move_id,
+                   lot_name_normalized,
+                   array_agg(id ORDER BY id),
+                   MIN(lot_name),
+                   bool_or(NOT (id = ANY(%s))) AS in_prefilled
+              FROM stock_move_line
+             WHERE move_id IN %s
+               AND lot_name_normalized IN %s
+             GROUP BY move_id, lot_name_normalized
+        """, [
+            records.ids,
+            tuple({move_id for move_id, _lot_key in checked_keys}),
+            tuple({lot_key for _move_id, lot_key in checked_keys}),
+        ])
+        
+        duplicates = []
+        unknown_lots = []
+        for move_id, lot_key, line_ids, lot_name, in_prefilled in self.env.cr.fetchall():
+            if (move_id, lot_key) not in checked_keys:
                 continue
-            
-            for line in existing_move_line_ids:
-                # 跳过当前行和没有批次号的行
-                # 注意：在批量保存时，当前记录可能在 move_line_ids 中
-                # 我们需要使用更精确的检查来排除当前记录
-                # **关键修复**：使用 try-except 捕获所有可能的异常，防止访问已删除记录
-                try:
-                    # 首先检查记录是否存在
-                    if not line.exists():
-                        continue
-                    
-                    # 检查是否是当前记录
-                    # 如果 record.id 是 NewId，需要比较对象的身份
-                    is_current_line = False
-                    if is_saved_record:
-                        # 如果是已保存的记录，直接比较 ID
-                        try:
-                            line_id = line.id if hasattr(line, 'id') else None
-                            is_current_line = (isinstance(line_id, int) and line_id > 0 and line_id == record.id)
-                        except Exception:
-                            # 访问 line.id 失败，跳过
-                            continue
-                    else:
-                        # 如果是未保存的记录，比较对象的身份（内存地址）
-                        # 注意：在批量保存时，可能无法直接比较对象身份
-                        # 因此，我们使用其他方式来判断：如果批次号相同且是同一个移动，则可能是当前记录
-                        # 但这种方法不够精确，所以我们暂时跳过批次号相同的未保存记录（在重复检测时会处理）
-                        is_current_line = (line is record)
-                    
-                    # 安全地访问 line.lot_name
-                    try:
-                        line_lot_name = line.lot_name
-                    except Exception:
-                        # 访问 line.lot_name 失败，跳过
-                        continue
-                    
-                    if is_current_line or not line_lot_name:
-                        continue
-                    
-                    lot_name_normalized = line_lot_name.strip().lower() if line_lot_name else ''
-                    if not lot_name_normalized:
-                        continue
-                    
-                    # 检查是否是已保存的记录（有真实 ID）
-                    try:
-                        line_id = line.id if hasattr(line, 'id') else None
-                        is_saved = isinstance(line_id, int) and line_id > 0
-                    except Exception:
-                        # 访问 line.id 失败，假设是未保存的记录
-                        is_saved = False
-                    
-                    if is_saved:
-                        # 已保存的记录
-                        saved_lot_lines.append(line)
-                        saved_lot_names.append(lot_name_normalized)
-                    else:
-                        # 未保存的记录（NewId），也添加到列表中进行重复检测和预填验证
-                        # 这是为了检测批量保存时的重复批次号和预填验证
-                        unsaved_lot_lines.append(line)
-                        unsaved_lot_names.append(lot_name_normalized)
-                    
-                    # 检查是否是重复的批次号（与当前记录的批次号相同）
-                    # 注意：在批量保存时，当前记录可能也在 move_line_ids 中
-                    # 我们需要确保不会把当前记录自己当作重复
-                    if lot_name_normalized == scanned_lot_name:
-                        # 检查是否是当前记录
-                        if is_saved_record:
-                            # 如果是已保存的记录，检查 ID 是否相同
-                            try:
-                                line_id = line.id if hasattr(line, 'id') else None
-                                if isinstance(line_id, int) and line_id > 0:
-                                    if line_id != record.id:
-                                        duplicate_lines.append(line)
-                                else:
-                                    # 未保存的记录，可能重复
-                                    duplicate_lines.append(line)
-                            except Exception:
-                                # 访问 line.id 失败，跳过
-                                continue
-                        else:
-                            # 如果是未保存的记录，检查是否是同一个对象
-                            if line is not record:
-                                duplicate_lines.append(line)
-                except Exception as e:
-                    _logger.warning(
-                        f"[批次号约束验证] 处理移动行时出错: "
-                        f"line_id={line.id if hasattr(line, 'id') else 'unknown'}, "
-                        f"错误={str(e)}"
-                    )
-                    continue
-            
-            # **关键修复**：在批量保存时，如果没有已保存的记录，但有未保存的记录（预填列表）
-            # 需要检查当前记录的批次号是否在预填列表中
-            # 这样可以防止用户预填了批次号A和B，但扫码输入了批次号C的情况
-            all_prefilled_lot_names = saved_lot_names + unsaved_lot_names  # 所有预填的批次号（已保存+未保存）
-            
+            if len(line_ids) > 1:
+                duplicates.append((move_id, lot_name, line_ids))
+            elif not in_prefilled:
+                unknown_lots.append((move_id, lot_name))
+        
+        if unknown_lots:
+            # 预填规则依赖扫码上下文，已在 create/write 中验证；约束阶段只记录，不阻止手动填写
+            tracing.note_branch('not_in_prefilled')
             _logger.info(
-                f"[批次号约束验证] 批次号={record.lot_name} (标准化={scanned_lot_name}), "
-                f"已保存的批次号列表={saved_lot_names}, "
-                f"未保存的批次号列表={unsaved_lot_names}, "
-                f"所有预填批次号列表={all_prefilled_lot_names}, "
-                f"已保存的记录数={len(saved_lot_lines)}, "
-                f"未保存的记录数={len(unsaved_lot_lines)}, "
-                f"重复批次号行数={len(duplicate_lines)}"
+                f"[批次号约束验证] 批次号不在预填列表中（手动填写或第一次预填）: "
+                f"{[(move_id, lot_name) for move_id, lot_name in unknown_lots]}"
             )
-            
-            # 关键逻辑：
-            # 1. 永远检查重复，确保每个批次号在当前移动中只出现一次
-            # 2. 如果当前记录是已保存的记录，且批次号没有变化，只需要检查重复，不需要检查"批次号不在列表中"
-            # 3. 如果当前记录是已保存的记录，但批次号发生了变化，需要检查新批次号是否在预填列表中（已保存+未保存）
-            # 4. 如果当前记录是新的记录（未保存），需要检查批次号是否在预填列表中（已保存+未保存）（扫码验证）
-            # 5. **关键修复**：如果存在预填列表（已保存或未保存），扫码的批次号必须在预填列表中
-            
-            # **关键修复**：检查重复批次号（包括已保存和未保存的记录）
-            # 关键逻辑：
-            # 1. 检查是否与已保存的记录重复
-            # 2. 检查是否与未保存的记录重复（批量保存时的重复检测）
-            # 3. 使用 duplicate_lines 列表，因为它已经包含了所有重复的记录
-            # 4. 注意：如果是同一个记录（自己），不算重复
-            
-            # 检查是否是当前记录自己（如果是自己，不算重复）
-            is_self_duplicate = False
-            if is_saved_record:
-                # 如果是已保存的记录，检查是否是自己的批次号
-                try:
-                    for line in saved_lot_lines:
-                        try:
-                            if line.exists() and line.id == record.id:
-                                line_lot_name = line.lot_name
-                                if line_lot_name and line_lot_name.strip().lower() == scanned_lot_name:
-                                    is_self_duplicate = True
-                                    break
-                        except Exception:
-                            # 访问 line 失败，跳过
-                            continue
-                except Exception:
-                    # 访问 saved_lot_lines 失败，跳过
-                    pass
-            else:
-                # 如果是未保存的记录，检查是否是同一个对象
-                # duplicate_lines 中可能包含当前记录，需要排除
-                try:
-                    for line in duplicate_lines:
-                        try:
-                            if line is record:
-                                is_self_duplicate = True
-                                break
-                        except Exception:
-                            # 访问 line 失败，跳过
-                            continue
-                except Exception:
-                    # 访问 duplicate_lines 失败，跳过
-                    pass
-            
-            # 如果有重复的记录，且不是当前记录自己，则阻止保存
-            if duplicate_lines and not is_self_duplicate:
-                # 过滤掉当前记录自己
-                real_duplicate_lines = []
-                for line in duplicate_lines:
-                    try:
-                        # 检查记录是否存在
-                        if not line.exists():
-                            continue
-                        
-                        if is_saved_record:
-                            # 如果是已保存的记录，检查 ID 是否相同
-                            try:
-                                line_id = line.id if hasattr(line, 'id') else None
-                                if isinstance(line_id, int) and line_id > 0:
-                                    if line_id != record.id:
-                                        real_duplicate_lines.append(line)
-                                else:
-                                    # 未保存的记录，可能重复
-                                    real_duplicate_lines.append(line)
-                            except Exception:
-                                # 访问 line.id 失败，跳过
-                                continue
-                        else:
-                            # 如果是未保存的记录，检查是否是同一个对象
-                            if line is not record:
-                                real_duplicate_lines.append(line)
-                    except Exception:
-                        # 访问 line 失败，跳过
-                        continue
-                
-                if real_duplicate_lines:
-                    duplicate_line_ids = []
-                    duplicate_new_ids = []
-                    for l in real_duplicate_lines:
-                        try:
-                            if l.exists():
-                                if hasattr(l, 'id') and isinstance(l.id, int) and l.id > 0:
-                                    duplicate_line_ids.append(l.id)
-                                else:
-                                    duplicate_new_ids.append(str(l.id))
-                        except Exception:
-                            continue
-                    
-                    # 检查是否与已保存的记录重复
-                    has_saved_duplicate = False
-                    for l in real_duplicate_lines:
-                        try:
-                            if l.exists() and hasattr(l, 'id') and isinstance(l.id, int) and l.id > 0:
-                                has_saved_duplicate = True
-                                break
-                        except Exception:
-                            continue
-                    
-                    # 检查是否与未保存的记录重复
-                    has_unsaved_duplicate = False
-                    for l in real_duplicate_lines:
-                        try:
-                            if l.exists() and not (hasattr(l, 'id') and isinstance(l.id, int) and l.id > 0):
-                                has_unsaved_duplicate = True
-                                break
-                        except Exception:
-                            continue
-                    
-                    _logger.warning(
-                        f"[批次号约束验证] 重复批次号: 批次号 {record.lot_name} 已重复, "
-                        f"重复行ID={duplicate_line_ids}, 重复新记录={duplicate_new_ids}, "
-                        f"与已保存记录重复={has_saved_duplicate}, 与未保存记录重复={has_unsaved_duplicate}"
-                    )
-                    
-                    if has_saved_duplicate:
-                        raise ValidationError(
-                            _('重复扫描！\n\n'
-                              '批次号 "%s" 已经在已保存的记录中，请勿重复扫描！\n\n'
-                              '如需修改，请直接在列表中编辑已保存的记录。')
-                            % record.lot_name
-                        )
-                    elif has_unsaved_duplicate:
-                        raise ValidationError(
-                            _('重复扫描！\n\n'
-                              '批次号 "%s" 已经在当前待保存的记录中，请勿重复扫描！\n\n'
-                              '同一个批次号只能扫描一次。')
-                            % record.lot_name
-                        )
-                    else:
-                        raise ValidationError(
-                            _('重复扫描！\n\n'
-                              '批次号 "%s" 已重复，请勿重复扫描！\n\n'
-                              '同一个批次号只能扫描一次。')
-                            % record.lot_name
-                        )
-            
-            # **关键修复**：问题的核心是：用户预填了批次号1和2，但扫码了123和321，这些不应该被保存
-            # 解决方案：我们需要确定"最初预填的批次号列表"
-            # 关键逻辑：
-            # 1. 如果当前移动中已经存在已保存的记录（这些是预填的批次号）
-            # 2. 那么，任何新记录或修改的记录的批次号必须在这些已保存记录的批次号列表中
-            # 3. 但是，我们需要排除当前记录本身，以及可能被错误保存的扫码记录
-            
-            # **更好的解决方案**：
-            # 1. 获取当前移动中**所有已保存记录**的批次号（排除当前记录）
-            # 2. 如果这些已保存记录的批次号列表不为空，说明已经有预填的批次号
-            # 3. 那么，当前记录的批次号必须在这个列表中
-            # 4. 但是，问题是：如果用户扫码了123和321，这些记录也会被保存，导致列表包含123和321
-            # 5. **关键**：我们需要在**第一次保存时**就阻止不匹配的批次号
-            
-            # **实际可行的解决方案**：
-            # 1. 在约束验证中，检查：如果当前移动中已经存在其他已保存的记录
-            # 2. 那么，当前记录的批次号必须在这些已保存记录的批次号列表中
-            # 3. 这样可以确保：一旦有预填的批次号保存后，后续的批次号必须匹配
-            
-            # **关键修复**：在批量保存时，需要合并已保存和未保存的批次号列表
-            # 问题：当批量保存时，第一个记录保存后，第二个记录的约束验证会查询数据库
-            # 数据库查询时，只查询到第一个记录的批次号，没有包含第二个记录（因为第二个记录还未保存）
-            # 第二个记录的批次号不在查询结果中，被误判为"不在预填列表中"
-            # 解决方案：合并已保存和未保存的批次号列表，作为完整的预填列表
-            
-            # 从数据库中获取当前移动的所有已保存记录的批次号（排除当前记录）
-            # 这些就是"预填列表"（已保存的批次号）
-            db_prefilled_lot_names = []
-            has_db_saved_records = False  # 标记是否有已保存的记录
-            if record.move_id and record.move_id.id:
-                try:
-                    # 查询当前移动的所有已保存记录的批次号（排除当前记录）
-                    # 使用 search 确保只获取真实存在的记录
-                    domain = [
-                        ('move_id', '=', record.move_id.id),
-                        ('lot_name', '!=', False),
-                        ('lot_name', '!=', ''),
-                    ]
-                    if is_saved_record:
-                        domain.append(('id', '!=', record.id))
-                    
-                    db_move_lines = self.env['stock.move.line'].search(domain)
-                    
-                    # 获取所有批次号（标准化后）
-                    for db_line in db_move_lines:
-                        if db_line.lot_name:
-                            db_lot_name_normalized = db_line.lot_name.strip().lower()
-                            if db_lot_name_normalized and db_lot_name_normalized not in db_prefilled_lot_names:
-                                db_prefilled_lot_names.append(db_lot_name_normalized)
-                                has_db_saved_records = True  # 标记有已保存的记录
-                    
-                    _logger.info(
-                        f"[批次号约束验证] 从数据库获取已保存批次号列表（预填列表）: {db_prefilled_lot_names}, "
-                        f"当前记录批次号={record.lot_name} (标准化={scanned_lot_name}), "
-                        f"是否有已保存记录={has_db_saved_records}"
-                    )
-                except Exception as e:
-                    _logger.warning(f"[批次号约束验证] 从数据库获取预填批次号列表时出错: {str(e)}")
-                    # 出错时，尝试使用内存中的已保存记录
-                    if saved_lot_names:
-                        db_prefilled_lot_names = saved_lot_names
-                        has_db_saved_records = True
-            
-            # **关键修复**：合并已保存和未保存的批次号列表，作为完整的预填列表
-            # 在批量保存时，未保存的记录（unsaved_lot_names）也应该是预填列表的一部分
-            # 这样可以正确处理批量保存的场景
-            all_prefilled_lot_names_combined = list(set(db_prefilled_lot_names + unsaved_lot_names))
-            
-            _logger.info(
-                f"[批次号约束验证] 合并预填列表: "
-                f"数据库预填批次号列表={db_prefilled_lot_names}, "
-                f"未保存批次号列表={unsaved_lot_names}, "
-                f"合并后的预填列表={all_prefilled_lot_names_combined}"
+        
+        if duplicates:
+            tracing.note_branch('duplicate')
+            _logger.warning(
+                f"[批次号约束验证] 重复批次号: "
+                f"{[(move_id, lot_name, line_ids) for move_id, lot_name, line_ids in duplicates]}"
             )
-            
-            # **关键修复**：只有在有已保存的记录时，才需要检查"批次号不在列表中"
-            # 关键逻辑：
-            # 1. **最重要**：如果记录是已保存的，且批次号发生了变化，这是用户的手动编辑，应该允许修改，不需要检查批次号是否在预填列表中
-            # 2. 如果有已保存的记录（has_db_saved_records=True），说明已经有预填的批次号
-            # 3. 在批量保存时，需要检查当前记录的批次号是否在合并后的预填列表中
-            # 4. 但是，如果记录是已保存的，且批次号没有变化，且批次号在合并后的预填列表中，应该允许保存
-            # 5. 如果记录是新的（未保存），且批次号在合并后的预填列表中，应该允许保存
-            # 6. **关键**：只有在记录是新的（未保存），且批次号不在合并后的预填列表中时，才应该阻止
-            #    因为手动预填时，批次号应该在预填列表中（已保存或未保存）
-            
-            # **关键修复**：如果记录是已保存的，且批次号发生了变化，这是用户的手动编辑
-            # 应该允许修改，不需要检查批次号是否在预填列表中
-            # 直接跳过所有预填列表检查，只检查重复
-            if is_saved_record and lot_name_changed:
-                _logger.info(
-                    f"[批次号约束验证] 已保存记录，批次号发生了变化（从 {original_lot_name} 改为 {record.lot_name}），"
-                    f"这是用户的手动编辑，允许保存，不需要检查批次号是否在预填列表中"
-                )
-                # 跳过所有预填列表检查，允许保存
-                # 但需要检查重复（上面已经检查过了）
-            elif is_saved_record and not lot_name_changed:
-                # **关键修复**：已保存的记录，批次号没有变化
-                # 这种情况可能是：
-                # 1. 用户手动编辑了批次号，write 方法已经更新了数据库，约束验证时从数据库读取的已经是新值
-                # 2. 约束验证时检测到批次号没有变化（因为数据库中的值已经是新值了）
-                # 3. 但是，如果批次号不在预填列表中，可能是手动编辑的结果，应该允许保存
-                # 
-                # **解决方案**：对于已保存的记录，如果批次号没有变化
-                # 说明记录已经被保存过了，不需要再检查批次号是否在预填列表中
-                # 只检查重复即可
-                # 
-                # **关键**：即使批次号不在预填列表中，只要是已保存的记录，就应该允许保存
-                # 因为记录已经被保存过了，说明是手动编辑的结果
-                _logger.info(
-                    f"[批次号约束验证] 已保存记录，批次号未变化（批次号={record.lot_name}），"
-                    f"记录已被保存过，允许保存，不需要检查批次号是否在预填列表中"
-                )
-                # 跳过所有预填列表检查，允许保存
-                # 但需要检查重复（上面已经检查过了）
-                # 使用 continue 跳过后续的预填列表检查
-                continue
-            elif has_db_saved_records and all_prefilled_lot_names_combined:
-                # **关键修复**：检查当前记录的批次号是否在合并后的预填列表中
-                # 如果当前记录的批次号不在合并后的预填列表中，说明是扫码时输入了不在预填列表中的批次号，应该阻止
-                if scanned_lot_name not in all_prefilled_lot_names_combined:
-                    # 批次号不在合并后的预填列表中
-                    # **关键修复**：对于已保存的记录，即使批次号不在预填列表中，也应该允许保存
-                    # 因为记录已经被保存过了，说明是手动编辑的结果
-                    # 约束验证不应该阻止已保存记录的保存操作
-                    if is_saved_record:
-                        # **关键修复**：对于已保存的记录，即使批次号不在预填列表中，也应该允许保存
-                        # 因为记录已经被保存过了，说明是手动编辑的结果
-                        # 约束验证不应该阻止已保存记录的保存操作
-                        _logger.info(
-                            f"[批次号约束验证] 已保存记录，批次号不在预填列表中，但记录已被保存过，允许保存: {record.lot_name}"
-                        )
-                        # 跳过预填列表检查，允许保存
-                        # 但需要检查重复（上面已经检查过了）
-                        continue
-                    else:
-                        # 新记录（未保存），批次号不在合并后的预填列表中，应该阻止
-                        # 这是扫码时输入了不在预填列表中的批次号
-                        _logger.warning(
-                            f"[批次号约束验证] 新记录，批次号不在预填列表中: "
-                            f"记录ID={record.id}, 批次号={record.lot_name}, "
-                            f"数据库预填批次号列表={db_prefilled_lot_names}"
-                        )
-                        
-                        # 获取所有预填的批次号（用于显示错误消息）
-                        try:
-                            db_lines = self.env['stock.move.line'].search([
-                                ('move_id', '=', record.move_id.id),
-                                ('lot_name', '!=', False),
-                                ('lot_name', '!=', ''),
-                            ])
-                            unique_lot_names = list(set([
-                                db_line.lot_name 
-                                for db_line in db_lines
-                                if db_line.lot_name and db_line.lot_name.strip()
-                            ]))
-                        except Exception:
-                            unique_lot_names = db_prefilled_lot_names
-                        
-                        raise ValidationError(
-                            _('批次号不在列表中！\n\n'
-                              '扫描的批次号："%s"\n\n'
-                              '已预填的批次号列表：\n%s\n\n'
-                              '扫码只是验证，批次号必须在预填列表中。\n'
-                              '请先手动预填批次号，然后再扫码验证。')
-                            % (record.lot_name, '\n'.join(unique_lot_names))
-                        )
-                else:
-                    # 批次号在合并后的预填列表中，允许保存
-                    # 如果记录是已保存的，且批次号没有变化，说明是合法的预填记录
-                    if is_saved_record and not lot_name_changed:
-                        _logger.info(
-                            f"[批次号约束验证] 已保存记录，批次号未变化，且在合并后的预填列表中，允许保存: {record.lot_name}"
-                        )
-                    else:
-                        _logger.info(
-                            f"[批次号约束验证] 批次号在合并后的预填列表中，允许保存: {record.lot_name}"
-                        )
-            else:
-                # 没有已保存的记录，说明是第一次预填，允许保存
-                # 但是，我们已经检查了重复（上面已经检查过了）
-                _logger.info(
-                    f"[批次号约束验证] 没有已保存的记录（has_db_saved_records={has_db_saved_records}），"
-                    f"这是第一次预填，允许保存: {record.lot_name}"
+            if len(duplicates) == 1:
+                raise ValidationError(
+                    _('重复扫描！\n\n'
+                      '批次号 "%s" 已经在已保存的记录中，请勿重复扫描！\n\n'
+                      '如需修改，请直接在列表中编辑已保存的记录。')
+                    % duplicates[0][1]
                 )
+            raise ValidationError(
+                _('重复扫描！\n\n'
+                  '以下批次号已经在已保存的记录中，请勿重复扫描！\n%s\n\n'
+                  '如需修改，请直接在列表中编辑已保存的记录。')
+                % '\n'.join(sorted({lot_name for _move_id, lot_name, _line_ids in duplicates}))
+            )
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, fields, api
+from odoo.tools.sql import create_index
+
+
+class StockMoveLineBarcodeRemoval(models.Model):
+    """扫码界面移除的移动行记录
+
+    移动行删除或移到其他调拨单后不再有修订号可查，这里按调拨单记录其ID和移除时的扫码修订号，
+    扫码界面增量加载时据此返回已移除的移动行ID（见 stock.picking._get_barcode_move_lines_delta）。
+    调拨单完成后不再扫码，其记录随之删除。
+    """
+    _name = 'stock.move.line.barcode.removal'
+    _description = '扫码移除移动行记录'
+    _log_access = False
+
+    picking_id = fields.Many2one('stock.picking', string='调拨单', required=True, ondelete='cascade')
+    move_line_id = fields.Integer(string='移动行ID', required=True)
+    barcode_revision = fields.Integer(string='扫码修订号', required=True)
+
+    def init(self):
+        """创建 (调拨单, 扫码修订号) 索引，用于按修订号查询移除的移动行"""
+        super(StockMoveLineBarcodeRemoval, self).init()
+        create_index(
+            self.env.cr, 'stock_move_line_barcode_removal_picking_revision_idx',
+            self._table, ['picking_id', 'barcode_revision']
+        )
+
+    @api.model
+    def _record_removal(self, move_lines):
+        """记录从所属调拨单移除的移动行（推进原调拨单的扫码修订号，一次 INSERT）
+
+        Args:
+            move_lines (stock.move.line): 即将删除或移到其他调拨单的移动行
+        """
+        lines = move_lines.filtered('picking_id')
+        if not lines:
+            return
+        revisions = self.env['stock.picking']._bump_barcode_revision(lines.picking_id.ids)
+        self.env.cr.execute("""
+            INSERT INTO stock_move_line_barcode_removal (picking_id, move_line_id, barcode_revision)
+            SELECT picking_id, move_line_id, revision
+              FROM unnest(%s::int[], %s::int[], %s::int[]) AS r(picking_id, move_line_id, revision)
+        """, [
+            [line.picking_id.id for line in lines],
+            lines.ids,
+            [revisions[line.picking_id.id] for line in lines],
+        ])
+
+    @api.model
+    def _get_removed_since(self, picking_id, since_revision):
+        """获取调拨单中修订号大于 since_revision 后移除的移动行ID
+
+        Returns:
+            list: 移除的移动行ID
+        """
+        self.env.cr.execute("""
+            SELECT DISTINCT move_line_id
+              FROM stock_move_line_barcode_removal
+             WHERE picking_id = %s
+               AND barcode_revision > %s
+        """, [picking_id, since_revision])
+        return [row[0] for row in self.env.cr.fetchall()]
@@ -1,21 +1,71 @@
 # -*- coding: utf-8 -*-
 
-from odoo import models, api, _
+from odoo import models, fields, api, _
 from odoo.exceptions import UserError, ValidationError
+from odoo.tools import LRU
+from odoo.tools.sql import column_exists, create_column
+from psycopg2 import errors
 import logging
+import time
 
 _logger = logging.getLogger(__name__)
 
+# 预填批次号索引缓存：{(数据库名, picking_id): (扫码修订号, 索引)}
+# 扫码修订号用于跨 worker / 跨事务校验索引是否过期（见 StockPicking._bump_barcode_revision）
+_PREFILLED_LOT_INDEX_CACHE = LRU(256)
+
+# 扫码咨询锁的命名空间（pg_advisory_xact_lock 的第一个键），第二个键为调拨单ID
+_BARCODE_LOCK_NAMESPACE = 52871
+# 等待扫码锁的默认最长时间（秒），可通过系统参数 stock_unit_mgmt.barcode_lock_timeout 调整
+_BARCODE_LOCK_TIMEOUT = 10.0
+# 等待扫码锁超过该秒数时记录日志
+_BARCODE_LOCK_LOG_THRESHOLD = 0.05
+
 
 class StockPicking(models.Model):
     _inherit = 'stock.picking'
 
+    # 扫码修订号：调拨单的移动行创建、修改扫码界面字段或被移除时递增（见 _bump_barcode_revision）
+    barcode_revision = fields.Integer(
+        string='扫码修订号',
+        default=0,
+        copy=False,
+        readonly=True,
+        help='扫码界面增量加载时，客户端只需加载修订号大于已知修订号的移动行'
+    )
+
+    def _auto_init(self):
+        """升级时从已有移动行和移除记录的修订号初始化调拨单的扫码修订号，新修订号不会小于已有的"""
+        column_created = not column_exists(self.env.cr, self._table, 'barcode_revision')
+        if column_created:
+            create_column(self.env.cr, self._table, 'barcode_revision', 'int4')
+        res = super(StockPicking, self)._auto_init()
+        if column_created:
+            self.env.cr.execute("""
+                UPDATE stock_picking p
+                   SET barcode_revision = r.revision
+                  FROM (
+                        SELECT picking_id, MAX(barcode_revision) AS revision
+                          FROM (
+                                SELECT picking_id, barcode_revision FROM stock_move_line
+                                 WHERE picking_id IS NOT NULL AND barcode_revision > 0
+                                UNION ALL
+                                SELECT picking_id, barcode_revision FROM stock_move_line_barcode_removal
+                          ) AS revisions
+                         GROUP BY picking_id
+                       ) AS r
+                 WHERE p.id = r.picking_id
+            """)
+        return res
+
     def button_validate(self):
         """重写验证方法，在验证前比对扫码数据和预填数据"""
         # **关键修复**：检查作业类型是否启用了增强条码验证
         # 只有当作业类型启用了增强条码验证时，才执行增强验证
         if (self.picking_type_id.code == 'incoming' and 
             self.picking_type_id.enable_enhanced_barcode_validation):
+            # 与扫码保存互斥，避免比对过程中其他操作员仍在写入同一调拨单
+            self._acquire_barcode_lock()
             self._validate_scanned_data()
         
         # 调用父类方法进行正常验证
@@ -27,54 +77,34 @@ class StockPicking(models.Model):
             self.picking_type_id.enable_enhanced_barcode_validation and
             self.state == 'done'):
             try:
-                # 查询所有有批次号的移动行
+                # **性能优化**：只查询缺少单位名称的批次号移动行，按目标单位分组，每组只写一次
+                # 逐行 write 会为每一卷重新进入 stock.move.line.write 的重写逻辑
                 move_lines = self.env['stock.move.line'].search([
                     ('picking_id', '=', self.id),
-                    ('lot_name', '!=', False),
-                    ('lot_name', '!=', ''),
+                    ('lot_name_normalized', '!=', False),
+                    ('lot_unit_name', '=', False),
                 ])
                 
-                if move_lines:
-                    # 为每个移动行检查和恢复 lot_quantity 和 lot_unit_name
-                    for move_line in move_lines:
-                        if move_line.lot_name:
-                            # 获取产品配置
-                            product = move_line.product_id
-                            if product and product.product_tmpl_id:
-                                product_tmpl = product.product_tmpl_id
-                                
-                                # 如果 lot_quantity 为空或 0，尝试从产品配置获取
-                                if not move_line.lot_quantity or move_line.lot_quantity == 0:
-                                    # 检查是否有默认单位配置
-                                    if (hasattr(product_tmpl, 'enable_custom_units') and 
-                                        product_tmpl.enable_custom_units and
-                                        hasattr(product_tmpl, 'default_unit_config') and
-                                        product_tmpl.default_unit_config):
-                                        # 如果有默认单位配置，但没有 lot_quantity，设置为默认值 1.0
-                                        # 注意：这里不设置 lot_quantity，因为用户可能想要手动填写
-                                        # 只设置 lot_unit_name
-                                        if not move_line.lot_unit_name:
-                                            move_line.with_context(skip_quantity_fix=True).write({
-                                                'lot_unit_name': product_tmpl.default_unit_config
-                                            })
-                                            _logger.info(
-                                                f"[入库验证后] 恢复 lot_unit_name: 记录ID={move_line.id}, "
-                                                f"批次号={move_line.lot_name}, lot_unit_name={product_tmpl.default_unit_config}"
-                                            )
-                                
-                                # 如果 lot_unit_name 为空，尝试从产品配置获取
-                                if not move_line.lot_unit_name:
-                                    if (hasattr(product_tmpl, 'enable_custom_units') and 
-                                        product_tmpl.enable_custom_units and
-                                        hasattr(product_tmpl, 'default_unit_config') and
-                                        product_tmpl.default_unit_config):
-                                        move_line.with_context(skip_quantity_fix=True).write({
-                                            'lot_unit_name': product_tmpl.default_unit_config
-                                        })
-                                        _logger.info(
-                                            f"[入库验证后] 恢复 lot_unit_name: 记录ID={move_line.id}, "
-                                            f"批次号={move_line.lot_name}, lot_unit_name={product_tmpl.default_unit_config}"
-                                        )
+                lines_by_unit = {}
+                for move_line in move_lines:
+                    product_tmpl = move_line.product_id.product_tmpl_id
+                    # 只有配置了默认单位的产品才恢复 lot_unit_name
+                    # 注意：这里不设置 lot_quantity，因为用户可能想要手动填写
+                    if (product_tmpl and
+                        getattr(product_tmpl, 'enable_custom_units', False) and
+                        getattr(product_tmpl, 'default_unit_config', False)):
+                        unit_name = product_tmpl.default_unit_config
+                        lines_by_unit.setdefault(unit_name, []).append(move_line.id)
+                
+                for unit_name, line_ids in lines_by_unit.items():
+                    unit_lines = move_lines.browse(line_ids)
+                    unit_lines.with_context(skip_quantity_fix=True).write({
+                        'lot_unit_name': unit_name
+                    })
+                    _logger.info(
+                        f"[入库验证后] 恢复 lot_unit_name: 调拨单={self.name}, "
+                        f"lot_unit_name={unit_name}, 记录数={len(unit_lines)}"
+                    )
             except Exception as e:
                 _logger.warning(
                     f"[入库验证后] 恢复单位信息时出错: picking_id={self.id}, 错误={str(e)}",
@@ -83,12 +113,258 @@ class StockPicking(models.Model):
         
         return result
 
+    def _action_done(self):
+        """调拨单完成后不再扫码，删除其扫码移除记录"""
+        result = super(StockPicking, self)._action_done()
+        done_picking_ids = self.filtered(lambda picking: picking.state == 'done').ids
+        if done_picking_ids:
+            self.env.cr.execute(
+                "DELETE FROM stock_move_line_barcode_removal WHERE picking_id = ANY(%s)",
+                [done_picking_ids]
+            )
+        return result
+
+    def _get_prefilled_lot_index(self):
+        """获取调拨单的预填批次号索引（标准化批次号 -> 移动行）
+        
+        索引在每个 worker 内按调拨单缓存，移动行创建/修改/删除时失效；
+        每次调用只读取一次调拨单的扫码修订号（调拨单上的计数，不扫描移动行），
+        修订号一致时直接返回缓存的索引，修订号变化（例如其他 worker 修改了批次号、
+        删除或移走了移动行）时重新构建。批次号、所属移动和调拨单的修改都会推进修订号，
+        且修订号按提交顺序递增（见 _bump_barcode_revision），晚提交的修改不会被漏掉。
+        索引与修订号一样按移动行的 picking_id 归属调拨单。
+        
+        Returns:
+            dict: {标准化批次号: {'name': 原始批次号, 'line_ids': [移动行ID, ...]}}
+                  返回的是共享缓存，调用方不得修改
+        """
+        self.ensure_one()
+        revision = self._get_barcode_revision()
+        
+        cache_key = (self.env.cr.dbname, self.id)
+        cached = _PREFILLED_LOT_INDEX_CACHE.get(cache_key)
+        if cached and cached[0] == revision:
+            return cached[1]
+        
+        index = {}
+        self.env['stock.move.line'].flush_model(['lot_name', 'lot_name_normalized', 'picking_id'])
+        self.env.cr.execute("""
+            SELECT id, lot_name, lot_name_normalized
+              FROM stock_move_line
+             WHERE picking_id = %s
+               AND lot_name_normalized IS NOT NULL
+             ORDER BY id
+        """, [self.id])
+        for line_id, lot_name, lot_key in self.env.cr.fetchall():
+            entry = index.setdefault(lot_key, {'name': lot_name, 'line_ids': []})
+            entry['line_ids'].append(line_id)
+        
+        _PREFILLED_LOT_INDEX_CACHE[cache_key] = (revision, index)
+        _logger.info(
+            f"[预填索引] 重建预填批次号索引: picking_id={self.id}, 批次号数={len(index)}"
+        )
+        return index
+
+    @api.model
+    def _invalidate_prefilled_lot_index(self, picking_ids):
+        """使指定调拨单的预填批次号索引失效
+        
+        Args:
+            picking_ids (iterable): 调拨单ID列表
+        """
+        dbname = self.env.cr.dbname
+        for picking_id in set(picking_ids or []):
+            try:
+                del _PREFILLED_LOT_INDEX_CACHE[(dbname, picking_id)]
+            except KeyError:
+                pass
+
+    def _acquire_barcode_lock(self, timeout=None):
+        """获取调拨单的扫码咨询锁（事务级，事务结束时自动释放）
+        
+        多个操作员同时扫码同一调拨单时，并发的保存会更新相同的移动行，
+        导致序列化失败和 Odoo 整个请求回滚重试。持锁后同一调拨单的保存、扫码登记和验证依次执行，
+        并发变为短暂排队。使用阻塞的 pg_advisory_xact_lock，由 lock_timeout 限制等待时间，
+        等待超过 timeout 秒时提示用户稍后重试。
+        
+        注意：调用方应在读取调拨单数据之前加锁（只使用记录ID，本方法不读取调拨单），
+        多张调拨单按ID顺序加锁，避免互相等待造成死锁。
+        
+        Args:
+            timeout (float): 最长等待秒数，None 时读取系统参数 stock_unit_mgmt.barcode_lock_timeout
+        
+        Returns:
+            float: 实际等待的秒数
+        """
+        if not self:
+            return 0.0
+        if timeout is None:
+            try:
+                timeout = float(self.env['ir.config_parameter'].sudo().get_param(
+                    'stock_unit_mgmt.barcode_lock_timeout', _BARCODE_LOCK_TIMEOUT
+                ))
+            except (TypeError, ValueError):
+                timeout = _BARCODE_LOCK_TIMEOUT
+        
+        cr = self.env.cr
+        started = time.monotonic()
+        # lock_timeout 只在加锁期间生效，加锁后恢复原值，不影响事务中后续的行锁
+        cr.execute("SELECT current_setting('lock_timeout')")
+        previous_lock_timeout = cr.fetchone()[0]
+        try:
+            with cr.savepoint(flush=False):
+                cr.execute(
+                    "SELECT set_config('lock_timeout', %s, true)",
+                    [f'{max(int(timeout * 1000), 1)}ms']
+                )
+                for picking_id in sorted(set(self.ids)):
+                    cr.execute(
+                        "SELECT pg_advisory_xact_lock(%s, %s)",
+                        [_BARCODE_LOCK_NAMESPACE, picking_id]
+                    )
+                cr.execute("SELECT set_config('lock_timeout', %s, true)", [previous_lock_timeout])
+        except errors.LockNotAvailable:
+            _logger.warning(
+                f"[扫码锁] 等待扫码锁超时: picking_ids={self.ids}, "
+                f"等待={time.monotonic() - started:.2f}秒"
+            )
+            raise UserError(_(
+                '其他操作员正在保存调拨单 %s 的扫码数据，请稍后重试。'
+            ) % ', '.join(self.sudo().mapped('name')))
+        
+        waited = time.monotonic() - started
+        if waited >= _BARCODE_LOCK_LOG_THRESHOLD:
+            _logger.info(
+                f"[扫码锁] 获取扫码锁: picking_ids={self.ids}, 等待={waited:.2f}秒"
+            )
+        return waited
+
+    @api.model
+    def _bump_barcode_revision(self, picking_ids):
+        """递增调拨单的扫码修订号
+
+        递增时锁定调拨单记录直到事务结束，同一调拨单的修订号只能在前一个取得修订号的事务
+        提交（或回滚）后再递增，因此修订号按提交顺序递增：客户端同步到修订号 N 后，
+        之后提交的变更修订号一定大于 N，增量加载不会遗漏。
+        （全局序列做不到：先取号的事务可能后提交，其修订号小于客户端已同步的修订号。）
+        多张调拨单按ID顺序加锁，避免互相等待造成死锁。
+
+        Args:
+            picking_ids (iterable): 调拨单ID
+
+        Returns:
+            dict: {调拨单ID: 新的扫码修订号}
+        """
+        picking_ids = sorted({picking_id for picking_id in picking_ids if picking_id})
+        if not picking_ids:
+            return {}
+        self.env.cr.execute("""
+            UPDATE stock_picking p
+               SET barcode_revision = COALESCE(p.barcode_revision, 0) + 1
+              FROM (
+                    SELECT id FROM stock_picking
+                     WHERE id = ANY(%s)
+                     ORDER BY id
+                       FOR NO KEY UPDATE
+                   ) AS locked
+             WHERE p.id = locked.id
+         RETURNING p.id, p.barcode_revision
+        """, [picking_ids])
+        revisions = dict(self.env.cr.fetchall())
+        self.browse(picking_ids).invalidate_recordset(['barcode_revision'])
+
+        # 回滚（包括回滚到保存点）后修订号会回到原值，之后可能被其他内容重新使用，
+        # 本事务中按未提交修订号缓存的预填索引不能保留：递增时和事务结束（提交或回滚）后都使其失效
+        self._invalidate_prefilled_lot_index(picking_ids)
+        cr = self.env.cr
+        touched_ids = cr.postcommit.data.setdefault('stock_unit_mgmt.barcode_revision_pickings', set())
+        if not touched_ids:
+            def invalidate_after_transaction():
+                self._invalidate_prefilled_lot_index(touched_ids)
+            cr.postcommit.add(invalidate_after_transaction)
+            cr.postrollback.add(invalidate_after_transaction)
+        touched_ids.update(picking_ids)
+        return revisions
+
+    def _get_barcode_revision(self):
+        """获取调拨单当前的扫码修订号
+
+        Returns:
+            int: 扫码修订号，没有变更过移动行时返回 0
+        """
+        self.ensure_one()
+        self.env.cr.execute("SELECT COALESCE(barcode_revision, 0) FROM stock_picking WHERE id = %s", [self.id])
+        row = self.env.cr.fetchone()
+        return row[0] if row else 0
+
+    def _get_barcode_move_lines_delta(self, since_revision=0, offset=0, limit=None):
+        """获取修订号大于 since_revision 的移动行（扫码界面增量加载/分页加载）
+
+        删除或移到其他调拨单的移动行在 removed_ids 中返回（见 stock.move.line.barcode.removal），
+        客户端从本地删除这些移动行即可，不需要整体重新加载。
+
+        Args:
+            since_revision (int): 客户端已知的修订号，0 表示从头分页加载
+            offset (int): 分页偏移
+            limit (int): 每页行数，None 表示不分页
+
+        Returns:
+            dict: {
+                'revision': 当前修订号,
+                'line_count': 调拨单移动行总数,
+                'removed_ids': since_revision 之后移除的移动行ID（since_revision 为 0 时为空）,
+                'has_more': 是否还有下一页,
+                'records': {'stock.move.line': [移动行数据, ...]},
+            }
+        """
+        self.ensure_one()
+        MoveLine = self.env['stock.move.line']
+        MoveLine.flush_model(['picking_id'])
+        self.env.cr.execute("""
+            SELECT COUNT(*)
+              FROM stock_move_line
+             WHERE picking_id = %s
+        """, [self.id])
+        line_count = self.env.cr.fetchone()[0]
+        revision = self._get_barcode_revision()
+        removed_ids = []
+        if since_revision:
+            removed_ids = self.env['stock.move.line.barcode.removal']._get_removed_since(self.id, since_revision)
+
+        domain = [('picking_id', '=', self.id)]
+        if since_revision:
+            domain.append(('barcode_revision', '>', since_revision))
+        # 多取一行用于判断是否还有下一页
+        lines = MoveLine.search(
+            domain, offset=offset, limit=limit + 1 if limit else None,
+            order='barcode_revision, id'
+        )
+        has_more = bool(limit) and len(lines) > limit
+        if has_more:
+            lines = lines[:limit]
+
+        field_names = MoveLine._get_barcode_fields()
+
+        _logger.info(
+            f"[扫码增量] 获取移动行: picking_id={self.id}, since_revision={since_revision}, "
+            f"offset={offset}, limit={limit}, 返回行数={len(lines)}, 移除行数={len(removed_ids)}, 当前修订号={revision}"
+        )
+        return {
+            'revision': revision,
+            'line_count': line_count,
+            'removed_ids': removed_ids,
+            'has_more': has_more,
+            'records': {
+                'stock.move.line': lines.read(field_names, load=False),
+            },
+        }
+
     def _validate_scanned_data(self):
         """比对扫码数据和预填数据
         
         比对逻辑（按照序列号的方式）：
         1. 预填数据：所有有批次号且已保存的记录（lot_name 不为空）
-        2. 扫码数据：所有有批次号且 qty_done > 0 的记录（表示已扫码验证）
+        2. 扫码数据：已登记扫码记录（stock.lot.scan）或已拣货且数量 > 0 的记录（即 qty_done > 0，表示已扫码验证）
         3. 比对批次号列表是否一致：
            - 预填的批次号必须都被扫码（qty_done > 0）
            - 扫码的批次号必须在预填列表中
@@ -111,124 +387,36 @@ class StockPicking(models.Model):
             f"调拨单ID={self.id}"
         )
         
-        # **关键修复**：在验证前，同步会话变量与数据库状态
-        # 如果数据库中不存在记录，但从会话变量中看到该批次号，说明记录已被删除
-        # 需要从会话变量中移除该批次号，避免误判为重复扫描
-        try:
-            # **关键修复**：在模型中访问 request 需要通过 odoo.http.request
-            # 而且需要检查是否有 HTTP 请求上下文（在后台任务或 cron 中可能没有）
-            try:
-                from odoo.http import request
-                if request and hasattr(request, 'session'):
-                    session = request.session
-                else:
-                    # 没有 HTTP 请求上下文，跳过会话操作
-                    _logger.debug(f"[验证比对] 没有 HTTP 请求上下文，跳过会话变量同步: picking_id={self.id}")
-                    session = None
-            except (ImportError, AttributeError, RuntimeError):
-                # 无法导入 request 或没有请求上下文，跳过会话操作
-                _logger.debug(f"[验证比对] 无法访问 request，跳过会话变量同步: picking_id={self.id}")
-                session = None
-            
-            if session:
-                scanned_lots_key = f'scanned_lots_{self.id}'
-                scanned_lots = list(session.get(scanned_lots_key, []) or [])
-                
-                if scanned_lots:
-                    # 检查每个批次号是否在数据库中存在
-                    # 查询所有有批次号的移动行
-                    all_lines_with_lot = self.env['stock.move.line'].search([
-                        ('picking_id', '=', self.id),
-                        ('lot_name', '!=', False),
-                        ('lot_name', '!=', ''),
-                    ])
-                    
-                    # 获取数据库中所有存在的批次号（标准化后），且 qty_done > 0
-                    # **关键修复**：只有 qty_done > 0 的批次号才应该保留在会话变量中
-                    # qty_done = 0 的批次号是包裹操作，不应该在会话中
-                    db_lot_names_with_qty_done = set()
-                    for line in all_lines_with_lot:
-                        if line.lot_name:
-                            try:
-                                # 清除缓存，读取最新的 qty_done
-                                line.invalidate_recordset(['qty_done'])
-                                read_result = line.read(['qty_done'])
-                                qty_done = read_result[0].get('qty_done', 0.0) or 0.0 if read_result else 0.0
-                                
-                                # 只有 qty_done > 0 的批次号才应该保留在会话变量中
-                                if qty_done > 0:
-                                    db_lot_names_with_qty_done.add(line.lot_name.strip().lower())
-                            except Exception as e:
-                                # 如果读取失败，使用属性访问
-                                try:
-                                    qty_done = line.qty_done or 0.0
-                                    if qty_done > 0:
-                                        db_lot_names_with_qty_done.add(line.lot_name.strip().lower())
-                                except:
-                                    # 如果还是失败，保守处理：不添加到集合中
-                                    pass
-                    
-                    # 从会话变量中移除数据库中不存在的批次号，或 qty_done = 0 的批次号
-                    original_scanned_lots = scanned_lots.copy()
-                    scanned_lots = [lot for lot in scanned_lots if lot in db_lot_names_with_qty_done]
-                    
-                    if len(scanned_lots) != len(original_scanned_lots):
-                        session[scanned_lots_key] = scanned_lots
-                        session.modified = True
-                        removed_lots = set(original_scanned_lots) - set(scanned_lots)
-                        _logger.info(
-                            f"[验证比对] 同步会话变量: picking_id={self.id}, "
-                            f"从会话中移除的批次号={list(removed_lots)} "
-                            f"（数据库中不存在或 qty_done=0）, "
-                            f"更新后的会话列表={scanned_lots}"
-                        )
-        except Exception as e:
-            _logger.warning(f"[验证比对] 同步会话变量时出错: {str(e)}")
+        # **性能优化**：一次聚合查询得到每个批次号（标准化后）的预填信息和扫码状态
+        # 扫码数据：已登记扫码记录（stock.lot.scan），或已拣货且数量 > 0 的记录（表示已扫码验证）
+        # 注意：qty_done 由 stock_barcode 按 picked/quantity 计算，不存储，SQL 中只能使用 picked 和 quantity
+        # **关键修改**：按照序列号的方式，每个批次号对应 1.0 单位，只需要检查批次号是否存在，不需要检查数量
+        self.env['stock.move.line'].flush_model(['lot_name', 'lot_name_normalized', 'move_id', 'picked', 'quantity', 'product_id'])
+        self.env['stock.move'].flush_model(['picking_id'])
+        self.env['stock.lot.scan'].flush_model()
+        self.env.cr.execute("""
+            SELECT sml.lot_name_normalized,
+                   MIN(btrim(sml.lot_name)) AS lot_name,
+                   MIN(sml.product_id) AS product_id,
+                   bool_or((sml.picked AND COALESCE(sml.quantity, 0) > 0) OR scan.id IS NOT NULL) AS scanned
+              FROM stock_move_line sml
+              JOIN stock_move sm ON sm.id = sml.move_id
+              LEFT JOIN stock_lot_scan scan
+                     ON scan.picking_id = sm.picking_id
+                    AND scan.lot_name_normalized = sml.lot_name_normalized
+                    AND scan.state = 'scanned'
+             WHERE sm.picking_id = %s
+               AND sml.lot_name_normalized IS NOT NULL
+             GROUP BY sml.lot_name_normalized
+        """, [self.id])
+        lot_rows = self.env.cr.fetchall()
         
-        # **关键修改**：按照序列号的方式收集数据
-        # 每个批次号对应 1.0 单位，不需要累计数量
-        # 预填数据：所有有批次号的记录（lot_name 不为空）
-        prefilled_lot_names = set()  # 预填的批次号集合
-        prefilled_lot_info = {}  # {批次号: {'product_id': 产品ID, 'product_name': 产品名称, 'move_line_ids': [记录ID列表]}}
-        
-        # 收集扫码数据：所有有批次号且 qty_done > 0 的记录（表示已扫码验证）
-        scanned_lot_names = set()  # 扫码的批次号集合
-        scanned_lot_info = {}  # {批次号: {'product_id': 产品ID, 'product_name': 产品名称, 'move_line_ids': [记录ID列表]}}
-        
-        for move in self.move_ids:
-            for line in move.move_line_ids:
-                if not line.lot_name:
-                    continue
-                
-                lot_name = line.lot_name.strip()
-                if not lot_name:
-                    continue
-                
-                product_id = line.product_id.id
-                product_name = line.product_id.name
-                
-                # **关键修改**：按照序列号的方式，每个批次号对应 1.0 单位
-                # 预填数据：所有有批次号的记录
-                if lot_name not in prefilled_lot_info:
-                    prefilled_lot_info[lot_name] = {
-                        'product_id': product_id,
-                        'product_name': product_name,
-                        'move_line_ids': [],
-                    }
-                prefilled_lot_info[lot_name]['move_line_ids'].append(line.id)
-                prefilled_lot_names.add(lot_name)
-                
-                # 扫码数据：所有有批次号且 qty_done > 0 的记录（表示已扫码验证）
-                # **关键修改**：按照序列号的方式，只需要检查批次号是否存在，不需要检查数量
-                if line.qty_done > 0:
-                    if lot_name not in scanned_lot_info:
-                        scanned_lot_info[lot_name] = {
-                            'product_id': product_id,
-                            'product_name': product_name,
-                            'move_line_ids': [],
-                        }
-                    scanned_lot_info[lot_name]['move_line_ids'].append(line.id)
-                    scanned_lot_names.add(lot_name)
+        # 预填数据：所有有批次号的记录；扫码数据：其中已扫码的批次号
+        prefilled_lot_info = {
+            lot_name: product_id for _lot_key, lot_name, product_id, _scanned in lot_rows
+        }  # {批次号: 产品ID}
+        prefilled_lot_names = set(prefilled_lot_info)
+        scanned_lot_names = {lot_name for _lot_key, lot_name, _product_id, scanned in lot_rows if scanned}
         
         _logger.info(
             f"[验证比对] 预填批次号: {sorted(prefilled_lot_names)}, "
@@ -249,8 +437,9 @@ class StockPicking(models.Model):
         # 检查是否有未扫码的批次号（预填了但没有 qty_done > 0）
         missing_scanned = prefilled_lot_names - scanned_lot_names
         if missing_scanned:
+            product_names = self._get_lot_product_names(prefilled_lot_info, missing_scanned)
             missing_list = '\n'.join([
-                f"  - {lot_name} ({prefilled_lot_info[lot_name]['product_name']})"
+                f"  - {lot_name} ({product_names[lot_name]})"
                 for lot_name in sorted(missing_scanned)
             ])
             error_msg = _(
@@ -268,8 +457,9 @@ class StockPicking(models.Model):
         # 检查是否有扫码了但不在预填列表中的批次号
         extra_scanned = scanned_lot_names - prefilled_lot_names
         if extra_scanned:
+            product_names = self._get_lot_product_names(prefilled_lot_info, extra_scanned)
             extra_list = '\n'.join([
-                f"  - {lot_name} ({scanned_lot_info[lot_name]['product_name']})"
+                f"  - {lot_name} ({product_names[lot_name]})"
                 for lot_name in sorted(extra_scanned)
             ])
             error_msg = _(
@@ -295,3 +485,18 @@ class StockPicking(models.Model):
             f"批次号列表一致（按照序列号方式，每个批次号对应 1.0 单位）"
         )
 
+    def _get_lot_product_names(self, lot_product_map, lot_names):
+        """获取批次号对应的产品名称（只读取错误提示中需要显示的产品）
+        
+        Args:
+            lot_product_map (dict): {批次号: 产品ID}
+            lot_names (iterable): 需要显示的批次号
+        
+        Returns:
+            dict: {批次号: 产品名称}
+        """
+        products = self.env['product.product'].browse(
+            {lot_product_map.get(lot_name) for lot_name in lot_names} - {None}
+        )
+        name_by_id = {product.id: product.name for product in products}
+        return {lot_name: name_by_id.get(lot_product_map.get(lot_name), '') for lot_name in lot_names}
@@ -60,18 +60,113 @@ class StockQuant(models.Model):
         help='根据库存数量（面积）和产品宽度自动计算的长度'
     )
 
+    def init(self):
+        """本模型的列创建后，创建产品库存汇总的 stock_quant 触发器（见 product.template.stock.summary）"""
+        super(StockQuant, self).init()
+        self.env['product.template.stock.summary']._setup_quant_trigger()
+
     @api.depends('lot_id', 'product_id', 'quantity', 'location_id')
     def _compute_lot_unit_info(self):
-        """从批次记录中获取单位信息，累加所有入库，减去所有出库
+        """计算单位数量、单位名称和合同号
+        
+        **性能优化**：默认从批次单位余额（stock.lot.unit.balance）读取累计的入库/出库单位数量，
+        每个库存数量记录只需 O(1) 读取；系统参数 stock_unit_mgmt.use_lot_unit_ledger = False 时
+        回退为按历史移动行计算（_compute_lot_unit_info_from_history）。
+        """
+        if not self:
+            return
+        use_ledger = self.env['ir.config_parameter'].sudo().get_param(
+            'stock_unit_mgmt.use_lot_unit_ledger', 'True'
+        ).lower() != 'false'
+        if not use_ledger:
+            self._compute_lot_unit_info_from_history()
+            return
+        
+        lot_quants = self.filtered(lambda q: q.product_id and q.lot_id)
+        for quant in self - lot_quants:
+            if not quant.product_id:
+                quant.lot_unit_name = False
+                quant.lot_unit_name_custom = False
+                quant.lot_quantity = 0.0
+                continue
+            # 没有批次号时，从产品配置获取单位信息，单位数量设为库存数量
+            unit_name = self._get_default_lot_unit_name(quant.product_id.product_tmpl_id)
+            quant.lot_unit_name = unit_name
+            if not unit_name:
+                quant.lot_unit_name_custom = False
+            quant.lot_quantity = quant.quantity if unit_name and quant.quantity > 0 else 0.0
+        
+        if not lot_quants:
+            return
+        
+        balances = self.env['stock.lot.unit.balance']._get_balances([
+            (quant.product_id.id, quant.lot_id.id, quant.location_id.id, quant.owner_id.id)
+            for quant in lot_quants
+        ])
+        for quant in lot_quants:
+            balance = balances.get(
+                (quant.product_id.id, quant.lot_id.id, quant.location_id.id, quant.owner_id.id or 0)
+            )
+            if not balance:
+                # 没有已完成的移动行，从产品配置获取单位名称
+                quant.lot_unit_name = self._get_default_lot_unit_name(quant.product_id.product_tmpl_id)
+                quant.lot_unit_name_custom = False
+                quant.lot_quantity = 0.0
+                continue
+            
+            total_incoming = balance['in_lot_quantity']
+            current_lot_quantity = total_incoming - balance['out_lot_quantity']
+            # 如果还有库存但单位数量为0或负数，说明可能出库时没有填写单位数量，按比例计算
+            if quant.quantity > 0 and current_lot_quantity <= 0 and total_incoming > 0 and balance['in_qty'] > 0:
+                current_lot_quantity = (quant.quantity / balance['in_qty']) * total_incoming
+            
+            if balance['lot_unit_name']:
+                quant.lot_unit_name = balance['lot_unit_name']
+                quant.lot_unit_name_custom = balance['lot_unit_name_custom']
+            else:
+                quant.lot_unit_name = self._get_default_lot_unit_name(quant.product_id.product_tmpl_id)
+                quant.lot_unit_name_custom = False
+            
+            # 合同号：优先最新入库移动行的合同号，其次最新移动行的合同号，都没有时保持原值
+            if balance['in_move_line_id'] and balance['in_contract_no']:
+                quant.contract_no = balance['in_contract_no']
+            elif balance['last_contract_no']:
+                quant.contract_no = balance['last_contract_no']
+            
+            quant.lot_quantity = max(0.0, current_lot_quantity)
+    
+    @api.model
+    def _get_default_lot_unit_name(self, product_tmpl):
+        """从产品配置获取默认单位名称
+        
+        Args:
+            product_tmpl (product.template): 产品模板
+        
+        Returns:
+            str: 单位名称，没有配置时返回 False
+        """
+        if not hasattr(product_tmpl, 'get_unit_config_for_stock_move'):
+            return False
+        try:
+            unit_configs = product_tmpl.get_unit_config_for_stock_move()
+        except Exception:
+            return False
+        return unit_configs[0]['name'] if unit_configs else False
+    
+    def _compute_lot_unit_info_from_history(self):
+        """从历史移动行计算单位信息，累加所有入库，减去所有出库
+        
+        **性能优化**：用两条聚合查询代替逐条加载移动行和逐个库存数量的 filtered：
+        • 按 (产品, 批次号, 库位, 方向) 汇总入库/出库的单位数量、数量和最新入库合同号
+        • 按 (产品, 批次号) 获取最新的单位名称和合同号（原逻辑不限库位）
+        调试日志开关只读取一次。
         
         注意：由于计算字段的依赖关系限制，当移动行发生变化时，
         需要确保相关的 stock_quant 记录被标记为需要重新计算。
         """
-        # 优化：批量加载所有相关的移动行，避免N+1查询
         if not self:
             return
         
-        # 收集所有需要查询的 lot_id 和 product_id
         lot_ids = self.filtered('lot_id').mapped('lot_id').ids
         product_ids = self.mapped('product_id').ids
         
@@ -83,22 +178,75 @@ class StockQuant(models.Model):
                 quant.lot_quantity = 0.0
             return
         
-        # 一次性查询所有相关的移动行
-        all_move_lines = self.env['stock.move.line'].search([
-            ('lot_id', 'in', lot_ids),
-            ('product_id', 'in', product_ids),
-            ('state', '=', 'done')
+        # 使用配置参数控制调试日志（生产环境默认关闭），整个计算只读取一次
+        enable_debug_logging = self.env['ir.config_parameter'].sudo().get_param(
+            'stock_unit_mgmt.enable_debug_logging', 'False'
+        ).lower() == 'true'
+        location_ids = self.mapped('location_id').ids
+        
+        self.env['stock.move.line'].flush_model([
+            'product_id', 'lot_id', 'location_id', 'location_dest_id', 'state',
+            'lot_quantity', 'quantity', 'lot_unit_name', 'lot_unit_name_custom', 'contract_no',
         ])
+        # 入库是指 destination 是当前 quant 的位置，出库是指 source 是当前 quant 的位置
+        self.env.cr.execute("""
+            SELECT sml.product_id, sml.lot_id, d.location_id, d.direction,
+                   COUNT(*) AS line_count,
+                   COUNT(*) FILTER (WHERE sml.lot_quantity > 0) AS lot_qty_line_count,
+                   COALESCE(SUM(sml.lot_quantity) FILTER (WHERE sml.lot_quantity > 0), 0) AS lot_quantity,
+                   COALESCE(SUM(sml.quantity), 0) AS quantity,
+                   (array_agg(sml.contract_no ORDER BY sml.id DESC))[1] AS latest_contract_no
+              FROM stock_move_line sml
+             CROSS JOIN LATERAL (
+                   VALUES ('in', sml.location_dest_id), ('out', sml.location_id)
+             ) AS d(direction, location_id)
+             WHERE sml.state = 'done'
+               AND sml.lot_id = ANY(%s)
+               AND sml.product_id = ANY(%s)
+               AND d.location_id = ANY(%s)
+             GROUP BY sml.product_id, sml.lot_id, d.location_id, d.direction
+        """, [lot_ids, product_ids, location_ids])
+        totals = {}  # {(产品ID, 批次号ID, 库位ID): {'in': {...}, 'out': {...}}}
+        for (product_id, lot_id, location_id, direction, line_count, lot_qty_line_count,
+             lot_quantity, quantity, latest_contract_no) in self.env.cr.fetchall():
+            totals.setdefault((product_id, lot_id, location_id), {})[direction] = {
+                'line_count': line_count,
+                'lot_qty_line_count': lot_qty_line_count,
+                'lot_quantity': lot_quantity,
+                'quantity': quantity,
+                'latest_contract_no': latest_contract_no,
+            }
+        
+        # 取最新的移动行来获取单位名称和合同号（不限库位）
+        self.env.cr.execute("""
+            SELECT sml.product_id, sml.lot_id,
+                   COUNT(*) AS line_count,
+                   (array_agg(sml.lot_unit_name ORDER BY sml.id DESC)
+                        FILTER (WHERE sml.lot_unit_name IS NOT NULL))[1] AS lot_unit_name,
+                   (array_agg(sml.lot_unit_name_custom ORDER BY sml.id DESC)
+                        FILTER (WHERE sml.lot_unit_name IS NOT NULL))[1] AS lot_unit_name_custom,
+                   (array_agg(sml.contract_no ORDER BY sml.id DESC))[1] AS latest_contract_no
+              FROM stock_move_line sml
+             WHERE sml.state = 'done'
+               AND sml.lot_id = ANY(%s)
+               AND sml.product_id = ANY(%s)
+             GROUP BY sml.product_id, sml.lot_id
+        """, [lot_ids, product_ids])
+        latest_by_lot = {
+            (product_id, lot_id): {
+                'line_count': line_count,
+                'lot_unit_name': lot_unit_name,
+                'lot_unit_name_custom': lot_unit_name_custom,
+                'latest_contract_no': latest_contract_no,
+            }
+            for product_id, lot_id, line_count, lot_unit_name, lot_unit_name_custom, latest_contract_no
+            in self.env.cr.fetchall()
+        }
         
-        # 建立索引：按 (lot_id, product_id) 索引
-        # 用于快速查找相关的移动行
-        # 注意：存储为 recordset，而不是 list
-        move_lines_by_key = {}
-        for ml in all_move_lines:
-            key = (ml.lot_id.id, ml.product_id.id)
-            if key not in move_lines_by_key:
-                move_lines_by_key[key] = self.env['stock.move.line']  # 初始化为空 recordset
-            move_lines_by_key[key] |= ml  # 使用 |= 操作符添加到 recordset
+        empty_totals = {
+            'line_count': 0, 'lot_qty_line_count': 0, 'lot_quantity': 0.0,
+            'quantity': 0.0, 'latest_contract_no': None,
+        }
         
         # 处理每个库存记录
         for quant in self:
@@ -110,192 +258,71 @@ class StockQuant(models.Model):
             
             # 如果没有批次号，尝试从产品配置获取单位信息
             if not quant.lot_id:
-                product_tmpl = quant.product_id.product_tmpl_id
-                if hasattr(product_tmpl, 'get_unit_config_for_stock_move'):
-                    try:
-                        unit_configs = product_tmpl.get_unit_config_for_stock_move()
-                        if unit_configs:
-                            config = unit_configs[0]
-                            quant.lot_unit_name = config['name']
-                            # 没有批次号时，单位数量设为库存数量（如果有配置）
-                            quant.lot_quantity = quant.quantity if quant.quantity > 0 else 0.0
-                        else:
-                            quant.lot_unit_name = False
-                            quant.lot_unit_name_custom = False
-                            quant.lot_quantity = 0.0
-                    except Exception:
-                        quant.lot_unit_name = False
-                        quant.lot_unit_name_custom = False
-                        quant.lot_quantity = 0.0
-                else:
-                    quant.lot_unit_name = False
+                unit_name = self._get_default_lot_unit_name(quant.product_id.product_tmpl_id)
+                quant.lot_unit_name = unit_name
+                if not unit_name:
                     quant.lot_unit_name_custom = False
-                    quant.lot_quantity = 0.0
+                # 没有批次号时，单位数量设为库存数量（如果有配置）
+                quant.lot_quantity = quant.quantity if unit_name and quant.quantity > 0 else 0.0
                 continue
             
             try:
-                # 从批量加载的移动行中获取当前记录相关的移动行
-                key = (quant.lot_id.id, quant.product_id.id)
-                relevant_move_lines = move_lines_by_key.get(key, self.env['stock.move.line'])
-                
-                # 筛选入库和出库移动行
-                # 注意：入库是指 destination 是当前 quant 的位置，出库是指 source 是当前 quant 的位置
-                # 直接使用位置ID匹配（因为 stock.quant 的位置应该是精确的）
-                incoming_move_lines = relevant_move_lines.filtered(
-                    lambda ml: ml.location_dest_id.id == quant.location_id.id
-                )
-                
-                outgoing_move_lines = relevant_move_lines.filtered(
-                    lambda ml: ml.location_id.id == quant.location_id.id
-                )
-                
-                # 累加入库的单位数量（只累加有 lot_quantity 的移动行）
-                # 重要：确保读取所有移动行的 lot_quantity 值
-                incoming_with_lot_qty = incoming_move_lines.filtered(
-                    lambda ml: ml.lot_quantity and ml.lot_quantity > 0
-                )
-                total_incoming = 0.0
-                for ml in incoming_with_lot_qty:
-                    total_incoming += ml.lot_quantity
-                
-                # 累加出库的单位数量（只累加有 lot_quantity 的移动行）
-                outgoing_with_lot_qty = outgoing_move_lines.filtered(
-                    lambda ml: ml.lot_quantity and ml.lot_quantity > 0
-                )
-                total_outgoing = 0.0
-                for ml in outgoing_with_lot_qty:
-                    total_outgoing += ml.lot_quantity
+                key_totals = totals.get((quant.product_id.id, quant.lot_id.id, quant.location_id.id), {})
+                incoming = key_totals.get('in', empty_totals)
+                outgoing = key_totals.get('out', empty_totals)
+                latest = latest_by_lot.get((quant.product_id.id, quant.lot_id.id))
                 
-                # 计算当前剩余的单位数量
+                # 累加入库/出库的单位数量（只累加有 lot_quantity 的移动行）
+                total_incoming = incoming['lot_quantity']
+                total_outgoing = outgoing['lot_quantity']
                 current_lot_quantity = total_incoming - total_outgoing
                 
-                # 调试日志：记录详细信息，特别是当没有单位信息时
-                product_code = quant.product_id.default_code or quant.product_id.name
-                lot_name = quant.lot_id.name if quant.lot_id else 'None'
-                # 检查是否缺少单位信息（在计算完成后检查）
-                # 使用配置参数控制调试日志（生产环境默认关闭）
-                enable_debug_logging = self.env['ir.config_parameter'].sudo().get_param(
-                    'stock_unit_mgmt.enable_debug_logging', 'False'
-                ).lower() == 'true'
-                should_log = enable_debug_logging and (
-                    (not current_lot_quantity or current_lot_quantity <= 0) and quant.quantity > 0
-                )
-                
-                if should_log:
-                    # 记录详细信息用于调试（使用 DEBUG 级别）
+                if enable_debug_logging:
                     _logger.debug(
-                        _("[批次数量计算] 产品=%s, 批次=%s, 位置=%s, 位置ID=%s, "
-                          "库存数量=%s, 所有移动行数=%s, 入库移动行数=%s, "
-                          "有数量入库行数=%s, 总入库数量=%s, 总出库数量=%s, 计算出的单位数量=%s"),
-                        product_code, lot_name,
-                        quant.location_id.name if quant.location_id else 'None',
-                        quant.location_id.id if quant.location_id else 'None',
-                        quant.quantity, len(relevant_move_lines),
-                        len(incoming_move_lines), len(incoming_with_lot_qty),
-                        total_incoming, total_outgoing, current_lot_quantity
+                        f"[批次数量计算] 批次={quant.lot_id.name}, "
+                        f"位置={quant.location_id.name if quant.location_id else 'None'}, "
+                        f"库存数量={quant.quantity}, "
+                        f"所有移动行数={latest['line_count'] if latest else 0}, "
+                        f"入库移动行数={incoming['line_count']}, "
+                        f"有数量入库行数={incoming['lot_qty_line_count']}, "
+                        f"总入库数量={total_incoming}, "
+                        f"总出库数量={total_outgoing}"
                     )
-                    # 记录移动行详情
-                    if relevant_move_lines:
-                        for ml in relevant_move_lines[:5]:  # 记录前5条
-                            _logger.debug(
-                                _("  -> 移动行 %s: lot_quantity=%s, lot_unit_name=%s, "
-                                  "location_dest=%s(ID:%s), location_id=%s(ID:%s), state=%s"),
-                                ml.id, ml.lot_quantity, ml.lot_unit_name,
-                                ml.location_dest_id.name if ml.location_dest_id else 'None',
-                                ml.location_dest_id.id if ml.location_dest_id else 'None',
-                                ml.location_id.name if ml.location_id else 'None',
-                                ml.location_id.id if ml.location_id else 'None',
-                                ml.state
-                            )
-                    else:
-                        _logger.debug(_("  -> 没有找到相关的移动行"))
-                
-                # 详细调试日志（仅在启用详细日志时输出）
-                if self.env['ir.config_parameter'].sudo().get_param('stock_unit_mgmt.enable_debug_logging', 'False').lower() == 'true':
-                    incoming_details = [(ml.id, ml.lot_quantity) for ml in incoming_with_lot_qty]
-                    _logger.debug(f"[批次数量计算] 批次={quant.lot_id.name if quant.lot_id else 'None'}, "
-                                 f"位置={quant.location_id.name if quant.location_id else 'None'}, "
-                                 f"所有移动行数={len(relevant_move_lines)}, "
-                                 f"入库移动行数={len(incoming_move_lines)}, "
-                                 f"有数量入库行数={len(incoming_with_lot_qty)}, "
-                                 f"总入库数量={total_incoming}, "
-                                 f"总出库数量={total_outgoing}")
                 
                 # 如果还有库存但单位数量为0或负数，说明可能出库时没有填写单位数量
                 # 在这种情况下，按比例计算
                 if quant.quantity > 0 and current_lot_quantity <= 0 and total_incoming > 0:
                     # 找到总的入库数量
-                    total_incoming_qty = sum(incoming_move_lines.mapped('qty_done') or [0.0]) or \
-                                        sum(incoming_move_lines.mapped('quantity') or [0.0])
+                    total_incoming_qty = incoming['quantity']
                     if total_incoming_qty > 0:
                         # 按比例计算：当前库存数量 / 总入库数量 * 总入库单位数量
                         current_lot_quantity = (quant.quantity / total_incoming_qty) * total_incoming
                 
-                # 取最新的移动行来获取单位名称（优先入库，其次出库）
-                latest_move_line = relevant_move_lines.filtered(
-                    lambda ml: ml.lot_unit_name
-                ).sorted(key='id', reverse=True)[:1]
-                
-                # 获取单位名称
-                if latest_move_line:
-                    quant.lot_unit_name = latest_move_line.lot_unit_name
-                    quant.lot_unit_name_custom = latest_move_line.lot_unit_name_custom
-                elif incoming_with_lot_qty:
-                    # 如果没有移动行但有入库数据，尝试从入库移动行获取
-                    latest_incoming = incoming_with_lot_qty.sorted(key='id', reverse=True)[:1]
-                    if latest_incoming:
-                        quant.lot_unit_name = latest_incoming.lot_unit_name
-                        quant.lot_unit_name_custom = latest_incoming.lot_unit_name_custom
-                    else:
-                        quant.lot_unit_name = False
-                        quant.lot_unit_name_custom = False
+                # 获取单位名称：最新的有单位名称的移动行
+                if latest and latest['lot_unit_name']:
+                    quant.lot_unit_name = latest['lot_unit_name']
+                    quant.lot_unit_name_custom = latest['lot_unit_name_custom']
+                elif incoming['lot_qty_line_count']:
+                    # 有入库数据但所有移动行都没有单位名称
+                    quant.lot_unit_name = False
+                    quant.lot_unit_name_custom = False
                 else:
                     # 如果找不到移动行，尝试从产品配置获取
-                    product_tmpl = quant.product_id.product_tmpl_id
-                    if hasattr(product_tmpl, 'get_unit_config_for_stock_move'):
-                        try:
-                            unit_configs = product_tmpl.get_unit_config_for_stock_move()
-                            if unit_configs:
-                                config = unit_configs[0]
-                                quant.lot_unit_name = config['name']
-                            else:
-                                quant.lot_unit_name = False
-                                quant.lot_unit_name_custom = False
-                        except Exception:
-                            quant.lot_unit_name = False
-                            quant.lot_unit_name_custom = False
-                    else:
-                        quant.lot_unit_name = False
-                        quant.lot_unit_name_custom = False
+                    quant.lot_unit_name = self._get_default_lot_unit_name(quant.product_id.product_tmpl_id)
+                    quant.lot_unit_name_custom = False
                 
                 # **关键修复**：从移动行获取合同号
-                # 优先从入库移动行获取，如果没有则从出库移动行获取
-                if incoming_move_lines:
-                    # 从入库移动行获取合同号（优先最新的）
-                    latest_incoming = incoming_move_lines.sorted(key='id', reverse=True)[:1]
-                    if latest_incoming and latest_incoming.contract_no:
-                        quant.contract_no = latest_incoming.contract_no
-                    elif relevant_move_lines:
-                        # 如果入库移动行没有合同号，尝试从所有移动行获取
-                        latest_all = relevant_move_lines.sorted(key='id', reverse=True)[:1]
-                        if latest_all and latest_all.contract_no:
-                            quant.contract_no = latest_all.contract_no
-                        else:
-                            # 如果所有移动行都没有合同号，保持原值或设为 False
-                            pass
-                elif relevant_move_lines:
-                    # 如果没有入库移动行，尝试从所有移动行获取
-                    latest_all = relevant_move_lines.sorted(key='id', reverse=True)[:1]
-                    if latest_all and latest_all.contract_no:
-                        quant.contract_no = latest_all.contract_no
+                # 优先从最新的入库移动行获取，如果没有则从所有移动行中最新的获取，都没有时保持原值
+                if incoming['line_count'] and incoming['latest_contract_no']:
+                    quant.contract_no = incoming['latest_contract_no']
+                elif latest and latest['latest_contract_no']:
+                    quant.contract_no = latest['latest_contract_no']
                 
                 # 设置单位数量（确保不为负数）
                 quant.lot_quantity = max(0.0, current_lot_quantity)
             except Exception as e:
                 # 错误处理：确保即使出错也不会导致系统崩溃
-                import logging
-                _log = logging.getLogger(__name__)
-                _log.error(
+                _logger.error(
                     f"[批次数量计算错误] 批次={quant.lot_id.name if quant.lot_id else 'None'}, "
                     f"位置={quant.location_id.name if quant.location_id else 'None'}, "
                     f"错误={str(e)}",
@@ -318,7 +345,7 @@ class StockQuant(models.Model):
             else:
                 quant.lot_unit_display = ""
     
-    @api.depends('quantity', 'product_id', 'product_id.product_tmpl_id.product_width', 'product_id.product_tmpl_id.uom_id')
+    @api.depends('quantity', 'product_id')
     def _compute_calculated_length(self):
         """根据面积和宽度计算长度
         
@@ -327,79 +354,78 @@ class StockQuant(models.Model):
         1. 产品主单位是"平米"或"平方米"
         2. 产品配置了宽度
         3. 库存数量（面积）大于0
+        
+        产品宽度、主单位变化时不通过 ORM 逐条重新计算，由产品模板 write 调用
+        _update_calculated_length 一条 SQL 批量更新。
         """
+        # **性能优化**：产品宽度变化时可能有大量库存数量重新计算，
+        # 按产品计算一次宽度系数（平米单位判断、宽度检查），每条记录只做一次除法
+        width_by_product = {
+            product.id: self._get_length_width_m(product)
+            for product in self.product_id
+        }
+        
+        computed = 0
         for quant in self:
-            if not quant.product_id or not quant.quantity or quant.quantity <= 0:
-                quant.calculated_length_m = 0.0
-                continue
-            
-            product = quant.product_id
-            product_tmpl = product.product_tmpl_id
-            
-            # 检查主单位是否是平米
-            # 从 product.product 获取主单位（字段名是 product_uom，不是 product_uom_id）
-            uom_id = product.product_uom if hasattr(product, 'product_uom') else product_tmpl.uom_id
-            if not uom_id:
-                quant.calculated_length_m = 0.0
-                continue
-            
-            # 获取单位名称（支持多语言和JSON格式）
-            uom_name = ''
-            try:
-                # 尝试获取当前语言环境下的名称
-                lang = self.env.context.get('lang', 'zh_CN')
-                uom_name = uom_id.with_context(lang=lang).name or ''
-                # 如果获取不到，尝试直接获取
-                if not uom_name:
-                    uom_name = uom_id.name or ''
-                # 如果是字典格式（JSON），尝试提取中文
-                if isinstance(uom_name, dict):
-                    uom_name = uom_name.get('zh_CN') or uom_name.get('en_US') or str(uom_name)
-                uom_name = str(uom_name)
-            except Exception as e:
-                _logger.warning(f"[计算长度] 获取单位名称失败: {str(e)}")
-                uom_name = str(uom_id.name or '')
-            
-            # 支持多种平米单位名称
-            uom_name_lower = uom_name.lower()
-            is_sqm_unit = (
-                '平米' in uom_name or 
-                '平方米' in uom_name or 
-                'sqm' in uom_name_lower or
-                'm²' in uom_name or
-                'm2' in uom_name_lower or
-                # 检查单位类别名称
-                (hasattr(uom_id, 'category_id') and uom_id.category_id and 
-                 ('面积' in (uom_id.category_id.name or '') or 
-                  'area' in (uom_id.category_id.name or '').lower()))
-            )
-            
-            # 调试日志
-            if not is_sqm_unit:
-                _logger.debug(f"[计算长度] 产品={product.name}, 单位名称={uom_name}, 单位ID={uom_id.id}, 不是平米单位")
-            
-            if not is_sqm_unit:
-                quant.calculated_length_m = 0.0
-                continue
-            
-            # 检查产品是否有宽度配置
-            if not product_tmpl.product_width or product_tmpl.product_width <= 0:
-                _logger.debug(f"[计算长度] 产品={product.name}, 没有配置宽度或宽度为0")
-                quant.calculated_length_m = 0.0
-                continue
-            
-            try:
+            width_m = width_by_product.get(quant.product_id.id, 0.0)
+            quantity = quant.quantity
+            if width_m > 0 and quantity and quantity > 0:
                 # 计算长度：面积(㎡) / (宽度(mm) / 1000) = 长度(m)
-                # quantity 是面积（平米），product_width 是宽度（毫米）
-                width_m = product_tmpl.product_width / 1000.0  # 转换为米
-                if width_m > 0:
-                    length_m = quant.quantity / width_m
-                    quant.calculated_length_m = round(length_m, 2)
-                    
-                    # 调试日志
-                    _logger.info(f"[计算长度] 产品={product.name}, 面积={quant.quantity}㎡, 宽度={product_tmpl.product_width}mm, 计算长度={quant.calculated_length_m}m")
-                else:
-                    quant.calculated_length_m = 0.0
-            except (ZeroDivisionError, TypeError, ValueError) as e:
-                _logger.error(f"[计算长度错误] 产品={product.name}, 错误={str(e)}", exc_info=True)
+                quant.calculated_length_m = round(quantity / width_m, 2)
+                computed += 1
+            else:
                 quant.calculated_length_m = 0.0
+        if computed:
+            _logger.debug(f"[计算长度] 批量计算 {len(self)} 条库存数量，其中 {computed} 条按宽度计算长度")
+
+    @api.model
+    def _update_calculated_length(self, products):
+        """产品宽度或主单位变化后批量更新计算长度
+        
+        **性能优化**：热门产品可能有上万条库存数量，按产品计算宽度系数后用一条 UPDATE 写回，
+        不把全部库存数量加载到 ORM 缓存逐条重新计算。
+        
+        Args:
+            products: product.product 记录集
+        """
+        if not products:
+            return
+        product_ids = products.ids
+        widths = [self._get_length_width_m(product) for product in products]
+        self.flush_model(['quantity', 'product_id', 'calculated_length_m'])
+        self.env.cr.execute("""
+            UPDATE stock_quant q
+               SET calculated_length_m = CASE
+                       WHEN v.width_m > 0 AND q.quantity > 0 THEN ROUND((q.quantity / v.width_m)::numeric, 2)
+                       ELSE 0
+                   END
+              FROM unnest(%s::int[], %s::float8[]) AS v(product_id, width_m)
+             WHERE q.product_id = v.product_id
+               AND q.calculated_length_m IS DISTINCT FROM CASE
+                       WHEN v.width_m > 0 AND q.quantity > 0 THEN ROUND((q.quantity / v.width_m)::numeric, 2)
+                       ELSE 0
+                   END
+        """, [product_ids, widths])
+        updated = self.env.cr.rowcount
+        self.invalidate_model(['calculated_length_m'])
+        _logger.info(f"[计算长度] 产品 {len(product_ids)} 个宽度/单位变化，批量更新 {updated} 条库存数量")
+
+    @api.model
+    def _get_length_width_m(self, product):
+        """获取产品计算长度用的宽度（米），不适用时返回 0
+        
+        适用条件：产品主单位是平米单位，且配置了宽度
+        """
+        product_tmpl = product.product_tmpl_id
+        # 从 product.product 获取主单位（字段名是 product_uom，不是 product_uom_id）
+        uom_id = product.product_uom if hasattr(product, 'product_uom') else product_tmpl.uom_id
+        if not uom_id:
+            return 0.0
+        if not self.env['uom.uom']._is_area_uom(uom_id.id):
+            _logger.debug(f"[计算长度] 产品={product.name}, 单位={uom_id.display_name}, 单位ID={uom_id.id}, 不是平米单位")
+            return 0.0
+        if not product_tmpl.product_width or product_tmpl.product_width <= 0:
+            _logger.debug(f"[计算长度] 产品={product.name}, 没有配置宽度或宽度为0")
+            return 0.0
+        # product_width 是宽度（毫米），转换为米
+        return product_tmpl.product_width / 1000.0
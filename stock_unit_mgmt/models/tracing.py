@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""
+热路径追踪模块
+为 stock.move.line 的 create/write 等热路径提供按需开启的诊断追踪
+
+开启方式（任选其一）：
+• 按数据库：系统参数 stock_unit_mgmt.trace_enabled = True
+• 按请求：context 中传入 stock_unit_trace=True（传入 False 可在已开启的数据库中关闭当前请求）
+
+关闭时被追踪的方法直接调用原函数，不获取调用栈、不计时、不记录任何数据，
+开关本身也只从缓存中读取（见 is_enabled）；
+开启时记录调用者、耗时、SQL 查询数和经过的验证分支，写入每个数据库独立的环形缓冲区，
+管理员可通过 /stock_unit_mgmt/trace 查看。缓冲区保存在进程内存中，多 worker 部署时
+每次请求只能看到处理该请求的 worker 记录的数据。
+"""
+
+import functools
+import os
+import sys
+import threading
+import time
+from collections import deque
+
+TRACE_PARAM = 'stock_unit_mgmt.trace_enabled'
+TRACE_CONTEXT_KEY = 'stock_unit_trace'
+TRACE_BUFFER_SIZE = 500
+
+# 每个数据库一个环形缓冲区：{数据库名: deque(追踪记录)}
+_TRACE_BUFFERS = {}
+_TRACE_BUFFERS_LOCK = threading.Lock()
+
+# 当前线程正在追踪的调用栈（用于 note_branch 记录分支）
+_LOCAL = threading.local()
+
+# 查找调用者时跳过的框架文件
+_SKIPPED_CALLER_FILES = (
+    os.path.normcase(__file__),
+    os.path.join('odoo', 'api.py'),
+    os.path.join('odoo', 'models.py'),
+    os.path.join('odoo', 'fields.py'),
+    os.path.join('odoo', 'orm', ''),
+    '<decorator-gen',
+)
+
+
+def is_enabled(env):
+    """检查当前环境是否开启追踪（请求级 context 优先于数据库级系统参数）
+
+    数据库级开关由 ir.config_parameter._get_stock_unit_trace_enabled 缓存，
+    不会在每次调用被追踪的方法时读取系统参数。
+
+    Args:
+        env: Odoo 环境
+
+    Returns:
+        bool: 是否开启追踪
+    """
+    context_flag = env.context.get(TRACE_CONTEXT_KEY)
+    if context_flag is not None:
+        return bool(context_flag)
+    return env['ir.config_parameter']._get_stock_unit_trace_enabled()
+
+
+def traced(label):
+    """追踪装饰器，用于模型方法
+
+    Args:
+        label (str): 追踪记录中显示的方法名（如：'stock.move.line.create'）
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            if not is_enabled(self.env):
+                return method(self, *args, **kwargs)
+            return _call_traced(label, method, self, args, kwargs)
+        return wrapper
+    return decorator
+
+
+def note_branch(branch):
+    """记录当前追踪调用经过的验证分支，未开启追踪时不做任何事
+
+    Args:
+        branch (str): 分支名称（如：'duplicate'、'not_in_prefilled'）
+    """
+    stack = getattr(_LOCAL, 'stack', None)
+    if stack:
+        stack[-1]['branches'].append(branch)
+
+
+def get_records(dbname, limit=None):
+    """获取数据库的追踪记录（最新的在前）
+
+    Args:
+        dbname (str): 数据库名
+        limit (int): 返回的最大记录数
+
+    Returns:
+        list: 追踪记录列表
+    """
+    records = list(reversed(_TRACE_BUFFERS.get(dbname, ())))
+    return records[:limit] if limit else records
+
+
+def clear_records(dbname):
+    """清空数据库的追踪记录
+
+    Args:
+        dbname (str): 数据库名
+    """
+    buffer = _TRACE_BUFFERS.get(dbname)
+    if buffer is not None:
+        buffer.clear()
+
+
+def _get_buffer(dbname):
+    buffer = _TRACE_BUFFERS.get(dbname)
+    if buffer is None:
+        with _TRACE_BUFFERS_LOCK:
+            buffer = _TRACE_BUFFERS.setdefault(dbname, deque(maxlen=TRACE_BUFFER_SIZE))
+    return buffer
+
+
+def _get_caller():
+    """获取第一个不属于 ORM 框架和本模块的调用位置"""
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = os.path.normcase(frame.f_code.co_filename)
+        if not any(skipped in filename for skipped in _SKIPPED_CALLER_FILES):
+            return f"{filename.rsplit(os.sep, 1)[-1]}:{frame.f_lineno} ({frame.f_code.co_name})"
+        frame = frame.f_back
+    return 'unknown'
+
+
+def _call_traced(label, method, record, args, kwargs):
+    cr = record.env.cr
+    entry = {
+        'method': label,
+        'uid': record.env.uid,
+        'record_count': len(record) or (len(args[0]) if args and isinstance(args[0], list) else 0),
+        'caller': _get_caller(),
+        'branches': [],
+        'error': None,
+        'timestamp': time.time(),
+    }
+    stack = getattr(_LOCAL, 'stack', None)
+    if stack is None:
+        stack = _LOCAL.stack = []
+    stack.append(entry)
+    sql_count_before = getattr(cr, 'sql_log_count', 0)
+    started = time.perf_counter()
+    try:
+        return method(record, *args, **kwargs)
+    except Exception as e:
+        entry['error'] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        entry['duration_ms'] = round((time.perf_counter() - started) * 1000, 3)
+        entry['sql_count'] = getattr(cr, 'sql_log_count', 0) - sql_count_before
+        stack.pop()
+        _get_buffer(cr.dbname).append(entry)
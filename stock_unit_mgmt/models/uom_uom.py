@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, api
+from odoo.tools import LRU
+
+# 平方米单位名称关键字（按小写匹配）
+AREA_UOM_NAME_KEYWORDS = ('平米', '平方米', 'sqm', 'm²', 'm2')
+# 面积类别名称关键字（按小写匹配）
+AREA_UOM_CATEGORY_KEYWORDS = ('面积', 'area')
+
+# 面积单位判断缓存：{(数据库名, 单位ID, 单位修改时间, 类别修改时间, 已安装语言): 是否面积单位}
+# 键中包含修改时间和已安装语言，其他 worker 提交的改名或新安装的语言使旧缓存自然失效
+_AREA_UOM_CACHE = LRU(1024)
+
+
+def touch_area_uom(records):
+    """单位或类别名称变化后使面积单位判断缓存失效
+
+    同一事务内修改时间不变，清空本 worker 的缓存；
+    只修改翻译（update_field_translations）时不会更新修改时间，这里一并更新，
+    其他 worker 提交后读到新的修改时间，不会命中旧缓存。
+
+    Args:
+        records: uom.uom 或 uom.category 记录集
+    """
+    if not records:
+        return
+    records.flush_recordset(['write_date'])
+    records.env.cr.execute(
+        f"UPDATE {records._table} SET write_date = now() AT TIME ZONE 'UTC' WHERE id = ANY(%s)",
+        [records.ids]
+    )
+    records.invalidate_recordset(['write_date'])
+    _AREA_UOM_CACHE.clear()
+
+
+class UomUom(models.Model):
+    _inherit = 'uom.uom'
+
+    @api.model
+    def _is_area_uom(self, uom_id):
+        """判断计量单位是否为平方米（面积）单位（按单位ID缓存）
+
+        **性能优化**：发货重量、计算长度等按行计算的字段不再对每行做单位名称的子串匹配。
+        缓存键包含单位和单位类别的修改时间：改名（包括只修改翻译，见 touch_area_uom）后自然失效。
+        名称按所有已安装语言的翻译匹配，与用户当前语言无关。
+
+        Args:
+            uom_id (int): 计量单位ID
+
+        Returns:
+            bool: 单位名称包含平米/平方米/sqm/m²/m2，或单位类别名称包含面积/area
+        """
+        uom = self.browse(uom_id).exists()
+        if not uom:
+            return False
+        langs = tuple(code for code, _name in self.env['res.lang'].get_installed()) or (self.env.lang,)
+        cache_key = (self.env.cr.dbname, uom.id, uom.write_date, uom.category_id.write_date, langs)
+        is_area = _AREA_UOM_CACHE.get(cache_key)
+        if is_area is None:
+            is_area = _AREA_UOM_CACHE[cache_key] = self._match_area_uom(uom, langs)
+        return is_area
+
+    @api.model
+    def _match_area_uom(self, uom, langs):
+        """按各语言的单位名称和类别名称判断是否为面积单位（_is_area_uom 的实际计算）"""
+        for lang in langs:
+            localized = uom.with_context(lang=lang)
+            uom_name = (localized.name or '').lower()
+            if any(keyword in uom_name for keyword in AREA_UOM_NAME_KEYWORDS):
+                return True
+            category_name = (localized.category_id.name or '').lower()
+            if any(keyword in category_name for keyword in AREA_UOM_CATEGORY_KEYWORDS):
+                return True
+        return False
+
+    def write(self, vals):
+        res = super(UomUom, self).write(vals)
+        if 'name' in vals or 'category_id' in vals:
+            touch_area_uom(self)
+        return res
+
+    def _update_field_translations(self, field_name, translations, *args, **kwargs):
+        # 翻译不经过 write，单独使面积单位判断缓存失效
+        res = super(UomUom, self)._update_field_translations(field_name, translations, *args, **kwargs)
+        if field_name == 'name':
+            touch_area_uom(self)
+        return res
+
+
+class UomCategory(models.Model):
+    _inherit = 'uom.category'
+
+    def write(self, vals):
+        res = super(UomCategory, self).write(vals)
+        if 'name' in vals:
+            # 类别名称参与面积单位判断，使 _is_area_uom 缓存失效
+            touch_area_uom(self)
+        return res
+
+    def _update_field_translations(self, field_name, translations, *args, **kwargs):
+        res = super(UomCategory, self)._update_field_translations(field_name, translations, *args, **kwargs)
+        if field_name == 'name':
+            touch_area_uom(self)
+        return res
@@ -16,6 +16,9 @@ UNIT_DISPLAY_MAP = {
     'custom': '自定义'
 }
 
+# 标准化批次号回填每批行数
+NORMALIZE_BACKFILL_BATCH_SIZE = 10000
+
 
 def get_unit_display_name(unit_code):
     """获取单位显示名称
@@ -49,3 +52,54 @@ def get_unit_display_name_cn(unit_code):
     }
     return unit_map_cn.get(unit_code, unit_code)
 
+
+
+def normalize_lot_name(lot_name):
+    """标准化批次号（去除首尾空格并转为小写），用于忽略大小写的批次号比对
+    
+    Args:
+        lot_name (str): 原始批次号
+    
+    Returns:
+        str: 标准化后的批次号，空值返回空字符串
+    """
+    return str(lot_name or '').strip().lower()
+
+
+def backfill_normalized_lot_names(cr, table, column, normalized_column):
+    """按 id 分批回填标准化批次号列（安装/升级时新建列后调用）
+
+    回填在 Python 中调用 normalize_lot_name，与字段计算结果完全一致：
+    PostgreSQL 的 \\s 和 lower() 受数据库字符集/排序规则影响，不会处理全角空格（U+3000）
+    等 Unicode 空白和非 ASCII 字母，用 SQL 表达式回填会与后续 ORM 计算的结果不同。
+
+    Args:
+        cr: 数据库游标
+        table (str): 表名（如：'stock_move_line'、'stock_lot'）
+        column (str): 批次号列名（如：'lot_name'、'name'）
+        normalized_column (str): 标准化批次号列名
+    """
+    last_id = 0
+    while True:
+        cr.execute(f"""
+            SELECT id, {column}
+              FROM {table}
+             WHERE {column} IS NOT NULL
+               AND id > %s
+             ORDER BY id
+             LIMIT %s
+        """, [last_id, NORMALIZE_BACKFILL_BATCH_SIZE])
+        rows = cr.fetchall()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        # 标准化后为空的批次号保持 NULL（与字段计算的 False 一致）
+        values = [(row_id, normalize_lot_name(name)) for row_id, name in rows]
+        values = [(row_id, normalized) for row_id, normalized in values if normalized]
+        if values:
+            cr.execute(f"""
+                UPDATE {table} t
+                   SET {normalized_column} = v.normalized
+                  FROM unnest(%s::int[], %s::varchar[]) AS v(id, normalized)
+                 WHERE t.id = v.id
+            """, [[v[0] for v in values], [v[1] for v in values]])
@@ -0,0 +1,8 @@
+# -*- coding: utf-8 -*-
+from . import test_stock_lot_unit_ledger
+from . import test_barcode_revision
+from . import test_prefilled_lot_index
+from . import test_stock_lot_scan
+from . import test_lot_name_match
+from . import test_product_stock_summary
+from . import test_import_lots
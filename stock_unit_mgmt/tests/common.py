@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+from odoo.tests.common import TransactionCase
+
+
+class BarcodePickingCase(TransactionCase):
+    """扫码测试公共数据：一张入库调拨单及其批次追踪产品的移动"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.product = cls.env['product.product'].create({
+            'name': 'Test Scan Product',
+            'is_storable': True,
+            'tracking': 'lot',
+        })
+        cls.picking_type = cls.env.ref('stock.picking_type_in')
+        cls.supplier_location = cls.env.ref('stock.stock_location_suppliers')
+        cls.stock_location = cls.env.ref('stock.stock_location_stock')
+        cls.picking = cls.env['stock.picking'].create({
+            'picking_type_id': cls.picking_type.id,
+            'location_id': cls.supplier_location.id,
+            'location_dest_id': cls.stock_location.id,
+        })
+        cls.move = cls.env['stock.move'].create({
+            'name': 'Scan Test Move',
+            'picking_id': cls.picking.id,
+            'product_id': cls.product.id,
+            'product_uom': cls.product.uom_id.id,
+            'product_uom_qty': 3.0,
+            'location_id': cls.supplier_location.id,
+            'location_dest_id': cls.stock_location.id,
+        })
+
+    def _create_line(self, lot_name):
+        return self.env['stock.move.line'].create({
+            'move_id': self.move.id,
+            'picking_id': self.picking.id,
+            'product_id': self.product.id,
+            'product_uom_id': self.product.uom_id.id,
+            'lot_name': lot_name,
+            'quantity': 1.0,
+            'location_id': self.supplier_location.id,
+            'location_dest_id': self.stock_location.id,
+        })
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+from .common import BarcodePickingCase
+
+
+class TestBarcodeRevision(BarcodePickingCase):
+
+    def test_revision_advances_on_barcode_changes(self):
+        """创建移动行和修改扫码界面字段时推进修订号，增量加载只返回变更的移动行"""
+        revision_before = self.picking._get_barcode_revision()
+        line = self._create_line('REV-001')
+        revision = self.picking._get_barcode_revision()
+        self.assertGreater(revision, revision_before)
+
+        delta = self.picking._get_barcode_move_lines_delta(since_revision=revision)
+        self.assertFalse(delta['records']['stock.move.line'])
+        self.assertEqual(delta['revision'], revision)
+
+        line.write({'lot_quantity': 2.0})
+        delta = self.picking._get_barcode_move_lines_delta(since_revision=revision)
+        self.assertGreater(delta['revision'], revision)
+        self.assertEqual([r['id'] for r in delta['records']['stock.move.line']], [line.id])
+
+    def test_revision_unchanged_on_other_fields(self):
+        """修改与扫码界面无关的字段不推进修订号"""
+        line = self._create_line('REV-002')
+        revision = self.picking._get_barcode_revision()
+
+        line.write({'contract_no': 'CONTRACT-001'})
+
+        self.assertEqual(self.picking._get_barcode_revision(), revision)
+
+    def test_delta_reports_removed_lines(self):
+        """删除的移动行在 removed_ids 中返回，首次加载时不返回移除记录"""
+        line = self._create_line('REV-003')
+        kept_line = self._create_line('REV-004')
+        revision = self.picking._get_barcode_revision()
+        removed_id = line.id
+
+        line.unlink()
+
+        delta = self.picking._get_barcode_move_lines_delta(since_revision=revision)
+        self.assertEqual(delta['removed_ids'], [removed_id])
+        self.assertGreater(delta['revision'], revision)
+        self.assertNotIn(kept_line.id, delta['removed_ids'])
+
+        full = self.picking._get_barcode_move_lines_delta(since_revision=0)
+        self.assertFalse(full['removed_ids'])
+        self.assertIn(kept_line.id, [r['id'] for r in full['records']['stock.move.line']])
+
+    def test_revision_is_per_picking(self):
+        """修订号按调拨单递增，其他调拨单的变更不推进本调拨单的修订号"""
+        other_picking = self.picking.copy()
+        revision = self.picking._get_barcode_revision()
+        other_revision = other_picking._get_barcode_revision()
+
+        line = self._create_line('REV-005')
+        self.assertEqual(other_picking._get_barcode_revision(), other_revision)
+
+        line.write({'picking_id': other_picking.id})
+        self.assertGreater(other_picking._get_barcode_revision(), other_revision)
+        delta = self.picking._get_barcode_move_lines_delta(since_revision=revision)
+        self.assertEqual(delta['removed_ids'], [line.id])
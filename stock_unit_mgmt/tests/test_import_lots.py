@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+from unittest.mock import patch
+
+from odoo.exceptions import UserError
+
+from odoo.addons.stock_unit_mgmt.models import stock_move
+from .common import BarcodePickingCase
+
+
+class TestImportLots(BarcodePickingCase):
+
+    def _move_lot_names(self):
+        return sorted(self.move.move_line_ids.mapped('lot_name'))
+
+    def test_import_skips_duplicates(self):
+        """与移动中已有的批次号及导入内容中的重复行去重（忽略大小写和首尾空格）"""
+        self._create_line('IMP-001')
+
+        result = self.move.import_lots('imp-001\nIMP-002\n\n IMP-003 \nimp-002\n')
+
+        self.assertEqual(result, {'created': 2, 'skipped': 2})
+        self.assertEqual(self._move_lot_names(), ['IMP-001', 'IMP-002', 'IMP-003'])
+
+    def test_import_parses_units(self):
+        """单位数量和单位按代码或显示名称识别，其他名称按自定义单位处理"""
+        self.move.import_lots('IMP-011;12.5;kg\nIMP-012\t3\t卷\nIMP-013; 2 ;桶装')
+
+        lines = {line.lot_name: line for line in self.move.move_line_ids}
+        self.assertEqual(lines['IMP-011'].lot_quantity, 12.5)
+        self.assertEqual(lines['IMP-011'].lot_unit_name, 'kg')
+        self.assertEqual(lines['IMP-012'].lot_quantity, 3.0)
+        self.assertEqual(lines['IMP-012'].lot_unit_name, 'roll')
+        self.assertEqual(lines['IMP-013'].lot_unit_name, 'custom')
+        self.assertEqual(lines['IMP-013'].lot_unit_name_custom, '桶装')
+
+    def test_import_in_chunks(self):
+        """按 LOT_IMPORT_CHUNK_SIZE 分批创建移动行"""
+        MoveLine = type(self.env['stock.move.line'])
+        with patch.object(stock_move, 'LOT_IMPORT_CHUNK_SIZE', 2), \
+                patch.object(MoveLine, 'create', autospec=True, side_effect=MoveLine.create) as create:
+            result = self.move.import_lots('\n'.join(f'IMP-02{i}' for i in range(5)))
+
+        self.assertEqual(result['created'], 5)
+        self.assertEqual(create.call_count, 3)
+        self.assertEqual(len(self.move.move_line_ids), 5)
+
+    def test_import_rejects_invalid_lines(self):
+        """有格式不正确的行时不创建任何移动行"""
+        with self.assertRaises(UserError):
+            self.move.import_lots('IMP-031\nIMP-032;abc')
+        self.assertFalse(self.move.move_line_ids)
+
+    def test_import_guards(self):
+        """已完成/取消的移动、未追踪批次号的产品、不允许创建批次号的作业类型不能导入"""
+        self.picking_type.use_create_lots = False
+        with self.assertRaises(UserError):
+            self.move.import_lots('IMP-041')
+        self.picking_type.use_create_lots = True
+
+        self.product.tracking = 'none'
+        with self.assertRaises(UserError):
+            self.move.import_lots('IMP-042')
+        self.product.tracking = 'lot'
+
+        self.move._action_cancel()
+        with self.assertRaises(UserError):
+            self.move.import_lots('IMP-043')
+        self.assertFalse(self.move.move_line_ids)
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+from odoo.exceptions import ValidationError
+
+from .common import BarcodePickingCase
+
+
+class TestLotNameMatch(BarcodePickingCase):
+
+    def test_duplicate_lot_in_move_blocked(self):
+        """同一移动中批次号不能重复（忽略大小写和首尾空格）"""
+        self._create_line('DUP-001')
+        with self.assertRaises(ValidationError):
+            self._create_line(' dup-001 ')
+
+    def test_same_lot_in_other_move_allowed(self):
+        """不同移动中的相同批次号不算重复"""
+        self._create_line('DUP-002')
+        other_move = self.move.copy({'picking_id': self.picking.id})
+        line = self.env['stock.move.line'].create({
+            'move_id': other_move.id,
+            'picking_id': self.picking.id,
+            'product_id': self.product.id,
+            'product_uom_id': self.product.uom_id.id,
+            'lot_name': 'DUP-002',
+            'quantity': 1.0,
+            'location_id': self.supplier_location.id,
+            'location_dest_id': self.stock_location.id,
+        })
+        self.assertEqual(line.lot_name_normalized, 'dup-002')
+
+    def test_duplicates_reported_together(self):
+        """一次创建多个重复批次号时，合并为一条错误提示"""
+        self._create_line('DUP-003')
+        self._create_line('DUP-004')
+        vals_list = [{
+            'move_id': self.move.id,
+            'picking_id': self.picking.id,
+            'product_id': self.product.id,
+            'product_uom_id': self.product.uom_id.id,
+            'lot_name': lot_name,
+            'quantity': 1.0,
+            'location_id': self.supplier_location.id,
+            'location_dest_id': self.stock_location.id,
+        } for lot_name in ['DUP-003', 'DUP-004']]
+        with self.assertRaisesRegex(ValidationError, 'DUP-003\nDUP-004'):
+            self.env['stock.move.line'].create(vals_list)
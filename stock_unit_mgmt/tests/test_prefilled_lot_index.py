@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+from .common import BarcodePickingCase
+
+
+class TestPrefilledLotIndex(BarcodePickingCase):
+
+    def test_prefilled_lot_index_follows_revision(self):
+        """预填批次号索引在移动行变化后重建"""
+        line = self._create_line('IDX-001')
+        index = self.picking._get_prefilled_lot_index()
+        self.assertEqual(len(index), 1)
+        self.assertEqual(next(iter(index.values()))['line_ids'], [line.id])
+
+        self._create_line('IDX-002')
+        self.assertEqual(len(self.picking._get_prefilled_lot_index()), 2)
+
+        line.unlink()
+        index = self.picking._get_prefilled_lot_index()
+        self.assertEqual([entry['name'] for entry in index.values()], ['IDX-002'])
+
+    def test_prefilled_lot_index_ignores_other_pickings(self):
+        """移到其他调拨单的移动行不再出现在原调拨单的索引中"""
+        line = self._create_line('IDX-003')
+        self.assertEqual(len(self.picking._get_prefilled_lot_index()), 1)
+
+        other_picking = self.picking.copy()
+        line.write({'picking_id': other_picking.id})
+
+        self.assertFalse(self.picking._get_prefilled_lot_index())
+        self.assertEqual(
+            [entry['name'] for entry in other_picking._get_prefilled_lot_index().values()],
+            ['IDX-003'])
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+from odoo.tests.common import TransactionCase
+
+
+class TestProductStockSummary(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.product = cls.env['product.product'].create({
+            'name': 'Test Summary Product',
+            'is_storable': True,
+            'tracking': 'lot',
+        })
+        cls.lot = cls.env['stock.lot'].create({
+            'name': 'SUMMARY-LOT-001',
+            'product_id': cls.product.id,
+        })
+        cls.stock_location = cls.env.ref('stock.stock_location_stock')
+        cls.customer_location = cls.env.ref('stock.stock_location_customers')
+        cls.Quant = cls.env['stock.quant']
+        cls.Summary = cls.env['product.template.stock.summary']
+
+    def _get_summary(self):
+        return self.Summary._get_summaries([self.product.product_tmpl_id.id]).get(
+            self.product.product_tmpl_id.id, {})
+
+    def _summary_row_count(self):
+        return self.Summary.search_count([('product_tmpl_id', '=', self.product.product_tmpl_id.id)])
+
+    def test_trigger_follows_quant_changes(self):
+        """库存数量增减、备注变化时触发器记录差额，汇总与库存一致"""
+        self.assertFalse(self._get_summary())
+
+        self.Quant._update_available_quantity(self.product, self.stock_location, 5.0, lot_id=self.lot)
+        summary = self._get_summary()
+        self.assertEqual(summary['quantity'], 5.0)
+        self.assertEqual(summary['quantity_no_notes'], 5.0)
+        self.assertEqual(summary['roll_count'], 1)
+
+        quant = self.Quant._gather(self.product, self.stock_location, lot_id=self.lot)
+        quant.write({'o_note1': 'RED'})
+        summary = self._get_summary()
+        self.assertEqual(summary['quantity'], 5.0)
+        self.assertEqual(summary['quantity_no_note1'], 0.0)
+        self.assertEqual(summary['quantity_no_note2'], 5.0)
+        self.assertEqual(summary['note_counts'], [('RED', 1)])
+
+        self.Quant._update_available_quantity(self.product, self.stock_location, -5.0, lot_id=self.lot)
+        summary = self._get_summary()
+        self.assertEqual(summary['quantity'], 0.0)
+        self.assertEqual(summary['roll_count'], 0)
+        self.assertFalse(summary['note_counts'])
+
+    def test_non_internal_location_ignored(self):
+        """非内部库位的库存数量不计入汇总"""
+        self.Quant._update_available_quantity(self.product, self.customer_location, 3.0, lot_id=self.lot)
+        self.assertFalse(self._get_summary())
+
+    def test_compact_merges_deltas(self):
+        """定时任务把差额合并为每个模板/备注一行，合并前后汇总不变"""
+        self.Quant._update_available_quantity(self.product, self.stock_location, 2.0, lot_id=self.lot)
+        self.Quant._update_available_quantity(self.product, self.stock_location, 3.0, lot_id=self.lot)
+        quant = self.Quant._gather(self.product, self.stock_location, lot_id=self.lot)
+        quant.write({'o_note2': 'BLUE'})
+        summary = self._get_summary()
+        self.assertGreater(self._summary_row_count(), 2)
+
+        self.Summary._cron_compact()
+
+        self.assertEqual(self._summary_row_count(), 2)
+        self.assertEqual(self._get_summary(), summary)
+
+    def test_compact_drops_empty_rows(self):
+        """差额相互抵消后，合并时不保留全为 0 的行"""
+        self.Quant._update_available_quantity(self.product, self.stock_location, 2.0, lot_id=self.lot)
+        self.Quant._update_available_quantity(self.product, self.stock_location, -2.0, lot_id=self.lot)
+
+        self.Summary._cron_compact()
+
+        self.assertEqual(self._summary_row_count(), 0)
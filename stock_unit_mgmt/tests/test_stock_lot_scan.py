@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+from .common import BarcodePickingCase
+
+
+class TestStockLotScan(BarcodePickingCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.LotScan = cls.env['stock.lot.scan']
+
+    def test_register_scan_detects_duplicate(self):
+        """同一调拨单中批次号第二次登记失败（重复扫描），标准化后相同的批次号视为同一个"""
+        self.assertTrue(self.LotScan._register_scan(self.picking.id, 'SCAN-001'))
+        self.assertFalse(self.LotScan._register_scan(self.picking.id, 'SCAN-001'))
+        self.assertFalse(self.LotScan._register_scan(self.picking.id, ' scan-001 '))
+
+    def test_release_scan_allows_rescan(self):
+        """释放后的批次号可以重新登记，并保留原扫描顺序"""
+        self.LotScan._register_scan(self.picking.id, 'SCAN-001')
+        self.LotScan._register_scan(self.picking.id, 'SCAN-002')
+        self.LotScan._release_scans(self.picking.id, ['SCAN-001'])
+        self.assertEqual(len(self.LotScan._get_scanned_lot_names(self.picking.id)), 1)
+
+        self.assertTrue(self.LotScan._register_scan(self.picking.id, 'SCAN-001'))
+        sequence_map = self.LotScan._get_scan_sequence_map(self.picking.id)
+        scanned = self.LotScan._get_scanned_lot_names(self.picking.id)
+        self.assertEqual(len(scanned), 2)
+        self.assertLess(sequence_map[scanned[0]], sequence_map[scanned[1]])
+
+    def test_register_scan_keeps_scanned_name(self):
+        """扫码记录保存扫描时的原始批次号，标准化批次号只用于判重"""
+        self.LotScan._register_scan(self.picking.id, 'Scan-003')
+        scan = self.LotScan.search([('picking_id', '=', self.picking.id)])
+        self.assertEqual(scan.lot_name, 'Scan-003')
+        self.assertEqual(scan.lot_name_normalized, 'scan-003')
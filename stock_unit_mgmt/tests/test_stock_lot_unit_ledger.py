@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+from odoo.tests.common import TransactionCase
+
+
+class TestStockLotUnitLedger(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.product = cls.env['product.product'].create({
+            'name': 'Test Roll Product',
+            'is_storable': True,
+            'tracking': 'lot',
+        })
+        cls.lot = cls.env['stock.lot'].create({
+            'name': 'LEDGER-LOT-001',
+            'product_id': cls.product.id,
+        })
+        cls.supplier_location = cls.env.ref('stock.stock_location_suppliers')
+        cls.stock_location = cls.env.ref('stock.stock_location_stock')
+        cls.customer_location = cls.env.ref('stock.stock_location_customers')
+        cls.Ledger = cls.env['stock.lot.unit.ledger']
+        cls.Balance = cls.env['stock.lot.unit.balance']
+
+    def _do_move(self, location, location_dest, qty, lot_quantity):
+        """创建并完成一个带批次号和单位数量的库存移动"""
+        move = self.env['stock.move'].create({
+            'name': 'Ledger Test Move',
+            'product_id': self.product.id,
+            'product_uom': self.product.uom_id.id,
+            'product_uom_qty': qty,
+            'location_id': location.id,
+            'location_dest_id': location_dest.id,
+        })
+        move._action_confirm()
+        self.env['stock.move.line'].create({
+            'move_id': move.id,
+            'product_id': self.product.id,
+            'product_uom_id': self.product.uom_id.id,
+            'lot_id': self.lot.id,
+            'quantity': qty,
+            'lot_quantity': lot_quantity,
+            'location_id': location.id,
+            'location_dest_id': location_dest.id,
+            'picked': True,
+        })
+        move.picked = True
+        move._action_done()
+        return move
+
+    def _get_balance(self, location):
+        key = (self.product.id, self.lot.id, location.id, 0)
+        return self.Balance._get_balances([key]).get(key)
+
+    def test_balance_after_incoming_move(self):
+        """入库完成后，目标库位的余额累加入库单位数量和入库数量"""
+        move = self._do_move(self.supplier_location, self.stock_location, 10.0, 3.0)
+        self.assertEqual(move.state, 'done')
+
+        balance = self._get_balance(self.stock_location)
+        self.assertTrue(balance, "入库完成后应生成余额")
+        self.assertAlmostEqual(balance['in_lot_quantity'], 3.0)
+        self.assertAlmostEqual(balance['out_lot_quantity'], 0.0)
+        self.assertAlmostEqual(balance['in_qty'], 10.0)
+        self.assertEqual(balance['in_move_line_id'], move.move_line_ids.id)
+
+        entries = self.Ledger.search([('move_line_id', '=', move.move_line_ids.id)])
+        self.assertEqual(sorted(entries.mapped('direction')), ['in', 'out'])
+
+    def test_balance_after_outgoing_move(self):
+        """出库完成后，源库位的余额累加出库单位数量"""
+        self._do_move(self.supplier_location, self.stock_location, 10.0, 3.0)
+        self._do_move(self.stock_location, self.customer_location, 4.0, 1.0)
+
+        balance = self._get_balance(self.stock_location)
+        self.assertAlmostEqual(balance['in_lot_quantity'], 3.0)
+        self.assertAlmostEqual(balance['out_lot_quantity'], 1.0)
+        self.assertAlmostEqual(balance['in_qty'], 10.0)
+
+    def test_repost_is_idempotent(self):
+        """重复记账时内容未变化的移动行不产生新分录，余额不变"""
+        move = self._do_move(self.supplier_location, self.stock_location, 10.0, 3.0)
+        entry_count = self.Ledger.search_count([('move_line_id', '=', move.move_line_ids.id)])
+
+        keys = self.Ledger._post_move_lines(move.move_line_ids.ids)
+
+        self.assertFalse(keys)
+        self.assertEqual(
+            self.Ledger.search_count([('move_line_id', '=', move.move_line_ids.id)]), entry_count
+        )
+        self.assertAlmostEqual(self._get_balance(self.stock_location)['in_lot_quantity'], 3.0)
+
+    def test_done_line_update_posts_difference(self):
+        """已完成的移动行修改单位数量后，台账只追加差额"""
+        move = self._do_move(self.supplier_location, self.stock_location, 10.0, 3.0)
+
+        move.move_line_ids.write({'lot_quantity': 5.0})
+
+        self.assertAlmostEqual(self._get_balance(self.stock_location)['in_lot_quantity'], 5.0)
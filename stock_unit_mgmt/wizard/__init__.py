@@ -1,3 +1,4 @@
 # -*- coding: utf-8 -*-
 
 from . import product_unit_setup_wizard
+from . import stock_move_lot_import_wizard
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, fields, _
+
+
+class StockMoveLotImportWizard(models.TransientModel):
+    _name = 'stock.move.lot.import.wizard'
+    _description = 'Stock Move Lot Import Wizard'
+
+    move_id = fields.Many2one(
+        'stock.move',
+        string='库存移动',
+        required=True,
+        ondelete='cascade'
+    )
+    product_id = fields.Many2one(
+        'product.product',
+        string='产品',
+        related='move_id.product_id',
+        readonly=True
+    )
+    lots_text = fields.Text(
+        string='批次号',
+        help='每行一个批次号，格式：批次号[制表符/分号 单位数量[制表符/分号 单位]]，可直接从 Excel 粘贴'
+    )
+
+    def action_import(self):
+        """导入批次号（stock.move.import_lots），完成后提示创建和跳过的行数"""
+        self.ensure_one()
+        result = self.move_id.import_lots(self.lots_text)
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': _('批量导入批次号'),
+                'message': _('已创建 %(created)s 行，重复跳过 %(skipped)s 行') % result,
+                'type': 'success',
+                'sticky': False,
+                'next': {'type': 'ir.actions.act_window_close'},
+            },
+        }